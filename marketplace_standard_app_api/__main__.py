@@ -1,3 +1,4 @@
+import asyncio
 import json
 
 try:
@@ -5,7 +6,14 @@ try:
 except ImportError:
     raise ImportError("Click is required to use this command, try `pip install click`.")
 
-from .main import api
+from .bench import (
+    BACKENDS,
+    SCENARIOS,
+    TRANSFORMATION_STORES,
+    BenchmarkOptions,
+    compare,
+    run_benchmarks,
+)
 
 
 @click.group()
@@ -13,6 +21,17 @@ def cli():
     pass
 
 
+def _write_if_changed(path, content):
+    # We only write the file if it either does not exist or in case it
+    # actually differs to avoid modifying the file metadata on every commit.
+    try:
+        current = click.open_file(path, "r").read()
+    except FileNotFoundError:
+        current = None
+    if current != content:
+        click.open_file(path, "w").write(content)
+
+
 @cli.command()
 @click.option(
     "-o",
@@ -21,20 +40,77 @@ def cli():
     default="-",
     help="Output file.",
 )
-def show(output):
+@click.option(
+    "--artifact",
+    is_flag=True,
+    help="Also write the schema that the package serves.",
+)
+def show(output, artifact):
     """Print the API as OpenAPI JSON document to stdout."""
+    from .main import OPENAPI_ARTIFACT, api
+
+    content = json.dumps(api.generate_openapi(), indent=2) + "\n"
     if output == "-":
-        click.echo(json.dumps(api.openapi(), indent=2))
+        click.echo(content, nl=False)
     else:
-        # We only write the file if it either does not exist or in case it
-        # actually differs to avoid modifying the file metadata on every commit.
-        try:
-            current_api = click.open_file(output, "r").read()
-        except FileNotFoundError:
-            current_api = None
-        new_api = json.dumps(api.openapi(), indent=2) + "\n"
-        if current_api != new_api:
-            click.open_file(output, "w").write(new_api)
+        _write_if_changed(output, content)
+    if artifact:
+        _write_if_changed(OPENAPI_ARTIFACT, content)
+
+
+@cli.command()
+@click.option(
+    "-s",
+    "--scenario",
+    "scenarios",
+    multiple=True,
+    type=click.Choice(list(SCENARIOS)),
+    help="Scenario to run, all by default.",
+)
+@click.option("-n", "--requests", default=1000, show_default=True, help="Iterations.")
+@click.option(
+    "-c", "--concurrency", default=8, show_default=True, help="Concurrent clients."
+)
+@click.option(
+    "--size", default=64 * 1024, show_default=True, help="Dataset size in bytes."
+)
+@click.option("--page-size", default=100, show_default=True, help="List page size.")
+@click.option(
+    "--backend",
+    type=click.Choice(BACKENDS),
+    default="filesystem",
+    show_default=True,
+    help="Object storage backend.",
+)
+@click.option(
+    "--transformation-store",
+    type=click.Choice(TRANSFORMATION_STORES),
+    default="memory",
+    show_default=True,
+    help="Transformation store.",
+)
+@click.option(
+    "-o",
+    "--output",
+    type=click.Path(dir_okay=False, writable=True, allow_dash=True),
+    default="-",
+    help="Output file of the JSON results.",
+)
+@click.option(
+    "--baseline",
+    type=click.Path(exists=True, dir_okay=False),
+    help="Results of a previous run to compare with.",
+)
+def bench(scenarios, output, baseline, **options):
+    """Benchmark the operations of an in-process app and print JSON results."""
+    results = asyncio.run(
+        run_benchmarks(scenarios or list(SCENARIOS), BenchmarkOptions(**options))
+    )
+    if baseline is not None:
+        with click.open_file(baseline) as file:
+            results["comparison"] = compare(json.load(file), results)
+    with click.open_file(output, "w") as file:
+        file.write(json.dumps(results, indent=2) + "\n")
 
 
 if __name__ == "__main__":
@@ -0,0 +1,316 @@
+"""Benchmarks of the standard API operations.
+
+The benchmarks drive an application created with `create_app` in-process
+through its ASGI interface, i.e., they measure the request overhead of the
+application (authentication, middleware, validation and serialization) and
+its backends without any network in between.  Each scenario issues
+``requests`` iterations from ``concurrency`` concurrent clients:
+
+- heartbeat: heartbeat, i.e., the overhead of every request.
+- upload: createOrReplaceDataset with datasets of ``size`` bytes.
+- download: getDataset of a dataset of ``size`` bytes.
+- list: listDatasets with pages of ``page_size`` datasets.
+- transformations: newTransformation, getTransformation and
+  deleteTransformation of a transformation.
+
+The latencies are reported per operation id as JSON, which can be compared
+with the results of a previous run:
+
+    marketplace-standard-app-api bench --output baseline.json
+    marketplace-standard-app-api bench --baseline baseline.json
+"""
+
+import asyncio
+import json
+import math
+import platform
+import tempfile
+import time
+from pathlib import Path
+from typing import (
+    Any,
+    Awaitable,
+    Callable,
+    Dict,
+    Iterable,
+    List,
+    NamedTuple,
+    Optional,
+    Tuple,
+)
+
+from .broker import Reply, call_app
+from .execution import TransformationExecutor, use_transformation_executor
+from .main import create_app
+from .models.message_broker import MessageBrokerBinaryPayload, MessageBrokerRequestModel
+from .search import IndexedStorage, SearchIndex
+from .storage import use_object_storage_backend
+from .storage.filesystem import FileSystemStorage
+from .storage.transformations import (
+    InMemoryTransformationStore,
+    SQLiteTransformationStore,
+    TransformationStore,
+)
+from .version import __version__
+
+BACKENDS = ("filesystem", "indexed")
+
+TRANSFORMATION_STORES = ("memory", "sqlite")
+
+COLLECTION = "bench"
+
+
+class BenchmarkOptions(NamedTuple):
+    requests: int = 1000
+    concurrency: int = 8
+    size: int = 64 * 1024
+    page_size: int = 100
+    backend: str = "filesystem"
+    transformation_store: str = "memory"
+
+
+def _transform(parameters: dict, stop_event: Any) -> None:
+    """The transformation function, transformations are never started."""
+
+
+class Client:
+    """Issue requests to the application and record their latencies."""
+
+    def __init__(self, app: Any):
+        self.app = app
+        self.latencies: Dict[str, List[float]] = {}
+        self.errors: Dict[str, int] = {}
+
+    def reset(self) -> None:
+        self.latencies.clear()
+        self.errors.clear()
+
+    async def request(
+        self,
+        operation_id: str,
+        method: str,
+        endpoint: str,
+        body: bytes = b"",
+        query: Optional[Dict[str, str]] = None,
+        content_type: Optional[str] = None,
+    ) -> Reply:
+        headers = {"Host": "bench", "Authorization": "Bearer bench"}
+        if content_type is not None:
+            headers["Content-Type"] = content_type
+        request = MessageBrokerRequestModel(
+            endpoint=endpoint,
+            method=method,
+            headers=headers,
+            query_params=query,
+            payload=MessageBrokerBinaryPayload(),
+        )
+        started = time.perf_counter()
+        reply = await call_app(self.app, request, [body] if body else ())
+        duration = time.perf_counter() - started
+        self.latencies.setdefault(operation_id, []).append(duration)
+        if reply.response.status_code >= 400:
+            self.errors[operation_id] = self.errors.get(operation_id, 0) + 1
+        return reply
+
+
+Step = Callable[[Client, int], Awaitable[None]]
+
+Scenario = Tuple[Callable[[Client], Awaitable[None]], Step]
+
+
+async def _no_setup(client: Client) -> None:
+    pass
+
+
+def _heartbeat(options: BenchmarkOptions) -> Scenario:
+    async def step(client: Client, index: int) -> None:
+        await client.request("heartbeat", "GET", "/health")
+
+    return _no_setup, step
+
+
+def _upload(options: BenchmarkOptions) -> Scenario:
+    data = bytes(options.size)
+
+    async def step(client: Client, index: int) -> None:
+        await client.request(
+            "createOrReplaceDataset",
+            "PUT",
+            f"/data/{COLLECTION}/upload-{index}",
+            data,
+            content_type="application/octet-stream",
+        )
+
+    return _no_setup, step
+
+
+def _download(options: BenchmarkOptions) -> Scenario:
+    async def setup(client: Client) -> None:
+        await client.request(
+            "createOrReplaceDataset",
+            "PUT",
+            f"/data/{COLLECTION}/download",
+            bytes(options.size),
+            content_type="application/octet-stream",
+        )
+
+    async def step(client: Client, index: int) -> None:
+        await client.request("getDataset", "GET", f"/data/{COLLECTION}/download")
+
+    return setup, step
+
+
+def _list(options: BenchmarkOptions) -> Scenario:
+    async def setup(client: Client) -> None:
+        for index in range(2 * options.page_size):
+            await client.request(
+                "createOrReplaceDataset",
+                "PUT",
+                f"/data/{COLLECTION}/list-{index:06d}",
+                b"x",
+                content_type="text/plain",
+            )
+
+    async def step(client: Client, index: int) -> None:
+        await client.request(
+            "listDatasets",
+            "GET",
+            f"/data/{COLLECTION}",
+            query={"limit": str(options.page_size)},
+        )
+
+    return setup, step
+
+
+def _transformations(options: BenchmarkOptions) -> Scenario:
+    body = json.dumps({"parameters": {"index": 0}}).encode()
+
+    async def step(client: Client, index: int) -> None:
+        reply = await client.request(
+            "newTransformation",
+            "POST",
+            "/transformations",
+            body,
+            content_type="application/json",
+        )
+        if reply.response.status_code != 200:
+            return
+        id = json.loads(b"".join(reply.body))["id"]
+        await client.request("getTransformation", "GET", f"/transformations/{id}")
+        await client.request("deleteTransformation", "DELETE", f"/transformations/{id}")
+
+    return _no_setup, step
+
+
+SCENARIOS: Dict[str, Callable[[BenchmarkOptions], Scenario]] = {
+    "heartbeat": _heartbeat,
+    "upload": _upload,
+    "download": _download,
+    "list": _list,
+    "transformations": _transformations,
+}
+
+
+def percentile(values: List[float], q: float) -> float:
+    """Return the q-th percentile of the sorted values (nearest rank)."""
+    return values[max(math.ceil(q / 100 * len(values)) - 1, 0)]
+
+
+def _summary(latencies: List[float], errors: int, duration: float) -> Dict[str, Any]:
+    latencies = sorted(latencies)
+    return {
+        "requests": len(latencies),
+        "errors": errors,
+        "p50_ms": percentile(latencies, 50) * 1000,
+        "p99_ms": percentile(latencies, 99) * 1000,
+        "mean_ms": sum(latencies) / len(latencies) * 1000,
+        "throughput": len(latencies) / duration,
+    }
+
+
+async def run_scenario(
+    app: Any, name: str, options: BenchmarkOptions
+) -> Dict[str, Any]:
+    """Run the scenario against the app and summarize its latencies."""
+    client = Client(app)
+    setup, step = SCENARIOS[name](options)
+    await setup(client)
+    client.reset()
+    indexes = iter(range(options.requests))
+
+    async def worker() -> None:
+        for index in indexes:
+            await step(client, index)
+
+    started = time.perf_counter()
+    await asyncio.gather(*(worker() for _ in range(options.concurrency)))
+    duration = time.perf_counter() - started
+    return {
+        "duration": duration,
+        "throughput": options.requests / duration,
+        "operations": {
+            operation_id: _summary(
+                latencies, client.errors.get(operation_id, 0), duration
+            )
+            for operation_id, latencies in sorted(client.latencies.items())
+        },
+    }
+
+
+def _transformation_store(
+    options: BenchmarkOptions, directory: Path
+) -> TransformationStore:
+    if options.transformation_store == "sqlite":
+        return SQLiteTransformationStore(directory / "transformations.db")
+    return InMemoryTransformationStore()
+
+
+async def run_benchmarks(
+    scenarios: Iterable[str], options: BenchmarkOptions = BenchmarkOptions()
+) -> Dict[str, Any]:
+    """Run the scenarios, each against a new app with empty backends."""
+    results: Dict[str, Any] = {}
+    for name in scenarios:
+        with tempfile.TemporaryDirectory() as tmp:
+            directory = Path(tmp)
+            app = create_app()
+            backend: Any = FileSystemStorage(directory / "data", fsync=False)
+            if options.backend == "indexed":
+                backend = IndexedStorage(backend, SearchIndex())
+            use_object_storage_backend(app, backend)
+            executor = TransformationExecutor(
+                _transform, store=_transformation_store(options, directory)
+            )
+            use_transformation_executor(app, executor)
+            try:
+                await Client(app).request(
+                    "createCollection", "PUT", f"/data/{COLLECTION}"
+                )
+                results[name] = await run_scenario(app, name, options)
+            finally:
+                await executor.close()
+    return {
+        "version": __version__,
+        "python": platform.python_version(),
+        "options": options._asdict(),
+        "scenarios": results,
+    }
+
+
+def compare(baseline: Dict[str, Any], results: Dict[str, Any]) -> Dict[str, Any]:
+    """Return the ratios of the latencies and throughputs to the baseline.
+
+    Ratios above one mean slower requests, respectively higher throughput.
+    """
+    ratios: Dict[str, Any] = {}
+    for name, scenario in results["scenarios"].items():
+        base_operations = baseline["scenarios"].get(name, {}).get("operations", {})
+        for operation_id, summary in scenario["operations"].items():
+            base = base_operations.get(operation_id)
+            if base is None:
+                continue
+            ratios.setdefault(name, {})[operation_id] = {
+                key: summary[key] / base[key] if base[key] else None
+                for key in ("p50_ms", "p99_ms", "throughput")
+            }
+    return ratios
@@ -0,0 +1,409 @@
+"""Dispatch of message broker requests to the application.
+
+Applications that are reached through the MarketPlace message broker receive
+`MessageBrokerRequestModel` messages and reply with
+`MessageBrokerResponseModel` messages.  The `MessageBrokerDispatcher` consumes
+the messages of a `MessageQueue` and calls the application in-process through
+its ASGI interface, i.e., without a loopback HTTP connection:
+
+    from marketplace_standard_app_api.main import api
+
+    dispatcher = MessageBrokerDispatcher(api, MyBrokerQueue(...))
+    await dispatcher.run()
+
+Up to ``max_concurrency`` messages are handled concurrently and messages are
+acknowledged in batches once their reply has been sent.  The
+`InMemoryMessageQueue` serves as a stand-in for the broker in tests.
+
+Binary bodies, e.g., of dataset uploads and downloads, are not embedded in the
+message as text but transmitted as length-prefixed chunks following the
+message (see `encode_frames`), which the dispatcher passes through to and from
+the application without intermediate string conversions.  Requests with a
+``payload`` are answered with a binary body as well.
+"""
+
+import asyncio
+import itertools
+import logging
+import struct
+from typing import (
+    Any,
+    Awaitable,
+    Callable,
+    Dict,
+    Hashable,
+    List,
+    MutableMapping,
+    NamedTuple,
+    Optional,
+    Protocol,
+    Sequence,
+    Set,
+    Tuple,
+    Type,
+    TypeVar,
+    Union,
+)
+from urllib.parse import urlencode
+
+from pydantic import BaseModel
+
+from .models.message_broker import (
+    MessageBrokerBinaryPayload,
+    MessageBrokerRequestModel,
+    MessageBrokerResponseModel,
+)
+from .streaming import DEFAULT_CHUNK_SIZE
+
+logger = logging.getLogger(__name__)
+
+ASGIApp = Callable[
+    [
+        MutableMapping[str, Any],
+        Callable[[], Awaitable[MutableMapping[str, Any]]],
+        Callable[[MutableMapping[str, Any]], Awaitable[None]],
+    ],
+    Awaitable[None],
+]
+
+
+M = TypeVar("M", bound=BaseModel)
+
+BytesLike = Union[bytes, bytearray, memoryview]
+
+FRAME_MAGIC = b"MPB1"
+
+_LENGTH = struct.Struct("!I")
+
+
+class InvalidFrame(ValueError):
+    """The framed message is malformed."""
+
+
+def encode_frames(
+    message: BaseModel,
+    body: Sequence[BytesLike] = (),
+    chunk_size: int = DEFAULT_CHUNK_SIZE,
+) -> List[BytesLike]:
+    """Frame a message and its binary body for transmission.
+
+    The message is encoded as JSON after a magic number and its length,
+    followed by the body in chunks of at most ``chunk_size`` bytes, each
+    prefixed with its length, and an empty chunk.  The body is not copied,
+    the returned parts are meant to be written with ``writelines`` or similar.
+    """
+    header = message.json(exclude_none=True).encode()
+    parts: List[BytesLike] = [FRAME_MAGIC, _LENGTH.pack(len(header)), header]
+    for chunk in body:
+        view = memoryview(chunk)
+        for start in range(0, len(view), chunk_size):
+            piece = view[start : start + chunk_size]
+            parts += [_LENGTH.pack(len(piece)), piece]
+    parts.append(_LENGTH.pack(0))
+    return parts
+
+
+def _read(view: memoryview, offset: int, length: int) -> memoryview:
+    if offset + length > len(view):
+        raise InvalidFrame("Truncated frame.")
+    return view[offset : offset + length]
+
+
+def decode_frames(data: BytesLike, model: Type[M]) -> Tuple[M, List[memoryview]]:
+    """Decode a framed message and return it with views of its body chunks."""
+    view = memoryview(data)
+    if bytes(_read(view, 0, len(FRAME_MAGIC))) != FRAME_MAGIC:
+        raise InvalidFrame("Invalid magic number.")
+    offset = len(FRAME_MAGIC)
+    (length,) = _LENGTH.unpack(_read(view, offset, _LENGTH.size))
+    offset += _LENGTH.size
+    try:
+        message = model.parse_raw(bytes(_read(view, offset, length)))
+    except ValueError as error:
+        raise InvalidFrame(str(error)) from error
+    offset += length
+    chunks: List[memoryview] = []
+    while True:
+        (length,) = _LENGTH.unpack(_read(view, offset, _LENGTH.size))
+        offset += _LENGTH.size
+        if length == 0:
+            break
+        chunks.append(_read(view, offset, length))
+        offset += length
+    return message, chunks
+
+
+class Message(NamedTuple):
+    """A request received from the broker, identified by its delivery tag."""
+
+    tag: Hashable
+    request: MessageBrokerRequestModel
+    body: Sequence[BytesLike] = ()
+
+
+class Reply(NamedTuple):
+    response: MessageBrokerResponseModel
+    body: Sequence[BytesLike] = ()
+
+
+class MessageQueue(Protocol):
+    """The connection to the message broker."""
+
+    async def receive(self, max_messages: int) -> List[Message]:
+        """Wait for and return between one and ``max_messages`` messages."""
+        ...
+
+    async def reply(self, message: Message, reply: Reply) -> None:
+        ...
+
+    async def ack(self, tags: List[Hashable]) -> None:
+        """Acknowledge the messages with the given delivery tags."""
+        ...
+
+
+def _scope(request: MessageBrokerRequestModel) -> Dict[str, Any]:
+    path = "/" + request.endpoint.lstrip("/")
+    query = urlencode(request.query_params or {})
+    headers = {key.lower(): value for key, value in (request.headers or {}).items()}
+    if request.payload is not None:
+        if request.payload.content_encoding is not None:
+            headers["content-encoding"] = request.payload.content_encoding
+        if request.payload.content_length is not None:
+            headers["content-length"] = str(request.payload.content_length)
+    elif request.body is not None:
+        headers["content-length"] = str(len(request.body.encode()))
+    return {
+        "type": "http",
+        "asgi": {"version": "3.0"},
+        "http_version": "1.1",
+        "method": (request.method or "GET").upper(),
+        "scheme": "http",
+        "path": path,
+        "raw_path": path.encode(),
+        "root_path": "",
+        "query_string": query.encode(),
+        "headers": [(key.encode(), value.encode()) for key, value in headers.items()],
+        "client": None,
+        "server": None,
+    }
+
+
+async def call_app(
+    app: ASGIApp, request: MessageBrokerRequestModel, body: Sequence[BytesLike] = ()
+) -> Reply:
+    """Call the ASGI application with the request and return its reply.
+
+    The request body is taken from the binary ``body`` chunks if the request
+    has a payload, the response body is returned as binary chunks then.
+    """
+    if request.payload is not None:
+        # ASGI requires bytes, views into a received frame are copied once.
+        messages = [
+            {
+                "type": "http.request",
+                "body": chunk if isinstance(chunk, bytes) else bytes(chunk),
+                "more_body": True,
+            }
+            for chunk in body
+        ]
+        messages.append({"type": "http.request", "body": b"", "more_body": False})
+    else:
+        text = request.body.encode() if request.body is not None else b""
+        messages = [{"type": "http.request", "body": text, "more_body": False}]
+    disconnected = asyncio.Event()
+    status_code = 500
+    headers: Dict[str, str] = {}
+    chunks: List[bytes] = []
+
+    async def receive() -> Dict[str, Any]:
+        if messages:
+            return messages.pop(0)
+        await disconnected.wait()
+        return {"type": "http.disconnect"}
+
+    async def send(message: MutableMapping[str, Any]) -> None:
+        nonlocal status_code
+        if message["type"] == "http.response.start":
+            status_code = message["status"]
+            for key, value in message.get("headers", []):
+                headers[key.decode("latin-1")] = value.decode("latin-1")
+        elif message["type"] == "http.response.body":
+            if message.get("body"):
+                chunks.append(message["body"])
+            if not message.get("more_body", False):
+                disconnected.set()
+
+    try:
+        await app(_scope(request), receive, send)
+    except Exception:
+        if not headers and not chunks:
+            status_code, chunks = 500, [b"Internal server error."]
+    finally:
+        disconnected.set()
+    if request.payload is None:
+        response = MessageBrokerResponseModel(
+            status_code=status_code,
+            headers=headers,
+            body=b"".join(chunks).decode(errors="replace"),
+        )
+        return Reply(response)
+    payload = MessageBrokerBinaryPayload(
+        content_encoding=headers.get("content-encoding"),
+        content_length=sum(len(chunk) for chunk in chunks),
+    )
+    response = MessageBrokerResponseModel(
+        status_code=status_code, headers=headers, payload=payload
+    )
+    return Reply(response, chunks)
+
+
+class MessageBrokerDispatcher:
+    """Dispatch the messages of a queue to an ASGI application.
+
+    Args:
+        app: The application, e.g., `main.api`.
+        queue: The connection to the message broker.
+        max_concurrency: The maximum number of concurrently handled messages.
+        ack_batch_size: The number of handled messages acknowledged at once.
+        ack_interval: The maximum time in seconds before a handled message is
+            acknowledged.
+    """
+
+    def __init__(
+        self,
+        app: ASGIApp,
+        queue: MessageQueue,
+        max_concurrency: int = 32,
+        ack_batch_size: int = 64,
+        ack_interval: float = 0.1,
+    ):
+        self.app = app
+        self.queue = queue
+        self.max_concurrency = max_concurrency
+        self.ack_batch_size = ack_batch_size
+        self.ack_interval = ack_interval
+        self._tasks: Set["asyncio.Task[None]"] = set()
+        self._pending_acks: List[Hashable] = []
+        self._ack_timer: Optional[asyncio.TimerHandle] = None
+        self._ack_tasks: Set["asyncio.Task[None]"] = set()
+        self.handled = 0
+
+    @property
+    def in_flight(self) -> int:
+        """The number of messages that are currently handled."""
+        return len(self._tasks)
+
+    async def run(self) -> None:
+        """Receive and dispatch messages until cancelled, then drain."""
+        slots = asyncio.Semaphore(self.max_concurrency)
+        try:
+            while True:
+                await slots.acquire()
+                # Fetch as many messages as there are free workers.
+                free = 1
+                while free < self.max_concurrency and not slots.locked():
+                    await slots.acquire()
+                    free += 1
+                try:
+                    messages = await self.queue.receive(free)
+                except BaseException:
+                    for _ in range(free):
+                        slots.release()
+                    raise
+                for _ in range(free - len(messages)):
+                    slots.release()
+                for message in messages:
+                    task = asyncio.create_task(self._handle(message, slots))
+                    self._tasks.add(task)
+                    task.add_done_callback(self._tasks.discard)
+        finally:
+            await self.drain()
+
+    async def _handle(self, message: Message, slots: asyncio.Semaphore) -> None:
+        try:
+            reply = await call_app(self.app, message.request, message.body)
+            await self.queue.reply(message, reply)
+        except Exception:
+            # Not acknowledged, such that the broker redelivers the message.
+            logger.exception("Failed to reply to message %r.", message.tag)
+        else:
+            self.handled += 1
+            self._ack(message.tag)
+        finally:
+            slots.release()
+
+    def _ack(self, tag: Hashable) -> None:
+        self._pending_acks.append(tag)
+        if len(self._pending_acks) >= self.ack_batch_size:
+            self._flush_acks()
+        elif self._ack_timer is None:
+            loop = asyncio.get_running_loop()
+            self._ack_timer = loop.call_later(self.ack_interval, self._flush_acks)
+
+    def _flush_acks(self) -> None:
+        if self._ack_timer is not None:
+            self._ack_timer.cancel()
+            self._ack_timer = None
+        if self._pending_acks:
+            tags, self._pending_acks = self._pending_acks, []
+            task = asyncio.create_task(self.queue.ack(tags))
+            self._ack_tasks.add(task)
+            task.add_done_callback(self._ack_tasks.discard)
+
+    async def drain(self) -> None:
+        """Wait for the messages in flight and acknowledge all handled ones."""
+        if self._tasks:
+            await asyncio.gather(*self._tasks, return_exceptions=True)
+        self._flush_acks()
+        if self._ack_tasks:
+            await asyncio.gather(*self._ack_tasks)
+
+
+class InMemoryMessageQueue:
+    """A message queue in memory, standing in for the broker in tests.
+
+    Requests are submitted with `request`, which waits for the reply.  Binary
+    requests and replies are framed as they would be for transmission.
+    """
+
+    def __init__(self) -> None:
+        self._messages: "asyncio.Queue[Message]" = asyncio.Queue()
+        self._replies: Dict[Hashable, "asyncio.Future[Reply]"] = {}
+        self._tags = itertools.count()
+        self.unacknowledged: Set[Hashable] = set()
+        self.ack_batches: List[List[Hashable]] = []
+
+    def submit(
+        self, request: MessageBrokerRequestModel, body: Sequence[BytesLike] = ()
+    ) -> "asyncio.Future[Reply]":
+        """Submit a request and return the future of its reply."""
+        tag = next(self._tags)
+        future: "asyncio.Future[Reply]" = asyncio.get_running_loop().create_future()
+        self._replies[tag] = future
+        self.unacknowledged.add(tag)
+        if request.payload is not None:
+            frames = b"".join(encode_frames(request, body))
+            request, body = decode_frames(frames, MessageBrokerRequestModel)
+        self._messages.put_nowait(Message(tag, request, body))
+        return future
+
+    async def request(
+        self, request: MessageBrokerRequestModel, body: Sequence[BytesLike] = ()
+    ) -> Reply:
+        return await self.submit(request, body)
+
+    async def receive(self, max_messages: int) -> List[Message]:
+        messages = [await self._messages.get()]
+        while len(messages) < max_messages and not self._messages.empty():
+            messages.append(self._messages.get_nowait())
+        return messages
+
+    async def reply(self, message: Message, reply: Reply) -> None:
+        if reply.response.payload is not None:
+            frames = b"".join(encode_frames(reply.response, reply.body))
+            reply = Reply(*decode_frames(frames, MessageBrokerResponseModel))
+        self._replies.pop(message.tag).set_result(reply)
+
+    async def ack(self, tags: List[Hashable]) -> None:
+        self.ack_batches.append(tags)
+        self.unacknowledged.difference_update(tags)
@@ -0,0 +1,323 @@
+"""Asynchronous client of MarketPlace applications.
+
+The operations of the client are derived from the routes of the routers in
+`FEATURES` and addressed by their operation ids, e.g.:
+
+    async with Client("https://app.example.org", token) as client:
+        state = await client.call("getTransformationState", transformation_id=id)
+        async for dataset in client.iter_datasets("results"):
+            await client.download_dataset("results", dataset.name, dataset.name)
+
+All requests of a client share a pool of keep-alive connections, such that
+concurrent requests, e.g., with `asyncio.gather`, do not pay for a new
+connection each.  Responses with status 503 are retried with exponential
+backoff, or after the delay of their Retry-After header.
+
+The client requires httpx, try `pip install marketplace-standard-app-api[client]`.
+"""
+
+import asyncio
+import os
+from functools import lru_cache
+from importlib import import_module
+from typing import (
+    Any,
+    AsyncIterator,
+    Awaitable,
+    Callable,
+    Dict,
+    NamedTuple,
+    Optional,
+    Union,
+)
+from urllib.parse import quote
+
+from fastapi.concurrency import run_in_threadpool
+from fastapi.routing import APIRoute
+from pydantic import parse_obj_as
+
+from .main import FEATURES
+from .models.object_storage import DatasetModel, DatasetResponseModel
+from .models.transformation import TransformationListResponse, TransformationModel
+from .storage import metadata_to_headers
+
+try:
+    import httpx
+except ImportError:  # Optional dependency.
+    httpx = None
+
+CHUNK_SIZE = 64 * 1024
+
+
+class Operation(NamedTuple):
+    method: str
+    path: str
+    response_model: Any
+
+
+@lru_cache(maxsize=None)
+def operations() -> Dict[str, Operation]:
+    """Return the operations of all routers by operation id."""
+    table: Dict[str, Operation] = {}
+    for module in FEATURES.values():
+        for route in import_module(module, __package__).router.routes:
+            if isinstance(route, APIRoute) and route.operation_id:
+                (method,) = route.methods
+                table[route.operation_id] = Operation(
+                    method, route.path, route.response_model
+                )
+    return table
+
+
+Content = Union[bytes, Callable[[], AsyncIterator[bytes]], None]
+
+
+async def _read_file(path: Union[str, "os.PathLike[str]"]) -> AsyncIterator[bytes]:
+    # The file is read in the thread pool, such that the event loop does not block.
+    file = await run_in_threadpool(open, path, "rb")
+    try:
+        while True:
+            chunk = await run_in_threadpool(file.read, CHUNK_SIZE)
+            if not chunk:
+                break
+            yield chunk
+    finally:
+        await run_in_threadpool(file.close)
+
+
+class Client:
+    """Client of the operations of a MarketPlace application.
+
+    Args:
+        base_url: The URL the routes of the application are relative to.
+        token: The bearer token sent with every request.
+        max_connections: The maximum number of concurrent connections.
+        retries: The number of retries of responses with status 503.
+        backoff: The delay before the first retry in seconds, which doubles
+            with every further retry.
+        timeout: The timeout of connecting, reading and writing in seconds.
+        transport: The httpx transport, e.g., an ASGI transport for tests.
+    """
+
+    def __init__(
+        self,
+        base_url: str,
+        token: Optional[str] = None,
+        *,
+        max_connections: int = 16,
+        retries: int = 3,
+        backoff: float = 0.5,
+        timeout: float = 30.0,
+        transport: Any = None,
+    ) -> None:
+        if httpx is None:
+            raise ImportError(
+                "httpx is required to use the client, "
+                "try `pip install marketplace-standard-app-api[client]`."
+            )
+        self.retries = retries
+        self.backoff = backoff
+        headers = {"Authorization": f"Bearer {token}"} if token else {}
+        self.http = httpx.AsyncClient(
+            base_url=base_url,
+            headers=headers,
+            timeout=timeout,
+            limits=httpx.Limits(
+                max_connections=max_connections,
+                max_keepalive_connections=max_connections,
+            ),
+            transport=transport,
+        )
+
+    async def __aenter__(self) -> "Client":
+        return self
+
+    async def __aexit__(self, *exc_info: Any) -> None:
+        await self.aclose()
+
+    async def aclose(self) -> None:
+        """Close the connections of the pool."""
+        await self.http.aclose()
+
+    def _request(
+        self,
+        operation_id: str,
+        path_params: Dict[str, Any],
+        params: Optional[Dict[str, Any]],
+        headers: Optional[Dict[str, str]],
+        json: Any,
+        content: Content,
+    ) -> Any:
+        try:
+            operation = operations()[operation_id]
+        except KeyError:
+            raise ValueError(f"Unknown operation: {operation_id}.")
+        path = operation.path.format(
+            **{name: quote(str(value), safe="") for name, value in path_params.items()}
+        )
+        return self.http.build_request(
+            operation.method,
+            path,
+            params={
+                key: value for key, value in (params or {}).items() if value is not None
+            },
+            headers=headers,
+            json=json,
+            content=content() if callable(content) else content,
+        )
+
+    def _delay(self, response: Any, attempt: int) -> float:
+        retry_after = response.headers.get("Retry-After", "")
+        if retry_after.isdigit():
+            return float(retry_after)
+        return self.backoff * 2**attempt
+
+    async def send(
+        self,
+        operation_id: str,
+        *,
+        params: Optional[Dict[str, Any]] = None,
+        headers: Optional[Dict[str, str]] = None,
+        json: Any = None,
+        content: Content = None,
+        stream: bool = False,
+        **path_params: Any,
+    ) -> Any:
+        """Send the request of the operation and return the httpx response.
+
+        A streamed content is passed as function that returns a new iterator
+        for every retry.  The body of a response with ``stream=True`` is not
+        read and the response must be closed by the caller.
+        """
+        attempt = 0
+        while True:
+            request = self._request(
+                operation_id, path_params, params, headers, json, content
+            )
+            response = await self.http.send(request, stream=stream)
+            if response.status_code != 503 or attempt >= self.retries:
+                return response
+            await response.aclose()
+            await asyncio.sleep(self._delay(response, attempt))
+            attempt += 1
+
+    async def call(
+        self,
+        operation_id: str,
+        *,
+        params: Optional[Dict[str, Any]] = None,
+        headers: Optional[Dict[str, str]] = None,
+        json: Any = None,
+        content: Content = None,
+        **path_params: Any,
+    ) -> Any:
+        """Call the operation and return its result.
+
+        The JSON body of the response is parsed into the response model of
+        the operation, if it has one, and the response is returned otherwise.
+        Error responses raise `httpx.HTTPStatusError`.
+        """
+        response = await self.send(
+            operation_id,
+            params=params,
+            headers=headers,
+            json=json,
+            content=content,
+            **path_params,
+        )
+        response.raise_for_status()
+        response_model = operations()[operation_id].response_model
+        if response_model is None or response.status_code == 204:
+            return response
+        return parse_obj_as(response_model, response.json())
+
+    async def _pages(
+        self, fetch: Callable[[Optional[str]], Awaitable[Any]]
+    ) -> AsyncIterator[Any]:
+        page = await fetch(None)
+        while page is not None:
+            # The next page is requested while the items of the page are consumed.
+            next_page = (
+                asyncio.ensure_future(fetch(page.next_cursor))
+                if page.next_cursor
+                else None
+            )
+            try:
+                for item in page.items:
+                    yield item
+            except BaseException:
+                if next_page is not None:
+                    next_page.cancel()
+                raise
+            page = None if next_page is None else await next_page
+
+    def iter_datasets(
+        self, collection_name: str, page_size: int = 100
+    ) -> AsyncIterator[DatasetModel]:
+        """Iterate over the datasets of the collection, page by page."""
+
+        async def fetch(cursor: Optional[str]) -> Optional[DatasetResponseModel]:
+            page = await self.call(
+                "listDatasets",
+                collection_name=collection_name,
+                params={"limit": page_size, "cursor": cursor},
+            )
+            return None if isinstance(page, httpx.Response) else page
+
+        return self._pages(fetch)
+
+    def iter_transformations(
+        self, page_size: int = 100
+    ) -> AsyncIterator[TransformationModel]:
+        """Iterate over the transformations, page by page."""
+
+        async def fetch(cursor: Optional[str]) -> TransformationListResponse:
+            return await self.call(
+                "getTransformationList",
+                params={"limit": page_size, "cursor": cursor},
+            )
+
+        return self._pages(fetch)
+
+    async def download_dataset(
+        self,
+        collection_name: str,
+        dataset_name: str,
+        path: Union[str, "os.PathLike[str]"],
+    ) -> Any:
+        """Stream the dataset into the file and return the response."""
+        response = await self.send(
+            "getDataset",
+            collection_name=collection_name,
+            dataset_name=dataset_name,
+            stream=True,
+        )
+        try:
+            response.raise_for_status()
+            file = await run_in_threadpool(open, path, "wb")
+            try:
+                async for chunk in response.aiter_bytes(CHUNK_SIZE):
+                    await run_in_threadpool(file.write, chunk)
+            finally:
+                await run_in_threadpool(file.close)
+        finally:
+            await response.aclose()
+        return response
+
+    async def upload_dataset(
+        self,
+        collection_name: str,
+        dataset_name: str,
+        path: Union[str, "os.PathLike[str]"],
+        content_type: str = "application/octet-stream",
+        metadata: Optional[Dict[str, str]] = None,
+    ) -> Any:
+        """Stream the file into the dataset, which is created or replaced."""
+        headers = {"Content-Type": content_type, **metadata_to_headers(metadata or {})}
+        return await self.call(
+            "createOrReplaceDataset",
+            collection_name=collection_name,
+            dataset_name=dataset_name,
+            headers=headers,
+            content=lambda: _read_file(path),
+        )
@@ -0,0 +1,520 @@
+"""Compression of responses and decompression of requests.
+
+The `CompressionMiddleware` compresses responses with the encoding preferred
+by the client's Accept-Encoding header: gzip, and zstd or brotli if the
+optional ``zstandard`` and ``brotli`` packages are installed.  Only responses
+with a content type of the allowlist and of at least ``minimum_size`` bytes are
+compressed, i.e., datasets with binary or already compressed content are sent
+as they are.  Responses are compressed message by message as they are sent,
+such that streamed responses are not buffered.  The compressed output is
+flushed once ``flush_size`` bytes were compressed, or after every message of
+event streams, such that events are not delayed.
+
+Request bodies with a Content-Encoding header are decompressed while they are
+received, e.g., for datasets uploaded with createDataset:
+
+    curl -X PUT -H "Content-Encoding: gzip" --data-binary @data.csv.gz ...
+
+The decompressed body is passed on in chunks of bounded size, such that small
+compressed bodies do not expand in memory, and bodies that end before their
+compressed stream are rejected with 400 (Bad Request).
+"""
+
+import zlib
+from typing import (
+    Any,
+    Callable,
+    Dict,
+    Iterator,
+    List,
+    MutableMapping,
+    Optional,
+    Protocol,
+    Sequence,
+    Tuple,
+)
+
+from fastapi import HTTPException
+from fastapi.responses import JSONResponse
+from starlette.datastructures import Headers, MutableHeaders
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+
+try:
+    import brotli
+except ImportError:  # Optional dependency.
+    brotli = None
+
+try:
+    import zstandard
+except ImportError:  # Optional dependency.
+    zstandard = None
+
+DEFAULT_MINIMUM_SIZE = 1024
+
+DEFAULT_MEDIA_TYPES = (
+    "text/",
+    "application/json",
+    "application/ld+json",
+    "application/n-triples",
+    "application/x-ndjson",
+    "application/xml",
+    "application/javascript",
+    "application/yaml",
+    "image/svg+xml",
+)
+
+# Structured syntax suffixes of compressible content types, e.g., of
+# application/problem+json.
+COMPRESSIBLE_SUFFIXES = ("+json", "+xml")
+
+DEFAULT_FLUSH_SIZE = 64 * 1024
+
+# The content types of responses that are flushed after every message.
+UNBUFFERED_MEDIA_TYPES = ("text/event-stream",)
+
+
+class Encoder(Protocol):
+    """Compressor of a response body."""
+
+    def compress(self, data: bytes) -> bytes:
+        """Compress the data, returning the output that is ready."""
+        ...
+
+    def flush(self) -> bytes:
+        """Return the output of all data compressed so far."""
+        ...
+
+    def finish(self) -> bytes:
+        """Return the remaining output, ending the compressed stream."""
+        ...
+
+
+class GzipEncoder:
+    def __init__(self, level: int = 6):
+        self._compressor = zlib.compressobj(level, zlib.DEFLATED, 16 + zlib.MAX_WBITS)
+
+    def compress(self, data: bytes) -> bytes:
+        return self._compressor.compress(data)
+
+    def flush(self) -> bytes:
+        return self._compressor.flush(zlib.Z_SYNC_FLUSH)
+
+    def finish(self) -> bytes:
+        return self._compressor.flush(zlib.Z_FINISH)
+
+
+class BrotliEncoder:
+    def __init__(self, quality: int = 4):
+        self._compressor = brotli.Compressor(quality=quality)
+
+    def compress(self, data: bytes) -> bytes:
+        return self._compressor.process(data)
+
+    def flush(self) -> bytes:
+        return self._compressor.flush()
+
+    def finish(self) -> bytes:
+        return self._compressor.finish()
+
+
+class ZstdEncoder:
+    def __init__(self, level: int = 3):
+        self._compressor = zstandard.ZstdCompressor(level=level).compressobj()
+
+    def compress(self, data: bytes) -> bytes:
+        return self._compressor.compress(data)
+
+    def flush(self) -> bytes:
+        return self._compressor.flush(zstandard.COMPRESSOBJ_FLUSH_BLOCK)
+
+    def finish(self) -> bytes:
+        return self._compressor.flush()
+
+
+# The maximum size of the chunks of decompressed request bodies.
+DECOMPRESSED_CHUNK_SIZE = 64 * 1024
+
+
+class Decoder(Protocol):
+    """Decompressor of a request body.
+
+    Invalid data raises ValueError.
+    """
+
+    def decompress(self, data: bytes) -> Iterator[bytes]:
+        """Decompress the data in chunks of bounded size."""
+        ...
+
+    @property
+    def eof(self) -> bool:
+        """Whether the end of the compressed stream has been reached."""
+        ...
+
+
+class ZlibDecoder:
+    def __init__(self, wbits: int = zlib.MAX_WBITS):
+        self._decompressor = zlib.decompressobj(wbits)
+
+    def decompress(self, data: bytes) -> Iterator[bytes]:
+        while True:
+            try:
+                chunk = self._decompressor.decompress(data, DECOMPRESSED_CHUNK_SIZE)
+            except zlib.error as error:
+                raise ValueError(error)
+            data = self._decompressor.unconsumed_tail
+            if chunk:
+                yield chunk
+            # A full chunk may leave output behind without unconsumed input.
+            if not data and len(chunk) < DECOMPRESSED_CHUNK_SIZE:
+                return
+
+    @property
+    def eof(self) -> bool:
+        return self._decompressor.eof
+
+
+class BrotliDecoder:
+    def __init__(self) -> None:
+        self._decompressor = brotli.Decompressor()
+
+    def decompress(self, data: bytes) -> Iterator[bytes]:
+        while True:
+            try:
+                chunk = self._decompressor.process(
+                    data, output_buffer_limit=DECOMPRESSED_CHUNK_SIZE
+                )
+            except brotli.error as error:
+                raise ValueError(error)
+            data = b""
+            if chunk:
+                yield chunk
+            elif self._decompressor.can_accept_more_data():
+                return
+
+    @property
+    def eof(self) -> bool:
+        return self._decompressor.is_finished()
+
+
+# The magic number that starts a zstd frame.
+_ZSTD_MAGIC = b"\x28\xb5\x2f\xfd"
+
+# The maximum size of a zstd block, compressed or decompressed.
+_ZSTD_MAX_BLOCK_SIZE = 128 * 1024
+
+
+class ZstdDecoder:
+    """Decompressor of zstd request bodies.
+
+    The zstandard decompressor has no output limit, the input is passed on
+    block by block instead.  A block decompresses to at most 128 KiB.
+    """
+
+    def __init__(self) -> None:
+        self._decompressor = zstandard.ZstdDecompressor().decompressobj()
+        self._input = bytearray()
+        # The part of the frame that follows: header, block, checksum or end.
+        self._next = "header"
+        self._checksum = False
+
+    def _next_size(self) -> Optional[int]:
+        """Return the size of the next part of the frame, None if incomplete."""
+        data = self._input
+        if self._next == "header":
+            if len(data) < 5:
+                return None
+            if data[:4] != _ZSTD_MAGIC:
+                return len(data)  # Rejected by the decompressor.
+            descriptor = data[4]
+            single_segment = descriptor >> 5 & 1
+            content_size = (single_segment, 2, 4, 8)[descriptor >> 6]
+            dictionary_id = (0, 1, 2, 4)[descriptor & 3]
+            self._checksum = bool(descriptor >> 2 & 1)
+            self._next = "block"
+            return 5 + (1 - single_segment) + dictionary_id + content_size
+        if self._next == "block":
+            if len(data) < 3:
+                return None
+            header = int.from_bytes(data[:3], "little")
+            size = header >> 3
+            if size > _ZSTD_MAX_BLOCK_SIZE:
+                raise ValueError("Block too large.")
+            if header & 1:
+                self._next = "checksum" if self._checksum else "end"
+            # The content of run-length encoded blocks is a single byte.
+            return 3 + (1 if header >> 1 & 3 == 1 else size)
+        if self._next == "checksum":
+            self._next = "end"
+            return 4
+        return len(data) or None  # Data after the frame is rejected.
+
+    def decompress(self, data: bytes) -> Iterator[bytes]:
+        self._input += data
+        while self._input:
+            state = self._next
+            size = self._next_size()
+            if size is None or size > len(self._input):
+                self._next = state  # Parsed again once more data arrived.
+                return
+            part = bytes(self._input[:size])
+            del self._input[:size]
+            try:
+                chunk = self._decompressor.decompress(part)
+            except zstandard.ZstdError as error:
+                raise ValueError(error)
+            if chunk:
+                yield chunk
+
+    @property
+    def eof(self) -> bool:
+        return self._decompressor.eof
+
+
+def available_encoders() -> Dict[str, Callable[[], Encoder]]:
+    """Return the encoders by content coding, in order of preference."""
+    encoders: Dict[str, Callable[[], Encoder]] = {}
+    if zstandard is not None:
+        encoders["zstd"] = ZstdEncoder
+    if brotli is not None:
+        encoders["br"] = BrotliEncoder
+    encoders["gzip"] = GzipEncoder
+    return encoders
+
+
+def available_decoders() -> Dict[str, Callable[[], Decoder]]:
+    """Return the decompressors of request bodies by content coding."""
+    decoders: Dict[str, Callable[[], Decoder]] = {
+        "gzip": lambda: ZlibDecoder(16 + zlib.MAX_WBITS),
+        "x-gzip": lambda: ZlibDecoder(16 + zlib.MAX_WBITS),
+        "deflate": ZlibDecoder,
+    }
+    if zstandard is not None:
+        decoders["zstd"] = ZstdDecoder
+    if brotli is not None:
+        decoders["br"] = BrotliDecoder
+    return decoders
+
+
+def select_encoding(accept_encoding: str, encodings: Sequence[str]) -> Optional[str]:
+    """Select the preferred of the encodings acceptable to the client.
+
+    Ties of the quality values are broken by the order of the encodings.
+    """
+    qualities: Dict[str, float] = {}
+    for item in accept_encoding.split(","):
+        coding, *params = (part.strip() for part in item.split(";"))
+        quality = 1.0
+        for param in params:
+            name, _, value = param.partition("=")
+            if name.strip().lower() == "q":
+                try:
+                    quality = float(value)
+                except ValueError:
+                    quality = 0.0
+        if coding:
+            qualities[coding.lower()] = quality
+    wildcard = qualities.get("*", 0.0)
+    best: Optional[str] = None
+    best_quality = 0.0
+    for encoding in encodings:
+        quality = qualities.get(encoding, wildcard)
+        if quality > best_quality:
+            best, best_quality = encoding, quality
+    return best
+
+
+class CompressionMiddleware:
+    """ASGI middleware that compresses responses and decompresses requests.
+
+    Args:
+        app: The ASGI application.
+        minimum_size: Responses smaller than this are sent uncompressed.
+        media_types: The content types (or prefixes thereof) that are
+            compressed.
+        encodings: The content codings to compress with, in order of
+            preference; all available ones by default.
+        flush_size: The number of bytes compressed before the output is
+            flushed, except for event streams, which are flushed after every
+            message.
+    """
+
+    def __init__(
+        self,
+        app: ASGIApp,
+        minimum_size: int = DEFAULT_MINIMUM_SIZE,
+        media_types: Sequence[str] = DEFAULT_MEDIA_TYPES,
+        encodings: Optional[Sequence[str]] = None,
+        flush_size: int = DEFAULT_FLUSH_SIZE,
+    ):
+        self.app = app
+        self.minimum_size = minimum_size
+        self.flush_size = flush_size
+        self.media_types = tuple(media_types)
+        available = available_encoders()
+        self.encoders = {
+            encoding: available[encoding]
+            for encoding in (encodings if encodings is not None else available)
+            if encoding in available
+        }
+        self.decoders = available_decoders()
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        headers = Headers(scope=scope)
+        content_encoding = headers.get("Content-Encoding", "").strip().lower()
+        if content_encoding and content_encoding != "identity":
+            decoder = self.decoders.get(content_encoding)
+            if decoder is None:
+                await _reject_encoding(scope, receive, send)
+                return
+            scope, receive = _decompressed(scope, receive, decoder())
+        encoding = select_encoding(
+            headers.get("Accept-Encoding", ""), list(self.encoders)
+        )
+        if encoding is None or scope["method"] == "HEAD":
+            await self.app(scope, receive, send)
+            return
+        responder = _CompressingResponder(self, encoding, send)
+        await self.app(scope, receive, responder.send)
+
+    def compressible(self, headers: Headers) -> bool:
+        if "Content-Encoding" in headers or "Content-Range" in headers:
+            return False
+        content_type = headers.get("Content-Type", "").split(";")[0].strip().lower()
+        if not (
+            content_type.startswith(self.media_types)
+            or content_type.endswith(COMPRESSIBLE_SUFFIXES)
+        ):
+            return False
+        content_length = headers.get("Content-Length")
+        return content_length is None or int(content_length) >= self.minimum_size
+
+
+def _decompressed(
+    scope: Scope, receive: Receive, decoder: Decoder
+) -> Tuple[Scope, Receive]:
+    """Return the scope and receive callable of the decompressed request."""
+    scope = dict(scope)
+    scope["headers"] = [
+        (key, value)
+        for key, value in scope["headers"]
+        if key not in (b"content-encoding", b"content-length")
+    ]
+    chunks: Iterator[bytes] = iter(())
+    more_body = True
+    finished = False
+
+    async def receive_decompressed() -> Message:
+        nonlocal chunks, more_body, finished
+        if finished:
+            return await receive()
+        while True:
+            try:
+                chunk = next(chunks, None)
+            except ValueError as error:
+                raise HTTPException(
+                    status_code=400, detail=f"Invalid Content-Encoding: {error}"
+                )
+            if chunk is not None:
+                return {"type": "http.request", "body": chunk, "more_body": True}
+            if not more_body:
+                if not decoder.eof:
+                    raise HTTPException(
+                        status_code=400,
+                        detail="Invalid Content-Encoding: truncated body.",
+                    )
+                finished = True
+                return {"type": "http.request", "body": b"", "more_body": False}
+            message = await receive()
+            if message["type"] != "http.request":
+                return message
+            more_body = message.get("more_body", False)
+            chunks = decoder.decompress(message.get("body", b""))
+
+    return scope, receive_decompressed
+
+
+async def _reject_encoding(scope: Scope, receive: Receive, send: Send) -> None:
+    response = JSONResponse(
+        {"detail": "Unsupported Content-Encoding."}, status_code=415
+    )
+    await response(scope, receive, send)
+
+
+class _CompressingResponder:
+    """Compress the body messages of a response as they are sent."""
+
+    def __init__(self, middleware: CompressionMiddleware, encoding: str, send: Send):
+        self.middleware = middleware
+        self.encoding = encoding
+        self._send = send
+        self._start: Optional[MutableMapping[str, Any]] = None
+        self._encoder: Optional[Encoder] = None
+        self._passthrough = False
+        self._unbuffered = False
+        # The number of bytes compressed since the output was last flushed.
+        self._unflushed = 0
+
+    async def send(self, message: Message) -> None:
+        if message["type"] == "http.response.start":
+            status = message["status"]
+            if (
+                status < 200
+                or status in (204, 304)
+                or not self.middleware.compressible(Headers(raw=message["headers"]))
+            ):
+                self._passthrough = True
+                await self._send(message)
+            else:
+                # Decided on the first body message, which may be too small.
+                self._start = message
+                content_type = Headers(raw=message["headers"]).get("Content-Type", "")
+                self._unbuffered = content_type.lower().startswith(
+                    UNBUFFERED_MEDIA_TYPES
+                )
+            return
+        if message["type"] != "http.response.body" or self._passthrough:
+            await self._send(message)
+            return
+        body = message.get("body", b"")
+        more_body = message.get("more_body", False)
+        if self._encoder is None:
+            assert self._start is not None
+            if not more_body and len(body) < self.middleware.minimum_size:
+                self._passthrough = True
+                await self._send(self._start)
+                await self._send(message)
+                return
+            self._encoder = self.middleware.encoders[self.encoding]()
+            await self._send(self._compressed_start(self._start))
+        chunks: List[bytes] = [self._encoder.compress(body)]
+        self._unflushed += len(body)
+        if not more_body:
+            chunks.append(self._encoder.finish())
+        elif self._unbuffered or self._unflushed >= self.middleware.flush_size:
+            chunks.append(self._encoder.flush())
+            self._unflushed = 0
+        compressed = b"".join(chunks)
+        if compressed or not more_body:
+            await self._send(
+                {
+                    "type": "http.response.body",
+                    "body": compressed,
+                    "more_body": more_body,
+                }
+            )
+
+    def _compressed_start(self, start: MutableMapping[str, Any]) -> Message:
+        message = dict(start)
+        headers = MutableHeaders(raw=list(start["headers"]))
+        del headers["Content-Length"]
+        headers["Content-Encoding"] = self.encoding
+        headers.add_vary_header("Accept-Encoding")
+        etag = headers.get("ETag")
+        if etag and not etag.startswith("W/"):
+            # The compressed representation is not byte-identical.
+            headers["ETag"] = f"W/{etag}"
+        message["headers"] = headers.raw
+        return message
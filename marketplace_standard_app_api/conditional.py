@@ -0,0 +1,216 @@
+"""Conditional requests for the object storage operations.
+
+The entity tag (ETag) of a dataset is derived from its hash, see `make_etag`.
+Conditional requests are evaluated by dependencies of the respective routes
+*before* the operation itself is executed:
+
+- getDataset, getDatasetMetadata, and listDatasets respond with 304 (Not
+  Modified) if the If-None-Match or If-Modified-Since headers match.
+- createOrReplaceDataset and deleteDataset respond with 412 (Precondition
+  Failed) if the If-Match header does not match the current dataset.
+
+To enable these checks, an application provides the current validators of
+datasets and collections by overriding the corresponding dependencies:
+
+    async def get_dataset_validators(collection_name, dataset_name):
+        dataset = await lookup(collection_name, dataset_name)
+        return Validators.from_dataset(dataset) if dataset else None
+
+    api.dependency_overrides[dataset_validators] = get_dataset_validators
+"""
+
+import re
+from datetime import datetime, timezone
+from email.utils import format_datetime, parsedate_to_datetime
+from typing import Dict, List, NamedTuple, Optional
+
+from fastapi import Depends, Header, HTTPException, Request
+
+from .models.object_storage import CollectionName, DatasetModel, DatasetName
+
+_ENTITY_TAG = re.compile(r'(?:W/)?"[^"]*"')
+
+
+def make_etag(hash: str, weak: bool = False) -> str:
+    """Return the entity tag for a dataset with the given hash."""
+    return f'W/"{hash}"' if weak else f'"{hash}"'
+
+
+class Validators(NamedTuple):
+    """Validators of the current representation of a dataset or collection."""
+
+    etag: Optional[str] = None
+    last_modified: Optional[datetime] = None
+
+    @classmethod
+    def from_dataset(cls, dataset: DatasetModel) -> "Validators":
+        return cls(
+            etag=make_etag(dataset.hash) if dataset.hash else None,
+            last_modified=dataset.last_modified,
+        )
+
+    def headers(self) -> Dict[str, str]:
+        """Return the ETag and Last-Modified response headers."""
+        headers = {}
+        if self.etag is not None:
+            headers["ETag"] = self.etag
+        if self.last_modified is not None:
+            headers["Last-Modified"] = format_http_date(self.last_modified)
+        return headers
+
+
+def as_utc(value: datetime) -> datetime:
+    """Return the datetime in UTC, naive datetimes are taken to be in UTC."""
+    if value.tzinfo is None:
+        return value.replace(tzinfo=timezone.utc)
+    return value.astimezone(timezone.utc)
+
+
+def format_http_date(value: datetime) -> str:
+    """Return the datetime as HTTP date, e.g., for the Last-Modified header."""
+    return format_datetime(as_utc(value), usegmt=True)
+
+
+def _parse_entity_tags(header: str) -> List[str]:
+    return _ENTITY_TAG.findall(header)
+
+
+def _opaque_tag(etag: str) -> str:
+    return etag[2:] if etag.startswith("W/") else etag
+
+
+def etag_matches(header: str, etag: Optional[str], weak: bool = True) -> bool:
+    """Check whether an If-Match or If-None-Match header matches the etag.
+
+    If-None-Match uses the weak comparison, If-Match the strong comparison
+    (RFC 9110, section 8.8.3.2).
+    """
+    if etag is None:
+        return False
+    if header.strip() == "*":
+        return True
+    for candidate in _parse_entity_tags(header):
+        if weak:
+            if _opaque_tag(candidate) == _opaque_tag(etag):
+                return True
+        elif candidate == etag and not etag.startswith("W/"):
+            return True
+    return False
+
+
+def evaluate_preconditions(
+    method: str,
+    validators: Optional[Validators],
+    if_match: Optional[str] = None,
+    if_none_match: Optional[str] = None,
+    if_modified_since: Optional[str] = None,
+) -> Optional[int]:
+    """Evaluate the request preconditions in the order of RFC 9110, 13.2.2.
+
+    Returns the status code that the request must be answered with (304 or
+    412), or None in case that the request should be processed.  The validators
+    are None for resources that do not exist.
+    """
+    safe = method.upper() in ("GET", "HEAD")
+    etag = validators.etag if validators else None
+    last_modified = validators.last_modified if validators else None
+
+    if if_match is not None:
+        if validators is None or not (
+            if_match.strip() == "*" or etag_matches(if_match, etag, weak=False)
+        ):
+            return 412
+
+    if if_none_match is not None:
+        if validators is not None and etag_matches(if_none_match, etag):
+            return 304 if safe else 412
+    elif if_modified_since is not None and safe and last_modified is not None:
+        try:
+            since = parsedate_to_datetime(if_modified_since)
+        except (TypeError, ValueError):
+            return None
+        if as_utc(last_modified).replace(microsecond=0) <= as_utc(since):
+            return 304
+    return None
+
+
+def _raise_for_preconditions(
+    request: Request,
+    validators: Optional[Validators],
+    if_match: Optional[str] = None,
+    if_none_match: Optional[str] = None,
+    if_modified_since: Optional[str] = None,
+) -> None:
+    status_code = evaluate_preconditions(
+        request.method, validators, if_match, if_none_match, if_modified_since
+    )
+    if status_code == 304:
+        assert validators is not None
+        raise HTTPException(status_code=304, headers=validators.headers())
+    if status_code == 412:
+        raise HTTPException(status_code=412, detail="Precondition failed.")
+
+
+async def dataset_validators(
+    collection_name: CollectionName, dataset_name: DatasetName
+) -> Optional[Validators]:
+    """Return the validators of a dataset or None if it does not exist.
+
+    Override this dependency to enable conditional requests for datasets.
+    """
+    return None
+
+
+async def collection_validators(
+    collection_name: CollectionName,
+) -> Optional[Validators]:
+    """Return the validators of a collection listing or None if unknown.
+
+    Override this dependency to enable conditional requests for listDatasets.
+    The entity tag of a listing should be weak, e.g., derived from the
+    collection's last modification and dataset count.
+    """
+    return None
+
+
+async def dataset_read_preconditions(
+    request: Request,
+    if_none_match: Optional[str] = Header(None, alias="If-None-Match"),
+    if_modified_since: Optional[str] = Header(None, alias="If-Modified-Since"),
+    validators: Optional[Validators] = Depends(dataset_validators),
+) -> Optional[Validators]:
+    """Respond with 304 in case that the client's copy of a dataset is current."""
+    _raise_for_preconditions(
+        request,
+        validators,
+        if_none_match=if_none_match,
+        if_modified_since=if_modified_since,
+    )
+    return validators
+
+
+async def dataset_write_preconditions(
+    request: Request,
+    if_match: Optional[str] = Header(None, alias="If-Match"),
+    validators: Optional[Validators] = Depends(dataset_validators),
+) -> Optional[Validators]:
+    """Respond with 412 in case that the dataset was modified concurrently."""
+    if if_match is not None:
+        _raise_for_preconditions(request, validators, if_match=if_match)
+    return validators
+
+
+async def collection_read_preconditions(
+    request: Request,
+    if_none_match: Optional[str] = Header(None, alias="If-None-Match"),
+    if_modified_since: Optional[str] = Header(None, alias="If-Modified-Since"),
+    validators: Optional[Validators] = Depends(collection_validators),
+) -> Optional[Validators]:
+    """Respond with 304 in case that the client's listing is current."""
+    _raise_for_preconditions(
+        request,
+        validators,
+        if_none_match=if_none_match,
+        if_modified_since=if_modified_since,
+    )
+    return validators
@@ -0,0 +1,411 @@
+"""DCAT metadata of collections and datasets as RDF triples.
+
+Collections are described as ``dcat:Catalog`` and datasets as ``dcat:Dataset``
+with a single ``dcat:Distribution`` that is downloaded from the getDataset
+operation.  Terms are represented in N-Triples syntax, i.e., IRIs as
+``<iri>`` and literals as ``"value"`` with optional datatype.
+
+Custom metadata (X-Object-Meta-* headers) is mapped to Dublin Core terms for
+well-known keys, e.g., ``title`` and ``description``, and to properties in the
+MarketPlace namespace otherwise.
+
+The triples are serialized incrementally as Turtle, JSON-LD, or N-Triples by a
+`DCATSerializer`, such that the metadata of large collections is streamed
+instead of rendered at once.  Rendered metadata is kept in a `DCATCache`,
+which is invalidated per collection by the operations that modify it.
+"""
+
+import json
+import re
+from collections import OrderedDict
+from datetime import datetime
+from typing import (
+    AsyncIterable,
+    AsyncIterator,
+    Dict,
+    Hashable,
+    Iterable,
+    Iterator,
+    List,
+    Optional,
+    Tuple,
+)
+from urllib.parse import quote
+
+from fastapi import FastAPI, HTTPException, Request
+
+from .models.object_storage import CollectionModel, DatasetModel, SemanticMappingModel
+from .streaming import accept_quality
+
+Triple = Tuple[str, str, str]
+
+RDF = "http://www.w3.org/1999/02/22-rdf-syntax-ns#"
+XSD = "http://www.w3.org/2001/XMLSchema#"
+DCAT = "http://www.w3.org/ns/dcat#"
+DCTERMS = "http://purl.org/dc/terms/"
+MARKETPLACE = "https://www.materials-marketplace.eu/ns#"
+
+DCTERMS_METADATA_KEYS = frozenset(
+    {
+        "creator",
+        "description",
+        "language",
+        "license",
+        "publisher",
+        "rights",
+        "subject",
+        "title",
+    }
+)
+
+_ESCAPES = str.maketrans(
+    {"\\": "\\\\", '"': '\\"', "\n": "\\n", "\r": "\\r", "\t": "\\t"}
+)
+
+
+def iri(value: str) -> str:
+    return f"<{value}>"
+
+
+def literal(value: object, datatype: Optional[str] = None) -> str:
+    text = f'"{str(value).translate(_ESCAPES)}"'
+    return f"{text}^^<{datatype}>" if datatype else text
+
+
+def _datetime(value: datetime) -> str:
+    return literal(value.isoformat(), XSD + "dateTime")
+
+
+TYPE = iri(RDF + "type")
+
+
+def collection_iri(base_iri: str, collection_name: str) -> str:
+    return iri(f"{base_iri.rstrip('/')}/data/{quote(collection_name, safe='')}")
+
+
+def dataset_iri(base_iri: str, collection_name: str, dataset_name: str) -> str:
+    return iri(
+        f"{base_iri.rstrip('/')}/data/{quote(collection_name, safe='')}"
+        f"/{quote(dataset_name, safe='')}"
+    )
+
+
+def _metadata_predicate(key: str) -> str:
+    if key.lower() in DCTERMS_METADATA_KEYS:
+        return iri(DCTERMS + key.lower())
+    return iri(MARKETPLACE + quote(key, safe=""))
+
+
+def _metadata_triples(subject: str, metadata: Dict[str, str]) -> Iterator[Triple]:
+    for key, value in metadata.items():
+        yield subject, _metadata_predicate(key), literal(value)
+
+
+def collection_triples(
+    base_iri: str, collection: CollectionModel, metadata: Dict[str, str]
+) -> Iterator[Triple]:
+    """Describe a collection as DCAT catalog, without its datasets."""
+    subject = collection_iri(base_iri, collection.name)
+    yield subject, TYPE, iri(DCAT + "Catalog")
+    yield subject, iri(DCTERMS + "identifier"), literal(collection.name)
+    if "title" not in {key.lower() for key in metadata}:
+        yield subject, iri(DCTERMS + "title"), literal(collection.name)
+    if collection.last_modified is not None:
+        yield subject, iri(DCTERMS + "modified"), _datetime(collection.last_modified)
+    yield from _metadata_triples(subject, metadata)
+
+
+def dataset_triples(
+    base_iri: str,
+    collection_name: str,
+    dataset: DatasetModel,
+    metadata: Dict[str, str],
+) -> Iterator[Triple]:
+    """Describe a dataset of a collection as DCAT dataset and distribution."""
+    subject = dataset_iri(base_iri, collection_name, dataset.name)
+    distribution = f"{subject[:-1]}#distribution>"
+    yield collection_iri(base_iri, collection_name), iri(DCAT + "dataset"), subject
+    yield subject, TYPE, iri(DCAT + "Dataset")
+    yield subject, iri(DCTERMS + "identifier"), literal(dataset.name)
+    if "title" not in {key.lower() for key in metadata}:
+        yield subject, iri(DCTERMS + "title"), literal(dataset.name)
+    if dataset.last_modified is not None:
+        yield subject, iri(DCTERMS + "modified"), _datetime(dataset.last_modified)
+    yield from _metadata_triples(subject, metadata)
+    yield subject, iri(DCAT + "distribution"), distribution
+    yield distribution, TYPE, iri(DCAT + "Distribution")
+    yield distribution, iri(DCAT + "downloadURL"), subject
+    if dataset.content_type:
+        yield distribution, iri(DCAT + "mediaType"), literal(dataset.content_type)
+    if dataset.bytes is not None:
+        yield distribution, iri(DCAT + "byteSize"), literal(
+            dataset.bytes, XSD + "nonNegativeInteger"
+        )
+    if dataset.hash:
+        yield distribution, iri(MARKETPLACE + "hash"), literal(dataset.hash)
+
+
+def semantic_mapping_triples(
+    subject: str, mapping: SemanticMappingModel
+) -> Iterator[Triple]:
+    """Describe the semantic mapping applied to the subject, e.g., a dataset.
+
+    Each property of the mapping is described by a node with the key-value
+    pairs of the property as MarketPlace properties.
+    """
+    name = quote(mapping.name, safe="")
+    for index, properties in enumerate(mapping.properties):
+        node = f"{subject[:-1]}#mapping-{name}-{index}>"
+        yield subject, iri(MARKETPLACE + "semanticMapping"), node
+        yield node, iri(MARKETPLACE + "mappingName"), literal(mapping.name)
+        for key, value in properties.items():
+            yield node, iri(MARKETPLACE + quote(key, safe="")), literal(value)
+
+
+# Serialization
+
+TURTLE = "text/turtle"
+JSON_LD = "application/ld+json"
+N_TRIPLES = "application/n-triples"
+
+MEDIA_TYPES = (TURTLE, JSON_LD, N_TRIPLES)
+
+PREFIXES = {
+    "rdf": RDF,
+    "xsd": XSD,
+    "dcat": DCAT,
+    "dct": DCTERMS,
+    "mp": MARKETPLACE,
+}
+
+_LITERAL = re.compile(r'^"(.*)"(?:\^\^<([^>]*)>|@([\w-]+))?$', re.S)
+
+_UNESCAPES = {"\\\\": "\\", '\\"': '"', "\\n": "\n", "\\r": "\r", "\\t": "\t"}
+
+_ESCAPED = re.compile(r'\\[\\"nrt]')
+
+_LOCAL_NAME = re.compile(r"^[A-Za-z_][\w-]*$")
+
+
+def negotiate(request: Request) -> str:
+    """Select the serialization preferred by the client, Turtle by default.
+
+    Responds with 406 (Not acceptable) if none of them is acceptable.
+    """
+    accept = request.headers.get("Accept")
+    if not accept:
+        return TURTLE
+    qualities = [
+        (accept_quality(accept, media_type), media_type) for media_type in MEDIA_TYPES
+    ]
+    quality, media_type = max(qualities, key=lambda item: item[0])
+    if quality <= 0:
+        raise HTTPException(status_code=406, detail="Not acceptable.")
+    return media_type
+
+
+def _unescape(text: str) -> str:
+    return _ESCAPED.sub(lambda match: _UNESCAPES[match.group()], text)
+
+
+def _compact(term: str) -> str:
+    """Abbreviate an IRI term with the known prefixes for Turtle."""
+    if term.startswith("<"):
+        value = term[1:-1]
+        for prefix, namespace in PREFIXES.items():
+            if value.startswith(namespace) and _LOCAL_NAME.match(
+                value[len(namespace) :]
+            ):
+                return f"{prefix}:{value[len(namespace):]}"
+        return term
+    match = _LITERAL.match(term)
+    if match and match.group(2):
+        return f'"{match.group(1)}"^^{_compact(f"<{match.group(2)}>")}'
+    return term
+
+
+def _json_ld_value(term: str) -> Dict[str, str]:
+    if term.startswith("<"):
+        return {"@id": term[1:-1]}
+    if term.startswith("_:"):
+        return {"@id": term}
+    match = _LITERAL.match(term)
+    if match is None:
+        raise ValueError(f"Invalid term: {term}")
+    value = {"@value": _unescape(match.group(1))}
+    if match.group(2):
+        value["@type"] = match.group(2)
+    elif match.group(3):
+        value["@language"] = match.group(3)
+    return value
+
+
+class DCATSerializer:
+    """Serialize triples incrementally in one of the `MEDIA_TYPES`.
+
+    Consecutive triples with the same subject are grouped, triples of the same
+    subject should hence be fed in sequence for compact output.
+    """
+
+    def __init__(self, media_type: str):
+        if media_type not in MEDIA_TYPES:
+            raise ValueError(f"Unsupported media type: {media_type}")
+        self.media_type = media_type
+        self._subject: Optional[str] = None
+        self._node: Dict[str, List[object]] = {}
+        self._nodes = 0
+
+    def start(self) -> str:
+        if self.media_type == TURTLE:
+            return "".join(
+                f"@prefix {prefix}: <{namespace}> .\n"
+                for prefix, namespace in PREFIXES.items()
+            )
+        if self.media_type == JSON_LD:
+            return "["
+        return ""
+
+    def feed(self, triple: Triple) -> str:
+        subject, predicate, object_ = triple
+        if self.media_type == N_TRIPLES:
+            return f"{subject} {predicate} {object_} .\n"
+        if self.media_type == TURTLE:
+            predicate = "a" if predicate == TYPE else _compact(predicate)
+            if subject == self._subject:
+                return f" ;\n    {predicate} {_compact(object_)}"
+            head = " .\n" if self._subject is not None else "\n"
+            self._subject = subject
+            return f"{head}{_compact(subject)} {predicate} {_compact(object_)}"
+        chunk = ""
+        if subject != self._subject:
+            chunk = self._flush()
+            self._subject = subject
+            self._node = {
+                "@id": [subject[1:-1] if subject.startswith("<") else subject]
+            }
+        if predicate == TYPE:
+            self._node.setdefault("@type", []).append(object_[1:-1])
+        else:
+            self._node.setdefault(predicate[1:-1], []).append(_json_ld_value(object_))
+        return chunk
+
+    def _flush(self) -> str:
+        if self._subject is None:
+            return ""
+        node = {
+            key: value[0] if key == "@id" else value
+            for key, value in self._node.items()
+        }
+        self._nodes += 1
+        return ("," if self._nodes > 1 else "") + "\n" + json.dumps(node)
+
+    def end(self) -> str:
+        if self.media_type == TURTLE:
+            return " .\n" if self._subject is not None else ""
+        if self.media_type == JSON_LD:
+            return self._flush() + "\n]\n"
+        return ""
+
+
+def serialize(triples: Iterable[Triple], media_type: str) -> bytes:
+    serializer = DCATSerializer(media_type)
+    chunks = [serializer.start()]
+    chunks += (serializer.feed(triple) for triple in triples)
+    chunks.append(serializer.end())
+    return "".join(chunks).encode()
+
+
+async def iter_serialized(
+    triples: AsyncIterable[Triple], media_type: str, chunk_size: int = 64 * 1024
+) -> AsyncIterator[bytes]:
+    """Serialize triples as they are produced, in chunks of about chunk_size."""
+    serializer = DCATSerializer(media_type)
+    buffer = [serializer.start()]
+    size = len(buffer[0])
+    async for triple in triples:
+        chunk = serializer.feed(triple)
+        buffer.append(chunk)
+        size += len(chunk)
+        if size >= chunk_size:
+            yield "".join(buffer).encode()
+            buffer, size = [], 0
+    buffer.append(serializer.end())
+    yield "".join(buffer).encode()
+
+
+# Caching
+
+
+class DCATCache:
+    """Cache of rendered DCAT metadata, keyed by the version of the collection.
+
+    The version of a collection is incremented by `invalidate`, such that
+    entries rendered before are no longer returned; they are evicted as least
+    recently used once the cache holds ``maxsize`` entries.  Entries larger
+    than ``max_entry_size`` bytes are not cached.
+    """
+
+    def __init__(self, maxsize: int = 1024, max_entry_size: int = 1024 * 1024):
+        self.maxsize = maxsize
+        self.max_entry_size = max_entry_size
+        self._versions: Dict[str, int] = {}
+        self._entries: "OrderedDict[Hashable, bytes]" = OrderedDict()
+        self.hits = 0
+        self.misses = 0
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def key(
+        self, collection_name: str, dataset_name: Optional[str], media_type: str
+    ) -> Hashable:
+        version = self._versions.get(collection_name, 0)
+        return collection_name, dataset_name, media_type, version
+
+    def get(self, key: Hashable) -> Optional[bytes]:
+        body = self._entries.get(key)
+        if body is None:
+            self.misses += 1
+            return None
+        self._entries.move_to_end(key)
+        self.hits += 1
+        return body
+
+    def put(self, key: Hashable, body: bytes) -> None:
+        if len(body) > self.max_entry_size:
+            return
+        self._entries[key] = body
+        self._entries.move_to_end(key)
+        while len(self._entries) > self.maxsize:
+            self._entries.popitem(last=False)
+
+    def invalidate(self, collection_name: str) -> None:
+        """Invalidate the metadata of the collection and its datasets."""
+        self._versions[collection_name] = self._versions.get(collection_name, 0) + 1
+
+    async def tee(
+        self, key: Hashable, chunks: AsyncIterable[bytes]
+    ) -> AsyncIterator[bytes]:
+        """Pass the chunks through and cache them once complete, if small."""
+        buffer: Optional[List[bytes]] = []
+        size = 0
+        async for chunk in chunks:
+            if buffer is not None:
+                size += len(chunk)
+                if size <= self.max_entry_size:
+                    buffer.append(chunk)
+                else:
+                    buffer = None
+            yield chunk
+        if buffer is not None:
+            self.put(key, b"".join(buffer))
+
+
+async def dcat_cache() -> Optional[DCATCache]:
+    """Return the configured DCAT metadata cache, None by default."""
+    return None
+
+
+def use_dcat_cache(app: FastAPI, cache: DCATCache) -> None:
+    """Cache the DCAT metadata served by the app."""
+    app.dependency_overrides[dcat_cache] = lambda: cache
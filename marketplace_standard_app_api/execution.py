@@ -0,0 +1,363 @@
+"""Execution of transformations in a bounded process pool.
+
+The transformation operations respond with 501 (Not implemented) unless an
+application provides a `TransformationExecutor`:
+
+    def simulate(parameters, stop_event):
+        for step in range(parameters["steps"]):
+            if stop_event.is_set():
+                return  # The transformation was stopped.
+            ...
+
+    use_transformation_executor(api, TransformationExecutor(simulate))
+
+The transformation function is executed in a separate process, it must hence be
+importable (defined on module level) and its parameters picklable.  Functions
+are expected to check the stop event periodically and return early once it is
+set; a running function can not be interrupted otherwise.
+
+Started transformations are queued and dispatched in the order of their
+priority (lower values first) and start, with at most ``max_concurrency``
+transformations executing at the same time.
+
+Transformations are kept in memory unless a persistent store is provided, see
+the `storage.transformations` module:
+
+    store = SQLiteTransformationStore("/var/lib/my-app/transformations.db")
+    use_transformation_executor(api, TransformationExecutor(simulate, store=store))
+
+Transformations that were running when the application was shut down are
+marked as FAILED when the executor is created.
+
+Clients can wait for state changes without polling, see `wait_for_state` and
+`watch`.
+"""
+
+import asyncio
+import itertools
+import logging
+import multiprocessing
+import threading
+from concurrent.futures import Executor, ProcessPoolExecutor
+from contextlib import contextmanager
+from typing import (
+    Any,
+    AsyncIterator,
+    Callable,
+    Dict,
+    Iterator,
+    List,
+    Optional,
+    Set,
+    Tuple,
+)
+from uuid import uuid4
+
+from fastapi import FastAPI
+from fastapi.concurrency import run_in_threadpool
+
+from .logs import ENTITY_ID
+from .models.transformation import (
+    TransformationId,
+    TransformationListResponse,
+    TransformationModel,
+    TransformationState,
+)
+from .storage.transformations import (
+    FINAL_STATES,
+    InMemoryTransformationStore,
+    StateTransition,
+    TransformationNotFound,
+    TransformationStore,
+)
+
+TransformationFunction = Callable[[dict, Any], None]
+
+logger = logging.getLogger(__name__)
+
+# State transitions that can be requested by the user.
+ALLOWED_TRANSITIONS = {
+    TransformationState.CREATED: {TransformationState.RUNNING},
+    TransformationState.RUNNING: {TransformationState.STOPPED},
+}
+
+
+class InvalidStateTransition(ValueError):
+    """The requested state can not be reached from the current state."""
+
+
+def _run(function: TransformationFunction, parameters: dict, stop_event: Any) -> None:
+    function(parameters, stop_event)
+
+
+class TransformationExecutor:
+    """Execute transformations in a process pool.
+
+    Args:
+        function: The transformation function, called with the parameters of
+            the transformation and an event that is set once it is stopped.
+        max_concurrency: The maximum number of concurrently executing
+            transformations, defaults to the number of CPUs.
+        executor: The pool in which the transformations are executed, defaults
+            to a process pool with ``max_concurrency`` processes.
+        store: The store of the transformations and their states, defaults to
+            an `InMemoryTransformationStore`.
+    """
+
+    def __init__(
+        self,
+        function: TransformationFunction,
+        max_concurrency: Optional[int] = None,
+        executor: Optional[Executor] = None,
+        store: Optional[TransformationStore] = None,
+    ):
+        self.function = function
+        self.max_concurrency = max_concurrency or multiprocessing.cpu_count()
+        self.store = store if store is not None else InMemoryTransformationStore()
+        self._executor = executor
+        self._manager: Optional[Any] = None
+        self._stop_events: Dict[TransformationId, Any] = {}
+        self._sequence = itertools.count()
+        self._queue: Optional[
+            "asyncio.PriorityQueue[Tuple[int, int, TransformationId]]"
+        ] = None
+        self._workers: List["asyncio.Task[None]"] = []
+        self._listeners: List[Callable[[StateTransition], None]] = []
+        # Queues of state changes per transformation, None once it is deleted.
+        self._subscribers: Dict[
+            TransformationId, Set["asyncio.Queue[Optional[TransformationState]]"]
+        ] = {}
+        self.running = 0
+        # Transformations interrupted by a restart can not be resumed.
+        for id in self.store.ids_in_state(TransformationState.RUNNING):
+            self.store.set_state(id, TransformationState.FAILED)
+
+    # Observation
+
+    def add_listener(self, listener: Callable[[StateTransition], None]) -> None:
+        """Call the listener for every state transition of a transformation."""
+        self._listeners.append(listener)
+
+    def _transition(self, id: TransformationId, state: TransformationState) -> None:
+        transition = self.store.set_state(id, state)
+        logger.info(
+            "Transformation %s is %s.", id, state.value, extra={ENTITY_ID: str(id)}
+        )
+        if state in FINAL_STATES:
+            self._stop_events.pop(id, None)
+        self._notify(transition)
+
+    def _notify(self, transition: StateTransition) -> None:
+        for queue in self._subscribers.get(transition.id, ()):
+            queue.put_nowait(transition.state)
+        for listener in self._listeners:
+            listener(transition)
+
+    @contextmanager
+    def _subscribe(
+        self, id: TransformationId
+    ) -> Iterator["asyncio.Queue[Optional[TransformationState]]"]:
+        queue: "asyncio.Queue[Optional[TransformationState]]" = asyncio.Queue()
+        self._subscribers.setdefault(id, set()).add(queue)
+        try:
+            yield queue
+        finally:
+            subscribers = self._subscribers[id]
+            subscribers.discard(queue)
+            if not subscribers:
+                del self._subscribers[id]
+
+    async def wait_for_state(
+        self,
+        id: TransformationId,
+        until: Callable[[TransformationState], bool],
+        timeout: float,
+    ) -> TransformationState:
+        """Wait up to ``timeout`` seconds for a state that satisfies ``until``.
+
+        Returns the state at the end of the wait, whether satisfying or not.
+        """
+        loop = asyncio.get_running_loop()
+        deadline = loop.time() + timeout
+        with self._subscribe(id) as queue:
+            state = self.get_state(id)
+            while not until(state):
+                try:
+                    next_state = await asyncio.wait_for(
+                        queue.get(), deadline - loop.time()
+                    )
+                except asyncio.TimeoutError:
+                    break
+                if next_state is None:
+                    raise TransformationNotFound(id)
+                state = next_state
+        return state
+
+    async def watch(self, id: TransformationId) -> AsyncIterator[TransformationState]:
+        """Iterate over the current and all following states of a transformation.
+
+        The iteration ends once a final state is reached or the transformation
+        is deleted.
+        """
+        with self._subscribe(id) as queue:
+            state: Optional[TransformationState] = self.get_state(id)
+            previous = None
+            while state is not None:
+                if state is not previous:
+                    yield state
+                if state in FINAL_STATES:
+                    break
+                previous, state = state, await queue.get()
+
+    @property
+    def queue_depth(self) -> int:
+        """The number of started transformations waiting for execution."""
+        return self._queue.qsize() if self._queue is not None else 0
+
+    # Transformation operations
+
+    def get(self, id: TransformationId) -> TransformationModel:
+        return self.store.get(id)
+
+    def get_state(self, id: TransformationId) -> TransformationState:
+        return self.store.get_state(id)
+
+    def transitions(self, id: TransformationId) -> List[StateTransition]:
+        return self.store.transitions(id)
+
+    async def list_transformations(
+        self, limit: int = 100, offset: int = 0, cursor: Optional[str] = None
+    ) -> TransformationListResponse:
+        """List transformations in the order of their creation."""
+        return await run_in_threadpool(self.store.list, limit, offset, cursor)
+
+    async def create(
+        self,
+        parameters: dict,
+        state: TransformationState = TransformationState.CREATED,
+        priority: int = 0,
+    ) -> TransformationId:
+        id = TransformationId(uuid4())
+        self._notify(await run_in_threadpool(self.store.add, id, parameters))
+        if state is TransformationState.RUNNING:
+            await self.update(id, state, priority=priority)
+        return id
+
+    async def update(
+        self, id: TransformationId, state: TransformationState, priority: int = 0
+    ) -> None:
+        """Request a state transition, i.e., start or stop a transformation."""
+        current = self.store.get_state(id)
+        if state not in ALLOWED_TRANSITIONS.get(current, set()):
+            raise InvalidStateTransition(f"{current.value} -> {state.value}")
+        if state is TransformationState.RUNNING:
+            self._stop_events[id] = self._create_event()
+            self._transition(id, TransformationState.RUNNING)
+            await self._enqueue(id, priority)
+        elif state is TransformationState.STOPPED:
+            stop_event = self._stop_events.get(id)
+            if stop_event is not None:
+                stop_event.set()
+            self._transition(id, TransformationState.STOPPED)
+
+    async def delete(self, id: TransformationId) -> None:
+        if self.store.get_state(id) is TransformationState.RUNNING:
+            await self.update(id, TransformationState.STOPPED)
+        await run_in_threadpool(self.store.delete, id)
+        for queue in self._subscribers.get(id, ()):
+            queue.put_nowait(None)
+
+    # Scheduling
+
+    def _get_executor(self) -> Executor:
+        if self._executor is None:
+            self._executor = ProcessPoolExecutor(max_workers=self.max_concurrency)
+        return self._executor
+
+    def _create_event(self) -> Any:
+        if isinstance(self._get_executor(), ProcessPoolExecutor):
+            # Plain multiprocessing events can not be passed to pool workers.
+            if self._manager is None:
+                self._manager = multiprocessing.Manager()
+            return self._manager.Event()
+        return threading.Event()
+
+    async def _enqueue(self, id: TransformationId, priority: int) -> None:
+        if self._queue is None:
+            self._queue = asyncio.PriorityQueue()
+            self._workers = [
+                asyncio.create_task(self._worker()) for _ in range(self.max_concurrency)
+            ]
+        await self._queue.put((priority, next(self._sequence), id))
+
+    def _is_stopped(self, id: TransformationId) -> bool:
+        try:
+            return self.store.get_state(id) is not TransformationState.RUNNING
+        except TransformationNotFound:
+            return True
+
+    async def _worker(self) -> None:
+        assert self._queue is not None
+        loop = asyncio.get_running_loop()
+        while True:
+            _, _, id = await self._queue.get()
+            try:
+                stop_event = self._stop_events.get(id)
+                if stop_event is None or self._is_stopped(id):
+                    continue  # Stopped or deleted while queued.
+                parameters = self.store.get(id).parameters
+                self.running += 1
+                try:
+                    await loop.run_in_executor(
+                        self._get_executor(),
+                        _run,
+                        self.function,
+                        parameters,
+                        stop_event,
+                    )
+                except Exception:
+                    logger.exception(
+                        "Transformation %s failed.", id, extra={ENTITY_ID: str(id)}
+                    )
+                    if not self._is_stopped(id):
+                        self._transition(id, TransformationState.FAILED)
+                else:
+                    if not self._is_stopped(id):
+                        self._transition(id, TransformationState.COMPLETED)
+                finally:
+                    self.running -= 1
+            finally:
+                self._queue.task_done()
+
+    async def join(self) -> None:
+        """Wait until all started transformations have finished."""
+        if self._queue is not None:
+            await self._queue.join()
+
+    async def close(self) -> None:
+        """Cancel the dispatch of queued transformations and shut down the pool."""
+        for worker in self._workers:
+            worker.cancel()
+        await asyncio.gather(*self._workers, return_exceptions=True)
+        self._workers, self._queue = [], None
+        if self._executor is not None:
+            self._executor.shutdown(wait=False)
+        if self._manager is not None:
+            self._manager.shutdown()
+            self._manager = None
+        self.store.close()
+
+
+async def transformation_executor() -> Optional[TransformationExecutor]:
+    """Return the configured transformation executor.
+
+    The default is None, in which case the transformation operations respond
+    with 501 (Not implemented).
+    """
+    return None
+
+
+def use_transformation_executor(app: FastAPI, executor: TransformationExecutor) -> None:
+    """Execute the transformations of the app with the executor."""
+    app.dependency_overrides[transformation_executor] = lambda: executor
+    app.router.on_shutdown.append(executor.close)
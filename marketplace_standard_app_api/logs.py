@@ -0,0 +1,531 @@
+"""Capture of application logs for the getLogs operation.
+
+The getLogs operation responds with 501 (Not implemented) unless an
+application provides a `LogStore`, which is a logging handler:
+
+    store = LogStore("/var/log/my-app")
+    logging.getLogger().addHandler(store)
+    use_log_store(api, store)
+
+Records are attributed to a transformation, collection or dataset by the
+``entity_id`` attribute, e.g., passed as extra or with `entity_logger`:
+
+    logger.info("Converged after %d steps.", steps, extra={"entity_id": id})
+    entity_logger(logger, f"{collection_name}/{dataset_name}").info("Imported.")
+
+The most recent ``capacity`` entries are kept in a ring buffer.  With a
+directory, all entries are appended to segment files of newline-delimited
+JSON as well, of which the oldest are removed once more than ``max_segments``
+exist.  Entries are numbered consecutively and indexed by entity id and
+timestamp in memory, such that the entries of an entity are looked up
+directly, from the ring buffer or with a seek into their segment, instead of
+scanning the log.  The index is rebuilt from the segments on startup.
+
+`LogStore.follow` waits for new entries, e.g., to tail the logs of a running
+transformation.
+"""
+
+import asyncio
+import json
+import logging
+import os
+from bisect import bisect_left, bisect_right
+from collections import deque
+from contextlib import contextmanager
+from datetime import datetime, timezone
+from itertools import chain
+from pathlib import Path
+from typing import (
+    IO,
+    AsyncIterator,
+    Callable,
+    Deque,
+    Dict,
+    Iterator,
+    List,
+    NamedTuple,
+    Optional,
+    Set,
+    Tuple,
+    Union,
+)
+
+from fastapi import FastAPI
+from fastapi.concurrency import run_in_threadpool
+
+from .models.system import LogEntryModel
+
+ENTITY_ID = "entity_id"
+
+SEGMENT_SUFFIX = ".log"
+
+# The (segment, offset) of an entry in the segment files.
+Position = Tuple[int, int]
+
+
+class LogEntry(NamedTuple):
+    sequence: int
+    timestamp: float
+    level: str
+    logger: str
+    entity_id: Optional[str]
+    message: str
+
+    def model(self) -> LogEntryModel:
+        return LogEntryModel(
+            sequence=self.sequence,
+            timestamp=datetime.fromtimestamp(self.timestamp, timezone.utc),
+            level=self.level,
+            logger=self.logger,
+            id=self.entity_id,
+            message=self.message,
+        )
+
+
+def entity_logger(logger: logging.Logger, entity_id: str) -> logging.LoggerAdapter:
+    """Return an adapter of the logger that attributes records to the entity."""
+    return logging.LoggerAdapter(logger, {ENTITY_ID: entity_id})
+
+
+class _EntityIndex:
+    """Sequence numbers, timestamps and positions of the entries of an entity."""
+
+    __slots__ = ("sequences", "timestamps", "positions")
+
+    def __init__(self) -> None:
+        self.sequences: List[int] = []
+        self.timestamps: List[float] = []
+        self.positions: List[Optional[Position]] = []
+
+    def append(self, entry: LogEntry, position: Optional[Position]) -> None:
+        self.sequences.append(entry.sequence)
+        self.timestamps.append(entry.timestamp)
+        self.positions.append(position)
+
+    def prune(self, first: int) -> None:
+        """Remove the entries before the given sequence number."""
+        end = bisect_left(self.sequences, first)
+        if end:
+            del self.sequences[:end], self.timestamps[:end], self.positions[:end]
+
+    def seek(self, after: Optional[int], since: Optional[float]) -> int:
+        start = 0 if after is None else bisect_right(self.sequences, after)
+        if since is not None:
+            start = max(start, bisect_left(self.timestamps, since))
+        return start
+
+
+def _encode(entry: LogEntry) -> bytes:
+    return json.dumps(entry, separators=(",", ":")).encode() + b"\n"
+
+
+def _decode(line: bytes) -> LogEntry:
+    return LogEntry(*json.loads(line))
+
+
+class _RangePlan(NamedTuple):
+    """The entries of a query without entity, see `LogStore._plan_range`."""
+
+    first: int
+    ring_start: int
+    # The segments to read the entries from first to ring_start from.
+    segments: List[int]
+    ring: List[LogEntry]
+
+
+class LogStore(logging.Handler):
+    """Logging handler that keeps the records for retrieval by entity.
+
+    Args:
+        directory: The directory of the segment files, entries are only kept
+            in memory if None.
+        capacity: The number of entries kept in memory.
+        segment_size: The size in bytes at which a new segment is started.
+        max_segments: The number of segments that are kept.
+        level: The minimum level of the stored records.
+    """
+
+    def __init__(
+        self,
+        directory: Union[str, "os.PathLike[str]", None] = None,
+        capacity: int = 10000,
+        segment_size: int = 4 * 1024 * 1024,
+        max_segments: int = 64,
+        level: int = logging.NOTSET,
+    ):
+        super().__init__(level)
+        self.directory = None if directory is None else Path(directory)
+        self.capacity = capacity
+        self.segment_size = segment_size
+        self.max_segments = max_segments
+        self._ring: Deque[LogEntry] = deque(maxlen=capacity)
+        self._index: Dict[str, _EntityIndex] = {}
+        self._next_sequence = 0
+        self._segments: List[int] = []
+        self._segment_starts: List[int] = []
+        self._segment_times: List[float] = []
+        self._file: Optional[IO[bytes]] = None
+        self._file_size = 0
+        self._waiters: Set[Tuple[asyncio.AbstractEventLoop, asyncio.Event]] = set()
+        if self.directory is not None:
+            self.directory.mkdir(parents=True, exist_ok=True)
+            self._load()
+
+    @contextmanager
+    def _locked(self) -> Iterator[None]:
+        """Hold the lock of the handler, which is also held while emitting."""
+        self.acquire()
+        try:
+            yield
+        finally:
+            self.release()
+
+    def _segment_path(self, segment: int) -> Path:
+        assert self.directory is not None
+        return self.directory / f"{segment:08d}{SEGMENT_SUFFIX}"
+
+    def _load(self) -> None:
+        """Rebuild the ring buffer and index from the segment files."""
+        assert self.directory is not None
+        segments = sorted(
+            int(path.stem)
+            for path in self.directory.glob("*" + SEGMENT_SUFFIX)
+            if path.stem.isdigit()
+        )
+        while len(segments) > self.max_segments:
+            self._segment_path(segments.pop(0)).unlink()
+        for segment in segments:
+            offset = 0
+            first: Optional[LogEntry] = None
+            with self._segment_path(segment).open("rb") as file:
+                for line in file:
+                    if not line.endswith(b"\n"):
+                        break  # Partially written when the application stopped.
+                    try:
+                        entry = _decode(line)
+                    except (ValueError, TypeError):
+                        offset += len(line)
+                        continue
+                    if first is None:
+                        first = entry
+                    self._add(entry, (segment, offset))
+                    self._next_sequence = entry.sequence + 1
+                    offset += len(line)
+            if first is None:
+                self._segment_path(segment).unlink()
+                continue
+            self._segments.append(segment)
+            self._segment_starts.append(first.sequence)
+            self._segment_times.append(first.timestamp)
+        if self._segments and self._segments[-1] == segments[-1]:
+            path = self._segment_path(self._segments[-1])
+            with path.open("r+b") as file:
+                file.truncate(offset)
+            self._file = path.open("ab")
+            self._file_size = offset
+
+    def emit(self, record: logging.LogRecord) -> None:
+        try:
+            entity_id = getattr(record, ENTITY_ID, None)
+            entry = LogEntry(
+                self._next_sequence,
+                record.created,
+                record.levelname,
+                record.name,
+                None if entity_id is None else str(entity_id),
+                self.format(record),
+            )
+            position = self._write(entry) if self.directory is not None else None
+            self._next_sequence += 1
+            self._add(entry, position)
+            if self.directory is None and entry.sequence % self.capacity == 0:
+                self._prune(self._ring[0].sequence)
+            for loop, event in self._waiters:
+                try:
+                    loop.call_soon_threadsafe(event.set)
+                except RuntimeError:
+                    pass  # The loop of the follower was closed.
+        except Exception:
+            self.handleError(record)
+
+    def _add(self, entry: LogEntry, position: Optional[Position]) -> None:
+        self._ring.append(entry)
+        if entry.entity_id is not None:
+            index = self._index.get(entry.entity_id)
+            if index is None:
+                index = self._index[entry.entity_id] = _EntityIndex()
+            index.append(entry, position)
+
+    def _prune(self, first: int) -> None:
+        """Remove the index entries before the given sequence number."""
+        for entity_id in list(self._index):
+            index = self._index[entity_id]
+            index.prune(first)
+            if not index.sequences:
+                del self._index[entity_id]
+
+    def _write(self, entry: LogEntry) -> Position:
+        if self._file is None or self._file_size >= self.segment_size:
+            self._rotate(entry)
+        assert self._file is not None
+        line = _encode(entry)
+        offset = self._file_size
+        self._file.write(line)
+        self._file.flush()
+        self._file_size += len(line)
+        return self._segments[-1], offset
+
+    def _rotate(self, entry: LogEntry) -> None:
+        if self._file is not None:
+            self._file.close()
+        segment = self._segments[-1] + 1 if self._segments else 0
+        self._file = self._segment_path(segment).open("ab")
+        self._file_size = 0
+        self._segments.append(segment)
+        self._segment_starts.append(entry.sequence)
+        self._segment_times.append(entry.timestamp)
+        if len(self._segments) > self.max_segments:
+            self._segment_path(self._segments[0]).unlink()
+            del self._segments[0], self._segment_starts[0], self._segment_times[0]
+            self._prune(self._segment_starts[0])
+
+    def close(self) -> None:
+        with self._locked():
+            if self._file is not None:
+                self._file.close()
+                self._file = None
+        super().close()
+
+    # Retrieval
+    #
+    # Queries look the entries up under the lock, but read the segment files
+    # after releasing it, such that a query does not block logging.  Segments
+    # are only appended to, and entries before the ring buffer were written
+    # completely, so they are read consistently without the lock; a segment
+    # removed in the meantime only held entries that are no longer retained.
+
+    def _first_sequence(self) -> int:
+        """Return the sequence number of the oldest available entry."""
+        if self._segment_starts:
+            return self._segment_starts[0]
+        return self._ring[0].sequence if self._ring else self._next_sequence
+
+    def _from_ring(self, sequence: int) -> Optional[LogEntry]:
+        if self._ring and sequence >= self._ring[0].sequence:
+            return self._ring[sequence - self._ring[0].sequence]
+        return None
+
+    def _iter_segment(self, segment: int) -> Iterator[LogEntry]:
+        try:
+            file = self._segment_path(segment).open("rb")
+        except FileNotFoundError:
+            return
+        with file:
+            for line in file:
+                if not line.endswith(b"\n"):
+                    break
+                try:
+                    yield _decode(line)
+                except (ValueError, TypeError):
+                    continue
+
+    def _plan_range(self, first: int, limit: int) -> _RangePlan:
+        """Plan the retrieval of up to limit entries from sequence first on."""
+        first = max(first, self._first_sequence())
+        ring_start = self._ring[0].sequence if self._ring else self._next_sequence
+        segments: List[int] = []
+        if first < ring_start:
+            segment_index = max(bisect_right(self._segment_starts, first) - 1, 0)
+            segments = self._segments[segment_index:]
+        ring_first = max(first, ring_start)
+        ring_end = min(ring_first + limit, self._next_sequence)
+        ring = [
+            self._ring[sequence - ring_start]
+            for sequence in range(ring_first, ring_end)
+        ]
+        return _RangePlan(first, ring_start, segments, ring)
+
+    def _read_range(self, plan: _RangePlan, limit: int) -> List[LogEntry]:
+        """Return the entries of the plan, reading the segments without the lock."""
+        entries: List[LogEntry] = []
+        for entry in chain.from_iterable(map(self._iter_segment, plan.segments)):
+            if len(entries) >= limit or entry.sequence >= plan.ring_start:
+                break
+            if entry.sequence >= plan.first:
+                entries.append(entry)
+        entries.extend(plan.ring[: limit - len(entries)])
+        return entries
+
+    def _seek_time(self, since: float) -> Union[int, Tuple[int, int]]:
+        """Return the sequence number of the first entry from since on.
+
+        If the entry left the ring buffer, the segment to scan for it with
+        `_scan_time` and the sequence number following the segment are
+        returned instead.
+        """
+        if self._ring and self._ring[0].timestamp <= since:
+            low, high = 0, len(self._ring)
+            while low < high:
+                middle = (low + high) // 2
+                if self._ring[middle].timestamp < since:
+                    low = middle + 1
+                else:
+                    high = middle
+            return self._ring[0].sequence + low
+        segment_index = max(bisect_right(self._segment_times, since) - 1, 0)
+        if segment_index < len(self._segments):
+            if segment_index + 1 < len(self._segments):
+                end = self._segment_starts[segment_index + 1]
+            else:
+                end = self._ring[0].sequence if self._ring else self._next_sequence
+            return self._segments[segment_index], end
+        return self._first_sequence()
+
+    def _scan_time(self, since: float, segment: int, end: int) -> int:
+        for entry in self._iter_segment(segment):
+            if entry.sequence >= end:
+                break
+            if entry.timestamp >= since:
+                return entry.sequence
+        return end
+
+    def _locate(
+        self, sequences: List[int], positions: List[Optional[Position]]
+    ) -> List[Union[LogEntry, Position]]:
+        """Return the entries in the ring buffer, the positions of the others."""
+        located: List[Union[LogEntry, Position]] = []
+        for sequence, position in zip(sequences, positions):
+            entry = self._from_ring(sequence)
+            if entry is not None:
+                located.append(entry)
+            elif position is not None:
+                located.append(position)
+        return located
+
+    def _read_positions(
+        self, located: List[Union[LogEntry, Position]]
+    ) -> List[LogEntry]:
+        entries: List[LogEntry] = []
+        files: Dict[int, Optional[IO[bytes]]] = {}
+        try:
+            for item in located:
+                if isinstance(item, LogEntry):
+                    entries.append(item)
+                    continue
+                segment, offset = item
+                if segment not in files:
+                    try:
+                        files[segment] = self._segment_path(segment).open("rb")
+                    except FileNotFoundError:
+                        files[segment] = None
+                file = files[segment]
+                if file is not None:
+                    file.seek(offset)
+                    entries.append(_decode(file.readline()))
+        finally:
+            for file in files.values():
+                if file is not None:
+                    file.close()
+        return entries
+
+    def query(
+        self,
+        entity_id: Optional[str] = None,
+        after: Optional[int] = None,
+        since: Optional[float] = None,
+        limit: int = 100,
+        offset: int = 0,
+    ) -> List[LogEntry]:
+        """Return the entries in the order they were logged.
+
+        The segment files are read, so call it from a worker thread in async
+        code.
+
+        Args:
+            entity_id: Only return entries of this entity.
+            after: Only return entries after this sequence number.
+            since: Only return entries logged at or after this timestamp.
+            limit: The maximum number of entries.
+            offset: The number of matching entries to skip.
+        """
+        if entity_id is None:
+            return self._query_range(after, since, limit, offset)
+        with self._locked():
+            index = self._index.get(entity_id)
+            if index is None:
+                return []
+            start = index.seek(after, since)
+            if self.directory is None and self._ring:
+                # Entries that left the ring buffer are only pruned lazily.
+                start = max(start, bisect_left(index.sequences, self._ring[0].sequence))
+            start += offset
+            located = self._locate(
+                index.sequences[start : start + limit],
+                index.positions[start : start + limit],
+            )
+        return self._read_positions(located)
+
+    def _query_range(
+        self, after: Optional[int], since: Optional[float], limit: int, offset: int
+    ) -> List[LogEntry]:
+        first = -1 if after is None else after + 1
+        if since is not None:
+            with self._locked():
+                seek = self._seek_time(since)
+            if isinstance(seek, tuple):
+                seek = self._scan_time(since, *seek)
+            first = max(first, seek)
+        with self._locked():
+            # Entries are numbered consecutively, so the offset is added once
+            # first is clamped to the retained entries.
+            first = max(first, self._first_sequence()) + offset
+            plan = self._plan_range(first, limit)
+        return self._read_range(plan, limit)
+
+    async def follow(
+        self,
+        entity_id: Optional[str] = None,
+        after: Optional[int] = None,
+        since: Optional[float] = None,
+        until: Optional[Callable[[], bool]] = None,
+    ) -> AsyncIterator[LogEntry]:
+        """Iterate over the entries and wait for new ones.
+
+        The iteration ends once ``until`` returns True after all entries
+        logged so far were returned, otherwise it continues until cancelled.
+        """
+        waiter = (asyncio.get_running_loop(), asyncio.Event())
+        with self._locked():
+            self._waiters.add(waiter)
+        try:
+            while True:
+                waiter[1].clear()
+                entries = await run_in_threadpool(
+                    self.query, entity_id, after, since, limit=1000
+                )
+                for entry in entries:
+                    yield entry
+                if entries:
+                    after, since = entries[-1].sequence, None
+                    continue
+                if until is not None and until():
+                    return
+                await waiter[1].wait()
+        finally:
+            with self._locked():
+                self._waiters.discard(waiter)
+
+
+async def log_store() -> Optional[LogStore]:
+    """Return the configured log store.
+
+    The default is None, in which case the getLogs operation responds with
+    501 (Not implemented).
+    """
+    return None
+
+
+def use_log_store(app: FastAPI, store: LogStore) -> None:
+    """Serve the logs of the app from the store."""
+    app.dependency_overrides[log_store] = lambda: store
+    app.router.on_shutdown.append(store.close)
@@ -1,13 +1,72 @@
-from typing import Any, Callable, Dict
+"""The MarketPlace application and the factory of customized applications.
+
+The application with all routers is created on first access of `api`, such
+that importing this module does not import the routers, their models or
+requests:
+
+    from marketplace_standard_app_api.main import api
+
+Applications that only implement some of the operations mount only those
+routers, e.g.:
+
+    api = create_app(features=["system", "object_storage"])
+
+The `api` serves the openapi.json shipped with the package instead of
+generating the schema at runtime, as long as it was written for the same
+routes.  It is written with `python -m marketplace_standard_app_api show
+--artifact`.
+"""
+
+import gzip
+import hashlib
+import json
+import logging
+import os
+import sys
+from enum import Enum
+from importlib import import_module
+from pathlib import Path
+from typing import (
+    Any,
+    Callable,
+    Dict,
+    Iterable,
+    List,
+    Optional,
+    Set,
+    Tuple,
+    Union,
+    get_args,
+    get_origin,
+)
 
-import requests
 from fastapi import Depends, FastAPI, Request
+from fastapi.dependencies.utils import get_flat_dependant
+from fastapi.openapi.utils import get_openapi
 from fastapi.responses import Response
+from fastapi.routing import APIRoute
+from pydantic import BaseModel
+from pydantic.fields import ModelField
 
-from .routers import frontend, object_storage, system, transformation
 from .security import AuthTokenBearer
 from .version import __version__
 
+logger = logging.getLogger(__name__)
+
+# The key of the route table hash in the info of the OpenAPI schema.
+ROUTE_TABLE_HASH = "x-route-table-hash"
+
+# The schema written by the show command, shipped as data of the package.
+OPENAPI_ARTIFACT = Path(__file__).resolve().parent / "openapi.json"
+
+# The modules of the routers by feature, in the order they are mounted.
+FEATURES = {
+    "frontend": ".routers.frontend",
+    "system": ".routers.system",
+    "object_storage": ".routers.object_storage",
+    "transformation": ".routers.transformation",
+}
+
 
 async def catch_authentication_request_errors_middleware(
     request: Request, call_next: Callable
@@ -15,40 +74,281 @@ async def catch_authentication_request_errors_middleware(
     "Catch authentication requests errors to the semantic service and respond with 401."
     try:
         return await call_next(request)
-    except requests.exceptions.HTTPError as error:
-        if error.response.status_code == 401:
+    except Exception as error:
+        # Errors of requests can only occur once it was imported.
+        requests = sys.modules.get("requests")
+        if (
+            requests is not None
+            and isinstance(error, requests.exceptions.HTTPError)
+            and error.response is not None
+            and error.response.status_code == 401
+        ):
             return Response("Not authenticated.", status_code=401)
         raise
 
 
+def _route_params(route: APIRoute) -> List[ModelField]:
+    # The parameters of the endpoint and of its dependencies.
+    dependant = get_flat_dependant(route.dependant, skip_repeats=True)
+    return [
+        *dependant.path_params,
+        *dependant.query_params,
+        *dependant.header_params,
+        *dependant.cookie_params,
+        *dependant.body_params,
+    ]
+
+
+# The attributes of the constrained types of pydantic, e.g., of `conint`.
+_CONSTRAINTS = (
+    "gt",
+    "ge",
+    "lt",
+    "le",
+    "multiple_of",
+    "min_length",
+    "max_length",
+    "min_items",
+    "max_items",
+    "regex",
+    "strict",
+    "max_digits",
+    "decimal_places",
+)
+
+
+def _signature(value: Any, seen: Optional[Set[type]] = None) -> Any:
+    """Return a representation of the value for the route table hash.
+
+    Types are described by their names and structure, which, unlike their
+    `repr`, does not depend on the Python version or on the process.
+    """
+    seen = set() if seen is None else seen
+    if value is None or value is type(None):
+        return None
+    if isinstance(value, (str, int, float, bool)):
+        return value
+    if isinstance(value, (list, tuple)):
+        return [_signature(item, seen) for item in value]
+    if isinstance(value, dict):
+        return sorted([str(key), _signature(item, seen)] for key, item in value.items())
+    if hasattr(value, "__supertype__"):  # NewType
+        return [value.__name__, _signature(value.__supertype__, seen)]
+    origin = get_origin(value)
+    if origin is not None:
+        return [_signature(origin, seen), _signature(get_args(value), seen)]
+    if not isinstance(value, type):
+        return repr(value)
+    name = f"{value.__module__}.{value.__qualname__}"
+    if issubclass(value, BaseModel):
+        # Models are described once, which also ends recursive models.
+        if value in seen:
+            return name
+        seen.add(value)
+        return [
+            name,
+            [_field_signature(field, seen) for field in value.__fields__.values()],
+        ]
+    if issubclass(value, Enum):
+        return [name, [_signature(member.value, seen) for member in value]]
+    constraints = {key: getattr(value, key, None) for key in _CONSTRAINTS}
+    return [
+        name,
+        _signature(
+            {key: item for key, item in constraints.items() if item is not None}, seen
+        ),
+    ]
+
+
+def _field_signature(field: ModelField, seen: Set[type]) -> Any:
+    # The constraints, e.g., `ge`, are part of the field info or the type.
+    return [
+        field.name,
+        field.alias,
+        field.required,
+        _signature(field.outer_type_, seen),
+        type(field.field_info).__name__,
+        _signature(dict(field.field_info.__repr_args__()), seen),
+    ]
+
+
 class MarketPlaceAPI(FastAPI):
-    def openapi(self) -> Dict[str, Any]:
-        openapi_schema = super().openapi()
+    """FastAPI application that serves a precomputed OpenAPI schema.
+
+    Args:
+        openapi_artifact: The path of a schema written by the show command.
+            It is served instead of generating the schema, unless its route
+            table hash differs from the one of the application's routes.
+    """
+
+    def __init__(
+        self,
+        *,
+        openapi_artifact: Union[str, "os.PathLike[str]", None] = None,
+        **kwargs: Any,
+    ) -> None:
+        self.openapi_artifact = openapi_artifact
+        self._openapi_document: Optional[Tuple[bytes, bytes, str]] = None
+        super().__init__(**kwargs)
+
+    def setup(self) -> None:
+        if self.openapi_url:
+            # Shadows the route of the same path that FastAPI adds.
+            self.add_route(
+                self.openapi_url, self.openapi_response, include_in_schema=False
+            )
+        super().setup()
+
+    def route_table_hash(self) -> str:
+        """Return a hash of the routes as far as they define the schema."""
+        routes = [
+            [
+                route.path,
+                sorted(route.methods),
+                route.operation_id,
+                route.summary,
+                route.description,
+                route.response_description,
+                route.status_code,
+                route.deprecated,
+                [str(tag) for tag in route.tags],
+                f"{route.endpoint.__module__}.{route.endpoint.__qualname__}",
+                [_field_signature(param, set()) for param in _route_params(route)],
+                _signature(route.response_model),
+                _signature(route.responses),
+                _signature(route.openapi_extra),
+            ]
+            for route in self.routes
+            if isinstance(route, APIRoute) and route.include_in_schema
+        ]
+        data = json.dumps([self.title, self.version, self.description, routes])
+        return hashlib.sha256(data.encode()).hexdigest()
+
+    def generate_openapi(self) -> Dict[str, Any]:
+        """Generate the OpenAPI schema from the routes."""
+        openapi_schema = get_openapi(
+            title=self.title,
+            version=self.version,
+            openapi_version=self.openapi_version,
+            description=self.description,
+            terms_of_service=self.terms_of_service,
+            contact=self.contact,
+            license_info=self.license_info,
+            routes=self.routes,
+            tags=self.openapi_tags,
+            servers=self.servers,
+        )
+        openapi_schema["info"][ROUTE_TABLE_HASH] = self.route_table_hash()
         # Example on how to add extra info to the OpenAPI schema:
         # openapi_schema["info"]["x-application-name"] = "My MarketPlace App"
         return openapi_schema
 
+    def _load_openapi_artifact(self) -> Optional[Dict[str, Any]]:
+        if self.openapi_artifact is None:
+            return None
+        try:
+            with open(self.openapi_artifact, encoding="utf-8") as file:
+                openapi_schema = json.load(file)
+        except (OSError, ValueError):
+            return None
+        info = (
+            openapi_schema.get("info", {}) if isinstance(openapi_schema, dict) else {}
+        )
+        if info.get(ROUTE_TABLE_HASH) != self.route_table_hash():
+            logger.warning(
+                "Ignoring %s, it does not match the routes.", self.openapi_artifact
+            )
+            return None
+        return openapi_schema
+
+    def openapi(self) -> Dict[str, Any]:
+        if not self.openapi_schema:
+            self.openapi_schema = (
+                self._load_openapi_artifact() or self.generate_openapi()
+            )
+        return self.openapi_schema
+
+    async def openapi_response(self, request: Request) -> Response:
+        """Respond with the schema, which is serialized and compressed once."""
+        from .compression import select_encoding
+        from .conditional import etag_matches, make_etag
+
+        if self._openapi_document is None:
+            body = json.dumps(self.openapi(), separators=(",", ":")).encode()
+            etag = make_etag(hashlib.sha256(body).hexdigest()[:32])
+            self._openapi_document = body, gzip.compress(body, mtime=0), etag
+        body, compressed, etag = self._openapi_document
+        headers = {"ETag": etag, "Vary": "Accept-Encoding"}
+        if etag_matches(request.headers.get("If-None-Match", ""), etag):
+            return Response(status_code=304, headers=headers)
+        if select_encoding(request.headers.get("Accept-Encoding", ""), ["gzip"]):
+            headers["Content-Encoding"] = "gzip"
+            body = compressed
+        return Response(body, media_type="application/json", headers=headers)
+
+
+# Call `auth_token_bearer.use_validator()` to validate the bearer tokens.
+auth_token_bearer = AuthTokenBearer()
+
+
+def create_app(
+    features: Optional[Iterable[str]] = None,
+    auth: AuthTokenBearer = auth_token_bearer,
+    openapi_artifact: Union[str, "os.PathLike[str]", None] = None,
+) -> MarketPlaceAPI:
+    """Create an application that mounts the routers of the given features.
+
+    Args:
+        features: The features of `FEATURES` the application implements,
+            all by default.
+        auth: The bearer token authentication of the application.
+        openapi_artifact: The path of a precomputed OpenAPI schema, see
+            `MarketPlaceAPI`.
+    """
+    # Imported here, such that only applications that are created pay for it.
+    from .compression import CompressionMiddleware
+    from .metrics import Metrics, token_cache_metrics, use_metrics
+
+    selected = set(FEATURES if features is None else features)
+    unknown = selected.difference(FEATURES)
+    if unknown:
+        raise ValueError(f"Unknown features: {', '.join(sorted(unknown))}.")
+
+    app = MarketPlaceAPI(
+        title="MarketPlace Standard App API",
+        description="Standard app API for the MarketPlace applications.",
+        version=__version__,
+        contact={
+            "name": "The Materials MarketPlace Consortium",
+            "url": "https://www.materials-marketplace.eu/",
+            "email": "dirk.helm@iwm.fraunhofer.de",
+        },
+        license_info={"name": "MIT", "url": "https://opensource.org/licenses/MIT"},
+        openapi_artifact=openapi_artifact,
+        dependencies=[Depends(auth)],
+        responses={
+            401: {"description": "Not authenticated."},
+            500: {"description": "Internal server error."},
+            503: {"description": "Service unavailable."},
+        },
+    )
+    app.middleware("http")(catch_authentication_request_errors_middleware)
+    # Added before the compression, such that the metrics see the routed scope.
+    metrics = Metrics()
+    metrics.add_collector(lambda: token_cache_metrics(auth.cache))
+    use_metrics(app, metrics)
+    # Compress responses for clients that accept it and decompress uploads.
+    app.add_middleware(CompressionMiddleware)
+
+    for feature, module in FEATURES.items():
+        if feature in selected:
+            app.include_router(import_module(module, __package__).router)
+    return app
 
-api = MarketPlaceAPI(
-    title="MarketPlace Standard App API",
-    description="Standard app API for the MarketPlace applications.",
-    version=__version__,
-    contact={
-        "name": "The Materials MarketPlace Consortium",
-        "url": "https://www.materials-marketplace.eu/",
-        "email": "dirk.helm@iwm.fraunhofer.de",
-    },
-    license_info={"name": "MIT", "url": "https://opensource.org/licenses/MIT"},
-    dependencies=[Depends(AuthTokenBearer())],
-    responses={
-        401: {"description": "Not authenticated."},
-        500: {"description": "Internal server error."},
-        503: {"description": "Service unavailable."},
-    },
-)
-api.middleware("http")(catch_authentication_request_errors_middleware)
 
-api.include_router(frontend.router)
-api.include_router(system.router)
-api.include_router(object_storage.router)
-api.include_router(transformation.router)
+def __getattr__(name: str) -> Any:
+    # Create the application with all routers on first access.
+    if name == "api":
+        api = globals()["api"] = create_app(openapi_artifact=OPENAPI_ARTIFACT)
+        return api
+    raise AttributeError(f"module {__name__!r} has no attribute {name!r}")
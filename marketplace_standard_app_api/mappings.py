@@ -0,0 +1,233 @@
+"""Registry of semantic mappings for the semanticMappings operations.
+
+The semanticMappings operations respond with 501 (Not implemented) unless an
+application provides a `SemanticMappingRegistry`:
+
+    registry = SemanticMappingRegistry()
+    registry.add(
+        SemanticMappingModel(
+            name="tensile-test",
+            properties=[
+                {"source": "E", "target": "https://example.org/ns#YoungsModulus"},
+                {"source": "Rm", "target": "https://example.org/ns#TensileStrength"},
+            ],
+        )
+    )
+    use_semantic_mapping_registry(api, registry)
+
+Each property of a mapping maps the ``source`` key of a record to the
+``target`` property, other entries of the property are kept as annotations.
+Mappings are compiled once into a hashed lookup table from source keys to
+targets; compiled mappings are cached with least recently used eviction.
+Records are translated with `CompiledMapping.apply`, or in bulk with
+`CompiledMapping.apply_all`, which resolves the keys of records with the same
+keys only once.
+"""
+
+from bisect import bisect_left, insort
+from collections import OrderedDict
+from operator import itemgetter
+from typing import Any, Callable, Dict, Iterable, Iterator, List, Optional, Tuple
+
+from fastapi import FastAPI
+
+from .models.object_storage import SemanticMappingModel, SemanticMappingName
+from .pagination import page_bounds
+
+Record = Dict[str, Any]
+
+SOURCE = "source"
+TARGET = "target"
+
+
+class InvalidMapping(ValueError):
+    """The properties of a semantic mapping are invalid."""
+
+
+class MappingNotFound(KeyError):
+    """The semantic mapping does not exist."""
+
+
+class CompiledMapping:
+    """Translation of records according to a semantic mapping.
+
+    Args:
+        mapping: The mapping, each property must have a source and target.
+        keep_unmapped: Whether keys without property are kept as they are,
+            otherwise they are dropped.
+    """
+
+    def __init__(self, mapping: SemanticMappingModel, keep_unmapped: bool = False):
+        self.name = mapping.name
+        self.keep_unmapped = keep_unmapped
+        self.targets: Dict[str, str] = {}
+        self.annotations: Dict[str, Dict[str, str]] = {}
+        for index, properties in enumerate(mapping.properties):
+            source = properties.get(SOURCE)
+            target = properties.get(TARGET)
+            if not source or not target:
+                raise InvalidMapping(
+                    f"Property {index} of {mapping.name!r} lacks {SOURCE} or {TARGET}."
+                )
+            if source in self.targets:
+                raise InvalidMapping(
+                    f"Source {source!r} is mapped twice by {mapping.name!r}."
+                )
+            self.targets[source] = target
+            self.annotations[target] = {
+                key: value
+                for key, value in properties.items()
+                if key not in (SOURCE, TARGET)
+            }
+        self._plans: Dict[Tuple[str, ...], Callable[[Record], Record]] = {}
+
+    def __len__(self) -> int:
+        return len(self.targets)
+
+    def lookup(self, source: str) -> Optional[str]:
+        """Return the target property of the source key, if mapped."""
+        return self.targets.get(source)
+
+    def apply(self, record: Record) -> Record:
+        """Translate the keys of the record to their target properties."""
+        if self.keep_unmapped:
+            return {self.targets.get(key, key): value for key, value in record.items()}
+        return {
+            self.targets[key]: value
+            for key, value in record.items()
+            if key in self.targets
+        }
+
+    def _plan(self, keys: Tuple[str, ...]) -> Callable[[Record], Record]:
+        """Return the translation of records with exactly the given keys."""
+        cached = self._plans.get(keys)
+        if cached is not None:
+            return cached
+        if self.keep_unmapped:
+            sources = keys
+        else:
+            sources = tuple(key for key in keys if key in self.targets)
+        targets = tuple(self.targets.get(key, key) for key in sources)
+        if not sources:
+
+            def plan(record: Record) -> Record:
+                return {}
+
+        elif len(sources) == 1:
+            source, target = sources[0], targets[0]
+
+            def plan(record: Record) -> Record:
+                return {target: record[source]}
+
+        else:
+            getter = itemgetter(*sources)
+
+            def plan(record: Record) -> Record:
+                return dict(zip(targets, getter(record)))
+
+        if len(self._plans) < 1024:
+            self._plans[keys] = plan
+        return plan
+
+    def apply_all(self, records: Iterable[Record]) -> Iterator[Record]:
+        """Translate the records lazily.
+
+        Records of a dataset usually share their keys, the targets of each
+        distinct set of keys are resolved once and the values of the records
+        are then fetched together.
+        """
+        keys: Optional[Tuple[str, ...]] = None
+        plan: Callable[[Record], Record] = self.apply
+        for record in records:
+            if keys is None or len(record) != len(keys) or tuple(record) != keys:
+                keys = tuple(record)
+                plan = self._plan(keys)
+            yield plan(record)
+
+
+class SemanticMappingRegistry:
+    """Semantic mappings by name, with a cache of their compiled form.
+
+    Args:
+        maxsize: The number of compiled mappings that are cached.
+    """
+
+    def __init__(self, maxsize: int = 128):
+        self.maxsize = maxsize
+        self._mappings: Dict[str, SemanticMappingModel] = {}
+        self._names: List[SemanticMappingName] = []
+        self._compiled: "OrderedDict[Tuple[str, bool], CompiledMapping]" = OrderedDict()
+
+    def __len__(self) -> int:
+        return len(self._mappings)
+
+    def __contains__(self, name: object) -> bool:
+        return name in self._mappings
+
+    def add(self, mapping: SemanticMappingModel) -> None:
+        """Add or replace the mapping, after validating its properties."""
+        compiled = CompiledMapping(mapping)
+        self.remove(mapping.name)
+        self._mappings[mapping.name] = mapping
+        insort(self._names, mapping.name)
+        self._cache((mapping.name, False), compiled)
+
+    def remove(self, name: str) -> None:
+        """Remove the mapping with the given name, if present."""
+        if self._mappings.pop(name, None) is None:
+            return
+        del self._names[bisect_left(self._names, name)]
+        for key in [key for key in self._compiled if key[0] == name]:
+            del self._compiled[key]
+
+    def get(self, name: str) -> SemanticMappingModel:
+        try:
+            return self._mappings[name]
+        except KeyError:
+            raise MappingNotFound(name)
+
+    def names(
+        self, limit: int = 100, offset: int = 0, after: Optional[str] = None
+    ) -> List[SemanticMappingName]:
+        """Return a page of the mapping names in ascending order."""
+        start, end = page_bounds(self._names, after, limit, offset)
+        return self._names[start:end]
+
+    def _cache(self, key: Tuple[str, bool], compiled: CompiledMapping) -> None:
+        self._compiled[key] = compiled
+        self._compiled.move_to_end(key)
+        while len(self._compiled) > self.maxsize:
+            self._compiled.popitem(last=False)
+
+    def compile(self, name: str, keep_unmapped: bool = False) -> CompiledMapping:
+        """Return the compiled mapping with the given name."""
+        key = (name, keep_unmapped)
+        compiled = self._compiled.get(key)
+        if compiled is not None:
+            self._compiled.move_to_end(key)
+            return compiled
+        compiled = CompiledMapping(self.get(name), keep_unmapped)
+        self._cache(key, compiled)
+        return compiled
+
+    def apply(
+        self, name: str, records: Iterable[Record], keep_unmapped: bool = False
+    ) -> List[Record]:
+        """Translate the records with the mapping of the given name."""
+        return list(self.compile(name, keep_unmapped).apply_all(records))
+
+
+async def semantic_mapping_registry() -> Optional[SemanticMappingRegistry]:
+    """Return the configured semantic mapping registry.
+
+    The default is None, in which case the semanticMappings operations
+    respond with 501 (Not implemented).
+    """
+    return None
+
+
+def use_semantic_mapping_registry(
+    app: FastAPI, registry: SemanticMappingRegistry
+) -> None:
+    """Serve the semantic mappings of the app from the registry."""
+    app.dependency_overrides[semantic_mapping_registry] = lambda: registry
@@ -0,0 +1,327 @@
+"""Operational metrics in the Prometheus text exposition format.
+
+The getMetrics operation responds with 501 (Not implemented) unless an
+application collects metrics:
+
+    metrics = Metrics()
+    use_metrics(api, metrics)
+
+The `MetricsMiddleware` installed by `use_metrics` records for every
+operation the number of requests by method and status code, a histogram of
+their latencies, and the number of bytes received and sent; the number of
+requests in flight is recorded over all operations.  Requests are counted on
+the event loop thread only, plain integers are hence sufficient and no locks
+are taken while handling requests.
+
+Metrics of other components are gathered when the metrics are scraped,
+either by registered collectors, e.g., for the token validation cache:
+
+    metrics.add_collector(lambda: token_cache_metrics(auth_token_bearer.cache))
+
+or from the transformation executor and DCAT cache of the app.
+"""
+
+import time
+from bisect import bisect_left
+from typing import (
+    Any,
+    Callable,
+    Dict,
+    Iterable,
+    List,
+    NamedTuple,
+    Optional,
+    Sequence,
+    Tuple,
+)
+
+from fastapi import FastAPI
+from starlette.types import ASGIApp, Message, Receive, Scope, Send
+
+from .dcat import DCATCache
+from .execution import TransformationExecutor
+from .security import TokenValidationCache
+
+CONTENT_TYPE = "text/plain; version=0.0.4"
+
+PREFIX = "marketplace_"
+
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0)
+
+# The operation of requests that did not match any route.
+UNMATCHED = "unmatched"
+
+Labels = Dict[str, str]
+
+
+class MetricFamily(NamedTuple):
+    """Samples of a metric as (name suffix, labels, value)."""
+
+    name: str
+    type: str
+    help: str
+    samples: List[Tuple[str, Labels, float]]
+
+
+def gauge(name: str, help: str, value: float) -> MetricFamily:
+    return MetricFamily(name, "gauge", help, [("", {}, value)])
+
+
+def counter(name: str, help: str, value: float) -> MetricFamily:
+    return MetricFamily(name, "counter", help, [("_total", {}, value)])
+
+
+class Histogram:
+    """Counts of observed values in buckets with the given upper bounds."""
+
+    __slots__ = ("buckets", "counts", "sum")
+
+    def __init__(self, buckets: Sequence[float] = DEFAULT_BUCKETS):
+        self.buckets = tuple(buckets)
+        self.counts = [0] * (len(self.buckets) + 1)
+        self.sum = 0.0
+
+    def observe(self, value: float) -> None:
+        self.counts[bisect_left(self.buckets, value)] += 1
+        self.sum += value
+
+    def samples(self, labels: Labels) -> List[Tuple[str, Labels, float]]:
+        samples: List[Tuple[str, Labels, float]] = []
+        cumulative = 0
+        for bound, count in zip(self.buckets, self.counts):
+            cumulative += count
+            samples.append(("_bucket", {**labels, "le": repr(bound)}, cumulative))
+        cumulative += self.counts[-1]
+        samples.append(("_bucket", {**labels, "le": "+Inf"}, cumulative))
+        samples.append(("_sum", labels, self.sum))
+        samples.append(("_count", labels, cumulative))
+        return samples
+
+
+class Metrics:
+    """Request metrics by operation and collectors of further metrics.
+
+    Args:
+        buckets: The upper bounds of the latency histogram buckets in seconds.
+    """
+
+    def __init__(self, buckets: Sequence[float] = DEFAULT_BUCKETS):
+        self.buckets = tuple(buckets)
+        self.requests: Dict[Tuple[str, str, int], int] = {}
+        self.durations: Dict[str, Histogram] = {}
+        self.bytes_received: Dict[str, int] = {}
+        self.bytes_sent: Dict[str, int] = {}
+        self.in_flight = 0
+        self._collectors: List[Callable[[], Iterable[MetricFamily]]] = []
+
+    def add_collector(self, collector: Callable[[], Iterable[MetricFamily]]) -> None:
+        """Add a callable returning further metrics whenever they are scraped."""
+        self._collectors.append(collector)
+
+    def observe_request(
+        self,
+        operation_id: str,
+        method: str,
+        status_code: int,
+        duration: float,
+        received: int,
+        sent: int,
+    ) -> None:
+        key = (operation_id, method, status_code)
+        self.requests[key] = self.requests.get(key, 0) + 1
+        histogram = self.durations.get(operation_id)
+        if histogram is None:
+            histogram = self.durations[operation_id] = Histogram(self.buckets)
+        histogram.observe(duration)
+        if received:
+            self.bytes_received[operation_id] = (
+                self.bytes_received.get(operation_id, 0) + received
+            )
+        if sent:
+            self.bytes_sent[operation_id] = self.bytes_sent.get(operation_id, 0) + sent
+
+    def collect(self) -> Iterable[MetricFamily]:
+        """Return the request metrics and those of the collectors."""
+        yield MetricFamily(
+            "http_requests",
+            "counter",
+            "Number of handled requests.",
+            [
+                (
+                    "_total",
+                    {"operation_id": op, "method": method, "status": str(status)},
+                    count,
+                )
+                for (op, method, status), count in sorted(self.requests.items())
+            ],
+        )
+        yield MetricFamily(
+            "http_request_duration_seconds",
+            "histogram",
+            "Latency of handled requests.",
+            [
+                sample
+                for op, histogram in sorted(self.durations.items())
+                for sample in histogram.samples({"operation_id": op})
+            ],
+        )
+        yield gauge(
+            "http_requests_in_flight",
+            "Number of requests being handled.",
+            self.in_flight,
+        )
+        yield MetricFamily(
+            "http_request_bytes",
+            "counter",
+            "Number of request body bytes received.",
+            [
+                ("_total", {"operation_id": op}, count)
+                for op, count in sorted(self.bytes_received.items())
+            ],
+        )
+        yield MetricFamily(
+            "http_response_bytes",
+            "counter",
+            "Number of response body bytes sent.",
+            [
+                ("_total", {"operation_id": op}, count)
+                for op, count in sorted(self.bytes_sent.items())
+            ],
+        )
+        for collector in self._collectors:
+            yield from collector()
+
+    def render(self, families: Iterable[MetricFamily] = ()) -> str:
+        """Return the metrics and further families in the text format."""
+        lines: List[str] = []
+        for family in (*self.collect(), *families):
+            name = PREFIX + family.name
+            lines.append(f"# HELP {name} {family.help}")
+            lines.append(f"# TYPE {name} {family.type}")
+            for suffix, labels, value in family.samples:
+                lines.append(f"{name}{suffix}{_format_labels(labels)} {value!r}")
+        return "\n".join(lines) + "\n"
+
+
+def _escape(value: str) -> str:
+    return value.replace("\\", "\\\\").replace('"', '\\"').replace("\n", "\\n")
+
+
+def _format_labels(labels: Labels) -> str:
+    if not labels:
+        return ""
+    return "{" + ",".join(f'{k}="{_escape(v)}"' for k, v in labels.items()) + "}"
+
+
+def _operation_id(scope: Scope) -> str:
+    route: Any = scope.get("route")
+    if route is None:
+        return UNMATCHED
+    return str(getattr(route, "operation_id", None) or route.name)
+
+
+class MetricsMiddleware:
+    """ASGI middleware that records the request metrics.
+
+    The operation of a request is taken from the route that the router stores
+    in the scope, the middleware must hence be added before any middleware
+    that copies the scope, i.e., closer to the routes.
+    """
+
+    def __init__(self, app: ASGIApp, metrics: Metrics):
+        self.app = app
+        self.metrics = metrics
+
+    async def __call__(self, scope: Scope, receive: Receive, send: Send) -> None:
+        if scope["type"] != "http":
+            await self.app(scope, receive, send)
+            return
+        received = sent = 0
+        status_code = 500
+
+        async def receive_counted() -> Message:
+            nonlocal received
+            message = await receive()
+            received += len(message.get("body", b""))
+            return message
+
+        async def send_counted(message: Message) -> None:
+            nonlocal sent, status_code
+            if message["type"] == "http.response.start":
+                status_code = message["status"]
+            else:
+                sent += len(message.get("body", b""))
+            await send(message)
+
+        metrics = self.metrics
+        metrics.in_flight += 1
+        started = time.perf_counter()
+        try:
+            await self.app(scope, receive_counted, send_counted)
+        finally:
+            metrics.in_flight -= 1
+            metrics.observe_request(
+                _operation_id(scope),
+                scope["method"],
+                status_code,
+                time.perf_counter() - started,
+                received,
+                sent,
+            )
+
+
+def token_cache_metrics(cache: Optional[TokenValidationCache]) -> List[MetricFamily]:
+    """Return the metrics of the token validation cache, if configured."""
+    if cache is None:
+        return []
+    return [
+        counter(
+            "auth_cache_hits", "Token validations served by the cache.", cache.hits
+        ),
+        counter("auth_cache_misses", "Token validations passed on.", cache.misses),
+        counter(
+            "auth_validation_seconds",
+            "Time spent waiting for token validations.",
+            cache.validation_seconds,
+        ),
+        gauge("auth_cache_entries", "Number of cached tokens.", len(cache)),
+    ]
+
+
+def executor_metrics(executor: TransformationExecutor) -> List[MetricFamily]:
+    """Return the metrics of the transformation executor."""
+    return [
+        gauge(
+            "transformation_queue_depth",
+            "Number of transformations waiting for execution.",
+            executor.queue_depth,
+        ),
+        gauge(
+            "transformations_running",
+            "Number of transformations being executed.",
+            executor.running,
+        ),
+    ]
+
+
+def dcat_cache_metrics(cache: DCATCache) -> List[MetricFamily]:
+    """Return the metrics of the DCAT metadata cache."""
+    return [
+        counter("dcat_cache_hits", "DCAT metadata served by the cache.", cache.hits),
+        counter("dcat_cache_misses", "DCAT metadata serialized.", cache.misses),
+    ]
+
+
+async def metrics_registry() -> Optional[Metrics]:
+    """Return the metrics of the app.
+
+    The default is None, in which case the getMetrics operation responds with
+    501 (Not implemented).
+    """
+    return None
+
+
+def use_metrics(app: FastAPI, metrics: Metrics) -> None:
+    """Record the metrics of the app's requests and serve them."""
+    app.add_middleware(MetricsMiddleware, metrics=metrics)
+    app.dependency_overrides[metrics_registry] = lambda: metrics
@@ -3,15 +3,31 @@ from typing import Dict, Optional
 from pydantic import BaseModel, Field
 
 
+class MessageBrokerBinaryPayload(BaseModel):
+    content_encoding: Optional[str] = Field(
+        None, description="The content encoding of the binary body, e.g., gzip"
+    )
+    content_length: Optional[int] = Field(
+        None, description="The length of the binary body in bytes, if known"
+    )
+
+
 class MessageBrokerRequestModel(BaseModel):
     endpoint: str = Field("", description="API endpoint of the application")
     query_params: Optional[Dict[str, str]] = Field(None, description="Query parameters")
     headers: Optional[Dict[str, str]] = Field(None, description="Request headers")
     method: str = Field("", description="The HTTP request method")
     body: Optional[str] = Field(None, description="The request message body")
+    payload: Optional[MessageBrokerBinaryPayload] = Field(
+        None,
+        description="Framed binary request body sent instead of body, also requests a binary response",
+    )
 
 
 class MessageBrokerResponseModel(BaseModel):
     status_code: int = Field(200, description="The HTTP response code")
     headers: Optional[Dict[str, str]] = Field(None, description="Response headers")
     body: Optional[str] = Field(None, description="The response message body")
+    payload: Optional[MessageBrokerBinaryPayload] = Field(
+        None, description="Framed binary response body sent instead of body"
+    )
@@ -1,7 +1,7 @@
 from datetime import datetime
-from typing import Dict, List, Optional
+from typing import Dict, List, Literal, Optional, Tuple
 
-from pydantic import BaseModel, ConstrainedStr
+from pydantic import BaseModel, ConstrainedStr, Field
 
 
 class CollectionName(ConstrainedStr):
@@ -19,6 +19,7 @@ class CollectionModel(BaseModel):
 
 class CollectionResponseModel(BaseModel):
     items: List[CollectionModel]
+    next_cursor: Optional[str]
 
 
 class CollectionCreateResponse(BaseModel):
@@ -45,6 +46,34 @@ class DatasetModel(BaseModel):
 
 class DatasetResponseModel(BaseModel):
     items: List[DatasetModel]
+    next_cursor: Optional[str]
+
+
+MAX_UPLOAD_PARTS = 10000
+
+
+class UploadPartModel(BaseModel):
+    part_number: int = Field(..., ge=1, le=MAX_UPLOAD_PARTS)
+    hash: str
+    bytes: int
+
+
+class MultipartUploadModel(BaseModel):
+    upload_id: str
+    parts: List[UploadPartModel] = []
+
+
+class UploadManifestPartModel(BaseModel):
+    part_number: int = Field(..., ge=1, le=MAX_UPLOAD_PARTS)
+    hash: Optional[str] = Field(
+        None, description="The hash of the part as returned by its upload"
+    )
+
+
+class UploadManifestModel(BaseModel):
+    parts: List[UploadManifestPartModel] = Field(
+        ..., min_items=1, description="The parts of the dataset in order"
+    )
 
 
 class SemanticMappingName(ConstrainedStr):
@@ -57,3 +86,54 @@ class SemanticMappingModel(BaseModel):
 
 
 SemanticMappingListResponse = List[SemanticMappingName]
+
+
+class QueryModel(BaseModel):
+    patterns: List[Tuple[str, str, str]] = Field(
+        ...,
+        min_items=1,
+        description=(
+            "Basic graph pattern of (subject, predicate, object) triple patterns. "
+            'Terms are given in N-Triples syntax (<iri>, "literal"), '
+            "variables are prefixed with ?."
+        ),
+    )
+
+
+class QueryResponseModel(BaseModel):
+    variables: List[str] = Field(..., description="The variables of the query")
+    items: List[Dict[str, str]] = Field(
+        ..., description="The bindings of the variables for each solution"
+    )
+
+
+BulkMethod = Literal["PUT", "DELETE", "HEAD"]
+
+
+class BulkOperationModel(BaseModel):
+    method: BulkMethod = Field(
+        ...,
+        description=(
+            "PUT creates or replaces the dataset, DELETE deletes it and HEAD "
+            "returns its metadata."
+        ),
+    )
+    name: DatasetName
+    content: Optional[str] = Field(None, description="The content of a PUT dataset")
+    content_encoding: Literal["utf-8", "base64"] = "utf-8"
+    content_type: Optional[str]
+    metadata: Dict[str, str] = Field(
+        default_factory=dict, description="The custom metadata of a PUT dataset"
+    )
+
+
+class BulkItemResponseModel(BaseModel):
+    name: DatasetName
+    status_code: int
+    dataset: Optional[DatasetModel]
+    metadata: Optional[Dict[str, str]]
+    detail: Optional[str]
+
+
+class BulkResponseModel(BaseModel):
+    items: List[BulkItemResponseModel]
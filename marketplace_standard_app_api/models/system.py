@@ -1,3 +1,4 @@
+from datetime import datetime
 from typing import List, Optional
 
 from pydantic import AnyUrl, BaseModel, Field
@@ -24,3 +25,24 @@ class GlobalSearchResponseItemModel(BaseModel):
 
 class GlobalSearchResponse(BaseModel):
     items: List[GlobalSearchResponseItemModel]
+    next_cursor: Optional[str] = Field(
+        None, description="Cursor of the next page of search results"
+    )
+
+
+class LogEntryModel(BaseModel):
+    sequence: int = Field(..., description="Consecutive number of the entry")
+    timestamp: datetime
+    level: str = Field(..., description="Level of the entry, e.g., INFO")
+    logger: str = Field(..., description="Name of the logger")
+    id: Optional[str] = Field(
+        None, description="Id of the transformation, collection or dataset"
+    )
+    message: str
+
+
+class LogListResponse(BaseModel):
+    items: List[LogEntryModel]
+    next_cursor: Optional[str] = Field(
+        None, description="Cursor of the next page of log entries"
+    )
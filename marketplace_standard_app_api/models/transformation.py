@@ -67,3 +67,4 @@ class TransformationStateResponse(BaseModel):
 
 class TransformationListResponse(BaseModel):
     items: List[TransformationModel]
+    next_cursor: Optional[str]
@@ -0,0 +1,117 @@
+"""Cursor-based pagination for the list operations.
+
+In addition to the limit/offset parameters, all list operations accept an
+opaque ``cursor`` and return the cursor of the next page (``next_cursor``) in
+the response, or None on the last page.  Cursors encode the sort key of the
+last item of a page, such that backends can seek to the next page with an
+index lookup instead of skipping over ``offset`` items and pages stay
+consistent under concurrent writes:
+
+    after = decode_cursor(cursor) if cursor else None
+    items = lookup_items(sorted_after=after, limit=limit)
+    next_cursor = next_page_cursor(items, limit, key=lambda item: (item.name,))
+"""
+
+import base64
+import binascii
+import json
+from bisect import bisect_right
+from typing import (
+    Any,
+    AsyncIterator,
+    Awaitable,
+    Callable,
+    List,
+    Optional,
+    Sequence,
+    Tuple,
+    TypeVar,
+)
+
+from fastapi import HTTPException
+
+T = TypeVar("T")
+
+NEXT_CURSOR_HEADER = "X-Next-Cursor"
+
+
+class InvalidCursor(ValueError):
+    """The cursor is malformed."""
+
+
+def encode_cursor(key: Sequence[Any]) -> str:
+    """Encode a (JSON-serializable) sort key as opaque cursor."""
+    data = json.dumps(list(key), separators=(",", ":")).encode()
+    return base64.urlsafe_b64encode(data).rstrip(b"=").decode()
+
+
+def decode_cursor(cursor: str) -> Tuple[Any, ...]:
+    """Decode a cursor into the sort key it was created from."""
+    try:
+        data = base64.urlsafe_b64decode(cursor + "=" * (-len(cursor) % 4))
+        key = json.loads(data)
+    except (binascii.Error, UnicodeDecodeError, ValueError) as error:
+        raise InvalidCursor(cursor) from error
+    if not isinstance(key, list):
+        raise InvalidCursor(cursor)
+    return tuple(key)
+
+
+def parse_cursor(cursor: Optional[str]) -> Optional[Tuple[Any, ...]]:
+    """Decode the cursor query parameter, responding with 400 if malformed."""
+    if cursor is None:
+        return None
+    try:
+        return decode_cursor(cursor)
+    except InvalidCursor:
+        raise HTTPException(status_code=400, detail="Invalid cursor.")
+
+
+def next_page_cursor(
+    items: Sequence[T], limit: int, key: Callable[[T], Sequence[Any]]
+) -> Optional[str]:
+    """Return the cursor of the page following the items, None if complete."""
+    if not items or len(items) < limit:
+        return None
+    return encode_cursor(key(items[-1]))
+
+
+def page_bounds(
+    sorted_keys: Sequence[Any],
+    after: Optional[Any] = None,
+    limit: int = 100,
+    offset: int = 0,
+) -> Tuple[int, int]:
+    """Return the slice of a sorted sequence that forms the requested page.
+
+    Seeks to the first key greater than ``after`` by bisection and skips
+    ``offset`` further items from there.
+    """
+    start = bisect_right(sorted_keys, after) if after is not None else 0
+    start = min(start + max(offset, 0), len(sorted_keys))
+    return start, min(start + max(limit, 0), len(sorted_keys))
+
+
+async def iter_pages(
+    fetch: Callable[[Optional[Any], int, int], Awaitable[List[T]]],
+    key: Callable[[T], Any],
+    after: Optional[Any] = None,
+    limit: int = 100,
+    offset: int = 0,
+    batch_size: int = 1000,
+) -> AsyncIterator[T]:
+    """Iterate over up to ``limit`` items, fetching them in bounded batches.
+
+    The ``fetch(after, limit, offset)`` callable returns the items following
+    the ``after`` key; batches after the first one seek with the key of the
+    last item instead of an offset.
+    """
+    remaining = limit
+    while remaining > 0:
+        batch = await fetch(after, min(batch_size, remaining), offset)
+        for item in batch:
+            yield item
+        if len(batch) < min(batch_size, remaining):
+            break
+        remaining -= len(batch)
+        after, offset = key(batch[-1]), 0
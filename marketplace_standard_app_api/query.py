@@ -0,0 +1,568 @@
+"""Triple store and basic graph pattern queries for the query operations.
+
+The query operations respond with 501 (Not implemented) unless an application
+provides a `QueryEngine`.  The engine keeps one graph per dataset, e.g., with
+the DCAT metadata of the dataset and its semantic mappings:
+
+    engine = QueryEngine()
+    await engine.load_storage(backend, base_iri="https://my-app.example.com")
+    engine.load(
+        "collection", "dataset", semantic_mapping_triples(subject, mapping)
+    )
+    use_query_engine(api, engine)
+
+The graphs of collections and datasets are updated as they are created,
+updated, and deleted if the storage backend is wrapped with
+`QueryableStorage`:
+
+    backend = QueryableStorage(backend, engine, "https://my-app.example.com")
+    use_object_storage_backend(api, backend)
+
+Queries are basic graph patterns, i.e., lists of triple patterns in N-Triples
+term syntax with variables prefixed by ``?``:
+
+    [("?dataset", "<http://purl.org/dc/terms/title>", "?title")]
+
+Terms are dictionary-encoded as integers and triples are indexed by subject,
+predicate, and object (SPO, POS, and OSP), such that every triple pattern is
+answered by an index lookup.  Patterns are joined in the order of their
+estimated selectivity given the variables bound so far, and solutions are
+produced lazily, i.e., only ``offset + limit`` solutions are computed.
+"""
+
+import re
+from collections import Counter
+from itertools import islice
+from typing import (
+    Any,
+    AsyncIterator,
+    Dict,
+    Iterable,
+    Iterator,
+    List,
+    Optional,
+    Sequence,
+    Set,
+    Tuple,
+    Union,
+    cast,
+)
+
+from fastapi import FastAPI
+
+from .dcat import Triple, collection_triples, dataset_triples
+from .models.object_storage import (
+    CollectionName,
+    DatasetModel,
+    DatasetName,
+    UploadManifestPartModel,
+)
+from .storage import (
+    BulkOperation,
+    BulkResult,
+    DatasetInfo,
+    MultipartUploadBackend,
+    ObjectStorageBackend,
+    apply_bulk,
+)
+from .streaming import DatasetUploadStream
+
+Pattern = Tuple[str, str, str]
+
+# An encoded pattern: term ids for constants, names for variables.
+_EncodedPattern = Tuple[Union[int, str], Union[int, str], Union[int, str]]
+
+_Index = Dict[int, Dict[int, Set[int]]]
+
+_TERM = re.compile(r'^(\?\w+|<[^<>"\s]*>|_:\w+|".*"(@[\w-]+|\^\^<[^<>"\s]*>)?)$', re.S)
+
+
+class InvalidQuery(ValueError):
+    """The query is malformed."""
+
+
+class GraphNotFound(KeyError):
+    """No graph has been loaded for the dataset."""
+
+
+def is_variable(term: object) -> bool:
+    return isinstance(term, str) and term.startswith("?")
+
+
+class TermDictionary:
+    """Bidirectional mapping of RDF terms to integer ids."""
+
+    def __init__(self) -> None:
+        self._ids: Dict[str, int] = {}
+        self._terms: List[str] = []
+
+    def __len__(self) -> int:
+        return len(self._terms)
+
+    def encode(self, term: str) -> int:
+        id = self._ids.get(term)
+        if id is None:
+            id = self._ids[term] = len(self._terms)
+            self._terms.append(term)
+        return id
+
+    def lookup(self, term: str) -> Optional[int]:
+        return self._ids.get(term)
+
+    def decode(self, id: int) -> str:
+        return self._terms[id]
+
+
+def _add(index: _Index, a: int, b: int, c: int) -> None:
+    index.setdefault(a, {}).setdefault(b, set()).add(c)
+
+
+def _discard(index: _Index, a: int, b: int, c: int) -> None:
+    second = index[a]
+    third = second[b]
+    third.discard(c)
+    if not third:
+        del second[b]
+        if not second:
+            del index[a]
+
+
+class TripleStore:
+    """Dictionary-encoded triples with SPO, POS, and OSP indexes.
+
+    Args:
+        terms: The term dictionary, shared by stores of the same engine.
+        counted: Count how often each triple was added and only remove it
+            once it was removed as often, e.g., for the union of graphs.
+    """
+
+    def __init__(
+        self, terms: Optional[TermDictionary] = None, counted: bool = False
+    ) -> None:
+        self.terms = terms if terms is not None else TermDictionary()
+        self._spo: _Index = {}
+        self._pos: _Index = {}
+        self._osp: _Index = {}
+        self._subjects: Counter = Counter()
+        self._predicates: Counter = Counter()
+        self._objects: Counter = Counter()
+        self._counts: Optional[Counter] = Counter() if counted else None
+        self._size = 0
+
+    def __len__(self) -> int:
+        return self._size
+
+    def _contains(self, s: int, p: int, o: int) -> bool:
+        return o in self._spo.get(s, {}).get(p, ())
+
+    def add(self, triple: Triple) -> bool:
+        """Add a triple, return False if it was already contained."""
+        s, p, o = (self.terms.encode(term) for term in triple)
+        if self._counts is not None:
+            self._counts[s, p, o] += 1
+        if self._contains(s, p, o):
+            return False
+        _add(self._spo, s, p, o)
+        _add(self._pos, p, o, s)
+        _add(self._osp, o, s, p)
+        self._subjects[s] += 1
+        self._predicates[p] += 1
+        self._objects[o] += 1
+        self._size += 1
+        return True
+
+    def add_all(self, triples: Iterable[Triple]) -> None:
+        for triple in triples:
+            self.add(triple)
+
+    def remove(self, triple: Triple) -> None:
+        s, p, o = (self.terms.lookup(term) for term in triple)
+        if s is None or p is None or o is None:
+            return
+        if not self._contains(s, p, o):
+            return
+        if self._counts is not None:
+            self._counts[s, p, o] -= 1
+            if self._counts[s, p, o] > 0:
+                return
+            del self._counts[s, p, o]
+        _discard(self._spo, s, p, o)
+        _discard(self._pos, p, o, s)
+        _discard(self._osp, o, s, p)
+        for counter, id in (
+            (self._subjects, s),
+            (self._predicates, p),
+            (self._objects, o),
+        ):
+            counter[id] -= 1
+            if not counter[id]:
+                del counter[id]
+        self._size -= 1
+
+    def remove_all(self, triples: Iterable[Triple]) -> None:
+        for triple in triples:
+            self.remove(triple)
+
+    def triples(self) -> Iterator[Triple]:
+        decode = self.terms.decode
+        for s, p, o in self.match(None, None, None):
+            yield decode(s), decode(p), decode(o)
+
+    def match(
+        self, s: Optional[int], p: Optional[int], o: Optional[int]
+    ) -> Iterator[Tuple[int, int, int]]:
+        """Iterate over the encoded triples matching the bound terms."""
+        if s is not None:
+            predicates = self._spo.get(s, {})
+            if p is not None:
+                objects = predicates.get(p, ())
+                if o is not None:
+                    if o in objects:
+                        yield s, p, o
+                    return
+                for o_ in objects:
+                    yield s, p, o_
+            elif o is not None:
+                for p_ in self._osp.get(o, {}).get(s, ()):
+                    yield s, p_, o
+            else:
+                for p_, objects in predicates.items():
+                    for o_ in objects:
+                        yield s, p_, o_
+        elif p is not None:
+            objects_ = self._pos.get(p, {})
+            if o is not None:
+                for s_ in objects_.get(o, ()):
+                    yield s_, p, o
+            else:
+                for o_, subjects in objects_.items():
+                    for s_ in subjects:
+                        yield s_, p, o_
+        elif o is not None:
+            for s_, predicates_ in self._osp.get(o, {}).items():
+                for p_ in predicates_:
+                    yield s_, p_, o
+        else:
+            for s_, predicates in self._spo.items():
+                for p_, objects in predicates.items():
+                    for o_ in objects:
+                        yield s_, p_, o_
+
+    def estimate(self, s: Optional[int], p: Optional[int], o: Optional[int]) -> int:
+        """Estimate the number of triples matching the bound terms."""
+        if s is not None and p is not None:
+            return len(self._spo.get(s, {}).get(p, ()))
+        if p is not None and o is not None:
+            return len(self._pos.get(p, {}).get(o, ()))
+        if o is not None and s is not None:
+            return len(self._osp.get(o, {}).get(s, ()))
+        if s is not None:
+            return self._subjects[s]
+        if p is not None:
+            return self._predicates[p]
+        if o is not None:
+            return self._objects[o]
+        return self._size
+
+    # Queries
+
+    def _encode(self, patterns: Sequence[Pattern]) -> Optional[List[_EncodedPattern]]:
+        """Encode the constants of the patterns, None if one is unknown."""
+        encoded: List[_EncodedPattern] = []
+        for pattern in patterns:
+            if len(pattern) != 3:
+                raise InvalidQuery(f"Not a triple pattern: {pattern}")
+            terms: List[Union[int, str]] = []
+            for term in pattern:
+                if not isinstance(term, str) or not _TERM.match(term):
+                    raise InvalidQuery(f"Invalid term: {term}")
+                if is_variable(term):
+                    terms.append(term)
+                else:
+                    id = self.terms.lookup(term)
+                    if id is None:
+                        return None  # There can not be any match.
+                    terms.append(id)
+            encoded.append((terms[0], terms[1], terms[2]))
+        return encoded
+
+    @staticmethod
+    def _resolve(
+        pattern: _EncodedPattern, binding: Dict[str, int]
+    ) -> Tuple[Optional[int], Optional[int], Optional[int]]:
+        s, p, o = [
+            binding.get(term) if isinstance(term, str) else term for term in pattern
+        ]
+        return s, p, o
+
+    def _solve(
+        self, patterns: List[_EncodedPattern], binding: Dict[str, int]
+    ) -> Iterator[Dict[str, int]]:
+        if not patterns:
+            yield binding
+            return
+        # Join the most selective pattern given the variables bound so far.
+        estimates = [self.estimate(*self._resolve(p, binding)) for p in patterns]
+        index = min(range(len(patterns)), key=estimates.__getitem__)
+        if estimates[index] == 0:
+            return
+        pattern = patterns[index]
+        rest = patterns[:index] + patterns[index + 1 :]
+        for triple in self.match(*self._resolve(pattern, binding)):
+            extended = dict(binding)
+            for term, id in zip(pattern, triple):
+                if isinstance(term, str):
+                    if extended.setdefault(term, id) != id:
+                        break  # The same variable is bound to different terms.
+            else:
+                yield from self._solve(rest, extended)
+
+    def query(
+        self, patterns: Sequence[Pattern], limit: Optional[int] = None, offset: int = 0
+    ) -> Tuple[List[str], Iterator[Dict[str, str]]]:
+        """Match a basic graph pattern.
+
+        Returns the variables of the patterns in order of appearance and an
+        iterator over the solutions, which maps each variable (without ?) to
+        its term.  Raises InvalidQuery for malformed patterns.
+        """
+        if not patterns:
+            raise InvalidQuery("Empty query.")
+        variables: List[str] = []
+        for pattern in patterns:
+            for term in pattern:
+                if is_variable(term) and term not in variables:
+                    variables.append(term)
+        encoded = self._encode(patterns)
+        solutions = self._solve(encoded, {}) if encoded is not None else iter(())
+        stop = None if limit is None else max(offset, 0) + max(limit, 0)
+        decode = self.terms.decode
+        return [variable[1:] for variable in variables], (
+            {variable[1:]: decode(id) for variable, id in solution.items()}
+            for solution in islice(solutions, max(offset, 0), stop)
+        )
+
+
+class QueryEngine:
+    """Graphs of triples per dataset, queryable individually or as union.
+
+    Collection-level triples are kept in the graph of the collection, i.e.,
+    with None as dataset name.
+    """
+
+    def __init__(self) -> None:
+        self.terms = TermDictionary()
+        self.union = TripleStore(self.terms, counted=True)
+        self._graphs: Dict[Tuple[str, Optional[str]], TripleStore] = {}
+
+    def graph(self, collection_name: str, dataset_name: Optional[str]) -> TripleStore:
+        try:
+            return self._graphs[collection_name, dataset_name]
+        except KeyError:
+            raise GraphNotFound((collection_name, dataset_name))
+
+    def load(
+        self,
+        collection_name: str,
+        dataset_name: Optional[str],
+        triples: Iterable[Triple],
+        replace: bool = True,
+    ) -> None:
+        """Add triples to the graph of a dataset, replacing its triples."""
+        if replace:
+            self.drop(collection_name, dataset_name)
+        graph = self._graphs.setdefault(
+            (collection_name, dataset_name), TripleStore(self.terms)
+        )
+        for triple in triples:
+            if graph.add(triple):
+                self.union.add(triple)
+
+    def drop(self, collection_name: str, dataset_name: Optional[str]) -> None:
+        """Remove the graph of a dataset, if it exists."""
+        graph = self._graphs.pop((collection_name, dataset_name), None)
+        if graph is not None:
+            self.union.remove_all(graph.triples())
+
+    def query(
+        self,
+        patterns: Sequence[Pattern],
+        collection_name: Optional[str] = None,
+        dataset_name: Optional[str] = None,
+        limit: Optional[int] = None,
+        offset: int = 0,
+    ) -> Tuple[List[str], Iterator[Dict[str, str]]]:
+        """Query the graph of a dataset or, without collection, all graphs."""
+        store = (
+            self.union
+            if collection_name is None
+            else self.graph(collection_name, dataset_name)
+        )
+        return store.query(patterns, limit=limit, offset=offset)
+
+    async def load_storage(
+        self, backend: ObjectStorageBackend, base_iri: str, batch_size: int = 1000
+    ) -> None:
+        """Load the DCAT metadata of all collections and datasets."""
+        after: Optional[str] = None
+        while True:
+            collections = await backend.list_collections(batch_size, after=after)
+            for collection in collections:
+                info = await backend.get_collection(collection.name)
+                self.load(
+                    collection.name,
+                    None,
+                    collection_triples(base_iri, info.collection, info.metadata),
+                )
+                last: Optional[str] = None
+                while True:
+                    datasets = await backend.list_datasets(
+                        collection.name, batch_size, after=last
+                    )
+                    for dataset in datasets:
+                        dataset_info = await backend.get_dataset(
+                            collection.name, dataset.name
+                        )
+                        self.load(
+                            collection.name,
+                            dataset.name,
+                            dataset_triples(
+                                base_iri,
+                                collection.name,
+                                dataset_info.dataset,
+                                dataset_info.metadata,
+                            ),
+                        )
+                    if len(datasets) < batch_size:
+                        break
+                    last = datasets[-1].name
+            if len(collections) < batch_size:
+                break
+            after = collections[-1].name
+
+
+class QueryableStorage:
+    """Object storage backend that keeps the graphs of a query engine up to date.
+
+    The graphs of created or changed collections and datasets are replaced
+    by their DCAT metadata, those of deleted ones are dropped.  Changes made
+    to the wrapped backend by other means are only picked up by
+    `QueryEngine.load_storage`.
+    """
+
+    def __init__(
+        self, backend: ObjectStorageBackend, engine: QueryEngine, base_iri: str
+    ):
+        self.backend = backend
+        self.engine = engine
+        self.base_iri = base_iri
+
+    def __getattr__(self, name: str) -> Any:
+        return getattr(self.backend, name)
+
+    async def _load_collection(self, collection_name: CollectionName) -> None:
+        info = await self.backend.get_collection(collection_name)
+        self.engine.load(
+            collection_name,
+            None,
+            collection_triples(self.base_iri, info.collection, info.metadata),
+        )
+
+    def _load_dataset(self, collection_name: str, info: DatasetInfo) -> None:
+        self.engine.load(
+            collection_name,
+            info.dataset.name,
+            dataset_triples(
+                self.base_iri, collection_name, info.dataset, info.metadata
+            ),
+        )
+
+    async def _reload_dataset(
+        self, collection_name: CollectionName, dataset_name: DatasetName
+    ) -> None:
+        info = await self.backend.get_dataset(collection_name, dataset_name)
+        self._load_dataset(collection_name, info)
+
+    async def create_collection(
+        self, collection_name: CollectionName, metadata: Dict[str, str]
+    ) -> bool:
+        created = await self.backend.create_collection(collection_name, metadata)
+        await self._load_collection(collection_name)
+        return created
+
+    async def delete_collection(self, collection_name: CollectionName) -> None:
+        await self.backend.delete_collection(collection_name)
+        # Only empty collections can be deleted, there are no datasets left.
+        self.engine.drop(collection_name, None)
+
+    async def put_dataset(
+        self,
+        collection_name: CollectionName,
+        dataset_name: DatasetName,
+        upload: DatasetUploadStream,
+        content_type: Optional[str],
+        metadata: Dict[str, str],
+    ) -> DatasetModel:
+        dataset = await self.backend.put_dataset(
+            collection_name, dataset_name, upload, content_type, metadata
+        )
+        await self._reload_dataset(collection_name, dataset_name)
+        return dataset
+
+    async def update_dataset_metadata(
+        self,
+        collection_name: CollectionName,
+        dataset_name: DatasetName,
+        metadata: Dict[str, str],
+    ) -> None:
+        await self.backend.update_dataset_metadata(
+            collection_name, dataset_name, metadata
+        )
+        await self._reload_dataset(collection_name, dataset_name)
+
+    async def delete_dataset(
+        self, collection_name: CollectionName, dataset_name: DatasetName
+    ) -> None:
+        await self.backend.delete_dataset(collection_name, dataset_name)
+        self.engine.drop(collection_name, dataset_name)
+
+    async def bulk(
+        self,
+        collection_name: CollectionName,
+        operations: AsyncIterator[BulkOperation],
+    ) -> List[BulkResult]:
+        results = await apply_bulk(self.backend, collection_name, operations)
+        for result in results:
+            if result.status_code == 204:
+                self.engine.drop(collection_name, result.dataset_name)
+            elif result.status_code == 201 and result.info is not None:
+                self._load_dataset(collection_name, result.info)
+        return results
+
+    async def complete_upload(
+        self,
+        collection_name: CollectionName,
+        dataset_name: DatasetName,
+        upload_id: str,
+        parts: Optional[List[UploadManifestPartModel]],
+    ) -> DatasetModel:
+        backend = cast(MultipartUploadBackend, self.backend)
+        dataset = await backend.complete_upload(
+            collection_name, dataset_name, upload_id, parts
+        )
+        await self._reload_dataset(collection_name, dataset_name)
+        return dataset
+
+
+async def query_engine() -> Optional[QueryEngine]:
+    """Return the configured query engine.
+
+    The default is None, in which case the query operations respond with 501
+    (Not implemented).
+    """
+    return None
+
+
+def use_query_engine(app: FastAPI, engine: QueryEngine) -> None:
+    """Answer the queries of the app with the engine."""
+    app.dependency_overrides[query_engine] = lambda: engine
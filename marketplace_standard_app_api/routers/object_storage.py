@@ -1,16 +1,91 @@
-from typing import Optional, Union
+import binascii
+import errno
+import mimetypes
+import sys
+from base64 import b64decode
+from contextlib import contextmanager
+from typing import AsyncIterator, Dict, Iterator, List, Optional, Tuple, Union, cast
+from uuid import uuid4
 
-from fastapi import APIRouter, HTTPException, Request, UploadFile
-from fastapi.responses import Response
+from fastapi import (
+    APIRouter,
+    Depends,
+    Header,
+    HTTPException,
+    Path,
+    Query,
+    Request,
+    UploadFile,
+)
+from fastapi.exceptions import RequestValidationError
+from fastapi.responses import Response, StreamingResponse
+from pydantic import ValidationError, conlist, parse_raw_as
 
+from .. import dcat
+from ..conditional import (
+    Validators,
+    collection_read_preconditions,
+    dataset_read_preconditions,
+    dataset_write_preconditions,
+)
+from ..dcat import (
+    DCATCache,
+    collection_triples,
+    dataset_triples,
+    dcat_cache,
+    iter_serialized,
+    negotiate,
+    serialize,
+)
+from ..mappings import (
+    MappingNotFound,
+    SemanticMappingRegistry,
+    semantic_mapping_registry,
+)
 from ..models.object_storage import (
+    MAX_UPLOAD_PARTS,
+    BulkItemResponseModel,
+    BulkOperationModel,
+    BulkResponseModel,
+    CollectionModel,
     CollectionName,
     CollectionResponseModel,
     DatasetCreateResponse,
+    DatasetModel,
     DatasetName,
     DatasetResponseModel,
+    MultipartUploadModel,
+    QueryModel,
+    QueryResponseModel,
     SemanticMappingListResponse,
     SemanticMappingModel,
+    UploadManifestModel,
+    UploadPartModel,
+)
+from ..pagination import NEXT_CURSOR_HEADER, iter_pages, next_page_cursor, parse_cursor
+from ..query import GraphNotFound, InvalidQuery, QueryEngine, query_engine
+from ..storage import (
+    BulkOperation,
+    BulkResult,
+    CollectionNotEmpty,
+    InvalidManifest,
+    MultipartUploadBackend,
+    NotFound,
+    ObjectStorageBackend,
+    apply_bulk,
+    metadata_from_headers,
+    metadata_to_headers,
+    object_storage_backend,
+)
+from ..streaming import (
+    DatasetUploadStream,
+    InvalidArchive,
+    NDJSONResponse,
+    accepts_ndjson,
+    dataset_response,
+    iter_gunzip,
+    iter_tar,
+    ndjson_response_schema,
 )
 
 router = APIRouter(
@@ -21,6 +96,56 @@ router = APIRouter(
 )
 
 
+def _require(backend: Optional[ObjectStorageBackend]) -> ObjectStorageBackend:
+    if backend is None:
+        raise HTTPException(status_code=501, detail="Not implemented.")
+    return backend
+
+
+def _require_multipart(
+    backend: Optional[ObjectStorageBackend],
+) -> MultipartUploadBackend:
+    if not hasattr(_require(backend), "create_upload"):
+        raise HTTPException(status_code=501, detail="Not implemented.")
+    return cast(MultipartUploadBackend, backend)
+
+
+def _invalidate(cache: Optional[DCATCache], collection_name: str) -> None:
+    if cache is not None:
+        cache.invalidate(collection_name)
+
+
+def _name_key(item: Union[CollectionModel, DatasetModel]) -> Tuple[str]:
+    return (item.name,)
+
+
+def _after_name(cursor: Optional[str]) -> Optional[str]:
+    "Return the name of the last item of the previous page."
+    key = parse_cursor(cursor)
+    if key is None:
+        return None
+    if len(key) != 1 or not isinstance(key[0], str):
+        raise HTTPException(status_code=400, detail="Invalid cursor.")
+    return key[0]
+
+
+@contextmanager
+def _storage_errors() -> Iterator[None]:
+    "Translate object storage backend errors into HTTP errors."
+    try:
+        yield
+    except NotFound:
+        raise HTTPException(status_code=404, detail="Not found.")
+    except CollectionNotEmpty:
+        raise HTTPException(status_code=409, detail="Collection is not empty.")
+    except InvalidManifest as error:
+        raise HTTPException(status_code=400, detail=f"Invalid manifest: {error}")
+    except OSError as error:
+        if error.errno == errno.ENOSPC:
+            raise HTTPException(status_code=507, detail="Insufficient storage.")
+        raise
+
+
 @router.get(
     "",
     operation_id="listCollections",
@@ -28,14 +153,104 @@ router = APIRouter(
     tags=["DataSource", "DataSink"],
     response_model=CollectionResponseModel,
     responses={
+        200: ndjson_response_schema("CollectionModel"),
         204: {"description": "No collections found."},
+        400: {"description": "Invalid cursor."},
     },
 )
 async def list_collections(
-    limit: int = 100, offset: int = 0
+    request: Request,
+    limit: int = Query(100, ge=1),
+    offset: int = 0,
+    cursor: Optional[str] = None,
+    backend: Optional[ObjectStorageBackend] = Depends(object_storage_backend),
 ) -> Union[CollectionResponseModel, Response]:
-    """List all collections."""
-    raise HTTPException(status_code=501, detail="Not implemented.")
+    """List all collections.
+
+    Results are paginated with limit and offset, or with the cursor returned
+    as next_cursor by the previous page.
+
+    With "Accept: application/x-ndjson" the collections are streamed as
+    newline-delimited JSON instead.
+    """
+    backend = _require(backend)
+    after = _after_name(cursor)
+    if accepts_ndjson(request):
+        collections: AsyncIterator[CollectionModel] = iter_pages(
+            lambda after_, limit_, offset_: backend.list_collections(
+                limit=limit_, offset=offset_, after=after_
+            ),
+            lambda collection: collection.name,
+            after=after,
+            limit=limit,
+            offset=offset,
+        )
+        return NDJSONResponse(collections)
+    items = await backend.list_collections(limit=limit, offset=offset, after=after)
+    if not items:
+        return Response(status_code=204)
+    return CollectionResponseModel(
+        items=items, next_cursor=next_page_cursor(items, limit, _name_key)
+    )
+
+
+# The semantic mapping routes precede the collection and dataset routes, which
+# would match their paths otherwise.
+@router.get(
+    "/semanticMappings",
+    operation_id="listSemanticMappings",
+    summary="List all semantic mappings",
+    tags=["DataSource", "DataSink"],
+    response_model=SemanticMappingListResponse,
+    responses={
+        204: {"description": "No mappings found."},
+        400: {"description": "Invalid cursor."},
+    },
+)
+async def list_semantic_mappings(
+    response: Response,
+    limit: int = Query(100, ge=1),
+    offset: int = 0,
+    cursor: Optional[str] = None,
+    registry: Optional[SemanticMappingRegistry] = Depends(semantic_mapping_registry),
+) -> Union[SemanticMappingListResponse, Response]:
+    """List all semantic mappings.
+
+    Results are paginated with limit and offset, or with the cursor returned
+    in the X-Next-Cursor header of the previous page.
+    """
+    if registry is None:
+        raise HTTPException(status_code=501, detail="Not implemented.")
+    names = registry.names(limit, offset, after=_after_name(cursor))
+    if not names:
+        return Response(status_code=204)
+    next_cursor = next_page_cursor(names, limit, lambda name: (name,))
+    if next_cursor is not None:
+        response.headers[NEXT_CURSOR_HEADER] = next_cursor
+    return names
+
+
+@router.get(
+    "/semanticMappings/{semantic_mapping_id}",
+    operation_id="getSemanticMapping",
+    summary="Get a specific semantic mapping",
+    tags=["DataSource", "DataSink"],
+    response_model=SemanticMappingModel,
+    responses={
+        404: {"description": "Not found."},
+    },
+)
+async def get_semantic_mapping(
+    semantic_mapping_id: str,
+    registry: Optional[SemanticMappingRegistry] = Depends(semantic_mapping_registry),
+) -> Union[SemanticMappingModel, Response]:
+    """Get a semantic mapping."""
+    if registry is None:
+        raise HTTPException(status_code=501, detail="Not implemented.")
+    try:
+        return registry.get(semantic_mapping_id)
+    except MappingNotFound:
+        raise HTTPException(status_code=404, detail="Not found.")
 
 
 @router.get(
@@ -45,15 +260,54 @@ async def list_collections(
     tags=["DataSource"],
     response_model=DatasetResponseModel,
     responses={
+        200: ndjson_response_schema("DatasetModel"),
         204: {"description": "No datasets found."},
+        304: {"description": "Not modified."},
+        400: {"description": "Invalid cursor."},
         404: {"description": "Container not found."},
     },
+    dependencies=[Depends(collection_read_preconditions)],
 )
 async def list_datasets(
-    collection_name: CollectionName, limit: int = 100, offset: int = 0
+    request: Request,
+    collection_name: CollectionName,
+    limit: int = Query(100, ge=1),
+    offset: int = 0,
+    cursor: Optional[str] = None,
+    backend: Optional[ObjectStorageBackend] = Depends(object_storage_backend),
 ) -> Union[DatasetResponseModel, Response]:
-    """List all datasets."""
-    raise HTTPException(status_code=501, detail="Not implemented.")
+    """List all datasets.
+
+    Results are paginated with limit and offset, or with the cursor returned
+    as next_cursor by the previous page.
+
+    With "Accept: application/x-ndjson" the datasets are streamed as
+    newline-delimited JSON instead.
+    """
+    backend = _require(backend)
+    after = _after_name(cursor)
+    if accepts_ndjson(request):
+        with _storage_errors():
+            await backend.get_collection(collection_name)
+        datasets: AsyncIterator[DatasetModel] = iter_pages(
+            lambda after_, limit_, offset_: backend.list_datasets(
+                collection_name, limit=limit_, offset=offset_, after=after_
+            ),
+            lambda dataset: dataset.name,
+            after=after,
+            limit=limit,
+            offset=offset,
+        )
+        return NDJSONResponse(datasets)
+    with _storage_errors():
+        items = await backend.list_datasets(
+            collection_name, limit=limit, offset=offset, after=after
+        )
+    if not items:
+        return Response(status_code=204)
+    return DatasetResponseModel(
+        items=items, next_cursor=next_page_cursor(items, limit, _name_key)
+    )
 
 
 CREATE_COLLECTION_DESCRIPTION = """
@@ -102,10 +356,19 @@ https://docs.openstack.org/api-ref/object-store/index.html#create-container
     description="Create a collection.\n" + CREATE_COLLECTION_DESCRIPTION,
 )
 async def create_collection(
-    request: Request, collection_name: Optional[CollectionName] = None
+    request: Request,
+    collection_name: Optional[CollectionName] = None,
+    backend: Optional[ObjectStorageBackend] = Depends(object_storage_backend),
+    cache: Optional[DCATCache] = Depends(dcat_cache),
 ) -> Response:
     """Create a new or replace an existing collection."""
-    raise HTTPException(status_code=501, detail="Not implemented.")
+    collection_name = collection_name or CollectionName(uuid4().hex)
+    with _storage_errors():
+        created = await _require(backend).create_collection(
+            collection_name, metadata_from_headers(request.headers)
+        )
+    _invalidate(cache, collection_name)
+    return Response(status_code=201 if created else 202)
 
 
 @router.head(
@@ -121,9 +384,17 @@ async def create_collection(
         404: {"description": "Not found."},
     },
 )
-async def get_collection_metadata(collection_name: CollectionName) -> Response:
+async def get_collection_metadata(
+    collection_name: CollectionName,
+    backend: Optional[ObjectStorageBackend] = Depends(object_storage_backend),
+) -> Response:
     """Get the metadata for a collection."""
-    raise HTTPException(status_code=501, detail="Not implemented.")
+    with _storage_errors():
+        info = await _require(backend).get_collection(collection_name)
+    headers = metadata_to_headers(info.metadata)
+    headers["X-Container-Object-Count"] = str(info.collection.count or 0)
+    headers["X-Container-Bytes-Used"] = str(info.collection.bytes or 0)
+    return Response(status_code=204, headers=headers)
 
 
 @router.delete(
@@ -141,9 +412,16 @@ async def get_collection_metadata(collection_name: CollectionName) -> Response:
         422: {"description": "Validation error."},
     },
 )
-async def delete_collection(collection_name: CollectionName) -> Response:
+async def delete_collection(
+    collection_name: CollectionName,
+    backend: Optional[ObjectStorageBackend] = Depends(object_storage_backend),
+    cache: Optional[DCATCache] = Depends(dcat_cache),
+) -> Response:
     """Delete an empty collection."""
-    raise HTTPException(status_code=501, detail="Not implemented.")
+    with _storage_errors():
+        await _require(backend).delete_collection(collection_name)
+    _invalidate(cache, collection_name)
+    return Response(status_code=204)
 
 
 CREATE_DATASET_DESCRIPTION = """
@@ -157,8 +435,30 @@ corresponding value.
 Note: This operation is in compliance with the OpenStack Swift object
 storage API:
 https://docs.openstack.org/api-ref/object-store/index.html#create-or-replace-object
+
+The dataset may either be uploaded as multipart form (file) or streamed as raw
+request body with content type application/octet-stream.  The latter avoids
+spooling large datasets to disk before they are processed.
+"""
+
+REPLACE_DATASET_DESCRIPTION = """
+Use the If-Match header with the dataset's ETag to only replace a dataset that
+has not been modified concurrently.
 """
 
+# Both operations accept the dataset as raw request body in addition to the
+# multipart form upload that is derived from the function signature.
+CREATE_DATASET_REQUEST_BODY = {
+    "requestBody": {
+        "content": {
+            "application/octet-stream": {
+                "schema": {"type": "string", "format": "binary"},
+            },
+        },
+        "required": True,
+    },
+}
+
 
 @router.put(
     "/{collection_name}/{dataset_name}",
@@ -169,9 +469,14 @@ https://docs.openstack.org/api-ref/object-store/index.html#create-or-replace-obj
     response_model=DatasetCreateResponse,
     status_code=201,
     responses={
+        412: {"description": "Precondition failed."},
         507: {"description": "Insufficient storage."},
     },
-    description="Create or replace a dataset.\n" + CREATE_DATASET_DESCRIPTION,
+    dependencies=[Depends(dataset_write_preconditions)],
+    description="Create or replace a dataset.\n"
+    + CREATE_DATASET_DESCRIPTION
+    + REPLACE_DATASET_DESCRIPTION,
+    openapi_extra=CREATE_DATASET_REQUEST_BODY,
 )
 @router.put(
     "/{collection_name}/",
@@ -185,15 +490,36 @@ https://docs.openstack.org/api-ref/object-store/index.html#create-or-replace-obj
         507: {"description": "Insufficient storage."},
     },
     description="Create a dataset.\n" + CREATE_DATASET_DESCRIPTION,
+    openapi_extra=CREATE_DATASET_REQUEST_BODY,
 )
 async def create_dataset(
     request: Request,
-    file: UploadFile,
     collection_name: CollectionName,
     dataset_name: Optional[DatasetName] = None,
+    file: Optional[UploadFile] = None,
+    backend: Optional[ObjectStorageBackend] = Depends(object_storage_backend),
+    cache: Optional[DCATCache] = Depends(dcat_cache),
 ) -> Union[DatasetCreateResponse, Response]:
-    """Create a new or replace an existing dataset."""
-    raise HTTPException(status_code=501, detail="Not implemented.")
+    """Create a new or replace an existing dataset.
+
+    The file is None in case that the dataset is sent as raw request body, use
+    `streaming.DatasetUploadStream.from_request(request, file)` to consume
+    either form in constant memory.
+    """
+    backend = _require(backend)
+    dataset_name = dataset_name or DatasetName(uuid4().hex)
+    content_type = file.content_type if file else request.headers.get("Content-Type")
+    with _storage_errors():
+        dataset = await backend.put_dataset(
+            collection_name,
+            dataset_name,
+            DatasetUploadStream.from_request(request, file),
+            content_type,
+            metadata_from_headers(request.headers),
+        )
+    _invalidate(cache, collection_name)
+    assert dataset.last_modified is not None
+    return DatasetCreateResponse(last_modified=dataset.last_modified, id=dataset_name)
 
 
 @router.post(
@@ -221,8 +547,11 @@ async def create_dataset(
     },
 )
 async def create_or_replace_dataset_metadata(
+    request: Request,
     collection_name: CollectionName,
     dataset_name: Optional[DatasetName] = None,
+    backend: Optional[ObjectStorageBackend] = Depends(object_storage_backend),
+    cache: Optional[DCATCache] = Depends(dcat_cache),
 ) -> Response:
     """Create or replace dataset metadata.
 
@@ -230,7 +559,15 @@ async def create_or_replace_dataset_metadata(
     storage API:
     https://docs.openstack.org/api-ref/object-store/index.html#create-or-update-object-metadata
     """
-    raise HTTPException(status_code=501, detail="Not implemented.")
+    backend = _require(backend)
+    if dataset_name is None:
+        raise HTTPException(status_code=404, detail="Not found.")
+    with _storage_errors():
+        await backend.update_dataset_metadata(
+            collection_name, dataset_name, metadata_from_headers(request.headers)
+        )
+    _invalidate(cache, collection_name)
+    return Response(status_code=202)
 
 
 @router.head(
@@ -242,11 +579,15 @@ async def create_or_replace_dataset_metadata(
     status_code=200,
     response_class=Response,
     responses={
+        304: {"description": "Not modified."},
         404: {"description": "Not found."},
     },
+    dependencies=[Depends(dataset_read_preconditions)],
 )
 async def get_dataset_metadata(
-    collection_name: CollectionName, dataset_name: DatasetName
+    collection_name: CollectionName,
+    dataset_name: DatasetName,
+    backend: Optional[ObjectStorageBackend] = Depends(object_storage_backend),
 ) -> Response:
     """Get dataset metadata.
 
@@ -262,12 +603,21 @@ async def get_dataset_metadata(
     - Content-Length: 1234
     - X-Object-Meta-my-key: some-value
 
+    The response should include the ETag (derived from the dataset hash) and
+    Last-Modified headers, see the `conditional` module.
+
     Note: This operation is in compliance with the OpenStack Swift object
     storage API:
     https://docs.openstack.org/api-ref/object-store/index.html#show-object-metadata
     """
-    # return Response(content=None, headers={"X-Object-Meta-my-key": "some-value"})
-    raise HTTPException(status_code=501, detail="Not implemented.")
+    with _storage_errors():
+        info = await _require(backend).get_dataset(collection_name, dataset_name)
+    headers = metadata_to_headers(info.metadata)
+    headers.update(Validators.from_dataset(info.dataset).headers())
+    headers["Content-Length"] = str(info.dataset.bytes or 0)
+    if info.dataset.content_type:
+        headers["Content-Type"] = info.dataset.content_type
+    return Response(status_code=200, headers=headers)
 
 
 @router.get(
@@ -278,11 +628,19 @@ async def get_dataset_metadata(
     tags=["DataSource"],
     response_class=Response,
     responses={
+        206: {"description": "Partial content."},
+        304: {"description": "Not modified."},
         404: {"description": "Not found."},
+        416: {"description": "Range not satisfiable."},
     },
+    dependencies=[Depends(dataset_read_preconditions)],
 )
 async def get_dataset(
-    collection_name: CollectionName, dataset_name: DatasetName
+    collection_name: CollectionName,
+    dataset_name: DatasetName,
+    range_: Optional[str] = Header(None, alias="Range"),
+    if_range: Optional[str] = Header(None, alias="If-Range"),
+    backend: Optional[ObjectStorageBackend] = Depends(object_storage_backend),
 ) -> Response:
     """Get a dataset.
 
@@ -303,12 +661,32 @@ async def get_dataset(
     - Content-Length: 1234
     - X-Object-Meta-my-key: some-value
 
+    A single byte range of the dataset may be requested with the Range header
+    (e.g. "Range: bytes=0-1023"), optionally conditioned on the If-Range
+    header.  Satisfiable range requests are answered with 206 (Partial Content)
+    and the Content-Range header, requests for ranges outside of the dataset
+    with 416 (Range Not Satisfiable).
+
     Note: This operation is in compliance with the OpenStack Swift object
     storage API:
     https://docs.openstack.org/api-ref/object-store/index.html#get-object-content-and-metadata
     """
-    # return Response(content=data, headers={"X-Object-Meta-my-key": "some-value"})
-    raise HTTPException(status_code=501, detail="Not implemented.")
+    backend = _require(backend)
+    with _storage_errors():
+        info = await backend.get_dataset(collection_name, dataset_name)
+    validators = Validators.from_dataset(info.dataset)
+    return dataset_response(
+        lambda start, end: backend.read_dataset(
+            collection_name, dataset_name, start, end
+        ),
+        info.dataset.bytes or 0,
+        range_header=range_,
+        if_range=if_range,
+        etag=validators.etag,
+        last_modified=validators.last_modified,
+        media_type=info.dataset.content_type,
+        headers=metadata_to_headers(info.metadata),
+    )
 
 
 @router.delete(
@@ -320,52 +698,42 @@ async def get_dataset(
     status_code=204,
     responses={
         404: {"description": "Not found."},
+        412: {"description": "Precondition failed."},
     },
+    dependencies=[Depends(dataset_write_preconditions)],
 )
 async def delete_dataset(
-    collection_name: CollectionName, dataset_name: DatasetName
+    collection_name: CollectionName,
+    dataset_name: DatasetName,
+    backend: Optional[ObjectStorageBackend] = Depends(object_storage_backend),
+    cache: Optional[DCATCache] = Depends(dcat_cache),
 ) -> Response:
     """Delete a dataset with the given dataset id.
 
+    The deletion is only performed if the optional If-Match header matches the
+    current ETag of the dataset.
+
     Note: This operation is in compliance with the OpenStack Swift object
     storage API:
     https://docs.openstack.org/api-ref/object-store/index.html#delete-object
     """
-    raise HTTPException(status_code=501, detail="Not implemented.")
+    with _storage_errors():
+        await _require(backend).delete_dataset(collection_name, dataset_name)
+    _invalidate(cache, collection_name)
+    return Response(status_code=204)
 
 
-@router.get(
-    "/semanticMappings",
-    operation_id="listSemanticMappings",
-    summary="List all semantic mappings",
-    tags=["DataSource", "DataSink"],
-    response_model=SemanticMappingListResponse,
-    responses={
-        204: {"description": "No mappings found."},
-    },
-)
-async def list_semantic_mappings(
-    limit: int = 100, offset: int = 0
-) -> Union[SemanticMappingListResponse, Response]:
-    """List all semantic mappings."""
-    raise HTTPException(status_code=501, detail="Not implemented.")
+DCAT_DESCRIPTION = """
+The metadata is described with the DCAT vocabulary
+(https://www.w3.org/TR/vocab-dcat-2/) and serialized as Turtle, JSON-LD or
+N-Triples, as negotiated with the Accept header; Turtle is the default.
+"""
 
+DCAT_CONTENT = {
+    media_type: {"schema": {"type": "string"}} for media_type in dcat.MEDIA_TYPES
+}
 
-@router.get(
-    "/semanticMappings/{semantic_mapping_id}",
-    operation_id="getSemanticMapping",
-    summary="Get a specific semantic mapping",
-    tags=["DataSource", "DataSink"],
-    response_model=SemanticMappingModel,
-    responses={
-        404: {"description": "Not found."},
-    },
-)
-async def get_semantic_mapping(
-    semantic_mapping_id,
-) -> Union[SemanticMappingModel, Response]:
-    """Get a semantic mapping."""
-    raise HTTPException(status_code=501, detail="Not implemented.")
+DCAT_HEADERS = {"Vary": "Accept"}
 
 
 @router.get(
@@ -376,12 +744,52 @@ async def get_semantic_mapping(
     tags=["DataSource"],
     response_class=Response,
     responses={
+        200: {"content": DCAT_CONTENT},
         404: {"description": "Not found."},
+        406: {"description": "Not acceptable."},
     },
+    description=DCAT_DESCRIPTION,
 )
-async def get_collection_metadata_dcat(collection_name: CollectionName) -> Response:
-    """Get the DCAT metadata for a collection."""
-    raise HTTPException(status_code=501, detail="Not implemented.")
+async def get_collection_metadata_dcat(
+    request: Request,
+    collection_name: CollectionName,
+    backend: Optional[ObjectStorageBackend] = Depends(object_storage_backend),
+    cache: Optional[DCATCache] = Depends(dcat_cache),
+) -> Response:
+    """Get the DCAT metadata for a collection.
+
+    The collection is described as catalog of its datasets, which are listed
+    page by page while the response is streamed.  The custom metadata of the
+    datasets is only part of their own DCAT metadata.
+    """
+    backend = _require(backend)
+    media_type = negotiate(request)
+    key = cache.key(collection_name, None, media_type) if cache is not None else None
+    body = cache.get(key) if cache is not None else None
+    if body is not None:
+        return Response(body, media_type=media_type, headers=DCAT_HEADERS)
+    with _storage_errors():
+        info = await backend.get_collection(collection_name)
+    base_iri = str(request.base_url)
+
+    async def triples() -> AsyncIterator[dcat.Triple]:
+        for triple in collection_triples(base_iri, info.collection, info.metadata):
+            yield triple
+        datasets: AsyncIterator[DatasetModel] = iter_pages(
+            lambda after, limit, offset: backend.list_datasets(
+                collection_name, limit=limit, offset=offset, after=after
+            ),
+            lambda dataset: dataset.name,
+            limit=sys.maxsize,
+        )
+        async for dataset in datasets:
+            for triple in dataset_triples(base_iri, collection_name, dataset, {}):
+                yield triple
+
+    chunks = iter_serialized(triples(), media_type)
+    if cache is not None:
+        chunks = cache.tee(key, chunks)
+    return StreamingResponse(chunks, media_type=media_type, headers=DCAT_HEADERS)
 
 
 @router.get(
@@ -392,14 +800,72 @@ async def get_collection_metadata_dcat(collection_name: CollectionName) -> Respo
     tags=["DataSource"],
     response_class=Response,
     responses={
+        200: {"content": DCAT_CONTENT},
         404: {"description": "Not found."},
+        406: {"description": "Not acceptable."},
     },
+    description=DCAT_DESCRIPTION,
 )
 async def get_dataset_metadata_dcat(
-    collection_name: CollectionName, dataset_name: DatasetName
+    request: Request,
+    collection_name: CollectionName,
+    dataset_name: DatasetName,
+    backend: Optional[ObjectStorageBackend] = Depends(object_storage_backend),
+    cache: Optional[DCATCache] = Depends(dcat_cache),
 ) -> Response:
     """Get the DCAT metadata for a dataset."""
-    raise HTTPException(status_code=501, detail="Not implemented.")
+    backend = _require(backend)
+    media_type = negotiate(request)
+    key = (
+        cache.key(collection_name, dataset_name, media_type)
+        if cache is not None
+        else None
+    )
+    body = cache.get(key) if cache is not None else None
+    if body is None:
+        with _storage_errors():
+            info = await backend.get_dataset(collection_name, dataset_name)
+        body = serialize(
+            dataset_triples(
+                str(request.base_url), collection_name, info.dataset, info.metadata
+            ),
+            media_type,
+        )
+        if cache is not None:
+            cache.put(key, body)
+    return Response(body, media_type=media_type, headers=DCAT_HEADERS)
+
+
+@contextmanager
+def _query_errors() -> Iterator[None]:
+    "Translate query engine errors into HTTP errors."
+    try:
+        yield
+    except InvalidQuery as error:
+        raise HTTPException(status_code=400, detail=f"Invalid query: {error}")
+    except GraphNotFound:
+        raise HTTPException(status_code=404, detail="Not found.")
+
+
+def _run_query(
+    engine: Optional[QueryEngine],
+    query: QueryModel,
+    limit: int,
+    offset: int,
+    collection_name: Optional[str] = None,
+    dataset_name: Optional[str] = None,
+) -> QueryResponseModel:
+    if engine is None:
+        raise HTTPException(status_code=501, detail="Not implemented.")
+    with _query_errors():
+        variables, solutions = engine.query(
+            query.patterns,
+            collection_name,
+            dataset_name,
+            limit=limit,
+            offset=offset,
+        )
+        return QueryResponseModel(variables=variables, items=list(solutions))
 
 
 @router.post(
@@ -407,13 +873,24 @@ async def get_dataset_metadata_dcat(
     operation_id="query",
     summary="execute a search query on datastore",
     tags=["DataSource"],
+    response_model=QueryResponseModel,
     responses={
         400: {"description": "improper query."},
     },
 )
-async def query(limit: int = 100, offset: int = 0):
-    """returns matching triples"""
-    raise HTTPException(status_code=501, detail="Not implemented.")
+async def query(
+    query: QueryModel,
+    limit: int = 100,
+    offset: int = 0,
+    engine: Optional[QueryEngine] = Depends(query_engine),
+) -> QueryResponseModel:
+    """returns matching triples
+
+    The query is a basic graph pattern that is matched against the metadata of
+    all datasets.  Each item binds the variables of the patterns for one
+    matching subgraph.
+    """
+    return _run_query(engine, query, limit, offset)
 
 
 @router.post(
@@ -421,10 +898,388 @@ async def query(limit: int = 100, offset: int = 0):
     operation_id="queryDataset",
     summary="execute a search query on specific dataset in datastore",
     tags=["DataSource"],
+    response_model=QueryResponseModel,
     responses={
         400: {"description": "improper query."},
+        404: {"description": "Not found."},
+    },
+)
+async def query_dataset(
+    collection_name: CollectionName,
+    dataset_name: DatasetName,
+    query: QueryModel,
+    limit: int = 100,
+    offset: int = 0,
+    engine: Optional[QueryEngine] = Depends(query_engine),
+) -> QueryResponseModel:
+    """returns matching triples
+
+    The query is a basic graph pattern that is matched against the metadata of
+    the dataset only.
+    """
+    return _run_query(engine, query, limit, offset, collection_name, dataset_name)
+
+
+MAX_BULK_OPERATIONS = 10000
+
+BULK_DESCRIPTION = f"""
+Apply operations on many datasets of the collection with a single request, in
+the spirit of the bulk-delete and extract-archive operations of the OpenStack
+Swift object storage API.
+
+The request body is either a JSON list of up to {MAX_BULK_OPERATIONS} operations
+or a tar archive (application/x-tar, or application/gzip if compressed).  The
+regular files of an archive are created or replaced as datasets named by their
+path within the archive, with the custom metadata of the X-Object-Meta-*
+headers of the request.  Dataset names must not contain "/", i.e., files in
+directories of the archive fail with status code 400.
+
+The operations are applied in order.  The response lists the status code of
+each operation, the failure of an operation does not abort the others.
+"""
+
+ARCHIVE_MEDIA_TYPES = ("application/x-tar", "application/gzip")
+
+BULK_REQUEST_BODY = {
+    "requestBody": {
+        "content": {
+            "application/json": {
+                "schema": {
+                    "type": "array",
+                    "items": BulkOperationModel.schema(),
+                    "maxItems": MAX_BULK_OPERATIONS,
+                },
+            },
+            **{
+                media_type: {"schema": {"type": "string", "format": "binary"}}
+                for media_type in ARCHIVE_MEDIA_TYPES
+            },
+        },
+        "required": True,
+    },
+}
+
+
+async def _iter_content(content: bytes) -> AsyncIterator[bytes]:
+    yield content
+
+
+def _bulk_operation(operation: BulkOperationModel) -> BulkOperation:
+    if operation.method != "PUT":
+        return BulkOperation(operation.method, operation.name)
+    content = operation.content or ""
+    try:
+        data = (
+            b64decode(content, validate=True)
+            if operation.content_encoding == "base64"
+            else content.encode()
+        )
+    except binascii.Error:
+        raise HTTPException(
+            status_code=400, detail=f"Invalid base64 content of {operation.name}."
+        )
+    return BulkOperation(
+        "PUT",
+        operation.name,
+        DatasetUploadStream(_iter_content(data)),
+        operation.content_type,
+        operation.metadata,
+    )
+
+
+async def _iter_operations(
+    operations: List[BulkOperation],
+) -> AsyncIterator[BulkOperation]:
+    for operation in operations:
+        yield operation
+
+
+async def _addressable_operations(
+    operations: AsyncIterator[BulkOperation], rejected: Dict[int, BulkResult]
+) -> AsyncIterator[BulkOperation]:
+    """Pass on the operations on names that the dataset routes can address.
+
+    The results of the other operations are added to rejected by position.
+    """
+    position = 0
+    async for operation in operations:
+        if "/" in operation.dataset_name:
+            rejected[position] = BulkResult(
+                operation.dataset_name, 400, detail="Invalid dataset name."
+            )
+        else:
+            yield operation
+        position += 1
+
+
+def _merge_results(
+    results: List[BulkResult], rejected: Dict[int, BulkResult]
+) -> List[BulkResult]:
+    merged = list(results)
+    for position in sorted(rejected):
+        merged.insert(position, rejected[position])
+    return merged
+
+
+async def _archive_operations(
+    request: Request, media_type: str, metadata: Dict[str, str]
+) -> AsyncIterator[BulkOperation]:
+    source: AsyncIterator[bytes] = request.stream()
+    if media_type == "application/gzip":
+        source = iter_gunzip(source)
+    async for member in iter_tar(source):
+        name = member.name
+        while name.startswith(("./", "/")):
+            name = name[2:] if name.startswith("./") else name[1:]
+        if not name:
+            continue
+        yield BulkOperation(
+            "PUT",
+            DatasetName(name),
+            DatasetUploadStream(member.chunks),
+            mimetypes.guess_type(name)[0],
+            dict(metadata),
+        )
+
+
+def _bulk_item(result: BulkResult) -> BulkItemResponseModel:
+    return BulkItemResponseModel(
+        name=result.dataset_name,
+        status_code=result.status_code,
+        dataset=result.info.dataset if result.info else None,
+        metadata=result.info.metadata if result.info else None,
+        detail=result.detail,
+    )
+
+
+# Registered after the query operations, which it would match otherwise.
+@router.post(
+    "/{collection_name}",
+    name="Bulk Dataset Operations",
+    operation_id="bulkDatasetOperations",
+    summary="Apply operations on many datasets",
+    tags=["DataSink"],
+    response_model=BulkResponseModel,
+    responses={
+        400: {"description": "Invalid archive."},
+        404: {"description": "Collection not found."},
+        415: {"description": "Unsupported media type."},
+        507: {"description": "Insufficient storage."},
+    },
+    description=BULK_DESCRIPTION,
+    openapi_extra=BULK_REQUEST_BODY,
+)
+async def bulk_dataset_operations(
+    request: Request,
+    collection_name: CollectionName,
+    backend: Optional[ObjectStorageBackend] = Depends(object_storage_backend),
+    cache: Optional[DCATCache] = Depends(dcat_cache),
+) -> BulkResponseModel:
+    """Create, delete, or get the metadata of many datasets.
+
+    The backend receives all operations with a single call to its ``bulk``
+    method if it implements one, see `storage.apply_bulk`.
+    """
+    backend = _require(backend)
+    content_type = request.headers.get("Content-Type", "")
+    media_type = content_type.split(";")[0].strip().lower()
+    operations: AsyncIterator[BulkOperation]
+    if media_type == "application/json":
+        try:
+            models = parse_raw_as(
+                conlist(BulkOperationModel, max_items=MAX_BULK_OPERATIONS),
+                await request.body(),
+            )
+        except ValidationError as error:
+            raise RequestValidationError(error.raw_errors)
+        operations = _iter_operations([_bulk_operation(model) for model in models])
+    elif media_type in ARCHIVE_MEDIA_TYPES:
+        operations = _archive_operations(
+            request, media_type, metadata_from_headers(request.headers)
+        )
+    else:
+        raise HTTPException(status_code=415, detail="Unsupported media type.")
+    rejected: Dict[int, BulkResult] = {}
+    operations = _addressable_operations(operations, rejected)
+    try:
+        with _storage_errors():
+            results = await apply_bulk(backend, collection_name, operations)
+    except InvalidArchive as error:
+        raise HTTPException(status_code=400, detail=f"Invalid archive: {error}")
+    results = _merge_results(results, rejected)
+    if any(result.status_code in (201, 204) for result in results):
+        _invalidate(cache, collection_name)
+    return BulkResponseModel(items=[_bulk_item(result) for result in results])
+
+
+MULTIPART_UPLOAD_DESCRIPTION = """
+Large datasets may be uploaded in parts, in the spirit of the static large
+objects of the OpenStack Swift object storage API and S3 multipart uploads:
+
+1. Create an upload with this operation, the Content-Type and X-Object-Meta-*
+   headers are those of the dataset.
+2. Upload the parts with uploadPart, in parallel and in any order.  Parts are
+   numbered from 1 and replaced if uploaded again.
+3. Complete the upload with completeMultipartUpload, which creates or replaces
+   the dataset with the parts in the order of their numbers or as listed.
+
+Interrupted uploads are resumed by uploading the parts that are missing from
+listUploadParts, and discarded with abortMultipartUpload.
+"""
+
+
+@router.post(
+    "/{collection_name}/{dataset_name}/uploads",
+    name="Create Multipart Upload",
+    operation_id="createMultipartUpload",
+    summary="Start uploading a dataset in parts",
+    tags=["DataSink"],
+    status_code=201,
+    response_model=MultipartUploadModel,
+    responses={
+        404: {"description": "Collection not found."},
+    },
+    description=MULTIPART_UPLOAD_DESCRIPTION,
+)
+async def create_multipart_upload(
+    request: Request,
+    collection_name: CollectionName,
+    dataset_name: DatasetName,
+    backend: Optional[ObjectStorageBackend] = Depends(object_storage_backend),
+) -> MultipartUploadModel:
+    """Create a multipart upload of a dataset."""
+    with _storage_errors():
+        upload_id = await _require_multipart(backend).create_upload(
+            collection_name,
+            dataset_name,
+            request.headers.get("Content-Type"),
+            metadata_from_headers(request.headers),
+        )
+    return MultipartUploadModel(upload_id=upload_id)
+
+
+@router.get(
+    "/{collection_name}/{dataset_name}/uploads/{upload_id}",
+    name="List Upload Parts",
+    operation_id="listUploadParts",
+    summary="List the parts of a multipart upload",
+    tags=["DataSink"],
+    response_model=MultipartUploadModel,
+    responses={
+        404: {"description": "Upload not found."},
+    },
+)
+async def list_upload_parts(
+    collection_name: CollectionName,
+    dataset_name: DatasetName,
+    upload_id: str,
+    backend: Optional[ObjectStorageBackend] = Depends(object_storage_backend),
+) -> MultipartUploadModel:
+    """List the parts that have been uploaded so far."""
+    with _storage_errors():
+        parts = await _require_multipart(backend).list_upload_parts(
+            collection_name, dataset_name, upload_id
+        )
+    return MultipartUploadModel(upload_id=upload_id, parts=parts)
+
+
+@router.put(
+    "/{collection_name}/{dataset_name}/uploads/{upload_id}/{part_number}",
+    name="Upload Part",
+    operation_id="uploadPart",
+    summary="Upload a part of a dataset",
+    tags=["DataSink"],
+    status_code=201,
+    response_model=UploadPartModel,
+    responses={
+        404: {"description": "Upload not found."},
+        507: {"description": "Insufficient storage."},
     },
+    openapi_extra=CREATE_DATASET_REQUEST_BODY,
 )
-async def query_dataset(limit: int = 100, offset: int = 0):
-    """returns matching triples"""
-    raise HTTPException(status_code=501, detail="Not implemented.")
+async def upload_part(
+    request: Request,
+    collection_name: CollectionName,
+    dataset_name: DatasetName,
+    upload_id: str,
+    part_number: int = Path(..., ge=1, le=MAX_UPLOAD_PARTS),
+    backend: Optional[ObjectStorageBackend] = Depends(object_storage_backend),
+) -> UploadPartModel:
+    """Create or replace a part of a multipart upload.
+
+    The part is sent as raw request body, the response contains its hash.
+    """
+    with _storage_errors():
+        return await _require_multipart(backend).put_upload_part(
+            collection_name,
+            dataset_name,
+            upload_id,
+            part_number,
+            DatasetUploadStream.from_request(request),
+        )
+
+
+@router.post(
+    "/{collection_name}/{dataset_name}/uploads/{upload_id}",
+    name="Complete Multipart Upload",
+    operation_id="completeMultipartUpload",
+    summary="Create a dataset from the uploaded parts",
+    tags=["DataSink"],
+    status_code=201,
+    response_model=DatasetCreateResponse,
+    responses={
+        400: {"description": "Invalid manifest."},
+        404: {"description": "Upload not found."},
+    },
+)
+async def complete_multipart_upload(
+    collection_name: CollectionName,
+    dataset_name: DatasetName,
+    upload_id: str,
+    manifest: Optional[UploadManifestModel] = None,
+    backend: Optional[ObjectStorageBackend] = Depends(object_storage_backend),
+    cache: Optional[DCATCache] = Depends(dcat_cache),
+) -> DatasetCreateResponse:
+    """Complete a multipart upload.
+
+    The manifest lists the parts of the dataset in order, optionally with
+    their hashes to make sure that they have not been replaced since.  All
+    uploaded parts are used in the order of their numbers without manifest.
+    The dataset's parts are assembled while it is read.
+    """
+    with _storage_errors():
+        dataset = await _require_multipart(backend).complete_upload(
+            collection_name,
+            dataset_name,
+            upload_id,
+            manifest.parts if manifest is not None else None,
+        )
+    _invalidate(cache, collection_name)
+    assert dataset.last_modified is not None
+    return DatasetCreateResponse(last_modified=dataset.last_modified, id=dataset_name)
+
+
+@router.delete(
+    "/{collection_name}/{dataset_name}/uploads/{upload_id}",
+    name="Abort Multipart Upload",
+    operation_id="abortMultipartUpload",
+    summary="Discard a multipart upload",
+    tags=["DataSink"],
+    status_code=204,
+    response_class=Response,
+    responses={
+        404: {"description": "Upload not found."},
+    },
+)
+async def abort_multipart_upload(
+    collection_name: CollectionName,
+    dataset_name: DatasetName,
+    upload_id: str,
+    backend: Optional[ObjectStorageBackend] = Depends(object_storage_backend),
+) -> Response:
+    """Discard a multipart upload and its parts."""
+    with _storage_errors():
+        await _require_multipart(backend).abort_upload(
+            collection_name, dataset_name, upload_id
+        )
+    return Response(status_code=204)
@@ -1,9 +1,38 @@
-from typing import Optional
+from datetime import datetime, timezone
+from typing import AsyncIterator, Awaitable, Callable, List, Optional, Tuple, Union
+from uuid import UUID
 
-from fastapi import APIRouter, HTTPException
-from fastapi.responses import HTMLResponse, JSONResponse, Response
+from fastapi import APIRouter, Depends, HTTPException, Query, Request
+from fastapi.concurrency import run_in_threadpool
+from fastapi.responses import HTMLResponse, JSONResponse, PlainTextResponse, Response
 
-from ..models.system import GlobalSearchResponse
+from ..dcat import DCATCache, dcat_cache
+from ..execution import (
+    FINAL_STATES,
+    TransformationExecutor,
+    TransformationNotFound,
+    transformation_executor,
+)
+from ..logs import LogEntry, LogStore, log_store
+from ..metrics import (
+    CONTENT_TYPE,
+    MetricFamily,
+    Metrics,
+    dcat_cache_metrics,
+    executor_metrics,
+    metrics_registry,
+)
+from ..models.system import GlobalSearchResponse, LogEntryModel, LogListResponse
+from ..models.transformation import TransformationId
+from ..pagination import iter_pages, next_page_cursor, parse_cursor
+from ..search import SearchIndex, search_index
+from ..streaming import (
+    EventStreamResponse,
+    NDJSONResponse,
+    accepts_ndjson,
+    event_stream_response_schema,
+    ndjson_response_schema,
+)
 
 router = APIRouter(
     tags=["System"],
@@ -15,16 +44,44 @@ router = APIRouter(
     operation_id="globalSearch",
     summary="Respond to global search queries",
     responses={
+        400: {"description": "Invalid cursor."},
         422: {"description": "Validation error."},
         501: {"description": "Not implemented."},
     },
     response_model=GlobalSearchResponse,
 )
 async def global_search(
-    q: str, limit: Optional[int] = 100, offset: Optional[int] = 0
+    request: Request,
+    q: str,
+    limit: Optional[int] = 100,
+    offset: Optional[int] = 0,
+    cursor: Optional[str] = None,
+    index: Optional[SearchIndex] = Depends(search_index),
 ) -> GlobalSearchResponse:
-    """Respond to global search queries."""
-    raise HTTPException(status_code=501, detail="Not implemented.")
+    """Respond to global search queries.
+
+    Results are ordered by descending score and paginated with limit and
+    offset, or with the cursor returned as next_cursor by the previous page.
+    """
+    if index is None:
+        raise HTTPException(status_code=501, detail="Not implemented.")
+    key = parse_cursor(cursor)
+    after: Optional[Tuple[float, str]] = None
+    if key is not None:
+        if not (
+            len(key) == 2
+            and isinstance(key[0], (int, float))
+            and isinstance(key[1], str)
+        ):
+            raise HTTPException(status_code=400, detail="Invalid cursor.")
+        after = (key[0], key[1])
+    limit = 100 if limit is None else limit
+    hits = index.search(q, limit, offset or 0, after=after)
+    base_url = str(request.base_url)
+    return GlobalSearchResponse(
+        items=[hit.model(base_url) for hit in hits],
+        next_cursor=hits[-1].cursor() if hits and len(hits) == limit else None,
+    )
 
 
 @router.get(
@@ -38,6 +95,36 @@ async def heartbeat() -> HTMLResponse:
     return HTMLResponse(content="<html><body>OK</body></html>", status_code=200)
 
 
+@router.get(
+    "/metrics",
+    operation_id="getMetrics",
+    summary="Returns metrics of the application.",
+    response_class=PlainTextResponse,
+    responses={
+        200: {"content": {CONTENT_TYPE: {}}},
+        501: {"description": "Not implemented."},
+    },
+)
+async def get_metrics(
+    metrics: Optional[Metrics] = Depends(metrics_registry),
+    executor: Optional[TransformationExecutor] = Depends(transformation_executor),
+    cache: Optional[DCATCache] = Depends(dcat_cache),
+) -> Response:
+    """Return operational metrics in the Prometheus text exposition format.
+
+    The metrics include request counts, latencies and transferred bytes by
+    operation, and the state of the caches and the transformation queue.
+    """
+    if metrics is None:
+        raise HTTPException(status_code=501, detail="Not implemented.")
+    families: List[MetricFamily] = []
+    if executor is not None:
+        families.extend(executor_metrics(executor))
+    if cache is not None:
+        families.extend(dcat_cache_metrics(cache))
+    return Response(metrics.render(families), media_type=CONTENT_TYPE)
+
+
 @router.get(
     "/info",
     operation_id="getInfo",
@@ -60,14 +147,114 @@ async def get_info() -> JSONResponse:
     "/logs",
     operation_id="getLogs",
     summary="Returns logs from the application.",
+    response_model=LogListResponse,
     responses={
+        200: {
+            "content": {
+                **ndjson_response_schema("LogEntryModel")["content"],
+                **event_stream_response_schema("LogEntryModel")["content"],
+            }
+        },
+        400: {"description": "Invalid cursor."},
         404: {"description": "Not found."},
         501: {"description": "Not implemented."},
     },
 )
-async def get_logs(id: Optional[str], limit: int = 100, offset: int = 0) -> Response:
+async def get_logs(
+    request: Request,
+    id: Optional[str] = None,
+    limit: int = Query(100, ge=1),
+    offset: int = 0,
+    cursor: Optional[str] = None,
+    since: Optional[datetime] = Query(
+        None, description="Only return entries logged at or after this time."
+    ),
+    follow: bool = Query(
+        False, description="Stream the entries and wait for new ones."
+    ),
+    store: Optional[LogStore] = Depends(log_store),
+    executor: Optional[TransformationExecutor] = Depends(transformation_executor),
+) -> Union[LogListResponse, Response]:
     """Return application logs.
 
     If an id is provided, the logs will be for a specific entity (transformation, collection or dataset).
+
+    Results are paginated with limit and offset, or with the cursor returned
+    as next_cursor by the previous page.  With "Accept: application/x-ndjson"
+    the entries are streamed as newline-delimited JSON instead.
+
+    With follow, the entries are sent as "log" Server-Sent Events, followed
+    by the entries logged later on.  The logs of a transformation are
+    followed until it reached a final state, other logs until the client
+    disconnects.
     """
-    raise HTTPException(status_code=501, detail="Not implemented.")
+    if store is None:
+        raise HTTPException(status_code=501, detail="Not implemented.")
+    key = parse_cursor(cursor)
+    after: Optional[int] = None
+    if key is not None:
+        if not (len(key) == 1 and isinstance(key[0], int)):
+            raise HTTPException(status_code=400, detail="Invalid cursor.")
+        after = key[0]
+    timestamp: Optional[float] = None
+    if since is not None:
+        if since.tzinfo is None:
+            since = since.replace(tzinfo=timezone.utc)
+        timestamp = since.timestamp()
+    if follow:
+        until = None
+        if id is not None and executor is not None:
+            until = _transformation_finished(executor, id)
+        entries = store.follow(id, after, timestamp, until=until)
+        return EventStreamResponse(_iter_log_models(entries), event="log")
+    if accepts_ndjson(request):
+        entries = iter_pages(
+            _log_fetcher(store, id, timestamp),
+            lambda entry: entry.sequence,
+            after=after,
+            limit=limit,
+            offset=offset,
+        )
+        return NDJSONResponse(_iter_log_models(entries))
+    page = await run_in_threadpool(store.query, id, after, timestamp, limit, offset)
+    return LogListResponse(
+        items=[entry.model() for entry in page],
+        next_cursor=next_page_cursor(page, limit, key=lambda entry: (entry.sequence,)),
+    )
+
+
+def _transformation_finished(
+    executor: TransformationExecutor, id: str
+) -> Optional[Callable[[], bool]]:
+    """Return whether the transformation finished, None if not a transformation."""
+    try:
+        transformation_id = TransformationId(UUID(id))
+        executor.get_state(transformation_id)
+    except (ValueError, TransformationNotFound):
+        return None
+
+    def finished() -> bool:
+        try:
+            return executor.get_state(transformation_id) in FINAL_STATES
+        except TransformationNotFound:
+            return True
+
+    return finished
+
+
+def _log_fetcher(
+    store: LogStore, id: Optional[str], since: Optional[float]
+) -> Callable[[Optional[int], int, int], Awaitable[List[LogEntry]]]:
+    """Return the fetch function of `iter_pages` for the log entries."""
+
+    async def fetch(after: Optional[int], limit: int, offset: int) -> List[LogEntry]:
+        return await run_in_threadpool(store.query, id, after, since, limit, offset)
+
+    return fetch
+
+
+async def _iter_log_models(
+    entries: AsyncIterator[LogEntry],
+) -> AsyncIterator[LogEntryModel]:
+    async for entry in entries:
+        yield entry.model()
@@ -1,16 +1,41 @@
-from fastapi import APIRouter, HTTPException
+from contextlib import contextmanager
+from typing import AsyncIterator, Callable, Iterator, Optional, Union
+
+from fastapi import APIRouter, Depends, HTTPException, Query, Request
 from fastapi.responses import Response
 
+from ..execution import (
+    FINAL_STATES,
+    InvalidStateTransition,
+    TransformationExecutor,
+    TransformationNotFound,
+    transformation_executor,
+)
 from ..models.transformation import (
     NewTransformationModel,
     TransformationCreateResponse,
     TransformationId,
     TransformationListResponse,
     TransformationModel,
+    TransformationState,
     TransformationStateResponse,
     TransformationUpdateModel,
     TransformationUpdateResponse,
 )
+from ..pagination import InvalidCursor
+from ..streaming import (
+    EventStreamResponse,
+    NDJSONResponse,
+    accepts_ndjson,
+    event_stream_response_schema,
+    ndjson_response_schema,
+)
+
+# The maximum number of seconds a state request waits for a change.
+MAX_WAIT = 60.0
+
+# The number of transformations fetched at once while streaming them.
+NDJSON_BATCH_SIZE = 1000
 
 router = APIRouter(
     prefix="/transformations",
@@ -21,6 +46,25 @@ router = APIRouter(
 )
 
 
+def _require(executor: Optional[TransformationExecutor]) -> TransformationExecutor:
+    if executor is None:
+        raise HTTPException(status_code=501, detail="Not implemented.")
+    return executor
+
+
+@contextmanager
+def _execution_errors() -> Iterator[None]:
+    "Translate transformation executor errors into HTTP errors."
+    try:
+        yield
+    except TransformationNotFound:
+        raise HTTPException(status_code=404, detail="Not found.")
+    except InvalidStateTransition as error:
+        raise HTTPException(status_code=409, detail=f"Invalid transition: {error}")
+    except InvalidCursor:
+        raise HTTPException(status_code=400, detail="Invalid cursor.")
+
+
 @router.post(
     "",
     operation_id="newTransformation",
@@ -29,6 +73,7 @@ router = APIRouter(
 )
 async def create_transformation(
     transformation: NewTransformationModel,
+    executor: Optional[TransformationExecutor] = Depends(transformation_executor),
 ) -> TransformationCreateResponse:
     """Create a new transformation.
 
@@ -40,7 +85,10 @@ async def create_transformation(
 
     Note that the parameters of an existing transformation can not be changed.
     """
-    raise HTTPException(status_code=501, detail="Not implemented.")
+    id = await _require(executor).create(
+        transformation.parameters, state=transformation.state
+    )
+    return TransformationCreateResponse(id=id)
 
 
 @router.get(
@@ -54,9 +102,11 @@ async def create_transformation(
 )
 async def get_transformation(
     transformation_id: TransformationId,
+    executor: Optional[TransformationExecutor] = Depends(transformation_executor),
 ) -> TransformationModel:
     """Retrieve an existing transformation."""
-    raise HTTPException(status_code=501, detail="Not implemented.")
+    with _execution_errors():
+        return _require(executor).get(transformation_id)
 
 
 @router.delete(
@@ -70,9 +120,12 @@ async def get_transformation(
 )
 async def delete_transformation(
     transformation_id: TransformationId,
+    executor: Optional[TransformationExecutor] = Depends(transformation_executor),
 ) -> Response:
     """Delete an existing transformation."""
-    raise HTTPException(status_code=501, detail="Not implemented.")
+    with _execution_errors():
+        await _require(executor).delete(transformation_id)
+    return Response(status_code=204)
 
 
 @router.patch(
@@ -88,7 +141,9 @@ async def delete_transformation(
     },
 )
 async def update_transformation(
-    id: TransformationId, update: TransformationUpdateModel
+    id: TransformationId,
+    update: TransformationUpdateModel,
+    executor: Optional[TransformationExecutor] = Depends(transformation_executor),
 ) -> TransformationUpdateResponse:
     """Update an existing transformation.
 
@@ -97,7 +152,9 @@ async def update_transformation(
     changed from CREATED to RUNNING or from RUNNING to STOPPED.  All other state
     update requests will result in a 409 conflict error.
     """
-    raise HTTPException(status_code=501, detail="Not implemented.")
+    with _execution_errors():
+        await _require(executor).update(id, update.state)
+    return TransformationUpdateResponse(id=id, state=update.state)
 
 
 @router.get(
@@ -111,9 +168,79 @@ async def update_transformation(
 )
 async def get_transformation_state(
     transformation_id: TransformationId,
+    wait: float = Query(
+        0,
+        ge=0,
+        le=MAX_WAIT,
+        description="Seconds to wait for the state to change before responding.",
+    ),
+    current_state: Optional[TransformationState] = Query(
+        None, description="The state known to the client when waiting."
+    ),
+    executor: Optional[TransformationExecutor] = Depends(transformation_executor),
 ) -> TransformationStateResponse:
-    """Retrieve the state of a transformation."""
-    raise HTTPException(status_code=501, detail="Not implemented.")
+    """Retrieve the state of a transformation.
+
+    With wait, the response is delayed until the state differs from
+    current_state or, without current_state, until the transformation reached
+    a final state (STOPPED, COMPLETED, or FAILED).  The state at the end of the
+    wait is returned, whether it changed or not.
+    """
+    executor = _require(executor)
+    with _execution_errors():
+        if wait:
+            state = await executor.wait_for_state(
+                transformation_id,
+                until=_state_changed(current_state),
+                timeout=wait,
+            )
+        else:
+            state = executor.get_state(transformation_id)
+    return TransformationStateResponse(id=transformation_id, state=state)
+
+
+def _state_changed(
+    current_state: Optional[TransformationState],
+) -> Callable[[TransformationState], bool]:
+    if current_state is None:
+        return lambda state: state in FINAL_STATES
+    return lambda state: state is not current_state
+
+
+@router.get(
+    "/{transformation_id}/events",
+    operation_id="getTransformationEvents",
+    summary="Subscribe to the state changes of a transformation",
+    response_class=EventStreamResponse,
+    responses={
+        200: event_stream_response_schema("TransformationStateResponse"),
+        404: {"description": "Not found."},
+    },
+)
+async def get_transformation_events(
+    transformation_id: TransformationId,
+    executor: Optional[TransformationExecutor] = Depends(transformation_executor),
+) -> EventStreamResponse:
+    """Subscribe to the state changes of a transformation as Server-Sent Events.
+
+    Sends a "state" event with the current state and one for every following
+    state change.  The stream ends once the transformation reached a final
+    state or was deleted.
+    """
+    executor = _require(executor)
+    with _execution_errors():
+        executor.get_state(transformation_id)
+    return EventStreamResponse(_iter_states(executor, transformation_id), event="state")
+
+
+async def _iter_states(
+    executor: TransformationExecutor, id: TransformationId
+) -> AsyncIterator[TransformationStateResponse]:
+    try:
+        async for state in executor.watch(id):
+            yield TransformationStateResponse(id=id, state=state)
+    except TransformationNotFound:
+        pass  # Deleted before the subscription.
 
 
 @router.get(
@@ -121,9 +248,49 @@ async def get_transformation_state(
     operation_id="getTransformationList",
     summary="List all transformations",
     response_model=TransformationListResponse,
+    responses={
+        200: ndjson_response_schema("TransformationModel"),
+        400: {"description": "Invalid cursor."},
+    },
 )
 async def list_transformation(
-    limit: int = 100, offset: int = 0
-) -> TransformationListResponse:
-    """Retrieve a list of transformations."""
-    raise HTTPException(status_code=501, detail="Not implemented.")
+    request: Request,
+    limit: int = Query(100, ge=1),
+    offset: int = 0,
+    cursor: Optional[str] = None,
+    executor: Optional[TransformationExecutor] = Depends(transformation_executor),
+) -> Union[TransformationListResponse, Response]:
+    """Retrieve a list of transformations.
+
+    Results are paginated with limit and offset, or with the cursor returned
+    as next_cursor by the previous page.
+
+    With "Accept: application/x-ndjson" the transformations are streamed as
+    newline-delimited JSON instead.
+    """
+    executor = _require(executor)
+    ndjson = accepts_ndjson(request)
+    with _execution_errors():
+        # Streamed transformations are fetched in bounded batches.
+        page = await executor.list_transformations(
+            min(limit, NDJSON_BATCH_SIZE) if ndjson else limit, offset, cursor
+        )
+    if ndjson:
+        return NDJSONResponse(_iter_transformations(executor, page, limit))
+    return page
+
+
+async def _iter_transformations(
+    executor: TransformationExecutor, page: TransformationListResponse, limit: int
+) -> AsyncIterator[TransformationModel]:
+    """Iterate over the first page and up to ``limit`` items in total."""
+    remaining = limit
+    while True:
+        for item in page.items[:remaining]:
+            yield item
+        remaining -= len(page.items)
+        if remaining <= 0 or page.next_cursor is None:
+            break
+        page = await executor.list_transformations(
+            min(remaining, NDJSON_BATCH_SIZE), cursor=page.next_cursor
+        )
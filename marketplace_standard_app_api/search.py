@@ -0,0 +1,475 @@
+"""In-process full-text search for the globalSearch operation.
+
+The globalSearch operation responds with 501 (Not implemented) unless an
+application provides a `SearchIndex`.  Collections and datasets are indexed
+as they are created, updated, and deleted if the storage backend is wrapped
+with `IndexedStorage`:
+
+    index = SearchIndex("/var/lib/my-app/search-index.json")
+    backend = IndexedStorage(FileSystemStorage("/var/lib/my-app/data"), index)
+    use_object_storage_backend(api, backend)
+    use_search_index(api, index)
+
+Other entities, e.g., transformations, are indexed with `SearchIndex.add`.
+
+Entries are ranked by the BM25 relevance of their label and description for
+the query terms.  Only the postings of the query terms are visited and the
+top-ranked entries are selected with a heap, such that queries do not scan the
+catalog.  The index is persisted to its path on shutdown and loaded from it on
+startup; entries are kept as term frequencies, i.e., loading does not
+tokenize the entries again.  Changes are appended to a journal next to the
+path as they are made and replayed on startup, such that they survive an
+application that is not shut down cleanly.
+"""
+
+import heapq
+import json
+import math
+import os
+import re
+import tempfile
+from collections import Counter
+from pathlib import Path
+from typing import (
+    IO,
+    Any,
+    AsyncIterator,
+    Dict,
+    Iterator,
+    List,
+    NamedTuple,
+    Optional,
+    Tuple,
+    Union,
+    cast,
+)
+from urllib.parse import quote
+
+from fastapi import FastAPI
+
+from .models.object_storage import (
+    CollectionModel,
+    CollectionName,
+    DatasetModel,
+    DatasetName,
+    UploadManifestPartModel,
+)
+from .models.system import GlobalSearchResponseItemModel
+from .pagination import encode_cursor
+from .storage import (
+    BulkOperation,
+    BulkResult,
+    CollectionInfo,
+    DatasetInfo,
+    MultipartUploadBackend,
+    ObjectStorageBackend,
+    apply_bulk,
+)
+from .streaming import DatasetUploadStream
+
+_TOKEN = re.compile(r"\w+")
+
+
+def tokenize(text: str) -> List[str]:
+    """Split text into lower-case word tokens."""
+    return _TOKEN.findall(text.lower())
+
+
+class SearchEntry(NamedTuple):
+    label: Optional[str]
+    description: Optional[str]
+    path: Optional[str]
+    terms: Dict[str, int]
+    length: int
+
+
+class SearchHit(NamedTuple):
+    key: str
+    score: float
+    entry: SearchEntry
+
+    def model(self, base_url: str = "") -> GlobalSearchResponseItemModel:
+        path = self.entry.path
+        return GlobalSearchResponseItemModel(
+            label=self.entry.label,
+            description=self.entry.description,
+            url=base_url.rstrip("/") + path if path and base_url else None,
+            score=self.score,
+        )
+
+    def cursor(self) -> str:
+        return encode_cursor([self.score, self.key])
+
+
+class SearchIndex:
+    """Inverted index of labeled entries with BM25 ranking.
+
+    Args:
+        path: The file the index is persisted to, loaded on creation if it
+            exists.  Changes since the last `save` are journaled to the
+            file of the same name with the suffix ".journal".
+        k1: The BM25 term frequency saturation.
+        b: The BM25 length normalization.
+    """
+
+    def __init__(
+        self,
+        path: Union[str, "os.PathLike[str]", None] = None,
+        k1: float = 1.2,
+        b: float = 0.75,
+    ):
+        self.path = Path(path) if path is not None else None
+        self.k1 = k1
+        self.b = b
+        self._entries: Dict[str, SearchEntry] = {}
+        self._postings: Dict[str, Dict[str, int]] = {}
+        self._total_length = 0
+        self._journal: Optional[IO[bytes]] = None
+        if self.path is not None:
+            self.load()
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def __contains__(self, key: object) -> bool:
+        return key in self._entries
+
+    def add(
+        self,
+        key: str,
+        label: Optional[str],
+        description: Optional[str] = None,
+        path: Optional[str] = None,
+    ) -> None:
+        """Add or replace the entry with the given key.
+
+        The path is resolved against the base URL of the application in
+        search results.
+        """
+        terms = Counter(tokenize(" ".join(filter(None, (label, description)))))
+        self._insert(
+            key, SearchEntry(label, description, path, terms, sum(terms.values()))
+        )
+        self._append([key, label, description, path, terms])
+
+    def _insert(self, key: str, entry: SearchEntry) -> None:
+        self._remove(key)
+        self._entries[key] = entry
+        self._total_length += entry.length
+        for term, frequency in entry.terms.items():
+            self._postings.setdefault(term, {})[key] = frequency
+
+    def remove(self, key: str) -> None:
+        """Remove the entry with the given key, if present."""
+        if key in self._entries:
+            self._remove(key)
+            self._append([key])
+
+    def _remove(self, key: str) -> None:
+        entry = self._entries.pop(key, None)
+        if entry is None:
+            return
+        self._total_length -= entry.length
+        for term in entry.terms:
+            postings = self._postings[term]
+            del postings[key]
+            if not postings:
+                del self._postings[term]
+
+    def _scores(self, query: str) -> Dict[str, float]:
+        count = len(self._entries)
+        if not count:
+            return {}
+        average_length = self._total_length / count or 1.0
+        scores: Dict[str, float] = {}
+        for term in set(tokenize(query)):
+            postings = self._postings.get(term)
+            if not postings:
+                continue
+            idf = math.log(1 + (count - len(postings) + 0.5) / (len(postings) + 0.5))
+            for key, frequency in postings.items():
+                norm = 1 - self.b + self.b * self._entries[key].length / average_length
+                weight = frequency * (self.k1 + 1) / (frequency + self.k1 * norm)
+                scores[key] = scores.get(key, 0.0) + idf * weight
+        return scores
+
+    def search(
+        self,
+        query: str,
+        limit: int = 100,
+        offset: int = 0,
+        after: Optional[Tuple[float, str]] = None,
+    ) -> List[SearchHit]:
+        """Return the entries matching the query, the most relevant first.
+
+        Entries with equal scores are ordered by key; ``after`` is the
+        (score, key) of the last entry of the previous page.
+        """
+        ranked: Iterator[Tuple[float, str]] = (
+            (-score, key) for key, score in self._scores(query).items()
+        )
+        if after is not None:
+            bound = (-after[0], after[1])
+            ranked = (item for item in ranked if item > bound)
+        top = heapq.nsmallest(max(offset, 0) + max(limit, 0), ranked)
+        return [
+            SearchHit(key, -score, self._entries[key])
+            for score, key in top[max(offset, 0) :]
+        ]
+
+    # Persistence
+
+    @property
+    def journal_path(self) -> Optional[Path]:
+        """The file the changes since the last save are appended to."""
+        return (
+            None
+            if self.path is None
+            else self.path.with_name(self.path.name + ".journal")
+        )
+
+    def _append(self, change: list) -> None:
+        if self.journal_path is None:
+            return
+        if self._journal is None:
+            self.journal_path.parent.mkdir(parents=True, exist_ok=True)
+            self._journal = self.journal_path.open("ab")
+        self._journal.write(json.dumps(change, separators=(",", ":")).encode() + b"\n")
+        self._journal.flush()
+
+    def close(self) -> None:
+        """Close the journal, the changes are replayed when loaded again."""
+        if self._journal is not None:
+            self._journal.close()
+            self._journal = None
+
+    def save(self) -> None:
+        """Write the index to its path atomically and clear the journal."""
+        if self.path is None or self.journal_path is None:
+            return
+        data = {
+            "version": 1,
+            "entries": {
+                key: [entry.label, entry.description, entry.path, entry.terms]
+                for key, entry in self._entries.items()
+            },
+        }
+        self.path.parent.mkdir(parents=True, exist_ok=True)
+        fd, tmp = tempfile.mkstemp(dir=self.path.parent, prefix=".search-")
+        try:
+            with os.fdopen(fd, "w") as file:
+                json.dump(data, file, separators=(",", ":"))
+            os.replace(tmp, self.path)
+        except BaseException:
+            os.unlink(tmp)
+            raise
+        # Replaying the journal on the saved index would be a no-op.
+        self.close()
+        self.journal_path.unlink(missing_ok=True)
+
+    def load(self) -> None:
+        """Replace the entries of the index with those saved to its path.
+
+        The changes of the journal are applied on top; a partially written
+        last change, e.g., of an application that was killed, is discarded.
+        """
+        assert self.path is not None and self.journal_path is not None
+        self.close()
+        self._entries, self._postings, self._total_length = {}, {}, 0
+        if self.path.exists():
+            with self.path.open() as file:
+                data = json.load(file)
+            for key, (label, description, path, terms) in data["entries"].items():
+                self._insert(
+                    key,
+                    SearchEntry(label, description, path, terms, sum(terms.values())),
+                )
+        if not self.journal_path.exists():
+            return
+        offset = 0
+        with self.journal_path.open("r+b") as file:
+            for line in file:
+                try:
+                    change = json.loads(line) if line.endswith(b"\n") else None
+                except ValueError:
+                    change = None
+                if change is None:
+                    break
+                offset += len(line)
+                if len(change) == 1:
+                    self._remove(change[0])
+                else:
+                    key, label, description, path, terms = change
+                    self._insert(
+                        key,
+                        SearchEntry(
+                            label, description, path, terms, sum(terms.values())
+                        ),
+                    )
+            file.truncate(offset)
+
+
+def _collection_key(collection_name: str) -> str:
+    return f"collection:{collection_name}"
+
+
+def _dataset_key(collection_name: str, dataset_name: str) -> str:
+    return f"dataset:{collection_name}/{dataset_name}"
+
+
+def _describe(metadata: Dict[str, str]) -> Optional[str]:
+    return " ".join(metadata.values()) or None
+
+
+class IndexedStorage:
+    """Object storage backend that keeps a search index up to date.
+
+    Collections and datasets are indexed by name and the values of their
+    metadata.  Changes made to the wrapped backend by other means are only
+    picked up by `reindex`.
+    """
+
+    def __init__(self, backend: ObjectStorageBackend, index: SearchIndex):
+        self.backend = backend
+        self.index = index
+
+    def __getattr__(self, name: str) -> Any:
+        return getattr(self.backend, name)
+
+    def _add_collection(self, name: str, metadata: Dict[str, str]) -> None:
+        self.index.add(
+            _collection_key(name),
+            name,
+            _describe(metadata),
+            f"/data/{quote(name, safe='')}",
+        )
+
+    def _add_dataset(
+        self, collection_name: str, dataset_name: str, metadata: Dict[str, str]
+    ) -> None:
+        self.index.add(
+            _dataset_key(collection_name, dataset_name),
+            dataset_name,
+            _describe(metadata),
+            f"/data/{quote(collection_name, safe='')}/{quote(dataset_name, safe='')}",
+        )
+
+    async def reindex(self, batch_size: int = 1000) -> None:
+        """Index all collections and datasets of the backend."""
+        collections: List[CollectionModel] = []
+        while True:
+            after = collections[-1].name if collections else None
+            batch = await self.backend.list_collections(batch_size, after=after)
+            collections += batch
+            if len(batch) < batch_size:
+                break
+        for collection in collections:
+            info = await self.backend.get_collection(collection.name)
+            self._add_collection(collection.name, info.metadata)
+            last: Optional[str] = None
+            while True:
+                datasets = await self.backend.list_datasets(
+                    collection.name, batch_size, after=last
+                )
+                for dataset in datasets:
+                    dataset_info = await self.backend.get_dataset(
+                        collection.name, dataset.name
+                    )
+                    self._add_dataset(
+                        collection.name, dataset.name, dataset_info.metadata
+                    )
+                if len(datasets) < batch_size:
+                    break
+                last = datasets[-1].name
+
+    async def create_collection(
+        self, collection_name: CollectionName, metadata: Dict[str, str]
+    ) -> bool:
+        created = await self.backend.create_collection(collection_name, metadata)
+        info: CollectionInfo = await self.backend.get_collection(collection_name)
+        self._add_collection(collection_name, info.metadata)
+        return created
+
+    async def delete_collection(self, collection_name: CollectionName) -> None:
+        await self.backend.delete_collection(collection_name)
+        # Only empty collections can be deleted, there are no datasets left.
+        self.index.remove(_collection_key(collection_name))
+
+    async def put_dataset(
+        self,
+        collection_name: CollectionName,
+        dataset_name: DatasetName,
+        upload: DatasetUploadStream,
+        content_type: Optional[str],
+        metadata: Dict[str, str],
+    ) -> DatasetModel:
+        dataset = await self.backend.put_dataset(
+            collection_name, dataset_name, upload, content_type, metadata
+        )
+        self._add_dataset(collection_name, dataset_name, metadata)
+        return dataset
+
+    async def update_dataset_metadata(
+        self,
+        collection_name: CollectionName,
+        dataset_name: DatasetName,
+        metadata: Dict[str, str],
+    ) -> None:
+        await self.backend.update_dataset_metadata(
+            collection_name, dataset_name, metadata
+        )
+        info: DatasetInfo = await self.backend.get_dataset(
+            collection_name, dataset_name
+        )
+        self._add_dataset(collection_name, dataset_name, info.metadata)
+
+    async def delete_dataset(
+        self, collection_name: CollectionName, dataset_name: DatasetName
+    ) -> None:
+        await self.backend.delete_dataset(collection_name, dataset_name)
+        self.index.remove(_dataset_key(collection_name, dataset_name))
+
+    async def bulk(
+        self,
+        collection_name: CollectionName,
+        operations: AsyncIterator[BulkOperation],
+    ) -> List[BulkResult]:
+        results = await apply_bulk(self.backend, collection_name, operations)
+        for result in results:
+            if result.status_code == 204:
+                self.index.remove(_dataset_key(collection_name, result.dataset_name))
+            elif result.status_code == 201 and result.info is not None:
+                self._add_dataset(
+                    collection_name, result.dataset_name, result.info.metadata
+                )
+        return results
+
+    async def complete_upload(
+        self,
+        collection_name: CollectionName,
+        dataset_name: DatasetName,
+        upload_id: str,
+        parts: Optional[List[UploadManifestPartModel]],
+    ) -> DatasetModel:
+        backend = cast(MultipartUploadBackend, self.backend)
+        dataset = await backend.complete_upload(
+            collection_name, dataset_name, upload_id, parts
+        )
+        info = await self.backend.get_dataset(collection_name, dataset_name)
+        self._add_dataset(collection_name, dataset_name, info.metadata)
+        return dataset
+
+
+async def search_index() -> Optional[SearchIndex]:
+    """Return the configured search index.
+
+    The default is None, in which case the globalSearch operation responds
+    with 501 (Not implemented).
+    """
+    return None
+
+
+def use_search_index(app: FastAPI, index: SearchIndex) -> None:
+    """Answer the global search queries of the app from the index."""
+    app.dependency_overrides[search_index] = lambda: index
+    app.router.on_shutdown.append(index.save)
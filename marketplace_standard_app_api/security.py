@@ -1,19 +1,168 @@
-from typing import Optional
+import asyncio
+import hashlib
+import time
+from collections import OrderedDict
+from typing import Awaitable, Callable, Dict, Optional, Tuple
 
-from fastapi import Request
+from fastapi import HTTPException, Request
+from fastapi.concurrency import run_in_threadpool
 from fastapi.security import HTTPAuthorizationCredentials, HTTPBearer
 
+TokenValidator = Callable[[str], Awaitable[bool]]
+
 
 class Auth(str):
     pass
 
 
+class TokenValidationCache:
+    """Cache of bearer token validation results.
+
+    Validation results are kept for ``ttl`` seconds (``negative_ttl`` seconds
+    for rejected tokens), the least recently used entries are evicted once the
+    cache holds ``maxsize`` tokens.  Concurrent validations of the same token
+    share a single call to the validator.  Tokens are only kept as hashes.
+    """
+
+    def __init__(
+        self,
+        validate: TokenValidator,
+        maxsize: int = 1024,
+        ttl: float = 60.0,
+        negative_ttl: float = 5.0,
+        clock: Callable[[], float] = time.monotonic,
+    ):
+        self.validate = validate
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.negative_ttl = negative_ttl
+        self._clock = clock
+        self._entries: "OrderedDict[bytes, Tuple[float, bool]]" = OrderedDict()
+        self._pending: Dict[bytes, "asyncio.Future[bool]"] = {}
+        self.hits = 0
+        self.misses = 0
+        # Total time spent waiting for the validator.
+        self.validation_seconds = 0.0
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def clear(self) -> None:
+        self._entries.clear()
+
+    async def is_valid(self, token: str) -> bool:
+        key = hashlib.sha256(token.encode()).digest()
+        entry = self._entries.get(key)
+        if entry is not None:
+            expires, valid = entry
+            if expires > self._clock():
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return valid
+            del self._entries[key]
+
+        pending = self._pending.get(key)
+        if pending is not None:
+            self.hits += 1
+        else:
+            self.misses += 1
+            # Validated in a task of its own, such that the validation is not
+            # cancelled with the request that started it.
+            pending = asyncio.ensure_future(self._validate(key, token))
+            pending.add_done_callback(_retrieve_exception)
+            self._pending[key] = pending
+        return await asyncio.shield(pending)
+
+    async def _validate(self, key: bytes, token: str) -> bool:
+        started = time.perf_counter()
+        try:
+            valid = await self.validate(token)
+        finally:
+            self.validation_seconds += time.perf_counter() - started
+            del self._pending[key]
+        ttl = self.ttl if valid else self.negative_ttl
+        self._entries[key] = (self._clock() + ttl, valid)
+        while len(self._entries) > self.maxsize:
+            self._entries.popitem(last=False)
+        return valid
+
+
+def _retrieve_exception(task: "asyncio.Future[bool]") -> None:
+    # Marks the exception as retrieved in case nobody waits for the task.
+    if not task.cancelled():
+        task.exception()
+
+
+class SemanticServiceTokenValidator:
+    """Validate bearer tokens against an endpoint of the semantic service.
+
+    The requests are sent with a shared session from the thread pool, i.e.,
+    connections are kept alive and reused and the event loop is not blocked.
+    A token is valid if the endpoint responds with a success status code and
+    invalid if it responds with 401 or 403.
+    """
+
+    def __init__(self, url: str, timeout: float = 10.0, pool_maxsize: int = 32):
+        import requests
+        from requests.adapters import HTTPAdapter
+
+        self.url = url
+        self.timeout = timeout
+        self._session = requests.Session()
+        adapter = HTTPAdapter(pool_connections=1, pool_maxsize=pool_maxsize)
+        self._session.mount("http://", adapter)
+        self._session.mount("https://", adapter)
+
+    def _validate(self, token: str) -> bool:
+        import requests
+
+        try:
+            response = self._session.get(
+                self.url,
+                headers={"Authorization": f"Bearer {token}"},
+                timeout=self.timeout,
+            )
+        except requests.RequestException:
+            raise HTTPException(
+                status_code=503, detail="Authentication service unavailable."
+            )
+        if response.status_code in (401, 403):
+            return False
+        if not response.ok:
+            raise HTTPException(
+                status_code=503, detail="Authentication service unavailable."
+            )
+        return True
+
+    async def __call__(self, token: str) -> bool:
+        return await run_in_threadpool(self._validate, token)
+
+    def close(self) -> None:
+        self._session.close()
+
+
 class AuthTokenBearer(HTTPBearer):
+    """Require a bearer token, optionally validating it.
+
+    Tokens are only validated once a validator is configured with
+    `use_validator`; the validation results are cached.
+    """
+
+    cache: Optional[TokenValidationCache] = None
+
+    def use_validator(self, validator: TokenValidator, **kwargs) -> None:
+        """Validate tokens with the validator, see TokenValidationCache."""
+        self.cache = TokenValidationCache(validator, **kwargs)
+
     async def __call__(
         self, request: Request
     ) -> Optional[HTTPAuthorizationCredentials]:
         auth = await super().__call__(request=request)
         if auth:
+            if self.cache is not None and not await self.cache.is_valid(
+                auth.credentials
+            ):
+                raise HTTPException(status_code=401, detail="Not authenticated.")
             return HTTPAuthorizationCredentials(
                 scheme="Bearer", credentials=auth.credentials
             )
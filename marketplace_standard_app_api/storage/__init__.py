@@ -0,0 +1,380 @@
+"""Pluggable storage backends for the object storage operations.
+
+All object storage operations respond with 501 (Not implemented) unless an
+application provides an implementation of the `ObjectStorageBackend` protocol:
+
+    from marketplace_standard_app_api.main import api
+    from marketplace_standard_app_api.storage import use_object_storage_backend
+    from marketplace_standard_app_api.storage.filesystem import FileSystemStorage
+
+    use_object_storage_backend(api, FileSystemStorage("/var/lib/my-app/data"))
+
+The backend also provides the validators for conditional requests, see the
+`conditional` module.
+
+Bulk requests are passed to the ``bulk`` method of backends that implement
+one, such that they can apply all operations at once; see `apply_bulk`.
+Multipart uploads are available with backends that also implement the
+`MultipartUploadBackend` protocol.
+"""
+
+import errno
+import hashlib
+from typing import AsyncIterator, Dict, Iterator, List, NamedTuple, Optional, Protocol
+
+from fastapi import FastAPI
+
+from ..conditional import (
+    Validators,
+    collection_validators,
+    dataset_validators,
+    make_etag,
+)
+from ..models.object_storage import (
+    CollectionModel,
+    CollectionName,
+    DatasetModel,
+    DatasetName,
+    UploadManifestPartModel,
+    UploadPartModel,
+)
+from ..streaming import DatasetUploadStream
+
+
+class ObjectStorageError(Exception):
+    """Base class for errors raised by object storage backends."""
+
+
+class NotFound(ObjectStorageError, KeyError):
+    """The collection or dataset does not exist."""
+
+
+class CollectionNotEmpty(ObjectStorageError):
+    """The collection can not be deleted since it still contains datasets."""
+
+
+class InvalidManifest(ObjectStorageError, ValueError):
+    """The manifest of a multipart upload refers to missing or modified parts."""
+
+
+class CollectionInfo(NamedTuple):
+    collection: CollectionModel
+    metadata: Dict[str, str]
+
+
+class DatasetInfo(NamedTuple):
+    dataset: DatasetModel
+    metadata: Dict[str, str]
+
+
+class BulkOperation(NamedTuple):
+    """Operation on a dataset of a bulk request.
+
+    The method is PUT, DELETE or HEAD; the upload, content type, and metadata
+    are those of PUT operations.
+    """
+
+    method: str
+    dataset_name: DatasetName
+    upload: Optional[DatasetUploadStream] = None
+    content_type: Optional[str] = None
+    metadata: Optional[Dict[str, str]] = None
+
+
+class BulkResult(NamedTuple):
+    """Outcome of an operation of a bulk request.
+
+    The info is that of the dataset after successful PUT and HEAD operations.
+    """
+
+    dataset_name: DatasetName
+    status_code: int
+    info: Optional[DatasetInfo] = None
+    detail: Optional[str] = None
+
+
+class ObjectStorageBackend(Protocol):
+    """Storage of collections and datasets with custom metadata.
+
+    Collection and dataset metadata are the key-value pairs that are provided
+    as X-Object-Meta-* headers.  Methods raise NotFound for collections and
+    datasets that do not exist.
+    """
+
+    async def list_collections(
+        self, limit: int = 100, offset: int = 0, after: Optional[str] = None
+    ) -> List[CollectionModel]:
+        """List collections ordered by name, starting after the given name."""
+        ...
+
+    async def create_collection(
+        self, collection_name: CollectionName, metadata: Dict[str, str]
+    ) -> bool:
+        """Create or update a collection, return True if it was created."""
+        ...
+
+    async def get_collection(self, collection_name: CollectionName) -> CollectionInfo:
+        ...
+
+    async def delete_collection(self, collection_name: CollectionName) -> None:
+        """Delete an empty collection, raise CollectionNotEmpty otherwise."""
+        ...
+
+    async def list_datasets(
+        self,
+        collection_name: CollectionName,
+        limit: int = 100,
+        offset: int = 0,
+        after: Optional[str] = None,
+    ) -> List[DatasetModel]:
+        """List datasets ordered by name, starting after the given name."""
+        ...
+
+    async def put_dataset(
+        self,
+        collection_name: CollectionName,
+        dataset_name: DatasetName,
+        upload: DatasetUploadStream,
+        content_type: Optional[str],
+        metadata: Dict[str, str],
+    ) -> DatasetModel:
+        """Create or replace a dataset, the hash is taken from the upload."""
+        ...
+
+    async def get_dataset(
+        self, collection_name: CollectionName, dataset_name: DatasetName
+    ) -> DatasetInfo:
+        ...
+
+    def read_dataset(
+        self,
+        collection_name: CollectionName,
+        dataset_name: DatasetName,
+        start: int,
+        end: int,
+    ) -> Iterator[bytes]:
+        """Iterate over the inclusive byte range [start, end] of a dataset.
+
+        The iterator is consumed within the thread pool.
+        """
+        ...
+
+    async def update_dataset_metadata(
+        self,
+        collection_name: CollectionName,
+        dataset_name: DatasetName,
+        metadata: Dict[str, str],
+    ) -> None:
+        ...
+
+    async def delete_dataset(
+        self, collection_name: CollectionName, dataset_name: DatasetName
+    ) -> None:
+        ...
+
+
+METADATA_HEADER_PREFIX = "x-object-meta-"
+
+
+def metadata_from_headers(headers) -> Dict[str, str]:
+    """Extract the custom metadata from X-Object-Meta-* request headers."""
+    return {
+        key[len(METADATA_HEADER_PREFIX) :]: value
+        for key, value in headers.items()
+        if key.lower().startswith(METADATA_HEADER_PREFIX)
+    }
+
+
+class MultipartUploadBackend(ObjectStorageBackend, Protocol):
+    """Storage of datasets that are uploaded in independent parts.
+
+    Parts may be uploaded in parallel and replaced until the upload is
+    completed.  Uploads are identified by the collection, dataset, and upload
+    id; methods raise NotFound for uploads that do not exist.
+    """
+
+    async def create_upload(
+        self,
+        collection_name: CollectionName,
+        dataset_name: DatasetName,
+        content_type: Optional[str],
+        metadata: Dict[str, str],
+    ) -> str:
+        """Start a multipart upload and return its id."""
+        ...
+
+    async def put_upload_part(
+        self,
+        collection_name: CollectionName,
+        dataset_name: DatasetName,
+        upload_id: str,
+        part_number: int,
+        upload: DatasetUploadStream,
+    ) -> UploadPartModel:
+        """Create or replace a part, the hash is taken from the upload."""
+        ...
+
+    async def list_upload_parts(
+        self,
+        collection_name: CollectionName,
+        dataset_name: DatasetName,
+        upload_id: str,
+    ) -> List[UploadPartModel]:
+        """List the parts uploaded so far ordered by part number."""
+        ...
+
+    async def complete_upload(
+        self,
+        collection_name: CollectionName,
+        dataset_name: DatasetName,
+        upload_id: str,
+        parts: Optional[List[UploadManifestPartModel]],
+    ) -> DatasetModel:
+        """Create or replace the dataset with the parts in the given order.
+
+        All uploaded parts are used if parts is None, raises InvalidManifest if
+        a part is missing or its hash does not match.
+        """
+        ...
+
+    async def abort_upload(
+        self,
+        collection_name: CollectionName,
+        dataset_name: DatasetName,
+        upload_id: str,
+    ) -> None:
+        """Discard the upload and its parts."""
+        ...
+
+
+def multipart_hash(part_hashes: List[str]) -> str:
+    """Return the hash of a dataset assembled from parts with the given hashes.
+
+    Follows the convention of S3 multipart uploads, the hash of the
+    concatenated hashes of the parts suffixed with the number of parts.
+    """
+    digest = hashlib.md5(b"".join(bytes.fromhex(part) for part in part_hashes))
+    return f"{digest.hexdigest()}-{len(part_hashes)}"
+
+
+BULK_STATUS_CODES = {"PUT": 201, "DELETE": 204, "HEAD": 200}
+
+
+def bulk_error(operation: BulkOperation, error: Exception) -> BulkResult:
+    """Return the result of an operation that failed with the error.
+
+    Re-raises errors that are neither NotFound nor OSError, i.e., that are not
+    specific to the operation.
+    """
+    if isinstance(error, NotFound):
+        return BulkResult(operation.dataset_name, 404, detail="Not found.")
+    if isinstance(error, OSError):
+        if error.errno == errno.ENOSPC:
+            return BulkResult(
+                operation.dataset_name, 507, detail="Insufficient storage."
+            )
+        if error.errno == errno.ENAMETOOLONG:
+            return BulkResult(operation.dataset_name, 400, detail="Name too long.")
+        return BulkResult(operation.dataset_name, 500, detail="Internal server error.")
+    raise error
+
+
+async def _apply_bulk_operation(
+    backend: ObjectStorageBackend,
+    collection_name: CollectionName,
+    operation: BulkOperation,
+) -> BulkResult:
+    name = operation.dataset_name
+    try:
+        if operation.method == "PUT":
+            assert operation.upload is not None
+            metadata = operation.metadata or {}
+            dataset = await backend.put_dataset(
+                collection_name,
+                name,
+                operation.upload,
+                operation.content_type,
+                metadata,
+            )
+            info: Optional[DatasetInfo] = DatasetInfo(dataset, metadata)
+        elif operation.method == "DELETE":
+            await backend.delete_dataset(collection_name, name)
+            info = None
+        else:
+            info = await backend.get_dataset(collection_name, name)
+    except (NotFound, OSError) as error:
+        return bulk_error(operation, error)
+    return BulkResult(name, BULK_STATUS_CODES[operation.method], info)
+
+
+async def apply_bulk(
+    backend: ObjectStorageBackend,
+    collection_name: CollectionName,
+    operations: AsyncIterator[BulkOperation],
+) -> List[BulkResult]:
+    """Apply the operations of a bulk request in order.
+
+    Uses the ``bulk(collection_name, operations)`` method of the backend if it
+    has one, which must return the results in the same way, and otherwise
+    applies the operations one by one.  The upload of a PUT operation has to
+    be consumed before the next operation is requested, the uploads of an
+    archive are read from the same request body.  Raises NotFound if the
+    collection does not exist.
+    """
+    bulk = getattr(backend, "bulk", None)
+    if bulk is not None:
+        return await bulk(collection_name, operations)
+    await backend.get_collection(collection_name)
+    return [
+        await _apply_bulk_operation(backend, collection_name, operation)
+        async for operation in operations
+    ]
+
+
+def metadata_to_headers(metadata: Dict[str, str]) -> Dict[str, str]:
+    return {f"X-Object-Meta-{key}": value for key, value in metadata.items()}
+
+
+def collection_etag(collection: CollectionModel) -> Optional[str]:
+    """Return a weak entity tag for the listing of a collection."""
+    if collection.last_modified is None:
+        return None
+    timestamp = collection.last_modified.timestamp()
+    return make_etag(f"{collection.count or 0}-{timestamp:.6f}", weak=True)
+
+
+async def object_storage_backend() -> Optional[ObjectStorageBackend]:
+    """Return the configured object storage backend.
+
+    The default is None, in which case the object storage operations respond
+    with 501 (Not implemented).
+    """
+    return None
+
+
+def use_object_storage_backend(app: FastAPI, backend: ObjectStorageBackend) -> None:
+    """Serve the object storage operations of the app from the backend."""
+
+    async def _dataset_validators(
+        collection_name: CollectionName, dataset_name: DatasetName
+    ) -> Optional[Validators]:
+        try:
+            info = await backend.get_dataset(collection_name, dataset_name)
+        except NotFound:
+            return None
+        return Validators.from_dataset(info.dataset)
+
+    async def _collection_validators(
+        collection_name: CollectionName,
+    ) -> Optional[Validators]:
+        try:
+            info = await backend.get_collection(collection_name)
+        except NotFound:
+            return None
+        return Validators(
+            collection_etag(info.collection), info.collection.last_modified
+        )
+
+    app.dependency_overrides[object_storage_backend] = lambda: backend
+    app.dependency_overrides[dataset_validators] = _dataset_validators
+    app.dependency_overrides[collection_validators] = _collection_validators
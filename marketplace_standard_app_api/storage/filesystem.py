@@ -0,0 +1,1042 @@
+"""Reference object storage backend on the local file system.
+
+Every collection is stored as a directory, every dataset as a file within that
+directory.  The dataset properties (hash, size, content type, modification
+time) and the custom metadata of the collection and its datasets are kept in a
+compact JSON sidecar index per collection (``.index.json``), such that listing
+and metadata requests do not touch the dataset files at all.  Modifications
+are appended to a log next to the index (``.index.log``), which is merged into
+the index once it has grown larger than the index itself.
+
+Datasets are written to a temporary file and atomically renamed into place.
+Writers modify a copy of the cached index, which replaces it once written.
+Readers therefore always observe either the previous or the new version of a
+dataset.  Datasets are read through a memory map, such that range requests
+only fault in the requested pages.
+
+The parts of multipart uploads are written to a directory per upload
+(``.uploads/<upload id>``) without locking the collection, such that they can
+be uploaded in parallel, they are only renamed into place while locked.
+Completed uploads are moved to ``.segments`` and their parts are kept as
+segments of the dataset, which are only assembled while the dataset is read.
+"""
+
+import bisect
+import json
+import mmap
+import os
+import re
+import shutil
+import tempfile
+import threading
+from contextlib import contextmanager
+from datetime import datetime, timezone
+from pathlib import Path
+from typing import (
+    Any,
+    AsyncIterator,
+    BinaryIO,
+    Dict,
+    Iterator,
+    List,
+    NamedTuple,
+    Optional,
+    Tuple,
+    Union,
+)
+from urllib.parse import quote, unquote
+from uuid import uuid4
+
+from fastapi.concurrency import run_in_threadpool
+
+from ..models.object_storage import (
+    CollectionModel,
+    CollectionName,
+    DatasetModel,
+    DatasetName,
+    UploadManifestPartModel,
+    UploadPartModel,
+)
+from ..pagination import page_bounds
+from ..streaming import DEFAULT_CHUNK_SIZE, DatasetUploadStream
+from . import (
+    BULK_STATUS_CODES,
+    BulkOperation,
+    BulkResult,
+    CollectionInfo,
+    CollectionNotEmpty,
+    DatasetInfo,
+    InvalidManifest,
+    NotFound,
+    bulk_error,
+    multipart_hash,
+)
+
+try:
+    import fcntl
+except ImportError:  # Windows
+    fcntl = None  # type: ignore
+
+INDEX_FILENAME = ".index.json"
+
+INDEX_LOG_FILENAME = ".index.log"
+
+LOCK_FILENAME = ".lock"
+
+UPLOADS_DIRNAME = ".uploads"
+
+SEGMENTS_DIRNAME = ".segments"
+
+UPLOAD_INFO_FILENAME = "upload.json"
+
+_TEMP_PREFIX = ".tmp-"
+
+_UPLOAD_ID = re.compile(r"^[0-9a-f]{32}$")
+
+# The size up to which the log is not merged into a smaller index.
+_MIN_LOG_SIZE = 64 * 1024
+
+# The inode, modification time, and size of the index and its log.
+_StatKey = Tuple[Tuple[int, int, int], Optional[Tuple[int, int, int]]]
+
+
+def _encode_name(name: str) -> str:
+    """Encode a collection or dataset name as safe file name.
+
+    Encoded names never start with a dot, which is reserved for the index,
+    lock, and temporary files.
+    """
+    encoded = quote(name, safe="")
+    if encoded.startswith("."):
+        encoded = "%2E" + encoded[1:]
+    return encoded
+
+
+def _now() -> datetime:
+    return datetime.now(timezone.utc)
+
+
+def _file_key(stat: os.stat_result) -> Tuple[int, int, int]:
+    return stat.st_ino, stat.st_mtime_ns, stat.st_size
+
+
+class _StaleLog(Exception):
+    """The log continues a later version of the index than the one read."""
+
+
+class _Index:
+    """In-memory copy of the sidecar index of a collection.
+
+    Cached indexes are never modified, writers modify a `copy` instead.
+    """
+
+    def __init__(self, data: Dict[str, Any], stat_key: Optional[_StatKey]):
+        self.data = data
+        self.stat_key = stat_key
+        # The entries of the datasets modified since the copy, None if deleted.
+        self.changes: Dict[str, Optional[Dict[str, Any]]] = {}
+        self._sorted_names: Optional[List[str]] = None
+
+    @property
+    def datasets(self) -> Dict[str, Dict[str, Any]]:
+        return self.data["datasets"]
+
+    @property
+    def sequence(self) -> int:
+        """The number of modifications of the index."""
+        return self.data.get("sequence", 0)
+
+    @property
+    def sorted_names(self) -> List[str]:
+        """The dataset names in listing order, cached until modified."""
+        if self._sorted_names is None:
+            self._sorted_names = sorted(self.datasets)
+        return self._sorted_names
+
+    def copy(self) -> "_Index":
+        index = _Index(
+            {
+                **self.data,
+                "metadata": dict(self.data["metadata"]),
+                "datasets": dict(self.datasets),
+            },
+            self.stat_key,
+        )
+        index._sorted_names = self._sorted_names
+        return index
+
+    def set_dataset(self, name: str, entry: Dict[str, Any]) -> None:
+        replaced = self.datasets.get(name)
+        if replaced is None and self._sorted_names is not None:
+            names = list(self._sorted_names)
+            bisect.insort(names, name)
+            self._sorted_names = names
+        self.data["bytes"] += entry["bytes"] - (replaced or {"bytes": 0})["bytes"]
+        self.datasets[name] = entry
+        self.changes[name] = entry
+
+    def pop_dataset(self, name: str) -> Optional[Dict[str, Any]]:
+        entry = self.datasets.pop(name, None)
+        if entry is None:
+            return None
+        if self._sorted_names is not None:
+            names = list(self._sorted_names)
+            del names[bisect.bisect_left(names, name)]
+            self._sorted_names = names
+        self.data["bytes"] -= entry["bytes"]
+        self.changes[name] = None
+        return entry
+
+    def touch(self, timestamp: datetime) -> None:
+        self.data["last_modified"] = timestamp.isoformat()
+
+    def log_entry(self) -> Dict[str, Any]:
+        """Return the entry of the log that records the changes."""
+        return {
+            "sequence": self.sequence,
+            "metadata": self.data["metadata"],
+            "bytes": self.data["bytes"],
+            "last_modified": self.data["last_modified"],
+            "datasets": self.changes,
+        }
+
+    def replay(self, lines: List[bytes]) -> None:
+        """Apply the entries of the log that follow the index."""
+        for line in lines:
+            entry = json.loads(line)
+            if entry["sequence"] <= self.sequence:
+                continue  # Already merged into the index.
+            if entry["sequence"] != self.sequence + 1:
+                raise _StaleLog()
+            for name, dataset in entry.pop("datasets").items():
+                if dataset is None:
+                    self.datasets.pop(name, None)
+                else:
+                    self.datasets[name] = dataset
+            self.data.update(entry)
+
+    def collection(self, name: str) -> CollectionModel:
+        return CollectionModel(
+            name=name,
+            count=len(self.datasets),
+            bytes=self.data["bytes"],
+            last_modified=self.data["last_modified"],
+        )
+
+    def dataset(self, name: str) -> DatasetModel:
+        entry = self.datasets[name]
+        return DatasetModel(
+            name=name,
+            hash=entry["hash"],
+            bytes=entry["bytes"],
+            content_type=entry["content_type"],
+            last_modified=entry["last_modified"],
+        )
+
+
+class _StagedOperation(NamedTuple):
+    operation: BulkOperation
+    tmp_path: Optional[str] = None
+    entry: Optional[Dict[str, Any]] = None
+    result: Optional[BulkResult] = None
+
+
+class FileSystemStorage:
+    """Object storage backend that stores collections as directories.
+
+    Args:
+        root: The directory in which the collections are stored.
+        chunk_size: The size of the chunks in which datasets are read.
+        fsync: Flush datasets to disk before they are renamed into place.
+    """
+
+    def __init__(
+        self,
+        root: Union[str, "os.PathLike[str]"],
+        chunk_size: int = DEFAULT_CHUNK_SIZE,
+        fsync: bool = True,
+    ):
+        self.root = Path(root)
+        self.root.mkdir(parents=True, exist_ok=True)
+        self.chunk_size = chunk_size
+        self.fsync = fsync
+        self._indexes: Dict[str, _Index] = {}
+        self._locks: Dict[str, threading.Lock] = {}
+        self._locks_lock = threading.Lock()
+
+    # Index handling
+
+    def _collection_path(self, collection_name: str) -> Path:
+        return self.root / _encode_name(collection_name)
+
+    def _dataset_path(self, collection_name: str, dataset_name: str) -> Path:
+        return self._collection_path(collection_name) / _encode_name(dataset_name)
+
+    def _upload_path(self, collection_name: str, upload_id: str) -> Path:
+        return self._collection_path(collection_name) / UPLOADS_DIRNAME / upload_id
+
+    def _segments_path(self, collection_name: str, upload_id: str) -> Path:
+        return self._collection_path(collection_name) / SEGMENTS_DIRNAME / upload_id
+
+    def _stat_key(self, collection_name: str) -> _StatKey:
+        collection_path = self._collection_path(collection_name)
+        try:
+            # The log is checked first, it is removed after the index is replaced.
+            log_key: Optional[Tuple[int, int, int]] = _file_key(
+                (collection_path / INDEX_LOG_FILENAME).stat()
+            )
+        except FileNotFoundError:
+            log_key = None
+        try:
+            index_key = _file_key((collection_path / INDEX_FILENAME).stat())
+        except FileNotFoundError:
+            self._indexes.pop(collection_name, None)
+            raise NotFound(collection_name)
+        return index_key, log_key
+
+    def _load_index(self, collection_name: str) -> _Index:
+        """Return the index of a collection, reloading it if modified on disk.
+
+        The returned index must not be modified, see `_Index.copy`.
+        """
+        collection_path = self._collection_path(collection_name)
+        while True:
+            stat_key = self._stat_key(collection_name)
+            cached = self._indexes.get(collection_name)
+            if cached is not None and cached.stat_key == stat_key:
+                return cached
+            try:
+                data = (collection_path / INDEX_FILENAME).read_bytes()
+            except FileNotFoundError:
+                continue  # Deleted or replaced concurrently.
+            index = _Index(json.loads(data), stat_key)
+            try:
+                log = (collection_path / INDEX_LOG_FILENAME).read_bytes()
+            except FileNotFoundError:
+                log = b""
+            try:
+                # A partially written last line is not part of the log yet.
+                index.replay(log.splitlines()[: log.count(b"\n")])
+            except _StaleLog:
+                continue  # The index was replaced since it was read.
+            self._indexes[collection_name] = index
+            return index
+
+    def _write_index(self, collection_name: str, index: _Index) -> None:
+        """Write the changes of a copy of the index and cache it.
+
+        Must be called while locked.
+        """
+        collection_path = self._collection_path(collection_name)
+        index.data["sequence"] = index.sequence + 1
+        index_size = index.stat_key[0][2] if index.stat_key else 0
+        log_size = index.stat_key[1][2] if index.stat_key and index.stat_key[1] else 0
+        if index.stat_key is None or log_size > max(index_size, _MIN_LOG_SIZE):
+            self._write_atomically(
+                collection_path / INDEX_FILENAME,
+                json.dumps(index.data, separators=(",", ":")).encode(),
+            )
+            try:
+                os.unlink(collection_path / INDEX_LOG_FILENAME)
+            except FileNotFoundError:
+                pass
+        else:
+            line = json.dumps(index.log_entry(), separators=(",", ":")) + "\n"
+            self._append(collection_path / INDEX_LOG_FILENAME, line.encode())
+        index.changes = {}
+        index.stat_key = self._stat_key(collection_name)
+        self._indexes[collection_name] = index
+
+    def _append(self, path: Path, content: bytes) -> None:
+        with open(path, "a+b") as file:
+            start = file.seek(0, os.SEEK_END)
+            file.seek(max(start - 1, 0))
+            if start and file.read(1) != b"\n":
+                # The line of an interrupted writer, which readers ignore.
+                file.seek(0)
+                start = file.read().rfind(b"\n") + 1
+                file.truncate(start)
+            try:
+                file.write(content)
+                file.flush()
+                if self.fsync:
+                    os.fsync(file.fileno())
+            except BaseException:
+                # Readers ignore the partial line, but writers would continue it.
+                file.truncate(start)
+                raise
+
+    def _write_atomically(self, path: Path, content: bytes) -> None:
+        fd, tmp_path = tempfile.mkstemp(dir=path.parent, prefix=_TEMP_PREFIX)
+        try:
+            with os.fdopen(fd, "wb") as file:
+                file.write(content)
+                if self.fsync:
+                    file.flush()
+                    os.fsync(file.fileno())
+            os.replace(tmp_path, path)
+        except BaseException:
+            os.unlink(tmp_path)
+            raise
+
+    @contextmanager
+    def _locked(self, collection_name: str) -> Iterator[None]:
+        """Serialize modifications of a collection across threads and processes."""
+        with self._locks_lock:
+            lock = self._locks.setdefault(collection_name, threading.Lock())
+        with lock:
+            if fcntl is None:
+                yield
+                return
+            lock_path = self._collection_path(collection_name) / LOCK_FILENAME
+            with open(lock_path, "a") as lock_file:
+                fcntl.flock(lock_file, fcntl.LOCK_EX)
+                try:
+                    yield
+                finally:
+                    fcntl.flock(lock_file, fcntl.LOCK_UN)
+
+    def _release(
+        self,
+        collection_name: str,
+        index: _Index,
+        released: List[Tuple[str, Dict[str, Any]]],
+    ) -> None:
+        """Remove the files of replaced or deleted index entries.
+
+        Must be called while locked, after the index has been written.
+        """
+        for dataset_name, entry in released:
+            if "segments" in entry:
+                shutil.rmtree(
+                    self._segments_path(collection_name, entry["upload_id"]),
+                    ignore_errors=True,
+                )
+                continue
+            current = index.datasets.get(dataset_name)
+            if current is not None and "segments" not in current:
+                continue  # The file has been replaced by the current one.
+            try:
+                os.unlink(self._dataset_path(collection_name, dataset_name))
+            except FileNotFoundError:
+                pass
+
+    # Collections
+
+    def _list_collections(
+        self, limit: int, offset: int, after: Optional[str]
+    ) -> List[CollectionModel]:
+        names = sorted(
+            unquote(entry.name)
+            for entry in os.scandir(self.root)
+            if entry.is_dir() and not entry.name.startswith(".")
+        )
+        collections = []
+        start, stop = page_bounds(names, after, limit, offset)
+        for name in names[start:stop]:
+            try:
+                collections.append(self._load_index(name).collection(name))
+            except NotFound:  # Deleted concurrently.
+                continue
+        return collections
+
+    async def list_collections(
+        self, limit: int = 100, offset: int = 0, after: Optional[str] = None
+    ) -> List[CollectionModel]:
+        return await run_in_threadpool(self._list_collections, limit, offset, after)
+
+    def _create_collection(
+        self, collection_name: CollectionName, metadata: Dict[str, str]
+    ) -> bool:
+        collection_path = self._collection_path(collection_name)
+        collection_path.mkdir(exist_ok=True)
+        with self._locked(collection_name):
+            try:
+                index = self._load_index(collection_name).copy()
+                created = False
+            except NotFound:
+                index = _Index({"metadata": {}, "datasets": {}, "bytes": 0}, None)
+                created = True
+            index.data["metadata"].update(metadata)
+            index.touch(_now())
+            self._write_index(collection_name, index)
+        return created
+
+    async def create_collection(
+        self, collection_name: CollectionName, metadata: Dict[str, str]
+    ) -> bool:
+        return await run_in_threadpool(
+            self._create_collection, collection_name, metadata
+        )
+
+    async def get_collection(self, collection_name: CollectionName) -> CollectionInfo:
+        index = await run_in_threadpool(self._load_index, collection_name)
+        return CollectionInfo(
+            index.collection(collection_name), dict(index.data["metadata"])
+        )
+
+    def _delete_collection(self, collection_name: CollectionName) -> None:
+        collection_path = self._collection_path(collection_name)
+        with self._locked(collection_name):
+            if self._load_index(collection_name).datasets:
+                raise CollectionNotEmpty(collection_name)
+            for entry in os.scandir(collection_path):
+                if entry.is_dir():
+                    shutil.rmtree(entry.path)
+                else:
+                    os.unlink(entry.path)
+            collection_path.rmdir()
+        self._indexes.pop(collection_name, None)
+
+    async def delete_collection(self, collection_name: CollectionName) -> None:
+        await run_in_threadpool(self._delete_collection, collection_name)
+
+    # Datasets
+
+    def _list_datasets(
+        self,
+        collection_name: CollectionName,
+        limit: int,
+        offset: int,
+        after: Optional[str],
+    ) -> List[DatasetModel]:
+        index = self._load_index(collection_name)
+        names = index.sorted_names
+        start, stop = page_bounds(names, after, limit, offset)
+        return [index.dataset(name) for name in names[start:stop]]
+
+    async def list_datasets(
+        self,
+        collection_name: CollectionName,
+        limit: int = 100,
+        offset: int = 0,
+        after: Optional[str] = None,
+    ) -> List[DatasetModel]:
+        return await run_in_threadpool(
+            self._list_datasets, collection_name, limit, offset, after
+        )
+
+    def _commit_dataset(
+        self,
+        collection_name: CollectionName,
+        dataset_name: DatasetName,
+        tmp_path: str,
+        entry: Dict[str, Any],
+    ) -> DatasetModel:
+        with self._locked(collection_name):
+            index = self._load_index(collection_name).copy()
+            os.replace(tmp_path, self._dataset_path(collection_name, dataset_name))
+            replaced = index.datasets.get(dataset_name)
+            index.set_dataset(dataset_name, entry)
+            index.touch(_now())
+            self._write_index(collection_name, index)
+            if replaced is not None:
+                self._release(collection_name, index, [(dataset_name, replaced)])
+            return index.dataset(dataset_name)
+
+    async def _write_upload(self, directory: Path, upload: DatasetUploadStream) -> str:
+        """Write the upload to a temporary file in the directory."""
+        fd, tmp_path = tempfile.mkstemp(dir=directory, prefix=_TEMP_PREFIX)
+        try:
+            with os.fdopen(fd, "wb") as file:
+                async for chunk in upload:
+                    await run_in_threadpool(file.write, chunk)
+                if self.fsync:
+                    file.flush()
+                    await run_in_threadpool(os.fsync, file.fileno())
+        except BaseException:
+            os.unlink(tmp_path)
+            raise
+        return tmp_path
+
+    async def _stage_upload(
+        self,
+        collection_name: CollectionName,
+        upload: DatasetUploadStream,
+        content_type: Optional[str],
+        metadata: Dict[str, str],
+    ) -> Tuple[str, Dict[str, Any]]:
+        """Write the upload to a temporary file, return its path and entry."""
+        tmp_path = await self._write_upload(
+            self._collection_path(collection_name), upload
+        )
+        entry = {
+            "hash": upload.hexdigest(),
+            "bytes": upload.bytes,
+            "content_type": content_type,
+            "last_modified": _now().isoformat(),
+            "metadata": metadata,
+        }
+        return tmp_path, entry
+
+    async def put_dataset(
+        self,
+        collection_name: CollectionName,
+        dataset_name: DatasetName,
+        upload: DatasetUploadStream,
+        content_type: Optional[str],
+        metadata: Dict[str, str],
+    ) -> DatasetModel:
+        if not (self._collection_path(collection_name) / INDEX_FILENAME).exists():
+            raise NotFound(collection_name)
+        tmp_path, entry = await self._stage_upload(
+            collection_name, upload, content_type, metadata
+        )
+        try:
+            return await run_in_threadpool(
+                self._commit_dataset, collection_name, dataset_name, tmp_path, entry
+            )
+        except BaseException:
+            if os.path.exists(tmp_path):
+                os.unlink(tmp_path)
+            raise
+
+    def _get_dataset(
+        self, collection_name: CollectionName, dataset_name: DatasetName
+    ) -> DatasetInfo:
+        index = self._load_index(collection_name)
+        if dataset_name not in index.datasets:
+            raise NotFound(dataset_name)
+        return DatasetInfo(
+            index.dataset(dataset_name),
+            dict(index.datasets[dataset_name]["metadata"]),
+        )
+
+    async def get_dataset(
+        self, collection_name: CollectionName, dataset_name: DatasetName
+    ) -> DatasetInfo:
+        return await run_in_threadpool(self._get_dataset, collection_name, dataset_name)
+
+    def read_dataset(
+        self,
+        collection_name: CollectionName,
+        dataset_name: DatasetName,
+        start: int,
+        end: int,
+    ) -> Iterator[bytes]:
+        path = self._dataset_path(collection_name, dataset_name)
+        try:
+            file = open(path, "rb")
+        except FileNotFoundError:
+            # Datasets of multipart uploads are stored as segments.
+            yield from self._read_segments(collection_name, dataset_name, start, end)
+            return
+        with file:
+            yield from self._read_file(file, start, end)
+
+    def _read_file(self, file: BinaryIO, start: int, end: int) -> Iterator[bytes]:
+        size = os.fstat(file.fileno()).st_size
+        end = min(end, size - 1)
+        if start > end:
+            return
+        with mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ) as mapped:
+            if hasattr(mapped, "madvise") and hasattr(mmap, "MADV_SEQUENTIAL"):
+                mapped.madvise(mmap.MADV_SEQUENTIAL)
+            for offset in range(start, end + 1, self.chunk_size):
+                yield mapped[offset : min(offset + self.chunk_size, end + 1)]
+
+    def _read_segments(
+        self,
+        collection_name: CollectionName,
+        dataset_name: DatasetName,
+        start: int,
+        end: int,
+    ) -> Iterator[bytes]:
+        """Assemble the requested range from the segments that overlap it."""
+        entry = self._load_index(collection_name).datasets.get(dataset_name)
+        if entry is None or "segments" not in entry:
+            raise NotFound(dataset_name)
+        path = self._segments_path(collection_name, entry["upload_id"])
+        offset = 0
+        for filename, size in entry["segments"]:
+            if offset > end:
+                break
+            if offset + size > start:
+                with open(path / filename, "rb") as file:
+                    yield from self._read_file(
+                        file, max(start - offset, 0), end - offset
+                    )
+            offset += size
+
+    def _update_dataset_metadata(
+        self,
+        collection_name: CollectionName,
+        dataset_name: DatasetName,
+        metadata: Dict[str, str],
+    ) -> None:
+        with self._locked(collection_name):
+            index = self._load_index(collection_name).copy()
+            if dataset_name not in index.datasets:
+                raise NotFound(dataset_name)
+            # Replaces the metadata as for the Swift object storage API.
+            index.set_dataset(
+                dataset_name, {**index.datasets[dataset_name], "metadata": metadata}
+            )
+            index.touch(_now())
+            self._write_index(collection_name, index)
+
+    async def update_dataset_metadata(
+        self,
+        collection_name: CollectionName,
+        dataset_name: DatasetName,
+        metadata: Dict[str, str],
+    ) -> None:
+        await run_in_threadpool(
+            self._update_dataset_metadata, collection_name, dataset_name, metadata
+        )
+
+    def _delete_dataset(
+        self, collection_name: CollectionName, dataset_name: DatasetName
+    ) -> None:
+        with self._locked(collection_name):
+            index = self._load_index(collection_name).copy()
+            entry = index.pop_dataset(dataset_name)
+            if entry is None:
+                raise NotFound(dataset_name)
+            index.touch(_now())
+            self._write_index(collection_name, index)
+            self._release(collection_name, index, [(dataset_name, entry)])
+
+    async def delete_dataset(
+        self, collection_name: CollectionName, dataset_name: DatasetName
+    ) -> None:
+        await run_in_threadpool(self._delete_dataset, collection_name, dataset_name)
+
+    # Bulk operations
+
+    def _commit_bulk(
+        self, collection_name: CollectionName, staged: List[_StagedOperation]
+    ) -> List[BulkResult]:
+        """Apply the staged operations in order with a single index write.
+
+        The uploads are renamed into place before the index is written, the
+        renames are rolled back if that fails.
+        """
+        renamed: List[Tuple[Path, Optional[str]]] = []
+        try:
+            with self._locked(collection_name):
+                index = self._load_index(collection_name).copy()
+                released: List[Tuple[str, Dict[str, Any]]] = []
+                try:
+                    results = [
+                        self._apply_staged(
+                            collection_name, index, item, released, renamed
+                        )
+                        for item in staged
+                    ]
+                    if any(item.operation.method != "HEAD" for item in staged):
+                        index.touch(_now())
+                        self._write_index(collection_name, index)
+                except BaseException:
+                    for path, backup in reversed(renamed):
+                        if backup is None:
+                            os.unlink(path)
+                        else:
+                            os.replace(backup, path)
+                    raise
+                self._release(collection_name, index, released)
+                return results
+        finally:
+            for item in staged:
+                if item.tmp_path is not None and os.path.exists(item.tmp_path):
+                    os.unlink(item.tmp_path)
+            for _, backup in renamed:
+                if backup is not None and os.path.exists(backup):
+                    os.unlink(backup)
+
+    def _move_into_place(self, tmp_path: str, path: Path) -> Optional[str]:
+        """Rename the file to the path, return the backup of a replaced file."""
+        backup: Optional[str] = None
+        if path.exists():
+            backup = tmp_path + ".replaced"
+            os.replace(path, backup)
+        try:
+            os.replace(tmp_path, path)
+        except BaseException:
+            if backup is not None:
+                os.replace(backup, path)
+            raise
+        return backup
+
+    def _apply_staged(
+        self,
+        collection_name: CollectionName,
+        index: _Index,
+        item: _StagedOperation,
+        released: List[Tuple[str, Dict[str, Any]]],
+        renamed: List[Tuple[Path, Optional[str]]],
+    ) -> BulkResult:
+        operation = item.operation
+        name = operation.dataset_name
+        if item.result is not None:
+            return item.result
+        if operation.method == "PUT":
+            assert item.tmp_path is not None and item.entry is not None
+            path = self._dataset_path(collection_name, name)
+            try:
+                backup = self._move_into_place(item.tmp_path, path)
+            except OSError as error:
+                return bulk_error(operation, error)
+            renamed.append((path, backup))
+            if name in index.datasets:
+                released.append((name, index.datasets[name]))
+            index.set_dataset(name, item.entry)
+        elif operation.method == "DELETE":
+            entry = index.pop_dataset(name)
+            if entry is None:
+                return bulk_error(operation, NotFound(name))
+            released.append((name, entry))
+            return BulkResult(name, BULK_STATUS_CODES["DELETE"])
+        elif name not in index.datasets:
+            return bulk_error(operation, NotFound(name))
+        return BulkResult(
+            name,
+            BULK_STATUS_CODES[operation.method],
+            DatasetInfo(index.dataset(name), dict(index.datasets[name]["metadata"])),
+        )
+
+    async def bulk(
+        self,
+        collection_name: CollectionName,
+        operations: AsyncIterator[BulkOperation],
+    ) -> List[BulkResult]:
+        """Apply the operations of a bulk request.
+
+        Uploads are staged as temporary files while the operations are read,
+        all operations are then applied with a single update of the index.
+        """
+        if not (self._collection_path(collection_name) / INDEX_FILENAME).exists():
+            raise NotFound(collection_name)
+        staged: List[_StagedOperation] = []
+        try:
+            async for operation in operations:
+                if operation.method != "PUT":
+                    staged.append(_StagedOperation(operation))
+                    continue
+                assert operation.upload is not None
+                try:
+                    tmp_path, entry = await self._stage_upload(
+                        collection_name,
+                        operation.upload,
+                        operation.content_type,
+                        operation.metadata or {},
+                    )
+                except OSError as error:
+                    staged.append(
+                        _StagedOperation(operation, result=bulk_error(operation, error))
+                    )
+                    continue
+                staged.append(_StagedOperation(operation, tmp_path, entry))
+        except BaseException:
+            for item in staged:
+                if item.tmp_path is not None:
+                    os.unlink(item.tmp_path)
+            raise
+        return await run_in_threadpool(self._commit_bulk, collection_name, staged)
+
+    # Multipart uploads
+
+    def _load_upload(
+        self, collection_name: CollectionName, dataset_name: DatasetName, upload_id: str
+    ) -> Dict[str, Any]:
+        if not _UPLOAD_ID.match(upload_id):
+            raise NotFound(upload_id)
+        path = self._upload_path(collection_name, upload_id) / UPLOAD_INFO_FILENAME
+        try:
+            info = json.loads(path.read_bytes())
+        except FileNotFoundError:
+            raise NotFound(upload_id)
+        if info["dataset_name"] != dataset_name:
+            raise NotFound(upload_id)
+        return info
+
+    def _upload_parts(self, path: Path) -> Dict[int, Tuple[str, str, int]]:
+        """Return the file name, hash, and size of the parts by number."""
+        parts = {}
+        for entry in os.scandir(path):
+            number, _, part_hash = entry.name.partition(".")
+            if number.isdigit() and part_hash:
+                parts[int(number)] = (entry.name, part_hash, entry.stat().st_size)
+        return parts
+
+    def _create_upload(
+        self,
+        collection_name: CollectionName,
+        dataset_name: DatasetName,
+        content_type: Optional[str],
+        metadata: Dict[str, str],
+    ) -> str:
+        self._load_index(collection_name)
+        upload_id = uuid4().hex
+        path = self._upload_path(collection_name, upload_id)
+        path.mkdir(parents=True)
+        info = {
+            "dataset_name": dataset_name,
+            "content_type": content_type,
+            "metadata": metadata,
+        }
+        self._write_atomically(path / UPLOAD_INFO_FILENAME, json.dumps(info).encode())
+        return upload_id
+
+    async def create_upload(
+        self,
+        collection_name: CollectionName,
+        dataset_name: DatasetName,
+        content_type: Optional[str],
+        metadata: Dict[str, str],
+    ) -> str:
+        return await run_in_threadpool(
+            self._create_upload, collection_name, dataset_name, content_type, metadata
+        )
+
+    def _commit_part(
+        self,
+        collection_name: CollectionName,
+        path: Path,
+        part_number: int,
+        tmp_path: str,
+        filename: str,
+    ) -> None:
+        """Rename the part into place and remove the part it replaces.
+
+        Locked, such that uploads of the same part or the completion of the
+        upload do not interleave with it.
+        """
+        with self._locked(collection_name):
+            try:
+                os.replace(tmp_path, path / filename)
+            except FileNotFoundError:  # Aborted or completed concurrently.
+                raise NotFound(path.name)
+            prefix = f"{part_number:05d}."
+            for entry in os.scandir(path):
+                if entry.name.startswith(prefix) and entry.name != filename:
+                    os.unlink(entry.path)
+
+    async def put_upload_part(
+        self,
+        collection_name: CollectionName,
+        dataset_name: DatasetName,
+        upload_id: str,
+        part_number: int,
+        upload: DatasetUploadStream,
+    ) -> UploadPartModel:
+        await run_in_threadpool(
+            self._load_upload, collection_name, dataset_name, upload_id
+        )
+        path = self._upload_path(collection_name, upload_id)
+        tmp_path = await self._write_upload(path, upload)
+        filename = f"{part_number:05d}.{upload.hexdigest()}"
+        try:
+            await run_in_threadpool(
+                self._commit_part,
+                collection_name,
+                path,
+                part_number,
+                tmp_path,
+                filename,
+            )
+        except BaseException:
+            if os.path.exists(tmp_path):
+                os.unlink(tmp_path)
+            raise
+        return UploadPartModel(
+            part_number=part_number, hash=upload.hexdigest(), bytes=upload.bytes
+        )
+
+    def _list_upload_parts(
+        self, collection_name: CollectionName, dataset_name: DatasetName, upload_id: str
+    ) -> List[UploadPartModel]:
+        self._load_upload(collection_name, dataset_name, upload_id)
+        parts = self._upload_parts(self._upload_path(collection_name, upload_id))
+        return [
+            UploadPartModel(part_number=number, hash=part_hash, bytes=size)
+            for number, (_, part_hash, size) in sorted(parts.items())
+        ]
+
+    async def list_upload_parts(
+        self, collection_name: CollectionName, dataset_name: DatasetName, upload_id: str
+    ) -> List[UploadPartModel]:
+        return await run_in_threadpool(
+            self._list_upload_parts, collection_name, dataset_name, upload_id
+        )
+
+    def _complete_upload(
+        self,
+        collection_name: CollectionName,
+        dataset_name: DatasetName,
+        upload_id: str,
+        parts: Optional[List[UploadManifestPartModel]],
+    ) -> DatasetModel:
+        with self._locked(collection_name):
+            index = self._load_index(collection_name).copy()
+            info = self._load_upload(collection_name, dataset_name, upload_id)
+            path = self._upload_path(collection_name, upload_id)
+            uploaded = self._upload_parts(path)
+            if parts is None:
+                parts = [
+                    UploadManifestPartModel(part_number=number)
+                    for number in sorted(uploaded)
+                ]
+            numbers = [part.part_number for part in parts]
+            if not numbers:
+                raise InvalidManifest("The upload has no parts.")
+            if len(set(numbers)) != len(numbers):
+                raise InvalidManifest("The manifest lists parts repeatedly.")
+            for part in parts:
+                if part.part_number not in uploaded:
+                    raise InvalidManifest(f"Part {part.part_number} is missing.")
+                if part.hash is not None and part.hash != uploaded[part.part_number][1]:
+                    raise InvalidManifest(f"Part {part.part_number} has been replaced.")
+            segments = [uploaded[number] for number in numbers]
+            entry = {
+                "hash": multipart_hash([part_hash for _, part_hash, _ in segments]),
+                "bytes": sum(size for _, _, size in segments),
+                "content_type": info["content_type"],
+                "last_modified": _now().isoformat(),
+                "metadata": info["metadata"],
+                "upload_id": upload_id,
+                "segments": [[filename, size] for filename, _, size in segments],
+            }
+            segments_path = self._segments_path(collection_name, upload_id)
+            segments_path.parent.mkdir(exist_ok=True)
+            os.replace(path, segments_path)
+            replaced = index.datasets.get(dataset_name)
+            index.set_dataset(dataset_name, entry)
+            index.touch(_now())
+            try:
+                self._write_index(collection_name, index)
+            except BaseException:
+                # The upload can be completed again.
+                os.replace(segments_path, path)
+                raise
+            os.unlink(segments_path / UPLOAD_INFO_FILENAME)
+            for number in set(uploaded) - set(numbers):
+                os.unlink(segments_path / uploaded[number][0])
+            if replaced is not None:
+                self._release(collection_name, index, [(dataset_name, replaced)])
+            return index.dataset(dataset_name)
+
+    async def complete_upload(
+        self,
+        collection_name: CollectionName,
+        dataset_name: DatasetName,
+        upload_id: str,
+        parts: Optional[List[UploadManifestPartModel]],
+    ) -> DatasetModel:
+        return await run_in_threadpool(
+            self._complete_upload, collection_name, dataset_name, upload_id, parts
+        )
+
+    def _abort_upload(
+        self, collection_name: CollectionName, dataset_name: DatasetName, upload_id: str
+    ) -> None:
+        with self._locked(collection_name):
+            self._load_upload(collection_name, dataset_name, upload_id)
+            shutil.rmtree(self._upload_path(collection_name, upload_id))
+
+    async def abort_upload(
+        self, collection_name: CollectionName, dataset_name: DatasetName, upload_id: str
+    ) -> None:
+        await run_in_threadpool(
+            self._abort_upload, collection_name, dataset_name, upload_id
+        )
@@ -0,0 +1,447 @@
+"""Stores for the state of transformations.
+
+The `TransformationExecutor` keeps transformations in a `TransformationStore`.
+The `InMemoryTransformationStore` is used by default, the
+`SQLiteTransformationStore` persists transformations and their state
+transitions in a local SQLite database, such that they survive restarts of the
+application without depending on any external service.
+"""
+
+import json
+import logging
+import os
+import sqlite3
+import threading
+import time
+from datetime import datetime, timezone
+from typing import Dict, List, NamedTuple, Optional, Protocol, Tuple, Union
+from uuid import UUID
+
+from ..models.transformation import (
+    TransformationId,
+    TransformationListResponse,
+    TransformationModel,
+    TransformationState,
+)
+from ..pagination import InvalidCursor, decode_cursor, encode_cursor, page_bounds
+
+logger = logging.getLogger(__name__)
+
+FINAL_STATES = frozenset(
+    {
+        TransformationState.STOPPED,
+        TransformationState.COMPLETED,
+        TransformationState.FAILED,
+    }
+)
+
+
+class TransformationNotFound(KeyError):
+    """The transformation does not exist."""
+
+
+class StateTransition(NamedTuple):
+    id: TransformationId
+    state: TransformationState
+    timestamp: datetime
+
+
+class TransformationStore(Protocol):
+    """Storage of transformations, their current state, and state history.
+
+    Methods raise TransformationNotFound for unknown transformations.
+    Transformations are listed in the order of their creation.
+    """
+
+    def add(self, id: TransformationId, parameters: dict) -> StateTransition:
+        """Add a new transformation in the CREATED state."""
+        ...
+
+    def get(self, id: TransformationId) -> TransformationModel:
+        ...
+
+    def get_state(self, id: TransformationId) -> TransformationState:
+        ...
+
+    def set_state(
+        self, id: TransformationId, state: TransformationState
+    ) -> StateTransition:
+        ...
+
+    def transitions(self, id: TransformationId) -> List[StateTransition]:
+        ...
+
+    def delete(self, id: TransformationId) -> None:
+        ...
+
+    def list(
+        self, limit: int = 100, offset: int = 0, cursor: Optional[str] = None
+    ) -> TransformationListResponse:
+        ...
+
+    def ids_in_state(self, state: TransformationState) -> List[TransformationId]:
+        ...
+
+    def close(self) -> None:
+        ...
+
+
+def _now() -> datetime:
+    return datetime.now(timezone.utc)
+
+
+def _sequence_from_cursor(cursor: str) -> int:
+    key = decode_cursor(cursor)
+    if len(key) != 1 or not isinstance(key[0], int):
+        raise InvalidCursor(cursor)
+    return key[0]
+
+
+class _Record:
+    def __init__(self, id: TransformationId, parameters: dict, sequence: int):
+        self.id = id
+        self.parameters = parameters
+        self.sequence = sequence
+        self.state = TransformationState.CREATED
+        self.transitions: List[StateTransition] = []
+
+    def model(self) -> TransformationModel:
+        return TransformationModel(
+            id=self.id, parameters=self.parameters, state=self.state
+        )
+
+
+class InMemoryTransformationStore:
+    """Keep transformations in memory for the lifetime of the application."""
+
+    def __init__(self) -> None:
+        self._records: Dict[TransformationId, _Record] = {}
+        self._sequence = 0
+        # Transformations are added and deleted from the thread pool.
+        self._lock = threading.Lock()
+
+    def _get(self, id: TransformationId) -> _Record:
+        try:
+            return self._records[id]
+        except KeyError:
+            raise TransformationNotFound(id)
+
+    def add(self, id: TransformationId, parameters: dict) -> StateTransition:
+        with self._lock:
+            self._sequence += 1
+            self._records[id] = _Record(id, parameters, self._sequence)
+        return self.set_state(id, TransformationState.CREATED)
+
+    def get(self, id: TransformationId) -> TransformationModel:
+        return self._get(id).model()
+
+    def get_state(self, id: TransformationId) -> TransformationState:
+        return self._get(id).state
+
+    def set_state(
+        self, id: TransformationId, state: TransformationState
+    ) -> StateTransition:
+        record = self._get(id)
+        record.state = state
+        transition = StateTransition(id, state, _now())
+        record.transitions.append(transition)
+        return transition
+
+    def transitions(self, id: TransformationId) -> List[StateTransition]:
+        return list(self._get(id).transitions)
+
+    def delete(self, id: TransformationId) -> None:
+        with self._lock:
+            self._get(id)
+            del self._records[id]
+
+    def list(
+        self, limit: int = 100, offset: int = 0, cursor: Optional[str] = None
+    ) -> TransformationListResponse:
+        records = list(self._records.values())
+        after = _sequence_from_cursor(cursor) if cursor else None
+        start, stop = page_bounds([r.sequence for r in records], after, limit, offset)
+        items = records[start:stop]
+        next_cursor = (
+            encode_cursor([items[-1].sequence])
+            if items and stop < len(records)
+            else None
+        )
+        return TransformationListResponse(
+            items=[record.model() for record in items], next_cursor=next_cursor
+        )
+
+    def ids_in_state(self, state: TransformationState) -> List[TransformationId]:
+        return [r.id for r in self._records.values() if r.state is state]
+
+    def close(self) -> None:
+        pass
+
+
+_SCHEMA = """
+CREATE TABLE IF NOT EXISTS transformations (
+    sequence INTEGER PRIMARY KEY AUTOINCREMENT,
+    id TEXT NOT NULL UNIQUE,
+    parameters TEXT NOT NULL,
+    state TEXT NOT NULL,
+    created REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS transformations_state
+    ON transformations (state, sequence);
+CREATE INDEX IF NOT EXISTS transformations_created
+    ON transformations (created);
+CREATE TABLE IF NOT EXISTS transitions (
+    id TEXT NOT NULL,
+    state TEXT NOT NULL,
+    timestamp REAL NOT NULL
+);
+CREATE INDEX IF NOT EXISTS transitions_id ON transitions (id, timestamp);
+"""
+
+_INSERT = (
+    "INSERT INTO transformations (id, parameters, state, created) VALUES (?, ?, ?, ?)"
+)
+_SELECT = "SELECT parameters, state FROM transformations WHERE id = ?"
+_SELECT_STATE = "SELECT state FROM transformations WHERE id = ?"
+_UPDATE_STATE = "UPDATE transformations SET state = ? WHERE id = ?"
+_INSERT_TRANSITION = "INSERT INTO transitions (id, state, timestamp) VALUES (?, ?, ?)"
+_SELECT_TRANSITIONS = (
+    "SELECT state, timestamp FROM transitions WHERE id = ? ORDER BY timestamp, rowid"
+)
+_DELETE = "DELETE FROM transformations WHERE id = ?"
+_DELETE_TRANSITIONS = "DELETE FROM transitions WHERE id = ?"
+_LIST = (
+    "SELECT sequence, id, parameters, state FROM transformations "
+    "WHERE sequence > ? ORDER BY sequence LIMIT ? OFFSET ?"
+)
+_SELECT_IDS_IN_STATE = (
+    "SELECT id FROM transformations WHERE state = ? ORDER BY sequence"
+)
+
+
+class SQLiteTransformationStore:
+    """Persist transformations in an SQLite database.
+
+    The database is operated in write-ahead-logging mode, such that reads are
+    not blocked by writes.  Transformations are indexed by id, state, and
+    creation time; listings seek the creation sequence instead of scanning.
+
+    State updates are buffered and written in a single transaction by a
+    background thread, at the latest ``max_delay`` seconds after the oldest
+    pending update and right away once ``batch_size`` updates are pending or a
+    transformation reached a final state.  Reads other than `get` and
+    `get_state`, which consult the buffer, write pending updates first.
+    Updates of the last ``max_delay`` seconds are lost if the process is
+    killed, except for final states, unless they were written already.
+
+    Args:
+        path: The path of the database file.
+        batch_size: The maximum number of buffered state updates.
+        max_delay: The maximum time in seconds an update is buffered for.
+    """
+
+    def __init__(
+        self,
+        path: Union[str, "os.PathLike[str]"],
+        batch_size: int = 64,
+        max_delay: float = 0.5,
+    ):
+        self.batch_size = batch_size
+        self.max_delay = max_delay
+        self._connection = sqlite3.connect(
+            path, check_same_thread=False, isolation_level=None
+        )
+        self._connection.execute("PRAGMA journal_mode=WAL")
+        self._connection.execute("PRAGMA synchronous=NORMAL")
+        self._connection.executescript(_SCHEMA)
+        self._lock = threading.RLock()
+        # Notified when updates are pending or the store is closed.
+        self._updated = threading.Condition(self._lock)
+        self._pending_states: Dict[str, TransformationState] = {}
+        self._pending_transitions: List[Tuple[str, str, float]] = []
+        self._pending_since: Optional[float] = None
+        self._flush_now = False
+        self._writer: Optional[threading.Thread] = None
+        self._closed = False
+
+    def _execute(self, sql: str, parameters: Tuple = ()) -> sqlite3.Cursor:
+        # The sqlite3 module caches the prepared statements by SQL string.
+        return self._connection.execute(sql, parameters)
+
+    def flush(self) -> None:
+        """Write all buffered state updates in a single transaction."""
+        with self._lock:
+            if not self._pending_transitions:
+                return
+            with self._transaction():
+                self._connection.executemany(
+                    _UPDATE_STATE,
+                    [(state.value, id) for id, state in self._pending_states.items()],
+                )
+                self._connection.executemany(
+                    _INSERT_TRANSITION, self._pending_transitions
+                )
+            self._pending_states.clear()
+            self._pending_transitions.clear()
+            self._pending_since = None
+            self._flush_now = False
+
+    def _write_pending(self) -> None:
+        """Flush the buffered updates once they are due, until closed."""
+        with self._updated:
+            while not self._closed:
+                if self._pending_since is None:
+                    self._updated.wait()
+                    continue
+                delay = self._pending_since + self.max_delay - time.monotonic()
+                if delay > 0 and not self._flush_now:
+                    self._updated.wait(delay)
+                    continue
+                try:
+                    self.flush()
+                except sqlite3.Error:
+                    logger.exception("Failed to write transformation states.")
+                    self._updated.wait(self.max_delay)
+
+    def _transaction(self) -> "_Transaction":
+        return _Transaction(self._connection)
+
+    def add(self, id: TransformationId, parameters: dict) -> StateTransition:
+        timestamp = _now()
+        with self._lock:
+            with self._transaction():
+                self._execute(
+                    _INSERT,
+                    (
+                        str(id),
+                        json.dumps(parameters),
+                        TransformationState.CREATED.value,
+                        timestamp.timestamp(),
+                    ),
+                )
+                self._execute(
+                    _INSERT_TRANSITION,
+                    (
+                        str(id),
+                        TransformationState.CREATED.value,
+                        timestamp.timestamp(),
+                    ),
+                )
+        return StateTransition(id, TransformationState.CREATED, timestamp)
+
+    def get(self, id: TransformationId) -> TransformationModel:
+        with self._lock:
+            row = self._execute(_SELECT, (str(id),)).fetchone()
+            if row is None:
+                raise TransformationNotFound(id)
+            state = self._pending_states.get(str(id), TransformationState(row[1]))
+        return TransformationModel(id=id, parameters=json.loads(row[0]), state=state)
+
+    def get_state(self, id: TransformationId) -> TransformationState:
+        with self._lock:
+            state = self._pending_states.get(str(id))
+            if state is not None:
+                return state
+            row = self._execute(_SELECT_STATE, (str(id),)).fetchone()
+        if row is None:
+            raise TransformationNotFound(id)
+        return TransformationState(row[0])
+
+    def set_state(
+        self, id: TransformationId, state: TransformationState
+    ) -> StateTransition:
+        timestamp = _now()
+        with self._lock:
+            self.get_state(id)  # Raises TransformationNotFound.
+            self._pending_states[str(id)] = state
+            self._pending_transitions.append(
+                (str(id), state.value, timestamp.timestamp())
+            )
+            if self._pending_since is None:
+                self._pending_since = time.monotonic()
+            if len(self._pending_transitions) >= self.batch_size:
+                self._flush_now = True
+            if state in FINAL_STATES:
+                # Otherwise a restart would mark the transformation as failed.
+                self._flush_now = True
+            if self._writer is None:
+                self._writer = threading.Thread(
+                    target=self._write_pending,
+                    name="transformation-store-writer",
+                    daemon=True,
+                )
+                self._writer.start()
+            self._updated.notify()
+        return StateTransition(id, state, timestamp)
+
+    def transitions(self, id: TransformationId) -> List[StateTransition]:
+        with self._lock:
+            self.flush()
+            self.get_state(id)  # Raises TransformationNotFound.
+            rows = self._execute(_SELECT_TRANSITIONS, (str(id),)).fetchall()
+        return [
+            StateTransition(
+                id,
+                TransformationState(state),
+                datetime.fromtimestamp(timestamp, timezone.utc),
+            )
+            for state, timestamp in rows
+        ]
+
+    def delete(self, id: TransformationId) -> None:
+        with self._lock:
+            self.flush()
+            with self._transaction():
+                if self._execute(_DELETE, (str(id),)).rowcount == 0:
+                    raise TransformationNotFound(id)
+                self._execute(_DELETE_TRANSITIONS, (str(id),))
+
+    def list(
+        self, limit: int = 100, offset: int = 0, cursor: Optional[str] = None
+    ) -> TransformationListResponse:
+        after = _sequence_from_cursor(cursor) if cursor else 0
+        with self._lock:
+            self.flush()
+            # Fetch one more row to determine whether there is a next page.
+            rows = self._execute(
+                _LIST, (after, max(limit, 0) + 1, max(offset, 0))
+            ).fetchall()
+        items = [
+            TransformationModel(
+                id=UUID(id), parameters=json.loads(parameters), state=state
+            )
+            for _, id, parameters, state in rows[: max(limit, 0)]
+        ]
+        next_cursor = (
+            encode_cursor([rows[len(items) - 1][0]])
+            if items and len(rows) > len(items)
+            else None
+        )
+        return TransformationListResponse(items=items, next_cursor=next_cursor)
+
+    def ids_in_state(self, state: TransformationState) -> List[TransformationId]:
+        with self._lock:
+            self.flush()
+            rows = self._execute(_SELECT_IDS_IN_STATE, (state.value,)).fetchall()
+        return [TransformationId(UUID(id)) for id, in rows]
+
+    def close(self) -> None:
+        with self._lock:
+            self._closed = True
+            self._updated.notify()
+        if self._writer is not None:
+            self._writer.join()
+        with self._lock:
+            self.flush()
+            self._connection.close()
+
+
+class _Transaction:
+    def __init__(self, connection: sqlite3.Connection):
+        self._connection = connection
+
+    def __enter__(self) -> None:
+        self._connection.execute("BEGIN")
+
+    def __exit__(self, exc_type, exc_value, traceback) -> None:
+        self._connection.execute("COMMIT" if exc_type is None else "ROLLBACK")
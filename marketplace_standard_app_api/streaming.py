@@ -0,0 +1,568 @@
+"""Helpers for streaming dataset payloads in and out of the API.
+
+Implementations of the createDataset and createOrReplaceDataset operations
+receive the dataset either as a ``multipart/form-data`` upload or as a raw
+``application/octet-stream`` request body.  The :class:`DatasetUploadStream`
+provides a uniform, constant-memory view onto both, computing the dataset hash
+in the same pass:
+
+    async def create_dataset(request, file, collection_name, dataset_name):
+        upload = DatasetUploadStream.from_request(request, file)
+        async for chunk in upload:
+            ...  # write the chunk to the storage backend
+        return DatasetCreateResponse(last_modified=..., id=upload.hexdigest())
+
+Datasets are served with `dataset_response`, which honors Range and If-Range
+requests such that only the requested bytes are read from the backend:
+
+    async def get_dataset(collection_name, dataset_name, range_, if_range):
+        return dataset_response(
+            lambda start, end: iter_file_range(path, start, end),
+            size,
+            range_header=range_,
+            if_range=if_range,
+        )
+
+Archives are extracted while they are received with `iter_tar`, e.g., for
+bulk uploads of datasets:
+
+    async for member in iter_tar(request.stream()):
+        upload = DatasetUploadStream(member.chunks)
+        ...
+
+List operations stream their items as newline-delimited JSON with the
+`NDJSONResponse` if the client asks for it (see `accepts_ndjson`).  Updates
+are pushed to clients as Server-Sent Events with the `EventStreamResponse`.
+"""
+
+import asyncio
+import hashlib
+import os
+import tarfile
+import zlib
+from datetime import datetime
+from email.utils import parsedate_to_datetime
+from typing import (
+    Any,
+    AsyncIterable,
+    AsyncIterator,
+    Callable,
+    Dict,
+    Iterator,
+    List,
+    Mapping,
+    NamedTuple,
+    Optional,
+    Tuple,
+    Union,
+)
+
+from fastapi import Request, UploadFile
+from fastapi.responses import Response, StreamingResponse
+from pydantic import BaseModel
+
+from .conditional import as_utc, format_http_date
+
+DEFAULT_CHUNK_SIZE = 1024 * 1024
+
+DEFAULT_HASH_ALGORITHM = "md5"
+
+
+class DatasetUploadStream:
+    """Async iterator over the chunks of an uploaded dataset.
+
+    Chunks are re-framed to at most ``chunk_size`` bytes, i.e., no more than one
+    chunk is buffered at any time regardless of how the client or the ASGI
+    server split the body.  The hash and size of the dataset are accumulated
+    while iterating and are available once the stream is exhausted.
+    """
+
+    def __init__(
+        self,
+        source: AsyncIterator[bytes],
+        chunk_size: int = DEFAULT_CHUNK_SIZE,
+        hash_algorithm: str = DEFAULT_HASH_ALGORITHM,
+    ):
+        if chunk_size <= 0:
+            raise ValueError("The chunk size must be positive.")
+        self._source = source
+        self._chunk_size = chunk_size
+        self._hash = hashlib.new(hash_algorithm)
+        self._buffer = bytearray()
+        self._exhausted = False
+        self.bytes = 0
+
+    @classmethod
+    def from_request(
+        cls,
+        request: Request,
+        file: Optional[UploadFile] = None,
+        **kwargs,
+    ) -> "DatasetUploadStream":
+        """Create the upload stream for a createDataset request.
+
+        Uses the multipart upload if one was provided and otherwise streams the
+        raw request body.
+        """
+        if file is not None:
+            return cls(_iter_upload_file(file, kwargs.get("chunk_size")), **kwargs)
+        return cls(request.stream(), **kwargs)
+
+    def __aiter__(self) -> "DatasetUploadStream":
+        return self
+
+    async def __anext__(self) -> bytes:
+        while not self._exhausted and len(self._buffer) < self._chunk_size:
+            try:
+                self._buffer += await self._source.__anext__()
+            except StopAsyncIteration:
+                self._exhausted = True
+        if not self._buffer:
+            raise StopAsyncIteration
+        chunk = bytes(self._buffer[: self._chunk_size])
+        del self._buffer[: self._chunk_size]
+        self._hash.update(chunk)
+        self.bytes += len(chunk)
+        return chunk
+
+    @property
+    def exhausted(self) -> bool:
+        return self._exhausted and not self._buffer
+
+    def hexdigest(self) -> str:
+        """Return the hash of the dataset, to be used for ``DatasetModel.hash``."""
+        if not self.exhausted:
+            raise RuntimeError(
+                "The hash is only available once the upload is consumed."
+            )
+        return self._hash.hexdigest()
+
+
+async def _iter_upload_file(
+    file: UploadFile, chunk_size: Optional[int] = None
+) -> AsyncIterator[bytes]:
+    while True:
+        chunk = await file.read(chunk_size or DEFAULT_CHUNK_SIZE)
+        if not chunk:
+            break
+        yield chunk
+
+
+# The maximum size of the GNU long name and pax headers of an archive member,
+# which are read in full.
+MAX_ARCHIVE_HEADER_SIZE = 1024 * 1024
+
+
+class InvalidArchive(ValueError):
+    """The archive is malformed or truncated."""
+
+
+class _ArchiveReader:
+    """Read exact amounts of bytes from a stream of chunks."""
+
+    def __init__(self, source: AsyncIterator[bytes]):
+        self._source = source
+        self._buffer = bytearray()
+
+    async def _fill(self, size: int) -> bool:
+        while len(self._buffer) < size:
+            try:
+                self._buffer += await self._source.__anext__()
+            except StopAsyncIteration:
+                return False
+        return True
+
+    async def read(self, size: int) -> bytes:
+        if not await self._fill(size):
+            raise InvalidArchive("The archive is truncated.")
+        data = bytes(self._buffer[:size])
+        del self._buffer[:size]
+        return data
+
+    async def at_end(self) -> bool:
+        return not await self._fill(1)
+
+    async def iter_bytes(self, size: int, consumed: List[int]) -> AsyncIterator[bytes]:
+        """Iterate over the next size bytes, counting them in consumed[0]."""
+        while consumed[0] < size:
+            if not self._buffer and not await self._fill(1):
+                raise InvalidArchive("The archive is truncated.")
+            chunk = bytes(self._buffer[: size - consumed[0]])
+            del self._buffer[: len(chunk)]
+            consumed[0] += len(chunk)
+            yield chunk
+
+
+class ArchiveMember(NamedTuple):
+    """Regular file of an archive, the chunks have to be consumed in order."""
+
+    name: str
+    size: int
+    chunks: AsyncIterator[bytes]
+
+
+def _pax_headers(data: bytes) -> Dict[str, str]:
+    headers = {}
+    while data:
+        length, _, rest = data.partition(b" ")
+        try:
+            record = data[len(length) + 1 : int(length)]
+        except ValueError:
+            raise InvalidArchive("Invalid pax header.")
+        key, _, value = record.rstrip(b"\n").partition(b"=")
+        headers[key.decode("utf-8", "surrogateescape")] = value.decode(
+            "utf-8", "surrogateescape"
+        )
+        data = data[int(length) :]
+    return headers
+
+
+async def iter_tar(source: AsyncIterator[bytes]) -> AsyncIterator[ArchiveMember]:
+    """Iterate over the regular files of a tar archive while it is received.
+
+    Supports ustar, GNU long names, and pax archives; directories, links, and
+    other special files are skipped.  Members that are not consumed completely
+    are skipped once the next member is requested.
+    """
+    reader = _ArchiveReader(source)
+    long_name: Optional[str] = None
+    pax: Dict[str, str] = {}
+    while True:
+        # Archives end with zero blocks, tolerate archives without them.
+        if await reader.at_end():
+            return
+        block = await reader.read(tarfile.BLOCKSIZE)
+        if not block.strip(b"\0"):
+            return
+        try:
+            info = tarfile.TarInfo.frombuf(block, "utf-8", "surrogateescape")
+        except tarfile.HeaderError as error:
+            raise InvalidArchive(str(error))
+        if info.type in (tarfile.GNUTYPE_LONGNAME, tarfile.XHDTYPE, tarfile.XGLTYPE):
+            if info.size > MAX_ARCHIVE_HEADER_SIZE:
+                raise InvalidArchive("The extended header is too large.")
+            data = await reader.read(info.size + -info.size % tarfile.BLOCKSIZE)
+            data = data[: info.size]
+            if info.type == tarfile.GNUTYPE_LONGNAME:
+                long_name = data.rstrip(b"\0").decode("utf-8", "surrogateescape")
+            elif info.type == tarfile.XHDTYPE:
+                pax = _pax_headers(data)
+            continue
+        try:
+            size = int(pax.get("size", info.size))
+        except ValueError:
+            raise InvalidArchive("Invalid pax header.")
+        padding = -size % tarfile.BLOCKSIZE
+        name = pax.get("path", long_name or info.name)
+        long_name, pax = None, {}
+        consumed = [0]
+        if info.type in tarfile.REGULAR_TYPES:
+            yield ArchiveMember(name, size, reader.iter_bytes(size, consumed))
+        async for _ in reader.iter_bytes(size, consumed):
+            pass
+        await reader.read(padding)
+
+
+async def iter_gunzip(source: AsyncIterator[bytes]) -> AsyncIterator[bytes]:
+    """Decompress a gzip stream chunk by chunk."""
+    decompressor = zlib.decompressobj(16 + zlib.MAX_WBITS)
+    try:
+        async for chunk in source:
+            data = decompressor.decompress(chunk)
+            if data:
+                yield data
+        data = decompressor.flush()
+    except zlib.error as error:
+        raise InvalidArchive(str(error))
+    if data:
+        yield data
+
+
+class ByteRange(NamedTuple):
+    """Inclusive byte range of a dataset as requested with the Range header."""
+
+    start: int
+    end: int
+
+    @property
+    def length(self) -> int:
+        return self.end - self.start + 1
+
+
+class RangeNotSatisfiable(ValueError):
+    """The requested range does not overlap with the dataset."""
+
+
+def parse_range(header: Optional[str], size: int) -> Optional[ByteRange]:
+    """Parse the value of a Range header for a dataset of the given size.
+
+    Returns None in case that the whole dataset should be served, which is the
+    case for absent, malformed, and multi-range headers (RFC 9110, section
+    14.2).  Raises RangeNotSatisfiable for ranges outside of the dataset.
+    """
+    if not header:
+        return None
+    unit, _, ranges = header.partition("=")
+    if unit.strip().lower() != "bytes" or "," in ranges:
+        return None
+    first, sep, last = ranges.strip().partition("-")
+    first, last = first.strip(), last.strip()
+    if not sep or not (first or last):
+        return None
+    if not all(value.isdigit() for value in (first, last) if value):
+        return None
+
+    if not first:
+        # Suffix range, i.e., the last N bytes of the dataset.
+        suffix_length = int(last)
+        if suffix_length == 0:
+            raise RangeNotSatisfiable(header)
+        start, end = max(size - suffix_length, 0), size - 1
+    else:
+        start = int(first)
+        end = int(last) if last else size - 1
+        if last and start > end:
+            return None
+    if start >= size:
+        raise RangeNotSatisfiable(header)
+    return ByteRange(start, min(end, size - 1))
+
+
+def if_range_matches(
+    if_range: Optional[str],
+    etag: Optional[str] = None,
+    last_modified: Optional[datetime] = None,
+) -> bool:
+    """Evaluate an If-Range header against the current dataset validators.
+
+    The range request is only honored if the If-Range header is absent or
+    matches the current (strong) entity tag or last modification date.
+    """
+    if not if_range:
+        return True
+    if_range = if_range.strip()
+    if if_range.startswith(('"', "W/")):
+        return etag is not None and if_range == etag and not etag.startswith("W/")
+    if last_modified is None:
+        return False
+    try:
+        date = parsedate_to_datetime(if_range)
+    except (TypeError, ValueError):
+        return False
+    return date == as_utc(last_modified).replace(microsecond=0)
+
+
+DatasetReader = Callable[[int, int], Union[Iterator[bytes], AsyncIterator[bytes]]]
+
+
+def dataset_response(
+    read: DatasetReader,
+    size: int,
+    *,
+    range_header: Optional[str] = None,
+    if_range: Optional[str] = None,
+    etag: Optional[str] = None,
+    last_modified: Optional[datetime] = None,
+    media_type: Optional[str] = None,
+    headers: Optional[Mapping[str, str]] = None,
+) -> Response:
+    """Create a (partial) streaming response for the getDataset operation.
+
+    The ``read(start, end)`` callable must return a (sync or async) iterator
+    over the bytes of the dataset in the inclusive range [start, end], e.g.,
+    `iter_file_range` for datasets that are stored as files.  Only the
+    requested bytes are read, responding with 206 (Partial Content) or 416
+    (Range Not Satisfiable) where applicable.
+    """
+    response_headers = dict(headers or {})
+    response_headers["Accept-Ranges"] = "bytes"
+    if etag is not None:
+        response_headers["ETag"] = etag
+    if last_modified is not None:
+        response_headers["Last-Modified"] = format_http_date(last_modified)
+
+    try:
+        byte_range = (
+            parse_range(range_header, size)
+            if if_range_matches(if_range, etag, last_modified)
+            else None
+        )
+    except RangeNotSatisfiable:
+        response_headers["Content-Range"] = f"bytes */{size}"
+        return Response(status_code=416, headers=response_headers)
+
+    if byte_range is None:
+        response_headers["Content-Length"] = str(size)
+        return StreamingResponse(
+            read(0, size - 1) if size else iter(()),
+            media_type=media_type,
+            headers=response_headers,
+        )
+    response_headers["Content-Length"] = str(byte_range.length)
+    response_headers[
+        "Content-Range"
+    ] = f"bytes {byte_range.start}-{byte_range.end}/{size}"
+    return StreamingResponse(
+        read(byte_range.start, byte_range.end),
+        status_code=206,
+        media_type=media_type,
+        headers=response_headers,
+    )
+
+
+def iter_file_range(
+    path: Union[str, "os.PathLike[str]"],
+    start: int,
+    end: int,
+    chunk_size: int = DEFAULT_CHUNK_SIZE,
+) -> Iterator[bytes]:
+    """Iterate over the inclusive byte range [start, end] of a file.
+
+    The iterator is synchronous, the StreamingResponse consumes it within the
+    thread pool so that the event loop is not blocked by disk I/O.
+    """
+    with open(path, "rb") as file:
+        file.seek(start)
+        remaining = end - start + 1
+        while remaining > 0:
+            chunk = file.read(min(chunk_size, remaining))
+            if not chunk:
+                break
+            remaining -= len(chunk)
+            yield chunk
+
+
+NDJSON_MEDIA_TYPE = "application/x-ndjson"
+
+
+def accept_quality(accept: str, media_type: str) -> float:
+    """Return the quality with which the Accept header accepts the media type."""
+    main_type = media_type.split("/")[0]
+    best: Optional[Tuple[int, float]] = None
+    for media_range in accept.split(","):
+        candidate, *params = (part.strip() for part in media_range.split(";"))
+        if candidate == media_type:
+            specificity = 2
+        elif candidate == f"{main_type}/*":
+            specificity = 1
+        elif candidate == "*/*":
+            specificity = 0
+        else:
+            continue
+        quality = 1.0
+        for param in params:
+            key, _, value = param.partition("=")
+            if key.strip() == "q":
+                try:
+                    quality = float(value)
+                except ValueError:
+                    quality = 0.0
+        if best is None or specificity > best[0]:
+            best = (specificity, quality)
+    return best[1] if best else 0.0
+
+
+def accepts_ndjson(request: Request) -> bool:
+    """Check whether the client prefers a streamed NDJSON list response.
+
+    NDJSON is only used if explicitly requested and at least as acceptable to
+    the client as JSON.
+    """
+    accept = request.headers.get("Accept")
+    if not accept or NDJSON_MEDIA_TYPE not in accept:
+        return False
+    quality = accept_quality(accept, NDJSON_MEDIA_TYPE)
+    return quality > 0 and quality >= accept_quality(accept, "application/json")
+
+
+async def _iter_ndjson(items: AsyncIterable[BaseModel]) -> AsyncIterator[bytes]:
+    async for item in items:
+        yield item.json().encode() + b"\n"
+
+
+class NDJSONResponse(StreamingResponse):
+    """Stream the items of a list response as newline-delimited JSON.
+
+    Each item is serialized as soon as it is produced by the iterator, such
+    that the response is sent in constant memory regardless of its length.
+    """
+
+    media_type = NDJSON_MEDIA_TYPE
+
+    def __init__(self, items: AsyncIterable[BaseModel], **kwargs) -> None:
+        super().__init__(_iter_ndjson(items), **kwargs)
+
+
+def ndjson_response_schema(model: str) -> Dict[str, Any]:
+    """Return the OpenAPI response for an NDJSON stream of the given model."""
+    return {
+        "content": {
+            NDJSON_MEDIA_TYPE: {
+                "schema": {"$ref": f"#/components/schemas/{model}"},
+            },
+        },
+    }
+
+
+EVENT_STREAM_MEDIA_TYPE = "text/event-stream"
+
+DEFAULT_KEEPALIVE_INTERVAL = 15.0
+
+
+async def _iter_events(
+    items: AsyncIterable[BaseModel], event: str, keepalive: float
+) -> AsyncIterator[bytes]:
+    iterator = items.__aiter__()
+    next_item: Optional["asyncio.Future[BaseModel]"] = None
+    try:
+        while True:
+            if next_item is None:
+                next_item = asyncio.ensure_future(iterator.__anext__())
+            # Wait without cancelling, the item is awaited again after the comment.
+            done, _ = await asyncio.wait({next_item}, timeout=keepalive)
+            if not done:
+                yield b": keepalive\n\n"
+                continue
+            try:
+                item = next_item.result()
+            except StopAsyncIteration:
+                break
+            next_item = None
+            yield f"event: {event}\ndata: {item.json()}\n\n".encode()
+    finally:
+        if next_item is not None:
+            next_item.cancel()
+
+
+class EventStreamResponse(StreamingResponse):
+    """Push the items of an async iterator as Server-Sent Events.
+
+    Each item is sent as a single event of the given type with the JSON
+    serialization of the item as data.  A comment is sent every ``keepalive``
+    seconds without events, such that proxies do not close idle connections.
+    """
+
+    media_type = EVENT_STREAM_MEDIA_TYPE
+
+    def __init__(
+        self,
+        items: AsyncIterable[BaseModel],
+        event: str = "message",
+        keepalive: float = DEFAULT_KEEPALIVE_INTERVAL,
+        status_code: int = 200,
+        headers: Optional[Mapping[str, str]] = None,
+    ) -> None:
+        headers = {"Cache-Control": "no-cache", **(headers or {})}
+        super().__init__(
+            _iter_events(items, event, keepalive),
+            status_code=status_code,
+            headers=headers,
+        )
+
+
+def event_stream_response_schema(model: str) -> Dict[str, Any]:
+    """Return the OpenAPI response for an event stream of the given model."""
+    return {
+        "description": f"Server-Sent Events with {model} data.",
+        "content": {EVENT_STREAM_MEDIA_TYPE: {"schema": {"type": "string"}}},
+    }
@@ -32,4 +32,4 @@ def marketplace_api():
 
 @pytest.fixture
 def marketplace_openapi():
-    return api.openapi()
+    return api.generate_openapi()
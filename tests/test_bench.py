@@ -0,0 +1,61 @@
+import asyncio
+import json
+
+import pytest
+
+from marketplace_standard_app_api.bench import (
+    SCENARIOS,
+    BenchmarkOptions,
+    compare,
+    percentile,
+    run_benchmarks,
+)
+
+
+def test_percentile():
+    values = [float(value) for value in range(1, 101)]
+    assert percentile(values, 50) == 50.0
+    assert percentile(values, 99) == 99.0
+    assert percentile([1.0], 99) == 1.0
+
+
+def test_run_benchmarks():
+    options = BenchmarkOptions(requests=6, concurrency=3, size=1024, page_size=5)
+    results = asyncio.run(run_benchmarks(SCENARIOS, options))
+    json.dumps(results)
+    assert results["options"]["concurrency"] == 3
+    operations = {
+        name: scenario["operations"] for name, scenario in results["scenarios"].items()
+    }
+    assert set(operations["transformations"]) == {
+        "newTransformation",
+        "getTransformation",
+        "deleteTransformation",
+    }
+    for name, summaries in operations.items():
+        for summary in summaries.values():
+            assert summary["requests"] == 6
+            assert summary["errors"] == 0
+            assert 0 < summary["p50_ms"] <= summary["p99_ms"]
+
+    ratios = compare(results, results)
+    assert ratios["heartbeat"]["heartbeat"] == {
+        "p50_ms": 1.0,
+        "p99_ms": 1.0,
+        "throughput": 1.0,
+    }
+
+
+def test_bench_command(tmp_path):
+    testing = pytest.importorskip("click.testing")
+    from marketplace_standard_app_api.__main__ import cli
+
+    output = tmp_path / "results.json"
+    result = testing.CliRunner().invoke(
+        cli,
+        ["bench", "-s", "download", "-n", "4", "--backend", "indexed", "-o", output],
+    )
+    assert result.exit_code == 0, result.output
+    results = json.loads(output.read_text())
+    assert list(results["scenarios"]) == ["download"]
+    assert results["options"]["backend"] == "indexed"
@@ -0,0 +1,119 @@
+import asyncio
+
+import pytest
+from fastapi import FastAPI
+
+from marketplace_standard_app_api.broker import (
+    InMemoryMessageQueue,
+    InvalidFrame,
+    MessageBrokerDispatcher,
+    decode_frames,
+    encode_frames,
+)
+from marketplace_standard_app_api.models.message_broker import (
+    MessageBrokerBinaryPayload,
+    MessageBrokerRequestModel,
+)
+from marketplace_standard_app_api.routers import object_storage
+from marketplace_standard_app_api.storage import use_object_storage_backend
+from marketplace_standard_app_api.storage.filesystem import FileSystemStorage
+
+
+def test_dispatcher_calls_app_in_process():
+    app = FastAPI()
+    concurrent = 0
+    max_concurrent = 0
+
+    @app.post("/echo")
+    async def echo(payload: dict, suffix: str = ""):
+        nonlocal concurrent, max_concurrent
+        concurrent += 1
+        max_concurrent = max(max_concurrent, concurrent)
+        await asyncio.sleep(0.01)
+        concurrent -= 1
+        return {"text": payload["text"] + suffix}
+
+    async def run():
+        queue = InMemoryMessageQueue()
+        dispatcher = MessageBrokerDispatcher(
+            app, queue, max_concurrency=4, ack_batch_size=5
+        )
+        runner = asyncio.create_task(dispatcher.run())
+        replies = await asyncio.gather(
+            *(
+                queue.request(
+                    MessageBrokerRequestModel(
+                        endpoint="echo",
+                        method="post",
+                        query_params={"suffix": "!"},
+                        headers={"Content-Type": "application/json"},
+                        body=f'{{"text": "{i}"}}',
+                    )
+                )
+                for i in range(12)
+            )
+        )
+        missing = await queue.request(MessageBrokerRequestModel(endpoint="/missing"))
+        runner.cancel()
+        await asyncio.gather(runner, return_exceptions=True)
+        return queue, [reply.response for reply in replies], missing.response
+
+    queue, responses, missing = asyncio.run(run())
+    assert [response.body for response in responses] == [
+        f'{{"text":"{i}!"}}' for i in range(12)
+    ]
+    assert all(response.status_code == 200 for response in responses)
+    assert missing.status_code == 404
+    assert max_concurrent == 4
+    assert not queue.unacknowledged
+    assert len(queue.ack_batches) < 13
+
+
+def test_binary_bodies_are_framed(tmp_path):
+    app = FastAPI()
+    app.include_router(object_storage.router)
+    use_object_storage_backend(app, FileSystemStorage(tmp_path))
+    data = bytes(range(256)) * 1000
+
+    async def run():
+        queue = InMemoryMessageQueue()
+        runner = asyncio.create_task(MessageBrokerDispatcher(app, queue).run())
+        await queue.request(
+            MessageBrokerRequestModel(endpoint="/data/collection", method="PUT")
+        )
+        put = await queue.request(
+            MessageBrokerRequestModel(
+                endpoint="/data/collection/dataset",
+                method="PUT",
+                headers={"Content-Type": "application/octet-stream"},
+                payload=MessageBrokerBinaryPayload(content_length=len(data)),
+            ),
+            [memoryview(data)[:1000], memoryview(data)[1000:]],
+        )
+        get = await queue.request(
+            MessageBrokerRequestModel(
+                endpoint="/data/collection/dataset",
+                method="GET",
+                payload=MessageBrokerBinaryPayload(),
+            )
+        )
+        runner.cancel()
+        await asyncio.gather(runner, return_exceptions=True)
+        return put, get
+
+    put, get = asyncio.run(run())
+    assert put.response.status_code == 201
+    assert get.response.status_code == 200
+    assert get.response.body is None
+    assert get.response.payload.content_length == len(data)
+    assert b"".join(get.body) == data
+
+
+def test_decode_frames_rejects_truncated_frames():
+    request = MessageBrokerRequestModel(payload=MessageBrokerBinaryPayload())
+    frames = b"".join(encode_frames(request, [b"abc"], chunk_size=2))
+    message, chunks = decode_frames(frames, MessageBrokerRequestModel)
+    assert message == request
+    assert [bytes(chunk) for chunk in chunks] == [b"ab", b"c"]
+    with pytest.raises(InvalidFrame):
+        decode_frames(frames[:-1], MessageBrokerRequestModel)
@@ -0,0 +1,86 @@
+import asyncio
+
+import pytest
+
+from marketplace_standard_app_api.client import Client, operations
+from marketplace_standard_app_api.execution import (
+    TransformationExecutor,
+    use_transformation_executor,
+)
+from marketplace_standard_app_api.main import create_app
+from marketplace_standard_app_api.models.object_storage import DatasetResponseModel
+from marketplace_standard_app_api.storage import use_object_storage_backend
+from marketplace_standard_app_api.storage.filesystem import FileSystemStorage
+
+
+def test_operations():
+    table = operations()
+    assert table["listDatasets"].method == "GET"
+    assert table["listDatasets"].path == "/data/{collection_name}"
+    assert table["listDatasets"].response_model is DatasetResponseModel
+    assert table["newTransformation"].method == "POST"
+
+
+def _transform(parameters, stop_event):
+    pass
+
+
+def test_client(tmp_path):
+    httpx = pytest.importorskip("httpx")
+    app = create_app()
+    use_object_storage_backend(app, FileSystemStorage(tmp_path / "data"))
+    executor = TransformationExecutor(_transform)
+    use_transformation_executor(app, executor)
+
+    source = tmp_path / "source.bin"
+    source.write_bytes(bytes(range(256)) * 1000)
+
+    async def run():
+        transport = httpx.ASGITransport(app=app)
+        async with Client("http://app", "token", transport=transport) as client:
+            response = await client.call(
+                "createOrUpdateCollection", collection_name="c"
+            )
+            assert response.status_code == 201
+            await asyncio.gather(
+                *(
+                    client.upload_dataset("c", f"d{i}", source, metadata={"i": str(i)})
+                    for i in range(5)
+                )
+            )
+            names = [dataset.name async for dataset in client.iter_datasets("c", 2)]
+            assert names == [f"d{i}" for i in range(5)]
+
+            target = tmp_path / "target.bin"
+            await client.download_dataset("c", "d3", target)
+            assert target.read_bytes() == source.read_bytes()
+
+            for i in range(3):
+                await client.call("newTransformation", json={"parameters": {"i": i}})
+            transformations = [t async for t in client.iter_transformations(2)]
+            assert sorted(t.parameters["i"] for t in transformations) == [0, 1, 2]
+
+            with pytest.raises(httpx.HTTPStatusError):
+                await client.call("getTransformation", transformation_id="missing")
+            with pytest.raises(ValueError):
+                await client.call("unknown")
+        await executor.close()
+
+    asyncio.run(run())
+
+
+def test_retry_on_service_unavailable():
+    httpx = pytest.importorskip("httpx")
+    responses = [503, 503, 200]
+
+    def handler(request):
+        return httpx.Response(responses.pop(0), headers={"Retry-After": "0"})
+
+    async def run(retries):
+        transport = httpx.MockTransport(handler)
+        async with Client("http://app", retries=retries, transport=transport) as client:
+            return await client.send("heartbeat")
+
+    assert asyncio.run(run(retries=2)).status_code == 200
+    responses[:] = [503, 503, 200]
+    assert asyncio.run(run(retries=1)).status_code == 503
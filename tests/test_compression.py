@@ -0,0 +1,186 @@
+import asyncio
+import gzip
+import zlib
+
+import pytest
+from fastapi import FastAPI
+from fastapi.responses import StreamingResponse
+
+from marketplace_standard_app_api.broker import call_app
+from marketplace_standard_app_api.compression import (
+    DECOMPRESSED_CHUNK_SIZE,
+    CompressionMiddleware,
+    available_decoders,
+    select_encoding,
+)
+from marketplace_standard_app_api.models.message_broker import (
+    MessageBrokerBinaryPayload,
+    MessageBrokerRequestModel,
+)
+from marketplace_standard_app_api.routers import object_storage
+from marketplace_standard_app_api.storage import use_object_storage_backend
+from marketplace_standard_app_api.storage.filesystem import FileSystemStorage
+
+TEXT = b"name,value\n" + b"".join(b"row%d,%d\n" % (i, i) for i in range(1000))
+
+
+@pytest.fixture
+def request_(tmp_path):
+    app = FastAPI()
+    app.include_router(object_storage.router)
+    app.add_middleware(CompressionMiddleware, minimum_size=100)
+    use_object_storage_backend(app, FileSystemStorage(tmp_path, fsync=False))
+
+    def request(method, endpoint, body=(), **headers):
+        reply = asyncio.run(
+            call_app(
+                app,
+                MessageBrokerRequestModel(
+                    endpoint=endpoint,
+                    method=method,
+                    headers=headers,
+                    payload=MessageBrokerBinaryPayload(),
+                ),
+                body,
+            )
+        )
+        return reply.response, b"".join(reply.body)
+
+    assert request("PUT", "/data/c")[0].status_code == 201
+    return request
+
+
+def test_select_encoding():
+    assert select_encoding("gzip, br;q=0.5", ["zstd", "br", "gzip"]) == "gzip"
+    assert select_encoding("*", ["zstd", "gzip"]) == "zstd"
+    assert select_encoding("gzip;q=0, *;q=0.1", ["gzip"]) is None
+    assert select_encoding("", ["gzip"]) is None
+
+
+def test_compressed_download(request_):
+    request_("PUT", "/data/c/text.csv", [TEXT], **{"Content-Type": "text/csv"})
+    request_("PUT", "/data/c/blob.bin", [TEXT], **{"Content-Type": "image/png"})
+    request_("PUT", "/data/c/small.csv", [b"a,b\n"], **{"Content-Type": "text/csv"})
+
+    response, body = request_("GET", "/data/c/text.csv", **{"Accept-Encoding": "gzip"})
+    assert response.headers["content-encoding"] == "gzip"
+    assert "accept-encoding" in response.headers["vary"].lower()
+    assert "content-length" not in response.headers
+    assert gzip.decompress(body) == TEXT
+
+    response, body = request_("GET", "/data/c/text.csv")
+    assert "content-encoding" not in response.headers
+    assert body == TEXT
+
+    for name in ("blob.bin", "small.csv"):
+        response, body = request_("GET", f"/data/c/{name}", **{"Accept-Encoding": "*"})
+        assert "content-encoding" not in response.headers
+
+
+def test_compressed_upload(request_):
+    response, _ = request_(
+        "PUT",
+        "/data/c/text.csv",
+        [gzip.compress(TEXT)],
+        **{"Content-Type": "text/csv", "Content-Encoding": "gzip"},
+    )
+    assert response.status_code == 201
+    assert request_("GET", "/data/c/text.csv")[1] == TEXT
+
+    response, _ = request_(
+        "PUT", "/data/c/bad.csv", [b"not gzip"], **{"Content-Encoding": "gzip"}
+    )
+    assert response.status_code == 400
+    compressed = gzip.compress(TEXT)
+    response, _ = request_(
+        "PUT",
+        "/data/c/truncated.csv",
+        [compressed[: len(compressed) // 2]],
+        **{"Content-Encoding": "gzip"},
+    )
+    assert response.status_code == 400
+    response, _ = request_(
+        "PUT", "/data/c/bad.csv", [b"data"], **{"Content-Encoding": "unknown"}
+    )
+    assert response.status_code == 415
+
+
+@pytest.mark.parametrize(
+    "media_type, flushed",
+    [("application/x-ndjson", False), ("text/event-stream", True)],
+)
+def test_streamed_responses(media_type, flushed):
+    app = FastAPI()
+    app.add_middleware(CompressionMiddleware, flush_size=4096)
+    lines = [b'{"row": %d}\n' % i for i in range(1000)]
+
+    @app.get("/stream")
+    async def stream():
+        async def iter_lines():
+            for line in lines:
+                yield line
+
+        return StreamingResponse(iter_lines(), media_type=media_type)
+
+    reply = asyncio.run(
+        call_app(
+            app,
+            MessageBrokerRequestModel(
+                endpoint="/stream",
+                method="GET",
+                headers={"Accept-Encoding": "gzip"},
+                payload=MessageBrokerBinaryPayload(),
+            ),
+        )
+    )
+    body = b"".join(reply.body)
+    assert gzip.decompress(body) == b"".join(lines)
+    # Event streams are flushed after every event, other streams in batches.
+    if flushed:
+        assert len(reply.body) > len(lines)
+    else:
+        assert len(reply.body) < len(lines) / 10
+        assert len(body) < len(b"".join(lines)) / 4
+
+
+@pytest.mark.parametrize("encoding, module", [("br", "brotli"), ("zstd", "zstandard")])
+def test_optional_encodings(request_, encoding, module):
+    pytest.importorskip(module)
+    request_("PUT", "/data/c/text.csv", [TEXT], **{"Content-Type": "text/csv"})
+    response, body = request_(
+        "GET", "/data/c/text.csv", **{"Accept-Encoding": encoding}
+    )
+    assert response.headers["content-encoding"] == encoding
+    assert b"".join(available_decoders()[encoding]().decompress(body)) == TEXT
+
+
+COMPRESSORS = {
+    "gzip": gzip.compress,
+    "deflate": zlib.compress,
+    "br": lambda data: pytest.importorskip("brotli").compress(data),
+    "zstd": lambda data: pytest.importorskip("zstandard").compress(data),
+}
+
+
+@pytest.mark.parametrize("encoding", list(COMPRESSORS))
+def test_decompression_is_bounded(encoding):
+    data = bytes(10 * 1024 * 1024)
+    compressed = COMPRESSORS[encoding](data)
+    decoder = available_decoders()[encoding]()
+    chunks = list(decoder.decompress(compressed[:-4]))
+    assert not decoder.eof
+    chunks += decoder.decompress(compressed[-4:])
+    assert decoder.eof
+    assert b"".join(chunks) == data
+    # The output limits of brotli and zstd are not exact.
+    assert max(len(chunk) for chunk in chunks) <= 2 * DECOMPRESSED_CHUNK_SIZE
+
+    # Compressed data is decompressed regardless of how it is split.
+    decoder = available_decoders()[encoding]()
+    chunks = [
+        chunk
+        for start in range(0, len(compressed), 7)
+        for chunk in decoder.decompress(compressed[start : start + 7])
+    ]
+    assert decoder.eof
+    assert b"".join(chunks) == data
@@ -0,0 +1,32 @@
+from datetime import datetime, timezone
+
+import pytest
+
+from marketplace_standard_app_api.conditional import Validators, evaluate_preconditions
+
+VALIDATORS = Validators('"abc"', datetime(2020, 1, 1, tzinfo=timezone.utc))
+
+
+@pytest.mark.parametrize(
+    "method,headers,expected",
+    [
+        ("GET", {}, None),
+        ("GET", {"if_none_match": '"abc"'}, 304),
+        ("GET", {"if_none_match": 'W/"abc"'}, 304),
+        ("GET", {"if_none_match": '"xyz", "abc"'}, 304),
+        ("GET", {"if_none_match": '"xyz"'}, None),
+        ("HEAD", {"if_modified_since": "Thu, 02 Jan 2020 00:00:00 GMT"}, 304),
+        ("GET", {"if_modified_since": "Tue, 31 Dec 2019 00:00:00 GMT"}, None),
+        ("PUT", {"if_match": '"abc"'}, None),
+        ("PUT", {"if_match": 'W/"abc"'}, 412),
+        ("DELETE", {"if_match": '"xyz"'}, 412),
+        ("PUT", {"if_none_match": "*"}, 412),
+    ],
+)
+def test_evaluate_preconditions(method, headers, expected):
+    assert evaluate_preconditions(method, VALIDATORS, **headers) == expected
+
+
+def test_evaluate_preconditions_missing_resource():
+    assert evaluate_preconditions("DELETE", None, if_match="*") == 412
+    assert evaluate_preconditions("PUT", None, if_none_match="*") is None
@@ -0,0 +1,126 @@
+import asyncio
+import json
+
+from fastapi import FastAPI
+
+from marketplace_standard_app_api.broker import call_app
+from marketplace_standard_app_api.dcat import (
+    DCAT,
+    DCTERMS,
+    JSON_LD,
+    N_TRIPLES,
+    TURTLE,
+    TYPE,
+    XSD,
+    DCATCache,
+    iri,
+    literal,
+    serialize,
+    use_dcat_cache,
+)
+from marketplace_standard_app_api.models.message_broker import MessageBrokerRequestModel
+from marketplace_standard_app_api.routers import object_storage
+from marketplace_standard_app_api.storage import use_object_storage_backend
+from marketplace_standard_app_api.storage.filesystem import FileSystemStorage
+
+TRIPLES = [
+    ("<http://example.org/a>", TYPE, iri(DCAT + "Dataset")),
+    ("<http://example.org/a>", iri(DCTERMS + "title"), literal('A "quoted"\ntitle')),
+    ("<http://example.org/a>", iri(DCAT + "byteSize"), literal(3, XSD + "integer")),
+    ("<http://example.org/b>", TYPE, iri(DCAT + "Dataset")),
+]
+
+
+def test_serializations():
+    assert serialize(TRIPLES, N_TRIPLES).decode().splitlines() == [
+        " ".join(triple) + " ." for triple in TRIPLES
+    ]
+
+    turtle = serialize(TRIPLES, TURTLE).decode()
+    assert "@prefix dcat: <http://www.w3.org/ns/dcat#> .\n" in turtle
+    assert turtle.endswith(
+        "<http://example.org/a> a dcat:Dataset ;\n"
+        '    dct:title "A \\"quoted\\"\\ntitle" ;\n'
+        '    dcat:byteSize "3"^^xsd:integer .\n'
+        "<http://example.org/b> a dcat:Dataset .\n"
+    )
+
+    nodes = json.loads(serialize(TRIPLES, JSON_LD))
+    assert nodes == [
+        {
+            "@id": "http://example.org/a",
+            "@type": [DCAT + "Dataset"],
+            DCTERMS + "title": [{"@value": 'A "quoted"\ntitle'}],
+            DCAT + "byteSize": [{"@value": "3", "@type": XSD + "integer"}],
+        },
+        {"@id": "http://example.org/b", "@type": [DCAT + "Dataset"]},
+    ]
+    assert json.loads(serialize([], JSON_LD)) == []
+
+
+def test_dcat_metadata_is_negotiated_and_cached(tmp_path):
+    app = FastAPI()
+    app.include_router(object_storage.router)
+    use_object_storage_backend(app, FileSystemStorage(tmp_path))
+    cache = DCATCache()
+    use_dcat_cache(app, cache)
+
+    def request(method, endpoint, accept=None, **headers):
+        headers["Host"] = "testserver"
+        if accept:
+            headers["Accept"] = accept
+        reply = asyncio.run(
+            call_app(
+                app,
+                MessageBrokerRequestModel(
+                    endpoint=endpoint, method=method, headers=headers
+                ),
+            )
+        )
+        return reply.response
+
+    assert request("PUT", "/data/c").status_code == 201
+    assert request("PUT", "/data/c/d1", **{"X-Object-Meta-Title": "One"})
+    collection = request("GET", "/data/metadata/dcat/c")
+    assert collection.status_code == 200
+    assert collection.headers["content-type"].startswith(TURTLE)
+    assert "<http://testserver/data/c/d1>" in collection.body
+    assert cache.misses == 1
+
+    assert request("GET", "/data/metadata/dcat/c").body == collection.body
+    assert cache.hits == 1
+
+    request("PUT", "/data/c/d2")
+    nodes = json.loads(request("GET", "/data/metadata/dcat/c", JSON_LD).body)
+    datasets = [
+        node["@id"] for node in nodes if DCAT + "Dataset" in node.get("@type", ())
+    ]
+    assert datasets == ["http://testserver/data/c/d1", "http://testserver/data/c/d2"]
+
+    dataset = request("GET", "/data/metadata/dcat/c/d1", N_TRIPLES)
+    assert dataset.status_code == 200
+    assert f'{iri(DCTERMS + "title")} "One" .' in dataset.body
+    request("POST", "/data/c/d1", **{"X-Object-Meta-Title": "Changed"})
+    dataset = request("GET", "/data/metadata/dcat/c/d1", N_TRIPLES)
+    assert f'{iri(DCTERMS + "title")} "Changed" .' in dataset.body
+
+    assert request("GET", "/data/metadata/dcat/c/d1", "image/png").status_code == 406
+    request("DELETE", "/data/c/d1")
+    assert request("GET", "/data/metadata/dcat/c/d1").status_code == 404
+    assert request("GET", "/data/metadata/dcat/missing").status_code == 404
+
+
+def test_cache_tee_keeps_only_small_bodies():
+    cache = DCATCache(max_entry_size=4)
+
+    async def chunks(*values):
+        for value in values:
+            yield value
+
+    async def tee(key, *values):
+        return b"".join([chunk async for chunk in cache.tee(key, chunks(*values))])
+
+    assert asyncio.run(tee("small", b"ab", b"cd")) == b"abcd"
+    assert asyncio.run(tee("large", b"ab", b"cd", b"e", b"")) == b"abcde"
+    assert cache.get("small") == b"abcd"
+    assert cache.get("large") is None
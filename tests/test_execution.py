@@ -0,0 +1,194 @@
+import asyncio
+import sqlite3
+import time
+from concurrent.futures import ThreadPoolExecutor
+from uuid import uuid4
+
+import pytest
+
+from marketplace_standard_app_api.broker import call_app
+from marketplace_standard_app_api.execution import (
+    FINAL_STATES,
+    InvalidStateTransition,
+    TransformationExecutor,
+)
+from marketplace_standard_app_api.main import create_app
+from marketplace_standard_app_api.models.message_broker import MessageBrokerRequestModel
+from marketplace_standard_app_api.models.transformation import TransformationState
+from marketplace_standard_app_api.storage.transformations import (
+    InMemoryTransformationStore,
+    SQLiteTransformationStore,
+)
+
+
+def square(parameters, stop_event):
+    if parameters["x"] < 0:
+        raise ValueError(parameters["x"])
+    return parameters["x"] ** 2
+
+
+def wait_until_stopped(parameters, stop_event):
+    while not stop_event.is_set():
+        time.sleep(0.01)
+
+
+def test_executor_runs_transformations_in_process_pool():
+    async def run():
+        executor = TransformationExecutor(square, max_concurrency=2)
+        try:
+            ok = await executor.create({"x": 2}, state=TransformationState.RUNNING)
+            failing = await executor.create({"x": -1})
+            await executor.update(failing, TransformationState.RUNNING)
+            await executor.join()
+            assert executor.get_state(ok) is TransformationState.COMPLETED
+            assert executor.get_state(failing) is TransformationState.FAILED
+            assert [t.state for t in executor.transitions(ok)] == [
+                TransformationState.CREATED,
+                TransformationState.RUNNING,
+                TransformationState.COMPLETED,
+            ]
+            with pytest.raises(InvalidStateTransition):
+                await executor.update(ok, TransformationState.STOPPED)
+        finally:
+            await executor.close()
+
+    asyncio.run(run())
+
+
+def test_executor_stops_cooperatively():
+    async def run():
+        executor = TransformationExecutor(
+            wait_until_stopped, max_concurrency=1, executor=ThreadPoolExecutor(1)
+        )
+        try:
+            running = await executor.create({}, state=TransformationState.RUNNING)
+            queued = await executor.create({}, state=TransformationState.RUNNING)
+            await asyncio.sleep(0.05)
+            assert executor.running == 1
+            assert executor.queue_depth == 1
+            await executor.update(queued, TransformationState.STOPPED)
+            await executor.update(running, TransformationState.STOPPED)
+            await asyncio.wait_for(executor.join(), timeout=5)
+            assert executor.get_state(running) is TransformationState.STOPPED
+            assert executor.get_state(queued) is TransformationState.STOPPED
+        finally:
+            await executor.close()
+
+    asyncio.run(run())
+
+
+def test_executor_publishes_state_changes():
+    async def run():
+        executor = TransformationExecutor(
+            wait_until_stopped, max_concurrency=1, executor=ThreadPoolExecutor(1)
+        )
+        try:
+            id = await executor.create({})
+            states = []
+
+            async def watch():
+                async for state in executor.watch(id):
+                    states.append(state)
+
+            watcher = asyncio.create_task(watch())
+            state = await executor.wait_for_state(
+                id, lambda state: state in FINAL_STATES, timeout=0.01
+            )
+            assert state is TransformationState.CREATED
+            await executor.update(id, TransformationState.RUNNING)
+            waiter = asyncio.create_task(
+                executor.wait_for_state(
+                    id, lambda state: state in FINAL_STATES, timeout=5
+                )
+            )
+            await asyncio.sleep(0.01)
+            await executor.update(id, TransformationState.STOPPED)
+            assert await waiter is TransformationState.STOPPED
+            await asyncio.wait_for(watcher, timeout=5)
+            assert states == [
+                TransformationState.CREATED,
+                TransformationState.RUNNING,
+                TransformationState.STOPPED,
+            ]
+        finally:
+            await executor.close()
+
+    asyncio.run(run())
+
+
+def test_sqlite_store_survives_restarts(tmp_path):
+    path = tmp_path / "transformations.db"
+    store = SQLiteTransformationStore(path, batch_size=2)
+    created, running = uuid4(), uuid4()
+    store.add(created, {"x": 1})
+    store.add(running, {"x": 2})
+    # The application is killed while the transformation is running.
+    store.set_state(running, TransformationState.RUNNING)
+    page = store.list(limit=1)
+    assert [item.id for item in page.items] == [created]
+    page = store.list(limit=1, cursor=page.next_cursor)
+    assert [item.id for item in page.items] == [running]
+    assert page.next_cursor is None
+    store.close()
+
+    executor = TransformationExecutor(square, store=SQLiteTransformationStore(path))
+    assert executor.get(created).parameters == {"x": 1}
+    assert executor.get_state(created) is TransformationState.CREATED
+    assert executor.get_state(running) is TransformationState.FAILED
+    assert [t.state for t in executor.transitions(running)] == [
+        TransformationState.CREATED,
+        TransformationState.RUNNING,
+        TransformationState.FAILED,
+    ]
+    executor.store.close()
+
+
+def test_sqlite_store_writes_buffered_states(tmp_path):
+    path = tmp_path / "transformations.db"
+    store = SQLiteTransformationStore(path, max_delay=0.05)
+    id = uuid4()
+    store.add(id, {})
+
+    def written_state(previous):
+        # The state in the database once it differs from the previous one.
+        deadline = time.monotonic() + 5
+        with sqlite3.connect(path) as connection:
+            while True:
+                (state,) = connection.execute(
+                    "SELECT state FROM transformations WHERE id = ?", (str(id),)
+                ).fetchone()
+                if state != previous or time.monotonic() > deadline:
+                    return state
+                time.sleep(0.01)
+
+    # Written once the delay has passed, without any further update or read.
+    store.set_state(id, TransformationState.RUNNING)
+    assert written_state("CREATED") == "RUNNING"
+
+    # Final states are written right away.
+    store.max_delay = 60
+    store.set_state(id, TransformationState.COMPLETED)
+    assert written_state("RUNNING") == "COMPLETED"
+    store.close()
+
+
+@pytest.mark.parametrize("limit", [0, -1])
+def test_list_with_empty_pages(tmp_path, limit):
+    for store in (
+        InMemoryTransformationStore(),
+        SQLiteTransformationStore(tmp_path / "transformations.db"),
+    ):
+        store.add(uuid4(), {"x": 1})
+        page = store.list(limit=limit)
+        assert page.items == []
+        assert page.next_cursor is None
+        store.close()
+
+    request = MessageBrokerRequestModel(
+        endpoint="/transformations",
+        method="GET",
+        headers={"Authorization": "Bearer token"},
+        query_params={"limit": str(limit)},
+    )
+    reply = asyncio.run(call_app(create_app(features=["transformation"]), request))
+    assert reply.response.status_code == 422
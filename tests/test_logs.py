@@ -0,0 +1,187 @@
+import asyncio
+import json
+import logging
+
+import pytest
+from fastapi import FastAPI
+
+from marketplace_standard_app_api.broker import call_app
+from marketplace_standard_app_api.logs import LogStore, entity_logger, use_log_store
+from marketplace_standard_app_api.models.message_broker import MessageBrokerRequestModel
+from marketplace_standard_app_api.routers import system
+
+
+@pytest.fixture
+def logger():
+    logger = logging.getLogger("tests.logs")
+    logger.setLevel(logging.INFO)
+    logger.propagate = False
+    clock = iter(range(1000000))
+
+    def tick(record):
+        record.created = float(next(clock))
+        return True
+
+    logger.addFilter(tick)
+    yield logger
+    logger.removeFilter(tick)
+    for handler in list(logger.handlers):
+        logger.removeHandler(handler)
+        handler.close()
+
+
+def _log(logger, store, count):
+    logger.addHandler(store)
+    for i in range(count):
+        entity_logger(logger, f"e{i % 3}").info("message %d", i)
+    logger.info("without entity")
+
+
+def _messages(entries):
+    return [entry.message for entry in entries]
+
+
+def test_memory_store(logger):
+    store = LogStore(capacity=6)
+    _log(logger, store, 9)
+
+    assert _messages(store.query()) == [f"message {i}" for i in range(4, 9)] + [
+        "without entity"
+    ]
+    assert _messages(store.query("e1")) == ["message 4", "message 7"]
+    assert _messages(store.query("e1", after=4)) == ["message 7"]
+    assert _messages(store.query("e2", limit=1, offset=1)) == ["message 8"]
+    assert _messages(store.query(since=8.0)) == ["message 8", "without entity"]
+    assert _messages(store.query("e1", since=5.0)) == ["message 7"]
+    assert store.query("missing") == []
+
+
+def test_segmented_store(logger, tmp_path):
+    store = LogStore(tmp_path, capacity=2, segment_size=200, max_segments=100)
+    _log(logger, store, 30)
+    assert len(list(tmp_path.glob("*.log"))) > 1
+    expected = [f"message {i}" for i in range(1, 30, 3)]
+    assert _messages(store.query("e1")) == expected
+    assert len(store.query(limit=1000)) == 31
+    assert _messages(store.query(after=5, limit=2)) == ["message 6", "message 7"]
+    logger.removeHandler(store)
+    store.close()
+
+    # Partially written entries are discarded when the index is rebuilt.
+    segment = sorted(tmp_path.glob("*.log"))[-1]
+    with segment.open("ab") as file:
+        file.write(b'[31,0.0,"INFO"')
+    reopened = LogStore(tmp_path, capacity=2, segment_size=200)
+    assert _messages(reopened.query("e1")) == expected
+    _log(logger, reopened, 1)
+    assert reopened.query(after=30)[0].message == "message 0"
+    logger.removeHandler(reopened)
+    reopened.close()
+
+    # Old segments are removed beyond max_segments.
+    pruned = LogStore(tmp_path, capacity=2, segment_size=200, max_segments=3)
+    assert len(list(tmp_path.glob("*.log"))) == 3
+    first = pruned.query()[0].sequence
+    assert first > 0
+    # The offset skips retained entries, also if after precedes them.
+    assert [entry.sequence for entry in pruned.query(after=0, offset=2, limit=2)] == [
+        first + 2,
+        first + 3,
+    ]
+    since = pruned.query(after=first + 4, limit=1)[0].timestamp
+    assert pruned.query(since=since, limit=1)[0].timestamp >= since
+    assert _messages(pruned.query("e1")) == [
+        entry.message for entry in pruned.query(limit=1000) if entry.entity_id == "e1"
+    ]
+    _log(logger, pruned, 30)
+    assert len(list(tmp_path.glob("*.log"))) == 3
+    assert pruned.query()[0].sequence > first
+    assert _messages(pruned.query(after=61)) == ["message 29", "without entity"]
+
+
+def test_follow(logger):
+    store = LogStore()
+    logger.addHandler(store)
+    entity_logger(logger, "t").info("first")
+
+    async def follow():
+        stop = []
+        entries = store.follow("t", until=lambda: bool(stop))
+        assert (await entries.__anext__()).message == "first"
+        waiting = asyncio.ensure_future(entries.__anext__())
+        await asyncio.sleep(0)
+        assert not waiting.done()
+        entity_logger(logger, "other").info("ignored")
+        entity_logger(logger, "t").info("second")
+        assert (await waiting).message == "second"
+        stop.append(True)
+        logger.info("wake up")
+        assert [entry async for entry in entries] == []
+
+    asyncio.run(follow())
+
+
+def test_get_logs(logger):
+    app = FastAPI()
+    app.include_router(system.router)
+
+    def request(query):
+        reply = asyncio.run(
+            call_app(
+                app,
+                MessageBrokerRequestModel(
+                    endpoint="/logs", method="GET", query_params=query
+                ),
+            )
+        )
+        return reply.response
+
+    assert request({}).status_code == 501
+
+    store = LogStore()
+    _log(logger, store, 6)
+    use_log_store(app, store)
+
+    response = request({"id": "e0", "limit": "1"})
+    assert response.status_code == 200
+    page = json.loads(response.body)
+    assert [item["message"] for item in page["items"]] == ["message 0"]
+    assert page["items"][0]["id"] == "e0"
+
+    page = json.loads(request({"id": "e0", "cursor": page["next_cursor"]}).body)
+    assert [item["message"] for item in page["items"]] == ["message 3"]
+    assert page["next_cursor"] is None
+    assert request({"cursor": "WyJ4Il0"}).status_code == 400
+
+
+def test_get_logs_as_ndjson(logger, monkeypatch):
+    app = FastAPI()
+    app.include_router(system.router)
+    store = LogStore(capacity=3000)
+    _log(logger, store, 2500)
+    use_log_store(app, store)
+    limits = []
+    query = store.query
+
+    def spy(*args):
+        limits.append(args[3])
+        return query(*args)
+
+    monkeypatch.setattr(store, "query", spy)
+    reply = asyncio.run(
+        call_app(
+            app,
+            MessageBrokerRequestModel(
+                endpoint="/logs",
+                method="GET",
+                headers={"Accept": "application/x-ndjson"},
+                query_params={"limit": "2200", "offset": "1"},
+            ),
+        )
+    )
+    lines = reply.response.body.splitlines()
+    assert [json.loads(line)["message"] for line in lines] == [
+        f"message {i}" for i in range(1, 2201)
+    ]
+    # The entries are fetched in bounded batches.
+    assert limits == [1000, 1000, 200]
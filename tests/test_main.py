@@ -0,0 +1,172 @@
+import asyncio
+import gzip
+import json
+import subprocess
+import sys
+
+import pytest
+
+from marketplace_standard_app_api import main
+from marketplace_standard_app_api.broker import call_app
+from marketplace_standard_app_api.main import MarketPlaceAPI, create_app
+from marketplace_standard_app_api.models.message_broker import (
+    MessageBrokerBinaryPayload,
+    MessageBrokerRequestModel,
+)
+
+# The budget for the time spent in the package's own modules when importing
+# the main module, in seconds.
+IMPORT_TIME_BUDGET = 0.25
+
+LAZY_MODULES = {
+    "requests",
+    "marketplace_standard_app_api.compression",
+    "marketplace_standard_app_api.metrics",
+    "marketplace_standard_app_api.routers.frontend",
+    "marketplace_standard_app_api.routers.object_storage",
+    "marketplace_standard_app_api.routers.system",
+    "marketplace_standard_app_api.routers.transformation",
+}
+
+
+def test_cold_import_is_lazy_and_within_budget():
+    script = (
+        "import json, sys; import marketplace_standard_app_api.main; "
+        "print(json.dumps(sorted(sys.modules)))"
+    )
+    process = subprocess.run(
+        [sys.executable, "-X", "importtime", "-c", script],
+        capture_output=True,
+        text=True,
+        check=True,
+    )
+    assert LAZY_MODULES.isdisjoint(json.loads(process.stdout))
+
+    own_time = 0
+    for line in process.stderr.splitlines():
+        # import time: self [us] | cumulative | imported package
+        if not line.startswith("import time:") or "|" not in line:
+            continue
+        self_time, _, name = (part.strip() for part in line[12:].split("|"))
+        if name.startswith("marketplace_standard_app_api") and self_time.isdigit():
+            own_time += int(self_time)
+    assert own_time / 1e6 < IMPORT_TIME_BUDGET
+
+
+def test_create_app_mounts_only_the_features():
+    paths = {route.path for route in create_app(features=["system"]).routes}
+    assert "/health" in paths
+    assert not any(path.startswith(("/data", "/transformations")) for path in paths)
+
+    all_paths = {route.path for route in main.api.routes}
+    assert paths < all_paths
+    assert main.api is main.api
+
+    with pytest.raises(ValueError):
+        create_app(features=["unknown"])
+
+
+@pytest.mark.parametrize(
+    "endpoint",
+    [
+        "/data",
+        "/data/semanticMappings",
+        "/data/collection",
+        "/transformations",
+        "/logs",
+    ],
+)
+def test_list_limit_is_positive(endpoint):
+    reply = asyncio.run(
+        call_app(
+            main.api,
+            MessageBrokerRequestModel(
+                endpoint=endpoint,
+                method="GET",
+                headers={"Authorization": "Bearer token"},
+                query_params={"limit": "0"},
+                payload=MessageBrokerBinaryPayload(),
+            ),
+        )
+    )
+    assert reply.response.status_code == 422
+
+
+def _get_openapi(app, **headers):
+    reply = asyncio.run(
+        call_app(
+            app,
+            MessageBrokerRequestModel(
+                endpoint="/openapi.json",
+                method="GET",
+                headers=headers,
+                payload=MessageBrokerBinaryPayload(),
+            ),
+        )
+    )
+    return reply.response, b"".join(reply.body)
+
+
+def test_openapi_artifact(tmp_path, monkeypatch):
+    artifact = tmp_path / "openapi.json"
+    app = create_app(features=["system"], openapi_artifact=artifact)
+    generated = app.generate_openapi()
+    artifact.write_text(json.dumps(generated))
+
+    # A matching artifact is served without generating the schema.
+    monkeypatch.setattr(MarketPlaceAPI, "generate_openapi", None)
+    app = create_app(features=["system"], openapi_artifact=artifact)
+    response, body = _get_openapi(app, **{"Accept-Encoding": "gzip"})
+    assert response.status_code == 200
+    assert response.headers["content-encoding"] == "gzip"
+    assert json.loads(gzip.decompress(body)) == generated
+
+    etag = response.headers["etag"]
+    response, body = _get_openapi(app, **{"If-None-Match": etag})
+    assert response.status_code == 304
+    assert body == b""
+    response, body = _get_openapi(app)
+    assert response.headers["etag"] == etag
+    assert json.loads(body) == generated
+    monkeypatch.undo()
+
+    # An artifact of other routes is ignored.
+    app = create_app(features=["system", "frontend"], openapi_artifact=artifact)
+    assert app.openapi()["paths"].keys() > generated["paths"].keys()
+
+
+def test_route_table_hash_covers_the_schema():
+    from fastapi import APIRouter, Query
+    from pydantic import Field, create_model
+
+    def app_with(**route_options):
+        router = APIRouter()
+        query = route_options.pop("query", Query(1))
+
+        @router.get("/items", **route_options)
+        def items(limit: int = query):
+            pass
+
+        app = create_app(features=[])
+        app.include_router(router)
+        return app
+
+    digest = app_with().route_table_hash()
+    assert app_with().route_table_hash() == digest
+    assert app_with(query=Query(1, ge=1)).route_table_hash() != digest
+    assert app_with(query=Query(1, le=9)).route_table_hash() != digest
+    assert app_with(responses={404: {"description": "Gone."}}).route_table_hash() != (
+        digest
+    )
+    assert app_with(openapi_extra={"x-a": 1}).route_table_hash() != digest
+
+    item = create_model("Item", name=(str, ...))
+    digest = app_with(response_model=item).route_table_hash()
+    item = create_model("Item", name=(str, Field(max_length=8)))
+    assert app_with(response_model=item).route_table_hash() != digest
+
+
+def test_packaged_openapi_artifact(marketplace_openapi_specification_file):
+    packaged = json.loads(main.OPENAPI_ARTIFACT.read_text())
+    assert packaged == marketplace_openapi_specification_file
+    assert packaged["info"][main.ROUTE_TABLE_HASH] == main.api.route_table_hash()
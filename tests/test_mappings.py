@@ -0,0 +1,92 @@
+import asyncio
+
+import pytest
+from fastapi import FastAPI
+
+from marketplace_standard_app_api.broker import call_app
+from marketplace_standard_app_api.mappings import (
+    InvalidMapping,
+    MappingNotFound,
+    SemanticMappingRegistry,
+    use_semantic_mapping_registry,
+)
+from marketplace_standard_app_api.models.message_broker import MessageBrokerRequestModel
+from marketplace_standard_app_api.models.object_storage import SemanticMappingModel
+from marketplace_standard_app_api.routers import object_storage
+
+TENSILE = SemanticMappingModel(
+    name="tensile",
+    properties=[
+        {"source": "E", "target": "ex:YoungsModulus", "unit": "GPa"},
+        {"source": "Rm", "target": "ex:TensileStrength"},
+    ],
+)
+
+
+def test_mappings_are_compiled_and_applied():
+    registry = SemanticMappingRegistry(maxsize=2)
+    registry.add(TENSILE)
+    compiled = registry.compile("tensile")
+    assert registry.compile("tensile") is compiled
+    assert compiled.lookup("E") == "ex:YoungsModulus"
+    assert compiled.annotations["ex:YoungsModulus"] == {"unit": "GPa"}
+
+    records = [{"E": 1, "Rm": 2, "id": 0}, {"E": 3, "Rm": 4, "id": 1}, {"Rm": 5}]
+    assert registry.apply("tensile", records) == [
+        {"ex:YoungsModulus": 1, "ex:TensileStrength": 2},
+        {"ex:YoungsModulus": 3, "ex:TensileStrength": 4},
+        {"ex:TensileStrength": 5},
+    ]
+    assert registry.apply("tensile", records[:1], keep_unmapped=True) == [
+        {"ex:YoungsModulus": 1, "ex:TensileStrength": 2, "id": 0}
+    ]
+    assert [compiled.apply(record) for record in records] == registry.apply(
+        "tensile", records
+    )
+    assert registry.apply("tensile", [{"id": 0}]) == [{}]
+
+    registry.add(SemanticMappingModel(name="other", properties=[]))
+    registry.compile("other", keep_unmapped=True)
+    assert registry.compile("tensile") is not compiled
+
+    registry.remove("tensile")
+    with pytest.raises(MappingNotFound):
+        registry.compile("tensile")
+    with pytest.raises(InvalidMapping):
+        registry.add(SemanticMappingModel(name="invalid", properties=[{"source": "E"}]))
+    assert "invalid" not in registry
+
+
+def test_semantic_mapping_routes():
+    app = FastAPI()
+    app.include_router(object_storage.router)
+
+    def request(endpoint, **query_params):
+        reply = asyncio.run(
+            call_app(
+                app,
+                MessageBrokerRequestModel(endpoint=endpoint, query_params=query_params),
+            )
+        )
+        return reply.response
+
+    assert request("/data/semanticMappings").status_code == 501
+
+    registry = SemanticMappingRegistry()
+    use_semantic_mapping_registry(app, registry)
+    assert request("/data/semanticMappings").status_code == 204
+    for name in ["c", "a", "b"]:
+        registry.add(SemanticMappingModel(name=name, properties=[]))
+    registry.add(TENSILE)
+
+    first = request("/data/semanticMappings", limit="2")
+    assert first.body == '["a","b"]'
+    second = request(
+        "/data/semanticMappings", limit="2", cursor=first.headers["x-next-cursor"]
+    )
+    assert second.body == '["c","tensile"]'
+    assert request("/data/semanticMappings", cursor="!").status_code == 400
+
+    mapping = request("/data/semanticMappings/tensile")
+    assert SemanticMappingModel.parse_raw(mapping.body) == TENSILE
+    assert request("/data/semanticMappings/missing").status_code == 404
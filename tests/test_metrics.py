@@ -0,0 +1,94 @@
+import asyncio
+
+from fastapi import FastAPI
+
+from marketplace_standard_app_api.broker import call_app
+from marketplace_standard_app_api.metrics import (
+    Histogram,
+    Metrics,
+    token_cache_metrics,
+    use_metrics,
+)
+from marketplace_standard_app_api.models.message_broker import MessageBrokerRequestModel
+from marketplace_standard_app_api.routers import object_storage, system
+from marketplace_standard_app_api.security import TokenValidationCache
+from marketplace_standard_app_api.storage import use_object_storage_backend
+from marketplace_standard_app_api.storage.filesystem import FileSystemStorage
+
+
+def test_histogram_buckets_are_cumulative():
+    histogram = Histogram([0.1, 1.0])
+    for value in (0.05, 0.1, 0.5, 2.0):
+        histogram.observe(value)
+    assert histogram.samples({}) == [
+        ("_bucket", {"le": "0.1"}, 2),
+        ("_bucket", {"le": "1.0"}, 3),
+        ("_bucket", {"le": "+Inf"}, 4),
+        ("_sum", {}, 2.65),
+        ("_count", {}, 4),
+    ]
+
+
+def _request(app, method, endpoint, body=None):
+    reply = asyncio.run(
+        call_app(
+            app, MessageBrokerRequestModel(endpoint=endpoint, method=method, body=body)
+        )
+    )
+    return reply.response
+
+
+def test_metrics_not_implemented():
+    app = FastAPI()
+    app.include_router(system.router)
+    assert _request(app, "GET", "/metrics").status_code == 501
+
+
+def test_metrics_endpoint(tmp_path):
+    app = FastAPI()
+    app.include_router(system.router)
+    app.include_router(object_storage.router)
+    use_object_storage_backend(app, FileSystemStorage(tmp_path, fsync=False))
+    metrics = Metrics()
+
+    async def validate(token):
+        return token == "valid"
+
+    cache = TokenValidationCache(validate)
+    asyncio.run(cache.is_valid("valid"))
+    metrics.add_collector(lambda: token_cache_metrics(cache))
+    use_metrics(app, metrics)
+
+    _request(app, "PUT", "/data/c")
+    _request(app, "PUT", "/data/c/d", body="0123456789")
+    _request(app, "GET", "/data/c/d")
+    _request(app, "GET", "/data/c/missing")
+    _request(app, "GET", "/not/a/route")
+
+    response = _request(app, "GET", "/metrics")
+    assert response.status_code == 200
+    assert response.headers["content-type"].startswith("text/plain; version=0.0.4")
+    lines = response.body.splitlines()
+    assert "# TYPE marketplace_http_requests counter" in lines
+    assert (
+        'marketplace_http_requests_total{operation_id="getDataset",'
+        'method="GET",status="200"} 1' in lines
+    )
+    assert (
+        'marketplace_http_requests_total{operation_id="getDataset",'
+        'method="GET",status="404"} 1' in lines
+    )
+    assert (
+        'marketplace_http_requests_total{operation_id="unmatched",'
+        'method="GET",status="404"} 1' in lines
+    )
+    assert (
+        'marketplace_http_request_duration_seconds_count{operation_id="getDataset"} 2'
+        in lines
+    )
+    assert (
+        'marketplace_http_request_bytes_total{operation_id="createOrReplaceDataset"} 10'
+        in (lines)
+    )
+    assert "marketplace_http_requests_in_flight 1" in lines  # The scrape itself.
+    assert "marketplace_auth_cache_misses_total 1" in lines
@@ -0,0 +1,58 @@
+import asyncio
+
+import pytest
+
+from marketplace_standard_app_api.pagination import (
+    InvalidCursor,
+    decode_cursor,
+    encode_cursor,
+    iter_pages,
+    next_page_cursor,
+    page_bounds,
+)
+
+
+@pytest.mark.parametrize("key", [("dataset",), ("2023-01-01", 42), ()])
+def test_cursor_roundtrip(key):
+    cursor = encode_cursor(key)
+    assert "=" not in cursor
+    assert decode_cursor(cursor) == key
+
+
+@pytest.mark.parametrize("cursor", ["not a cursor", "e30", "!!"])
+def test_invalid_cursor(cursor):
+    with pytest.raises(InvalidCursor):
+        decode_cursor(cursor)
+
+
+def test_page_bounds():
+    keys = ["a", "b", "c", "d", "e"]
+    assert page_bounds(keys, limit=2) == (0, 2)
+    assert page_bounds(keys, after="b", limit=2) == (2, 4)
+    assert page_bounds(keys, after="bb", limit=10) == (2, 5)
+    assert page_bounds(keys, after="b", limit=2, offset=1) == (3, 5)
+    assert page_bounds(keys, after="z") == (5, 5)
+
+
+def test_next_page_cursor():
+    assert next_page_cursor(["a", "b"], 2, key=lambda item: (item,)) == encode_cursor(
+        ["b"]
+    )
+    assert next_page_cursor(["a"], 2, key=lambda item: (item,)) is None
+
+
+def test_iter_pages_fetches_bounded_batches():
+    keys = list(range(10))
+    calls = []
+
+    async def fetch(after, limit, offset):
+        calls.append((after, limit, offset))
+        start, stop = page_bounds(keys, after, limit, offset)
+        return keys[start:stop]
+
+    async def collect():
+        return [key async for key in iter_pages(fetch, lambda key: key, **kwargs)]
+
+    kwargs = dict(after=0, limit=7, offset=1, batch_size=3)
+    assert asyncio.run(collect()) == [2, 3, 4, 5, 6, 7, 8]
+    assert calls == [(0, 3, 1), (4, 3, 0), (7, 1, 0)]
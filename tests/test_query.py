@@ -0,0 +1,137 @@
+import asyncio
+
+import pytest
+from fastapi import FastAPI
+
+from marketplace_standard_app_api.broker import call_app
+from marketplace_standard_app_api.dcat import DCAT, DCTERMS, TYPE, iri
+from marketplace_standard_app_api.models.message_broker import MessageBrokerRequestModel
+from marketplace_standard_app_api.query import (
+    InvalidQuery,
+    QueryableStorage,
+    QueryEngine,
+    TripleStore,
+    use_query_engine,
+)
+from marketplace_standard_app_api.routers import object_storage
+from marketplace_standard_app_api.storage.filesystem import FileSystemStorage
+from marketplace_standard_app_api.streaming import DatasetUploadStream
+
+KNOWS = "<http://example.org/knows>"
+NAME = "<http://example.org/name>"
+
+
+def test_basic_graph_pattern_join():
+    store = TripleStore()
+    store.add_all(
+        [
+            ("<a>", KNOWS, "<b>"),
+            ("<b>", KNOWS, "<c>"),
+            ("<c>", KNOWS, "<a>"),
+            ("<a>", NAME, '"Alice"'),
+            ("<b>", NAME, '"Bob"'),
+        ]
+    )
+    variables, solutions = store.query(
+        [("?x", KNOWS, "?y"), ("?y", NAME, "?name"), ("?x", NAME, '"Alice"')]
+    )
+    assert variables == ["x", "y", "name"]
+    assert list(solutions) == [{"x": "<a>", "y": "<b>", "name": '"Bob"'}]
+
+    _, solutions = store.query([("?x", KNOWS, "?x")])
+    assert list(solutions) == []
+    _, solutions = store.query([("?x", KNOWS, "?y")], limit=2, offset=2)
+    assert len(list(solutions)) == 1
+    _, solutions = store.query([("?x", "<unknown>", "?y")])
+    assert list(solutions) == []
+    with pytest.raises(InvalidQuery):
+        store.query([("?x", "not a term", "?y")])
+
+
+def test_engine_keeps_graphs_per_dataset(tmp_path):
+    backend = FileSystemStorage(tmp_path)
+
+    async def populate():
+        await backend.create_collection("c", {"title": "Samples"})
+        for name in ("d1", "d2"):
+            upload = DatasetUploadStream(_iter([b"data"]))
+            await backend.put_dataset("c", name, upload, "text/csv", {})
+        engine = QueryEngine()
+        await engine.load_storage(backend, "http://app.example.org")
+        return engine
+
+    engine = asyncio.run(populate())
+    datasets = [("?dataset", TYPE, iri(DCAT + "Dataset"))]
+    _, solutions = engine.query(datasets)
+    assert sorted(s["dataset"] for s in solutions) == [
+        "<http://app.example.org/data/c/d1>",
+        "<http://app.example.org/data/c/d2>",
+    ]
+    title = [("?catalog", iri(DCTERMS + "title"), '"Samples"')]
+    _, solutions = engine.query(title, "c", None)
+    assert len(list(solutions)) == 1
+
+    engine.drop("c", "d1")
+    _, solutions = engine.query(datasets)
+    assert len(list(solutions)) == 1
+    # Triples shared by several graphs remain until all graphs are dropped.
+    engine.load("c", "d3", [("<x>", KNOWS, "<y>")])
+    engine.load("c", "d4", [("<x>", KNOWS, "<y>")])
+    engine.drop("c", "d3")
+    _, solutions = engine.query([("<x>", KNOWS, "?y")])
+    assert list(solutions) == [{"y": "<y>"}]
+
+
+def test_queryable_storage_updates_graphs(tmp_path):
+    engine = QueryEngine()
+    backend = QueryableStorage(
+        FileSystemStorage(tmp_path), engine, "http://app.example.org"
+    )
+    datasets = [("?dataset", TYPE, iri(DCAT + "Dataset"))]
+    titles = [("?dataset", iri(DCTERMS + "title"), "?title")]
+
+    def solutions(patterns, *graph):
+        return sorted(str(solution) for solution in engine.query(patterns, *graph)[1])
+
+    async def run():
+        await backend.create_collection("c", {"title": "Samples"})
+        for name in ("d1", "d2"):
+            upload = DatasetUploadStream(_iter([b"data"]))
+            await backend.put_dataset("c", name, upload, "text/csv", {})
+        assert len(solutions(datasets)) == 2
+
+        await backend.update_dataset_metadata("c", "d1", {"title": "Steel"})
+        assert solutions(titles, "c", "d1") == [
+            str({"dataset": "<http://app.example.org/data/c/d1>", "title": '"Steel"'})
+        ]
+        await backend.delete_dataset("c", "d1")
+        await backend.delete_dataset("c", "d2")
+        assert solutions(datasets) == []
+        await backend.delete_collection("c")
+        assert solutions(titles) == []
+
+    asyncio.run(run())
+
+
+async def _iter(chunks):
+    for chunk in chunks:
+        yield chunk
+
+
+def test_query_route_is_not_shadowed():
+    app = FastAPI()
+    app.include_router(object_storage.router)
+    use_query_engine(app, QueryEngine())
+    reply = asyncio.run(
+        call_app(
+            app,
+            MessageBrokerRequestModel(
+                endpoint="/data/query",
+                method="POST",
+                headers={"Content-Type": "application/json"},
+                body='{"patterns": [["?s", "?p", "?o"]]}',
+            ),
+        )
+    )
+    assert reply.response.status_code == 200
+    assert reply.response.body == '{"variables":["s","p","o"],"items":[]}'
@@ -0,0 +1,76 @@
+import asyncio
+
+from marketplace_standard_app_api.search import IndexedStorage, SearchIndex
+from marketplace_standard_app_api.storage.filesystem import FileSystemStorage
+from marketplace_standard_app_api.streaming import DatasetUploadStream
+
+
+async def _iter(chunks):
+    for chunk in chunks:
+        yield chunk
+
+
+def test_search_ranks_by_relevance(tmp_path):
+    index = SearchIndex(tmp_path / "index.json")
+    index.add("a", "Steel alloy", "Tensile tests of steel samples", "/data/a")
+    index.add("b", "Aluminium alloy", "Fatigue of aluminium")
+    index.add("c", "Polymer", "Steel reinforced polymer composite steel")
+    hits = index.search("steel tensile")
+    assert [hit.key for hit in hits] == ["a", "c"]
+    assert hits[0].score > hits[1].score
+    assert index.search("steel", limit=1, after=(hits[0].score, "a"))[0].key == "c"
+    assert [hit.key for hit in index.search("alloy", limit=1, offset=1)] == ["a"]
+    assert hits[0].model("http://app/").url == "http://app/data/a"
+
+    index.add("a", "Copper")
+    assert [hit.key for hit in index.search("steel")] == ["c"]
+    index.remove("c")
+    assert index.search("steel") == []
+
+    index.save()
+    restored = SearchIndex(tmp_path / "index.json")
+    assert len(restored) == 2
+    assert restored.search("copper aluminium") == index.search("copper aluminium")
+
+
+def test_changes_survive_without_save(tmp_path):
+    path = tmp_path / "index.json"
+    index = SearchIndex(path)
+    index.add("a", "Steel")
+    index.save()
+    index.add("b", "Steel alloy")
+    index.add("c", "Copper")
+    index.remove("a")
+    index.close()
+    # The application is killed while appending a change.
+    with index.journal_path.open("ab") as file:
+        file.write(b'["d","Ste')
+
+    restored = SearchIndex(path)
+    assert sorted(hit.key for hit in restored.search("steel copper")) == ["b", "c"]
+    restored.add("d", "Steel")
+    assert len(SearchIndex(path)) == 3
+
+    restored.save()
+    assert not restored.journal_path.exists()
+    assert len(SearchIndex(path)) == 3
+
+
+def test_indexed_storage_updates_index(tmp_path):
+    index = SearchIndex()
+    backend = IndexedStorage(FileSystemStorage(tmp_path), index)
+
+    async def run():
+        await backend.create_collection("samples", {"title": "Measured samples"})
+        upload = DatasetUploadStream(_iter([b"data"]))
+        await backend.put_dataset(
+            "samples", "steel.csv", upload, "text/csv", {"title": "Steel samples"}
+        )
+        found = [hit.key for hit in index.search("samples")]
+        await backend.delete_dataset("samples", "steel.csv")
+        await backend.delete_collection("samples")
+        return found
+
+    found = asyncio.run(run())
+    assert sorted(found) == ["collection:samples", "dataset:samples/steel.csv"]
+    assert len(index) == 0
@@ -0,0 +1,74 @@
+import asyncio
+
+from marketplace_standard_app_api.security import TokenValidationCache
+
+
+class Clock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+def test_token_validation_cache():
+    calls = []
+    clock = Clock()
+
+    async def validate(token):
+        calls.append(token)
+        await asyncio.sleep(0)
+        return token.startswith("valid")
+
+    cache = TokenValidationCache(
+        validate, maxsize=2, ttl=10, negative_ttl=1, clock=clock
+    )
+
+    async def check():
+        # Concurrent checks of the same token share one validation.
+        results = await asyncio.gather(*(cache.is_valid("valid-a") for _ in range(5)))
+        assert results == [True] * 5
+        assert calls == ["valid-a"]
+
+        # Rejected tokens are cached for a shorter time.
+        assert not await cache.is_valid("invalid")
+        assert not await cache.is_valid("invalid")
+        assert calls == ["valid-a", "invalid"]
+        clock.now = 2
+        assert not await cache.is_valid("invalid")
+        assert await cache.is_valid("valid-a")
+        assert calls == ["valid-a", "invalid", "invalid"]
+
+        # The least recently used token is evicted.
+        assert await cache.is_valid("valid-b")
+        assert len(cache) == 2
+        assert not await cache.is_valid("invalid")
+        assert calls[-1] == "invalid"
+
+    asyncio.run(check())
+
+
+def test_token_validation_survives_cancelled_requests():
+    calls = []
+
+    async def validate(token):
+        calls.append(token)
+        await asyncio.sleep(0.01)
+        return True
+
+    cache = TokenValidationCache(validate)
+
+    async def check():
+        first = asyncio.ensure_future(cache.is_valid("token"))
+        await asyncio.sleep(0)
+        second = asyncio.ensure_future(cache.is_valid("token"))
+        await asyncio.sleep(0)
+        # The request that started the validation is cancelled, not the others.
+        first.cancel()
+        assert await second
+        assert first.cancelled()
+        assert calls == ["token"]
+        assert await cache.is_valid("token")
+        assert calls == ["token"]
+
+    asyncio.run(check())
@@ -0,0 +1,397 @@
+import asyncio
+import hashlib
+import io
+import json
+import tarfile
+import threading
+
+import pytest
+from fastapi import FastAPI
+
+from marketplace_standard_app_api.broker import call_app
+from marketplace_standard_app_api.models.message_broker import (
+    MessageBrokerBinaryPayload,
+    MessageBrokerRequestModel,
+)
+from marketplace_standard_app_api.models.object_storage import UploadManifestPartModel
+from marketplace_standard_app_api.routers import object_storage
+from marketplace_standard_app_api.storage import (
+    BulkOperation,
+    CollectionNotEmpty,
+    InvalidManifest,
+    NotFound,
+    apply_bulk,
+    filesystem,
+    multipart_hash,
+    use_object_storage_backend,
+)
+from marketplace_standard_app_api.storage.filesystem import FileSystemStorage
+from marketplace_standard_app_api.streaming import DatasetUploadStream
+
+
+async def _iter(*chunks):
+    for chunk in chunks:
+        yield chunk
+
+
+@pytest.fixture
+def storage(tmp_path):
+    return FileSystemStorage(tmp_path, chunk_size=4, fsync=False)
+
+
+def test_filesystem_storage_roundtrip(storage):
+    async def roundtrip():
+        assert await storage.create_collection("col", {"owner": "me"})
+        assert not await storage.create_collection("col", {})
+        dataset = await storage.put_dataset(
+            "col",
+            "../data.txt",
+            DatasetUploadStream(_iter(b"0123", b"456789")),
+            "text/plain",
+            {"key": "value"},
+        )
+        assert dataset.hash == hashlib.md5(b"0123456789").hexdigest()
+        assert dataset.bytes == 10
+
+        info = await storage.get_dataset("col", "../data.txt")
+        assert info.metadata == {"key": "value"}
+        assert [d.name for d in await storage.list_datasets("col")] == ["../data.txt"]
+        assert b"".join(storage.read_dataset("col", "../data.txt", 2, 8)) == b"2345678"
+
+        collection = (await storage.get_collection("col")).collection
+        assert (collection.count, collection.bytes) == (1, 10)
+        with pytest.raises(CollectionNotEmpty):
+            await storage.delete_collection("col")
+
+        await storage.delete_dataset("col", "../data.txt")
+        with pytest.raises(NotFound):
+            await storage.get_dataset("col", "../data.txt")
+        await storage.delete_collection("col")
+        assert await storage.list_collections() == []
+
+    asyncio.run(roundtrip())
+
+
+def test_filesystem_storage_reloads_modified_index(tmp_path, storage):
+    async def modify():
+        await storage.create_collection("col", {})
+        other = FileSystemStorage(tmp_path, fsync=False)
+        await other.put_dataset("col", "a", DatasetUploadStream(_iter(b"a")), None, {})
+        assert [d.name for d in await storage.list_datasets("col")] == ["a"]
+
+    asyncio.run(modify())
+
+
+def test_filesystem_storage_index_log(tmp_path, storage, monkeypatch):
+    monkeypatch.setattr(filesystem, "_MIN_LOG_SIZE", 0)
+
+    async def modify():
+        await storage.create_collection("col", {"owner": "me"})
+        before = storage._load_index("col")
+        for name in "abcd":
+            upload = DatasetUploadStream(_iter(name.encode()))
+            await storage.put_dataset("col", name, upload, None, {})
+        await storage.delete_dataset("col", "b")
+        await storage.update_dataset_metadata("col", "c", {"key": "value"})
+        # Readers of a previous version are not affected by the writers.
+        assert before.datasets == {}
+
+    asyncio.run(modify())
+    log_path = tmp_path / "col" / filesystem.INDEX_LOG_FILENAME
+    # The log has been merged into the index while it grew.
+    assert len(log_path.read_bytes().splitlines()) < 5
+    with log_path.open("ab") as file:
+        file.write(b'{"sequence":')  # Partially written.
+
+    other = FileSystemStorage(tmp_path, fsync=False)
+    assert [d.name for d in asyncio.run(other.list_datasets("col"))] == ["a", "c", "d"]
+    info = asyncio.run(other.get_dataset("col", "c"))
+    assert info.metadata == {"key": "value"}
+    collection = asyncio.run(other.get_collection("col"))
+    assert (collection.collection.bytes, collection.metadata) == (3, {"owner": "me"})
+
+    asyncio.run(other.delete_dataset("col", "a"))
+    assert [d.name for d in asyncio.run(storage.list_datasets("col"))] == ["c", "d"]
+
+
+@pytest.mark.parametrize("native", [True, False])
+def test_bulk_operations(storage, native):
+    class PerOperationStorage:
+        """Hides the bulk method of the storage."""
+
+        def __getattr__(self, name):
+            if name == "bulk":
+                raise AttributeError(name)
+            return getattr(storage, name)
+
+    backend = storage if native else PerOperationStorage()
+
+    async def operations():
+        yield BulkOperation("PUT", "a", DatasetUploadStream(_iter(b"abc")), None, {})
+        yield BulkOperation("DELETE", "b")
+        yield BulkOperation("PUT", "b", DatasetUploadStream(_iter(b"b")), "text/plain")
+        yield BulkOperation("HEAD", "a")
+        yield BulkOperation("DELETE", "a")
+        yield BulkOperation("HEAD", "a")
+        yield BulkOperation("PUT", "a", DatasetUploadStream(_iter(b"new")), None, {})
+        yield BulkOperation("PUT", "n" * 300, DatasetUploadStream(_iter(b"n")))
+
+    async def run():
+        with pytest.raises(NotFound):
+            await apply_bulk(backend, "col", operations())
+        await storage.create_collection("col", {})
+        results = await apply_bulk(backend, "col", operations())
+        datasets = await storage.list_datasets("col")
+        return results, datasets
+
+    results, datasets = asyncio.run(run())
+    assert [(r.dataset_name, r.status_code) for r in results] == [
+        ("a", 201),
+        ("b", 404),
+        ("b", 201),
+        ("a", 200),
+        ("a", 204),
+        ("a", 404),
+        ("a", 201),
+        ("n" * 300, 400),
+    ]
+    assert results[3].info.dataset.hash == hashlib.md5(b"abc").hexdigest()
+    assert [(d.name, d.bytes) for d in datasets] == [("a", 3), ("b", 1)]
+    assert b"".join(storage.read_dataset("col", "a", 0, 10)) == b"new"
+    assert not [path for path in storage.root.glob("col/.tmp-*")]
+
+
+def test_bulk_rolls_back_renames(storage, monkeypatch):
+    async def operations():
+        yield BulkOperation("PUT", "a", DatasetUploadStream(_iter(b"new")), None, {})
+        yield BulkOperation("PUT", "b", DatasetUploadStream(_iter(b"b")), None, {})
+
+    def fail(collection_name, index):
+        raise OSError("index not written")
+
+    async def run():
+        await storage.create_collection("col", {})
+        await storage.put_dataset(
+            "col", "a", DatasetUploadStream(_iter(b"old")), None, {}
+        )
+        monkeypatch.setattr(storage, "_write_index", fail)
+        with pytest.raises(OSError):
+            await storage.bulk("col", operations())
+        monkeypatch.undo()
+        return await storage.list_datasets("col")
+
+    datasets = asyncio.run(run())
+    assert [(d.name, d.bytes) for d in datasets] == [("a", 3)]
+    assert b"".join(storage.read_dataset("col", "a", 0, 10)) == b"old"
+    assert sorted(path.name for path in storage.root.glob("col/*")) == [
+        ".index.json",
+        ".index.log",
+        ".lock",
+        "a",
+    ]
+
+
+def test_bulk_endpoint(storage):
+    app = FastAPI()
+    app.include_router(object_storage.router)
+    use_object_storage_backend(app, storage)
+    archive = io.BytesIO()
+    with tarfile.open(fileobj=archive, mode="w") as tar:
+        for name in ["./x.json", "dir/z.txt", "y.txt"]:
+            info = tarfile.TarInfo(name)
+            info.size = 2
+            tar.addfile(info, io.BytesIO(b"{}"))
+
+    def request(content_type, body, **headers):
+        binary = isinstance(body, bytes)
+        reply = asyncio.run(
+            call_app(
+                app,
+                MessageBrokerRequestModel(
+                    endpoint="/data/col",
+                    method="POST",
+                    headers={"Content-Type": content_type, **headers},
+                    body=None if binary else body,
+                    payload=MessageBrokerBinaryPayload() if binary else None,
+                ),
+                [body] if binary else (),
+            )
+        )
+        response = reply.response
+        text = b"".join(reply.body).decode() if binary else response.body
+        return response.status_code, json.loads(text) if text else None
+
+    operations = json.dumps(
+        [
+            {"method": "PUT", "name": "a", "content": "text"},
+            {
+                "method": "PUT",
+                "name": "b",
+                "content": "AAE=",
+                "content_encoding": "base64",
+            },
+            {"method": "HEAD", "name": "b"},
+            {"method": "DELETE", "name": "c"},
+        ]
+    )
+    assert request("application/json", operations)[0] == 404
+    asyncio.run(storage.create_collection("col", {}))
+    status_code, response = request("application/json", operations)
+    assert status_code == 200
+    assert [item["status_code"] for item in response["items"]] == [201, 201, 200, 404]
+    assert response["items"][2]["dataset"]["bytes"] == 2
+
+    status_code, response = request(
+        "application/x-tar", archive.getvalue(), **{"X-Object-Meta-Source": "tar"}
+    )
+    assert status_code == 200
+    assert [(item["name"], item["status_code"]) for item in response["items"]] == [
+        ("x.json", 201),
+        ("dir/z.txt", 400),
+        ("y.txt", 201),
+    ]
+    info = asyncio.run(storage.get_dataset("col", "x.json"))
+    assert info.dataset.content_type == "application/json"
+    assert info.metadata == {"source": "tar"}
+
+    assert request("application/x-tar", archive.getvalue()[:600])[0] == 400
+    assert request("application/json", "[{}]")[0] == 422
+    assert request("text/plain", "")[0] == 415
+    assert len(asyncio.run(storage.list_datasets("col"))) == 4
+
+
+def test_multipart_upload(storage):
+    parts = {1: b"0123", 2: b"456", 3: b"789ab"}
+
+    async def run():
+        await storage.create_collection("col", {})
+        with pytest.raises(NotFound):
+            await storage.list_upload_parts("col", "big", "0" * 32)
+        upload_id = await storage.create_upload("col", "big", "text/plain", {"k": "v"})
+        uploaded = await asyncio.gather(
+            *(
+                storage.put_upload_part(
+                    "col", "big", upload_id, number, DatasetUploadStream(_iter(data))
+                )
+                for number, data in [(3, b"stale"), (1, parts[1]), (2, parts[2])]
+            )
+        )
+        await storage.put_upload_part(
+            "col", "big", upload_id, 3, DatasetUploadStream(_iter(parts[3]))
+        )
+        listed = await storage.list_upload_parts("col", "big", upload_id)
+        with pytest.raises(InvalidManifest):
+            await storage.complete_upload(
+                "col",
+                "big",
+                upload_id,
+                [UploadManifestPartModel(part_number=3, hash=uploaded[0].hash)],
+            )
+        with pytest.raises(NotFound):
+            await storage.complete_upload("col", "other", upload_id, None)
+        dataset = await storage.complete_upload("col", "big", upload_id, None)
+        with pytest.raises(NotFound):
+            await storage.list_upload_parts("col", "big", upload_id)
+        return listed, dataset
+
+    listed, dataset = asyncio.run(run())
+    assert [(part.part_number, part.bytes) for part in listed] == [
+        (1, 4),
+        (2, 3),
+        (3, 5),
+    ]
+    assert dataset.bytes == 12
+    assert dataset.hash == multipart_hash(
+        [hashlib.md5(parts[number]).hexdigest() for number in (1, 2, 3)]
+    )
+    assert b"".join(storage.read_dataset("col", "big", 0, 100)) == b"0123456789ab"
+    assert b"".join(storage.read_dataset("col", "big", 3, 8)) == b"345678"
+    info = asyncio.run(storage.get_dataset("col", "big"))
+    assert (info.dataset.content_type, info.metadata) == ("text/plain", {"k": "v"})
+
+    asyncio.run(
+        storage.put_dataset("col", "big", DatasetUploadStream(_iter(b"x")), None, {})
+    )
+    assert b"".join(storage.read_dataset("col", "big", 0, 100)) == b"x"
+    assert not list(storage.root.glob("col/.segments/*"))
+
+    async def abort():
+        upload_id = await storage.create_upload("col", "big", None, {})
+        await storage.abort_upload("col", "big", upload_id)
+        with pytest.raises(NotFound):
+            await storage.abort_upload("col", "big", upload_id)
+        await storage.delete_dataset("col", "big")
+        await storage.create_upload("col", "big", None, {})
+        await storage.delete_collection("col")
+
+    asyncio.run(abort())
+
+
+def test_concurrent_uploads_of_a_part(storage):
+    asyncio.run(storage.create_collection("col", {}))
+    upload_id = asyncio.run(storage.create_upload("col", "big", None, {}))
+    path = storage._upload_path("col", upload_id)
+    barrier = threading.Barrier(8)
+
+    def commit(attempt):
+        tmp_path = path / f".tmp-{attempt}"
+        tmp_path.write_bytes(b"x")
+        barrier.wait()
+        storage._commit_part("col", path, 1, str(tmp_path), f"00001.{attempt:032x}")
+
+    for _ in range(10):
+        threads = [threading.Thread(target=commit, args=(i,)) for i in range(8)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        # The last upload of the part wins, the others are removed.
+        assert len(list(path.glob("00001.*"))) == 1
+
+
+def test_multipart_upload_endpoints(storage):
+    app = FastAPI()
+    app.include_router(object_storage.router)
+    use_object_storage_backend(app, storage)
+    asyncio.run(storage.create_collection("col", {}))
+
+    def request(method, endpoint, body=None, **headers):
+        binary = isinstance(body, bytes)
+        reply = asyncio.run(
+            call_app(
+                app,
+                MessageBrokerRequestModel(
+                    endpoint=endpoint,
+                    method=method,
+                    headers=headers,
+                    body=None if binary else body,
+                    payload=MessageBrokerBinaryPayload() if binary else None,
+                ),
+                [body] if binary else (),
+            )
+        )
+        response = reply.response
+        text = b"".join(reply.body).decode() if binary else response.body
+        return response.status_code, json.loads(text) if text else None
+
+    status_code, upload = request(
+        "POST", "/data/col/big/uploads", **{"Content-Type": "text/plain"}
+    )
+    assert status_code == 201
+    endpoint = f"/data/col/big/uploads/{upload['upload_id']}"
+    assert request("PUT", f"{endpoint}/2", b"world")[0] == 201
+    status_code, part = request("PUT", f"{endpoint}/1", b"hello ")
+    assert part == {
+        "part_number": 1,
+        "hash": hashlib.md5(b"hello ").hexdigest(),
+        "bytes": 6,
+    }
+    assert request("PUT", f"{endpoint}/0", b"")[0] == 422
+    assert len(request("GET", endpoint)[1]["parts"]) == 2
+
+    manifest = json.dumps({"parts": [{"part_number": 1}, {"part_number": 3}]})
+    headers = {"Content-Type": "application/json"}
+    assert request("POST", endpoint, manifest, **headers)[0] == 400
+    assert request("POST", endpoint)[0] == 201
+    assert request("GET", endpoint)[0] == 404
+    assert b"".join(storage.read_dataset("col", "big", 0, 100)) == b"hello world"
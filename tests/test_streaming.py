@@ -0,0 +1,163 @@
+import asyncio
+import gzip
+import hashlib
+import io
+import tarfile
+from datetime import datetime, timezone
+
+import pytest
+from pydantic import BaseModel
+
+from marketplace_standard_app_api.streaming import (
+    MAX_ARCHIVE_HEADER_SIZE,
+    ByteRange,
+    DatasetUploadStream,
+    EventStreamResponse,
+    InvalidArchive,
+    RangeNotSatisfiable,
+    dataset_response,
+    if_range_matches,
+    iter_gunzip,
+    iter_tar,
+    parse_range,
+)
+
+
+async def _iter(chunks):
+    for chunk in chunks:
+        yield chunk
+
+
+def _consume(upload):
+    async def consume():
+        return [chunk async for chunk in upload]
+
+    return asyncio.run(consume())
+
+
+def test_upload_stream_reframes_chunks():
+    upload = DatasetUploadStream(_iter([b"a", b"bcdef", b"", b"gh"]), chunk_size=3)
+    assert _consume(upload) == [b"abc", b"def", b"gh"]
+    assert upload.bytes == 8
+
+
+def test_upload_stream_hash():
+    upload = DatasetUploadStream(_iter([b"hello ", b"world"]), chunk_size=4)
+    _consume(upload)
+    assert upload.hexdigest() == hashlib.md5(b"hello world").hexdigest()
+
+
+@pytest.mark.parametrize(
+    "header,expected",
+    [
+        (None, None),
+        ("bytes=0-9", ByteRange(0, 9)),
+        ("bytes=90-", ByteRange(90, 99)),
+        ("bytes=95-200", ByteRange(95, 99)),
+        ("bytes=-5", ByteRange(95, 99)),
+        ("bytes=-500", ByteRange(0, 99)),
+        ("bytes=9-0", None),
+        ("bytes=0-1,5-6", None),
+        ("items=0-9", None),
+        ("bytes=a-b", None),
+    ],
+)
+def test_parse_range(header, expected):
+    assert parse_range(header, 100) == expected
+
+
+@pytest.mark.parametrize("header", ["bytes=100-", "bytes=200-300", "bytes=-0"])
+def test_parse_range_not_satisfiable(header):
+    with pytest.raises(RangeNotSatisfiable):
+        parse_range(header, 100)
+
+
+@pytest.mark.parametrize(
+    "last_modified",
+    [
+        datetime(2020, 1, 1, 12, 0, 0, 500),
+        datetime(2020, 1, 1, 12, tzinfo=timezone.utc),
+    ],
+)
+def test_naive_last_modified_is_utc(last_modified):
+    http_date = "Wed, 01 Jan 2020 12:00:00 GMT"
+    assert if_range_matches(http_date, last_modified=last_modified)
+    response = dataset_response(
+        lambda start, end: iter([b"x"]), 1, last_modified=last_modified
+    )
+    assert response.headers["last-modified"] == http_date
+
+
+class _Event(BaseModel):
+    n: int
+
+
+def test_event_stream_sends_keepalive_comments():
+    async def events():
+        yield _Event(n=1)
+        await asyncio.sleep(0.05)
+        yield _Event(n=2)
+
+    response = EventStreamResponse(events(), event="count", keepalive=0.02)
+    body = b"".join(_consume(response.body_iterator))
+    assert body.startswith(b'event: count\ndata: {"n": 1}\n\n: keepalive\n\n')
+    assert body.endswith(b'event: count\ndata: {"n": 2}\n\n')
+
+
+def _tar(files, format=tarfile.PAX_FORMAT):
+    buffer = io.BytesIO()
+    with tarfile.open(fileobj=buffer, mode="w", format=format) as archive:
+        directory = tarfile.TarInfo("dir")
+        directory.type = tarfile.DIRTYPE
+        archive.addfile(directory)
+        for name, content in files.items():
+            info = tarfile.TarInfo(name)
+            info.size = len(content)
+            archive.addfile(info, io.BytesIO(content))
+    return buffer.getvalue()
+
+
+@pytest.mark.parametrize("format", [tarfile.GNU_FORMAT, tarfile.PAX_FORMAT])
+def test_iter_tar_extracts_members_while_streaming(format):
+    files = {
+        "dir/a.txt": b"a" * 1000,
+        "n\u00e4me-" + "x" * 200: b"long name",
+        "skipped": b"b" * 700,
+        "empty": b"",
+    }
+    data = _tar(files, format)
+
+    async def extract(source):
+        members = {}
+        async for member in iter_tar(source):
+            if member.name != "skipped":
+                members[member.name] = b"".join(
+                    [chunk async for chunk in member.chunks]
+                )
+        return members
+
+    chunks = [data[i : i + 100] for i in range(0, len(data), 100)]
+    assert asyncio.run(extract(_iter(chunks))) == {
+        name: content for name, content in files.items() if name != "skipped"
+    }
+    compressed = gzip.compress(data)
+    assert asyncio.run(extract(iter_gunzip(_iter([compressed]))))["empty"] == b""
+    with pytest.raises(InvalidArchive):
+        asyncio.run(extract(_iter([data[:1500]])))
+
+
+def test_iter_tar_rejects_large_headers():
+    info = tarfile.TarInfo("././@LongLink")
+    info.type = tarfile.GNUTYPE_LONGNAME
+    info.size = MAX_ARCHIVE_HEADER_SIZE + 1
+    header = info.tobuf(tarfile.GNU_FORMAT)
+
+    async def source():
+        yield header
+        raise AssertionError("The header was read.")
+
+    async def extract():
+        return [member.name async for member in iter_tar(source())]
+
+    with pytest.raises(InvalidArchive):
+        asyncio.run(extract())